@@ -205,6 +205,91 @@ def performance_status():
     else:
         print("\n✅ 系统性能良好")
 
+@app.cli.command('rebuild-inventory-summary')
+@click.option('--if-needed', is_flag=True, help='只在汇总表尚未回填时执行（首次部署）')
+def rebuild_inventory_summary(if_needed):
+    """全量重建库存汇总表 inventory_summary"""
+    from app.services.inventory_summary_service import InventorySummaryService
+
+    print("🔄 开始重建库存汇总表...")
+    if if_needed:
+        result = InventorySummaryService.backfill_if_needed()
+    else:
+        result = InventorySummaryService.rebuild_all()
+
+    if not result.get('success'):
+        print(f"❌ 重建失败: {result.get('message')}")
+    elif result.get('skipped'):
+        print(f"⚠️ {result.get('message')}")
+    else:
+        print(f"✅ 重建完成: {result['code_count']} 个识别编码, {result['row_count']} 行, 耗时 {result['duration']:.2f}秒")
+
+@app.cli.command('rebuild-search-index')
+@click.option('--if-needed', is_flag=True, help='只在索引尚未回填时执行（首次部署）')
+def rebuild_search_index(if_needed):
+    """全量重建搜索分词表 search_tokens"""
+    from app.services.search_index_service import SearchIndexService
+
+    print("🔄 开始重建搜索索引...")
+    if if_needed:
+        result = SearchIndexService.backfill_if_needed()
+    else:
+        result = SearchIndexService.rebuild_all()
+
+    if not result.get('success'):
+        print(f"❌ 重建失败: {result.get('message')}")
+    elif result.get('skipped'):
+        print(f"⚠️ {result.get('message')}")
+    else:
+        print(f"✅ 重建完成: {result['token_count']} 个分词, 耗时 {result['duration']:.2f}秒")
+
+@app.cli.command('rebuild-daily-rollup')
+@click.option('--days', type=int, default=None, help='只重建最近N天，不指定则全量重建')
+@click.option('--if-needed', is_flag=True, help='只在汇总表尚未回填时执行（首次部署）')
+def rebuild_daily_rollup(days, if_needed):
+    """重建每日作业汇总表 daily_operations_rollup"""
+    from app.services.daily_rollup_service import DailyRollupService
+
+    print("🔄 开始重建每日作业汇总表...")
+    if if_needed:
+        result = DailyRollupService.backfill_if_needed()
+    elif days:
+        result = DailyRollupService.refresh_recent(days=days)
+    else:
+        result = DailyRollupService.rebuild_all()
+
+    if not result.get('success'):
+        print(f"❌ 重建失败: {result.get('message')}")
+    elif result.get('skipped'):
+        print(f"⚠️ {result.get('message')}")
+    else:
+        print(f"✅ 重建完成: {result['row_count']} 行, 耗时 {result['duration']:.2f}秒")
+
+@app.cli.command('reconcile-inventory')
+@click.option('--full', is_flag=True, help='执行全量扫描（从上次断点继续）')
+@click.option('--restart', is_flag=True, help='全量扫描从头开始')
+@click.option('--throttle', type=float, default=None, help='全量扫描每块之间休眠的秒数')
+def reconcile_inventory(full, restart, throttle):
+    """库存对账：默认增量核对上次对账之后有写入的识别编码"""
+    from app.services.reconciliation_service import InventoryReconciler
+
+    if full or restart:
+        print("🔄 开始库存全量对账...")
+        result = InventoryReconciler.run_sweep(throttle_seconds=throttle, restart=restart)
+    else:
+        print("🔄 开始库存增量对账...")
+        result = InventoryReconciler.run_incremental()
+
+    if not result.get('success'):
+        print(f"❌ 对账失败: {result.get('message')}")
+    elif result.get('skipped'):
+        print(f"⚠️ {result.get('message')}")
+    else:
+        print(f"✅ {result.get('message')}, 新发现 {result.get('new_findings', 0)} 个问题, "
+              f"解决 {result.get('resolved_findings', 0)} 个")
+        if result.get('sweep_requested'):
+            print("⚠️ 需要执行全量对账: flask reconcile-inventory --full")
+
 @app.cli.command('cache-status')
 def cache_status():
     """查看双层缓存状态"""
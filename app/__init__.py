@@ -40,6 +40,13 @@ def create_app(config_class=None):
     migrate.init_app(app, db)
     csrf.init_app(app)
 
+    # JSON 接口响应使用 orjson 序列化（未安装时保持 Flask 默认实现）
+    try:
+        from app.utils.json_provider import init_json_provider
+        init_json_provider(app)
+    except ImportError as e:
+        app.logger.warning(f'orjson JSON序列化未启用: {e}')
+
     # CSRF错误处理
     from flask_wtf.csrf import CSRFError
     @app.errorhandler(CSRFError)
@@ -100,6 +107,90 @@ def create_app(config_class=None):
     except ImportError:
         app.logger.warning('Customer蓝图未找到，跳过注册')
     
+    # 注册库存汇总表维护事件（写入路径提交前刷新 inventory_summary）
+    try:
+        from app.services.inventory_summary_service import register_inventory_summary_events
+        register_inventory_summary_events()
+    except ImportError as e:
+        app.logger.warning(f'库存汇总服务未找到，跳过注册: {e}')
+
+    # 注册每日作业汇总表维护事件（写入路径提交前刷新 daily_operations_rollup）
+    try:
+        from app.services.daily_rollup_service import register_daily_rollup_events
+        register_daily_rollup_events()
+    except ImportError as e:
+        app.logger.warning(f'每日作业汇总服务未找到，跳过注册: {e}')
+
+    # 注册搜索索引维护事件（写入路径提交前重建 search_tokens 分词）
+    try:
+        from app.services.search_index_service import register_search_index_events
+        register_search_index_events()
+    except ImportError as e:
+        app.logger.warning(f'搜索索引服务未找到，跳过注册: {e}')
+
+    # 注册对账变更日志事件（删除、修改识别编码的写入提交时记录，供增量对账读取）
+    try:
+        from app.services.reconciliation_service import register_reconciliation_events
+        register_reconciliation_events()
+    except ImportError as e:
+        app.logger.warning(f'库存对账服务未找到，跳过注册: {e}')
+
+    # 跨进程锁服务（请求结束时释放本请求持有的库存锁）
+    try:
+        from app.utils.lock_service import init_lock_service
+        init_lock_service(app)
+    except ImportError as e:
+        app.logger.warning(f'锁服务未找到，跳过注册: {e}')
+
+    # 工作单元执行器（记录数据库死锁、锁等待超时，供写接口回滚重放）
+    try:
+        from app.utils.unit_of_work import init_unit_of_work
+        init_unit_of_work(app)
+    except ImportError as e:
+        app.logger.warning(f'工作单元执行器未找到，跳过注册: {e}')
+
+    # 注册用户权限缓存失效事件（权限、角色写入提交后按用户失效）
+    try:
+        from app.utils.permission_cache import register_permission_cache_events
+        register_permission_cache_events()
+    except ImportError as e:
+        app.logger.warning(f'用户权限缓存未找到，跳过注册: {e}')
+
+    # 启动缓存失效广播（各进程L1缓存之间同步失效）
+    try:
+        from app.cache.invalidation_bus import start_invalidation_bus
+        start_invalidation_bus(app)
+    except ImportError as e:
+        app.logger.warning(f'缓存失效广播未找到，跳过启动: {e}')
+
+    # 注册变更驱动的缓存预热（写入提交后只重建受影响仓库的缓存）
+    try:
+        from app.cache.cache_warmer import start_event_warming
+        start_event_warming(app)
+    except ImportError as e:
+        app.logger.warning(f'缓存预热器未找到，跳过注册: {e}')
+
+    # 库存一致性验证（写入提交后识别编码进入后台队列批量核对）
+    try:
+        from app.inventory_validator import setup_inventory_validation
+        setup_inventory_validation(app)
+    except ImportError as e:
+        app.logger.warning(f'库存验证器未找到，跳过注册: {e}')
+
+    # 列表和报表接口的条件响应（数据未变化的轮询直接返回304）
+    try:
+        from app.cache.conditional_responses import init_conditional_responses
+        init_conditional_responses(app)
+    except ImportError as e:
+        app.logger.warning(f'条件响应中间件未找到，跳过注册: {e}')
+
+    # 按视图 @route_cache 声明缓存接口响应（依赖数据表写入后自动失效）
+    try:
+        from app.cache.auto_cache_middleware import init_auto_cache_middleware
+        init_auto_cache_middleware(app)
+    except ImportError as e:
+        app.logger.warning(f'自动缓存中间件未找到，跳过注册: {e}')
+
     # 移除复杂的缓存和优化系统初始化
 
     # CSRF错误处理
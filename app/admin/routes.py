@@ -1299,6 +1299,68 @@ def get_performance_status():
         return jsonify({'error': str(e)}), 500
 
 
+@bp.route('/transactions/retry_stats')
+@login_required
+@check_permission('ADMIN_SYSTEM_MONITOR')
+def get_transaction_retry_stats():
+    """按操作类型的事务死锁重试统计API"""
+    try:
+        from app.utils.unit_of_work import unit_of_work
+        return jsonify({
+            'success': True,
+            'data': unit_of_work.get_stats()
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"获取事务重试统计失败: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@bp.route('/inventory_validation/stats')
+@login_required
+@check_permission('ADMIN_SYSTEM_MONITOR')
+def get_inventory_validation_stats():
+    """库存一致性后台验证统计和最近发现的不一致API"""
+    try:
+        from app.inventory_validator import validation_queue
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({
+            'success': True,
+            'data': {
+                'stats': validation_queue.get_stats(),
+                'recent_inconsistencies': validation_queue.get_history(limit)
+            }
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"获取库存验证统计失败: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
+@bp.route('/inventory_reconciliation/findings')
+@login_required
+@check_permission('ADMIN_SYSTEM_MONITOR')
+def get_inventory_reconciliation_findings():
+    """库存对账进度和未解决的不一致问题API"""
+    try:
+        from app.services.reconciliation_service import InventoryReconciler
+        limit = request.args.get('limit', 100, type=int)
+        code = request.args.get('identification_code', '').strip()
+        findings = InventoryReconciler.get_open_findings(
+            identification_codes=[code] if code else None, limit=limit)
+        return jsonify({
+            'success': True,
+            'data': {
+                'status': InventoryReconciler.get_status(),
+                'findings': [finding.to_dict() for finding in findings]
+            }
+        })
+
+    except Exception as e:
+        current_app.logger.error(f"获取库存对账结果失败: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+
 @bp.route('/optimization_monitor')
 @login_required
 # @check_permission('ADMIN_VIEW')  # 临时禁用权限检查
@@ -3,7 +3,7 @@ from flask import Blueprint
 bp = Blueprint('api', __name__, url_prefix='/api')
 
 # 导入路由，确保它们被注册到蓝图
-from app.api import inventory_routes, outbound_routes, startup_routes, backend_routes
+from app.api import inventory_routes, outbound_routes, startup_routes, backend_routes, export_job_routes
 
 # 确保所有路由函数被导入
 from app.api.inventory_routes import get_inventory
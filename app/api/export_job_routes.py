@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台导出任务API路由
+提交导出/报表任务、查询进度、下载生成的文件
+"""
+
+import os
+from flask import jsonify, request, send_file
+from flask_login import login_required, current_user
+from app.api.bp import bp
+from app.services.export_job_service import ExportJobService
+
+
+@bp.route('/export_jobs', methods=['POST'])
+@login_required
+def submit_export_job():
+    """提交后台导出任务"""
+    try:
+        data = request.get_json(silent=True) or request.form.to_dict()
+        job_type = data.get('job_type', 'export')
+        job_name = data.get('job_name', '')
+        params = data.get('params') or {}
+
+        permission = ExportJobService.required_permission(job_type, job_name)
+        if permission and not current_user.has_permission(permission):
+            return jsonify({'success': False, 'message': '您没有权限导出该数据'}), 403
+
+        result = ExportJobService.submit(current_user, job_type, job_name,
+                                         params=params, file_format=data.get('file_format'))
+        if not result['success']:
+            return jsonify(result), 400
+
+        result['status_url'] = f"/api/export_jobs/{result['job_id']}"
+        return jsonify(result), 202
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'message': f'提交导出任务失败: {str(e)}'
+        }), 500
+
+
+@bp.route('/export_jobs', methods=['GET'])
+@login_required
+def list_export_jobs():
+    """当前用户最近的导出任务"""
+    jobs = ExportJobService.list_jobs(current_user)
+    return jsonify({
+        'success': True,
+        'data': [job.to_dict() for job in jobs]
+    })
+
+
+@bp.route('/export_jobs/<job_id>', methods=['GET'])
+@login_required
+def get_export_job(job_id):
+    """查询导出任务状态和进度"""
+    job = ExportJobService.get_job(job_id, current_user)
+    if not job:
+        return jsonify({'success': False, 'message': '导出任务不存在'}), 404
+
+    data = job.to_dict()
+    if job.status == 'finished':
+        data['download_url'] = f"/api/export_jobs/{job.id}/download"
+    return jsonify({'success': True, 'data': data})
+
+
+@bp.route('/export_jobs/<job_id>/download', methods=['GET'])
+@login_required
+def download_export_job(job_id):
+    """下载已完成任务生成的文件"""
+    job = ExportJobService.get_job(job_id, current_user)
+    if not job:
+        return jsonify({'success': False, 'message': '导出任务不存在'}), 404
+
+    if job.status != 'finished' or not job.file_path or not os.path.exists(job.file_path):
+        return jsonify({
+            'success': False,
+            'message': '文件尚未生成或已过期',
+            'status': job.status
+        }), 409
+
+    return send_file(job.file_path, as_attachment=True, download_name=job.filename)
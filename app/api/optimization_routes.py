@@ -11,6 +11,7 @@ import psutil
 from app import db
 from app.models import SystemOptimizationLog
 from app.decorators import require_permission
+from app.utils.keyset_pagination import keyset_paginate
 
 # 创建蓝图
 optimization_api = Blueprint('optimization_api', __name__)
@@ -190,8 +191,10 @@ def get_optimization_logs():
         if optimization_type:
             query = query.filter(SystemOptimizationLog.optimization_type == optimization_type)
         
-        logs = query.order_by(SystemOptimizationLog.timestamp.desc()).paginate(
-            page=page, per_page=per_page, error_out=False
+        logs = keyset_paginate(
+            query, SystemOptimizationLog.timestamp, SystemOptimizationLog.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            descending=True, count_mode=request.args.get('count', 'exact')
         )
         
         return jsonify({
@@ -203,12 +206,7 @@ def get_optimization_logs():
                     'message': log.message,
                     'timestamp': log.timestamp.isoformat()
                 } for log in logs.items],
-                'pagination': {
-                    'page': logs.page,
-                    'pages': logs.pages,
-                    'per_page': logs.per_page,
-                    'total': logs.total
-                }
+                'pagination': logs.to_dict()
             }
         })
         
@@ -7,6 +7,7 @@ from datetime import datetime
 import traceback
 import json
 from sqlalchemy import func, or_
+from app.utils.keyset_pagination import keyset_paginate
 
 # 确保API路由被正确注册到蓝图
 __all__ = ['save_outbound_batch', 'get_outbound_list', 'get_outbound_history', 'save_frontend_outbound_to_backend']
@@ -292,11 +293,19 @@ def get_outbound_list():
                 current_app.logger.warning(f"无效的结束日期格式: {date_end}")
                 pass
         
-        # 按出库时间降序排序
-        query = query.order_by(OutboundRecord.outbound_time.desc())
-        
-        # 执行查询
-        records = query.all()
+        # 传入 per_page 或 cursor 时按出库时间降序键集分页，否则保持返回全部记录
+        pagination = None
+        if request.args.get('per_page') or request.args.get('cursor'):
+            pagination = keyset_paginate(
+                query, OutboundRecord.outbound_time, OutboundRecord.id,
+                cursor=request.args.get('cursor'),
+                page=request.args.get('page', 1, type=int),
+                per_page=request.args.get('per_page', 50, type=int),
+                descending=True, count_mode=request.args.get('count', 'none')
+            )
+            records = pagination.items
+        else:
+            records = query.order_by(OutboundRecord.outbound_time.desc()).all()
         current_app.logger.info(f"查询到 {len(records)} 条出库记录")
         
         # 转换为字典列表
@@ -323,11 +332,14 @@ def get_outbound_list():
         
         current_app.logger.info(f"成功处理 {len(result)} 条出库记录")
         
-        return jsonify({
+        response = {
             'success': True,
             'records': result,
             'count': len(result)
-        })
+        }
+        if pagination is not None:
+            response['pagination'] = pagination.to_dict()
+        return jsonify(response)
     except Exception as e:
         current_app.logger.error(f"获取出库记录列表出错: {str(e)}")
         current_app.logger.error(traceback.format_exc())
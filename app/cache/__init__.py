@@ -10,6 +10,9 @@ from .memory_cache import MemoryCache
 from .redis_cache import RedisCache
 from .cache_warmer import CacheWarmer
 from .cache_decorators import cached, cache_invalidate
+from .cache_tags import CacheTagRegistry, get_tag_registry, invalidate_tags
+from .request_batcher import RequestCacheBatcher, prefetch_cache_keys
+from .route_cache import RouteCacheSpec, route_cache
 
 __all__ = [
     'DualCacheManager',
@@ -17,5 +20,12 @@ __all__ = [
     'RedisCache',
     'CacheWarmer',
     'cached',
-    'cache_invalidate'
+    'cache_invalidate',
+    'CacheTagRegistry',
+    'get_tag_registry',
+    'invalidate_tags',
+    'RequestCacheBatcher',
+    'prefetch_cache_keys',
+    'RouteCacheSpec',
+    'route_cache'
 ]
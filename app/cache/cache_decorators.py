@@ -8,10 +8,11 @@
 import functools
 import hashlib
 import json
-from typing import Any, Callable, Optional, Union, List
+from typing import Any, Callable, Iterable, Optional, Tuple, Union, List
 from flask_login import current_user
 
 from .dual_cache_manager import get_dual_cache_manager
+from .request_batcher import prefetch_cache_keys
 
 
 def generate_cache_key(prefix: str, *args, **kwargs) -> str:
@@ -50,12 +51,86 @@ def generate_cache_key(prefix: str, *args, **kwargs) -> str:
     return cache_key
 
 
+def _call_args(call: Any) -> tuple:
+    """批量调用中单次调用的位置参数：元组按位置参数展开，其他值作为唯一的位置参数"""
+    return call if isinstance(call, tuple) else (call,)
+
+
+def attach_batch_methods(wrapper: Callable, func: Callable, make_key: Callable, cache_type: str,
+                         tags: Optional[Union[List[str], Callable]] = None,
+                         condition: Optional[Callable] = None,
+                         batchable: bool = True) -> Callable:
+    """
+    为缓存装饰器生成的函数添加批量方法，用于按仓库、按客户等扇出查询：
+    - get_many(calls, **kwargs): 一次 MGET 读取所有调用的缓存，未命中的逐个调用原函数后批量写入，按顺序返回结果
+    - set_many(items, **kwargs): items 为 (调用参数, 值)，批量写入缓存
+    - prefetch(calls, **kwargs): 登记本请求稍后要调用的参数，第一次调用时一次 MGET 全部取回
+
+    calls 中每一项是一次调用的位置参数元组（单个参数可以直接传值），kwargs 为所有调用共用的关键字参数。
+    方法上的装饰器需要显式传入 self，如 Service._method.get_many([(service, 1), (service, 2)])。
+
+    Args:
+        batchable: 为 False 时（如使用旧缓存策略）get_many 逐个调用被装饰的函数
+    """
+    def get_many(calls: Iterable[Any], **kwargs) -> List[Any]:
+        arg_lists = [_call_args(call) for call in calls]
+        if not batchable:
+            return [wrapper(*args, **kwargs) for args in arg_lists]
+
+        results = [None] * len(arg_lists)
+        positions = {}
+        args_by_key = {}
+        for index, args in enumerate(arg_lists):
+            if condition and not condition(*args, **kwargs):
+                results[index] = func(*args, **kwargs)
+                continue
+            key = make_key(*args, **kwargs)
+            positions.setdefault(key, []).append(index)
+            args_by_key[key] = args
+
+        if positions:
+            def fallback(missing_keys):
+                return {key: func(*args_by_key[key], **kwargs) for key in missing_keys}
+
+            key_tags = {key: tags(*args, **kwargs) for key, args in args_by_key.items()} if callable(tags) else tags
+            values = get_dual_cache_manager().get_many(
+                list(positions), fallback=fallback, cache_type=cache_type, tags=key_tags
+            )
+            for key, indexes in positions.items():
+                for index in indexes:
+                    results[index] = values.get(key)
+        return results
+
+    def set_many(items: Iterable[Tuple[Any, Any]], **kwargs) -> bool:
+        mapping = {}
+        key_tags = {} if callable(tags) else tags
+        for call, value in items:
+            args = _call_args(call)
+            key = make_key(*args, **kwargs)
+            mapping[key] = value
+            if callable(tags):
+                key_tags[key] = tags(*args, **kwargs)
+        return get_dual_cache_manager().set_many(mapping, cache_type=cache_type, tags=key_tags)
+
+    def prefetch(calls: Iterable[Any], **kwargs) -> int:
+        if not batchable:
+            return 0
+        keys = [make_key(*_call_args(call), **kwargs) for call in calls]
+        return prefetch_cache_keys(keys, cache_type)
+
+    wrapper.get_many = get_many
+    wrapper.set_many = set_many
+    wrapper.prefetch = prefetch
+    return wrapper
+
+
 def cached(cache_type: str = 'default',
            key_prefix: Optional[str] = None,
            l1_ttl: Optional[int] = None,
            l2_ttl: Optional[int] = None,
            key_generator: Optional[Callable] = None,
-           condition: Optional[Callable] = None):
+           condition: Optional[Callable] = None,
+           tags: Optional[Union[List[str], Callable]] = None):
     """
     缓存装饰器
     
@@ -66,18 +141,20 @@ def cached(cache_type: str = 'default',
         l2_ttl: L2缓存TTL
         key_generator: 自定义键生成器
         condition: 缓存条件函数，返回True时才缓存
+        tags: 附加的缓存标签，或根据函数参数返回标签列表的函数
     """
     def decorator(func: Callable) -> Callable:
+        def make_key(*args, **kwargs):
+            if key_generator:
+                return key_generator(*args, **kwargs)
+            return generate_cache_key(key_prefix or f"func:{func.__name__}", *args, **kwargs)
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             cache_manager = get_dual_cache_manager()
             
             # 生成缓存键
-            if key_generator:
-                cache_key = key_generator(*args, **kwargs)
-            else:
-                prefix = key_prefix or f"func:{func.__name__}"
-                cache_key = generate_cache_key(prefix, *args, **kwargs)
+            cache_key = make_key(*args, **kwargs)
             
             # 检查缓存条件
             if condition and not condition(*args, **kwargs):
@@ -91,31 +168,32 @@ def cached(cache_type: str = 'default',
             result = cache_manager.get(
                 key=cache_key,
                 fallback=fallback,
-                cache_type=cache_type
+                cache_type=cache_type,
+                tags=tags(*args, **kwargs) if callable(tags) else tags
             )
             
             return result
         
         # 添加缓存控制方法
-        wrapper.cache_key = lambda *args, **kwargs: generate_cache_key(
-            key_prefix or f"func:{func.__name__}", *args, **kwargs
-        )
+        wrapper.cache_key = make_key
         wrapper.invalidate = lambda *args, **kwargs: get_dual_cache_manager().delete(
             wrapper.cache_key(*args, **kwargs)
         )
         
-        return wrapper
+        return attach_batch_methods(wrapper, func, make_key, cache_type, tags=tags, condition=condition)
     return decorator
 
 
-def cache_invalidate(patterns: Union[str, List[str]], level: str = 'both'):
+def cache_invalidate(patterns: Optional[Union[str, List[str]]] = None, level: str = 'both',
+                     tags: Optional[Union[List[str], Callable]] = None):
     """
     缓存失效装饰器
     在函数执行后清理相关缓存
     
     Args:
-        patterns: 要清理的缓存模式
+        patterns: 要清理的缓存模式，'<命名空间>:*' 等模式会转换为标签失效
         level: 清理级别 ('l1', 'l2', 'both')
+        tags: 要失效的标签，或根据函数参数返回标签列表的函数
     """
     def decorator(func: Callable) -> Callable:
         @functools.wraps(func)
@@ -126,10 +204,17 @@ def cache_invalidate(patterns: Union[str, List[str]], level: str = 'both'):
             # 清理缓存
             cache_manager = get_dual_cache_manager()
             
+            if tags:
+                try:
+                    tag_list = tags(*args, **kwargs) if callable(tags) else tags
+                    cache_manager.invalidate_tags(*tag_list)
+                except Exception as e:
+                    print(f"缓存标签失效失败 {tags}: {e}")
+            
             if isinstance(patterns, str):
                 pattern_list = [patterns]
             else:
-                pattern_list = patterns
+                pattern_list = patterns or []
             
             for pattern in pattern_list:
                 try:
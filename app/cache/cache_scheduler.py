@@ -32,20 +32,20 @@ class CacheScheduler:
     def _setup_jobs(self):
         """设置调度任务"""
         
-        # 1. 每5分钟预热仪表板数据
+        # 1. 每小时全量预热仪表板数据（兜底，日常由写入变更驱动预热）
         self.scheduler.add_job(
             func=self._warm_dashboard_cache,
-            trigger=IntervalTrigger(minutes=5),
+            trigger=IntervalTrigger(hours=1),
             id='warm_dashboard_cache',
             name='预热仪表板缓存',
             max_instances=1,
             coalesce=True
         )
         
-        # 2. 每10分钟预热库存数据
+        # 2. 每小时全量预热库存数据（兜底，日常由写入变更驱动预热）
         self.scheduler.add_job(
             func=self._warm_inventory_cache,
-            trigger=IntervalTrigger(minutes=10),
+            trigger=IntervalTrigger(hours=1),
             id='warm_inventory_cache',
             name='预热库存缓存',
             max_instances=1,
@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存标签与版本号
+缓存项写入时登记标签（如 ns:inventory_list、warehouse:3、user:5），并记录各标签当时的版本号；
+失效时只把标签版本号加一，读取时版本号不一致即视为未命中并顺手删除该项：
+- 失效操作为 O(1)，不再使用 KEYS 扫描或 FLUSHDB 阻塞共享的 Redis
+- 标签版本号保存在 Redis 中，所有进程共享；Redis 不可用时退化为进程内版本号
+- L1 内存缓存和 L2 Redis 缓存使用同一套版本号，校验方式完全一致
+- 为避免每次读取都访问 Redis，版本号在进程内缓存 VERSION_CACHE_SECONDS 秒，
+  本进程的失效操作立即生效，其他进程的失效由失效广播（invalidation_bus）推送，
+  广播不可用时最多延迟该时间
+"""
+
+import re
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from flask import current_app, has_app_context
+
+from .redis_cache import get_redis_cache, RedisCache
+
+
+# 带标签的缓存值包装键
+TAG_VERSIONS_KEY = '__tag_versions__'
+TAGGED_VALUE_KEY = '__tagged_value__'
+
+# 所有缓存项都带有的全局标签，用于整体清空
+GLOBAL_TAG = 'all'
+
+# 标签版本号在 Redis 中的键前缀
+VERSION_KEY_PREFIX = 'warehouse_system:tagver:'
+
+# 版本号进程内缓存时间（秒）
+VERSION_CACHE_SECONDS = 1.0
+
+# 可以转换为标签的清理模式
+_NAMESPACE_PATTERN = re.compile(r'^([A-Za-z0-9_\-]+):?\*$')
+_SCOPE_PATTERN = re.compile(r'^\*:?(user|warehouse)[:_]([A-Za-z0-9\-]+):?\*?$')
+
+
+def namespace_tag(namespace: str) -> str:
+    """命名空间标签，命名空间为缓存键第一段（或旧缓存管理器的 key_type）"""
+    return f'ns:{namespace}'
+
+
+def tags_for_key(key: str) -> List[str]:
+    """
+    根据缓存键推导默认标签：全局标签、命名空间标签，以及键中的 user:X / warehouse:X 段
+    """
+    parts = key.split(':')
+    tags = [GLOBAL_TAG, namespace_tag(parts[0])]
+    for name, value in zip(parts, parts[1:]):
+        if name in ('user', 'warehouse') and value and value != 'all':
+            tags.append(f'{name}:{value}')
+    return tags
+
+
+def tags_for_pattern(pattern: str) -> Optional[List[str]]:
+    """
+    将通配符清理模式转换为等价（或范围更大）的标签
+
+    支持 '*'、'<命名空间>:*'、'<命名空间>*'、'*:warehouse:X'、'*user_X*' 等形式，
+    其他模式返回 None，由调用方按模式逐个删除。
+    """
+    if not pattern:
+        return None
+    if pattern == '*':
+        return [GLOBAL_TAG]
+    match = _NAMESPACE_PATTERN.match(pattern)
+    if match:
+        return [namespace_tag(match.group(1))]
+    match = _SCOPE_PATTERN.match(pattern)
+    if match:
+        return [f'{match.group(1)}:{match.group(2)}']
+    return None
+
+
+class CacheTagRegistry:
+    """标签版本号登记表"""
+
+    def __init__(self, redis_cache: Optional[RedisCache] = None,
+                 cache_seconds: float = VERSION_CACHE_SECONDS):
+        self.redis_cache = redis_cache or get_redis_cache()
+        self.cache_seconds = cache_seconds
+        self.lock = threading.Lock()
+
+        # 进程内版本号: tag -> (版本号, 读取时间)
+        self._versions: Dict[str, Tuple[int, float]] = {}
+
+        # 失效监听者（失效广播），本进程失效后以 {标签: 新版本号} 回调 on_tags_invalidated
+        self.listeners = []
+
+        self.stats = {
+            'invalidations': 0,
+            'version_fetches': 0,
+            'stale_entries': 0
+        }
+
+    def _client(self):
+        if self.redis_cache is not None and self.redis_cache.available:
+            return self.redis_cache.client
+        return None
+
+    def get_versions(self, tags: Iterable[str]) -> Dict[str, int]:
+        """
+        获取标签的当前版本号，未失效过的标签版本号为 0
+
+        Args:
+            tags: 标签列表
+
+        Returns:
+            dict: {标签: 版本号}
+        """
+        tags = list(dict.fromkeys(tags))
+        now = time.time()
+        client = self._client()
+        result = {}
+        missing = []
+
+        with self.lock:
+            for tag in tags:
+                cached = self._versions.get(tag)
+                if cached is not None and (client is None or now - cached[1] < self.cache_seconds):
+                    result[tag] = cached[0]
+                else:
+                    missing.append(tag)
+
+        if not missing:
+            return result
+
+        if client is None:
+            # Redis 不可用，进程内版本号即为权威值
+            for tag in missing:
+                result[tag] = 0
+            return result
+
+        try:
+            values = client.mget([VERSION_KEY_PREFIX + tag for tag in missing])
+            self.stats['version_fetches'] += 1
+        except Exception as e:
+            self._log_error('读取标签版本号失败', e)
+            # 读取失败时使用进程内旧值，没有旧值的按 0 处理
+            with self.lock:
+                for tag in missing:
+                    cached = self._versions.get(tag)
+                    result[tag] = cached[0] if cached else 0
+            return result
+
+        with self.lock:
+            for tag, value in zip(missing, values):
+                version = int(value) if value is not None else 0
+                # MGET 期间本进程失效或收到广播的更新版本号不能被读到的旧值覆盖
+                cached = self._versions.get(tag)
+                if cached is not None:
+                    version = max(version, cached[0])
+                self._versions[tag] = (version, now)
+                result[tag] = version
+        return result
+
+    def invalidate(self, *tags: str) -> int:
+        """
+        使标签失效（版本号加一），带有这些标签的缓存项在下次读取时被视为未命中
+
+        Returns:
+            int: 失效的标签数
+        """
+        tags = [tag for tag in dict.fromkeys(tags) if tag]
+        if not tags:
+            return 0
+
+        now = time.time()
+        client = self._client()
+        new_versions = {}
+
+        if client is not None:
+            try:
+                pipe = client.pipeline(transaction=False)
+                for tag in tags:
+                    pipe.incr(VERSION_KEY_PREFIX + tag)
+                new_versions = dict(zip(tags, (int(v) for v in pipe.execute())))
+            except Exception as e:
+                self._log_error('更新标签版本号失败', e)
+
+        with self.lock:
+            for tag in tags:
+                if tag not in new_versions:
+                    cached = self._versions.get(tag)
+                    new_versions[tag] = (cached[0] if cached else 0) + 1
+                self._versions[tag] = (new_versions[tag], now)
+            self.stats['invalidations'] += len(tags)
+
+        for listener in list(self.listeners):
+            try:
+                listener.on_tags_invalidated(new_versions)
+            except Exception as e:
+                self._log_error('通知标签失效失败', e)
+        return len(tags)
+
+    def apply_remote(self, versions: Dict[str, int]):
+        """
+        应用其他进程广播的标签失效
+
+        共享版本号（Redis）时直接采用广播的新版本号；进程内版本号互不相同，
+        此时在本进程的版本号上加一。
+        """
+        now = time.time()
+        shared = self._client() is not None
+        with self.lock:
+            for tag, version in versions.items():
+                cached = self._versions.get(tag)
+                current = cached[0] if cached else 0
+                if shared:
+                    self._versions[tag] = (max(current, int(version)), now)
+                else:
+                    self._versions[tag] = (current + 1, now)
+
+    def wrap(self, value: Any, tags: Iterable[str],
+             versions: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """
+        将缓存值与标签版本号一起包装
+
+        Args:
+            value: 缓存值
+            tags: 标签列表
+            versions: 预先读取的版本号快照，回源前读取可避免回源期间的失效被覆盖
+        """
+        tags = list(dict.fromkeys(tags))
+        if versions is None or any(tag not in versions for tag in tags):
+            versions = self.get_versions(tags)
+        return {
+            TAG_VERSIONS_KEY: {tag: versions[tag] for tag in tags},
+            TAGGED_VALUE_KEY: value
+        }
+
+    @staticmethod
+    def is_tagged(value: Any) -> bool:
+        return isinstance(value, dict) and TAG_VERSIONS_KEY in value and TAGGED_VALUE_KEY in value
+
+    def is_current(self, value: Any) -> bool:
+        """缓存值的标签版本号是否都是最新的，未包装的值总是有效"""
+        if not self.is_tagged(value):
+            return True
+        stored = value[TAG_VERSIONS_KEY] or {}
+        if not stored:
+            return True
+        current = self.get_versions(stored.keys())
+        if all(current.get(tag, 0) == version for tag, version in stored.items()):
+            return True
+        self.stats['stale_entries'] += 1
+        return False
+
+    def unwrap(self, value: Any) -> Any:
+        """取出包装内的缓存值"""
+        if self.is_tagged(value):
+            return value[TAGGED_VALUE_KEY]
+        return value
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.copy()
+        stats['known_tags'] = len(self._versions)
+        stats['shared'] = self._client() is not None
+        return stats
+
+    @staticmethod
+    def _log_error(message: str, error: Exception):
+        if has_app_context():
+            current_app.logger.error(f"{message}: {error}")
+
+
+# 全局标签登记表实例
+_tag_registry = None
+_tag_registry_lock = threading.Lock()
+
+
+def get_tag_registry() -> CacheTagRegistry:
+    """获取全局标签登记表实例"""
+    global _tag_registry
+    if _tag_registry is None:
+        with _tag_registry_lock:
+            if _tag_registry is None:
+                _tag_registry = CacheTagRegistry()
+    return _tag_registry
+
+
+def invalidate_tags(*tags: str) -> int:
+    """使标签失效的便捷函数"""
+    return get_tag_registry().invalidate(*tags)
@@ -2,20 +2,58 @@
 # -*- coding: utf-8 -*-
 """
 缓存预热器
-负责预计算和预热热点数据
+负责预计算和预热热点数据：
+- 变更驱动：订阅写入路径的变更通知（change_feed），只重建受影响的 仓库/日期 对应的缓存键
+- 同一预热目标的连续变更合并为一次（防抖），持续写入时最迟在首次变更后 max_delay 秒执行
+- 到期任务按优先级执行，今日统计等仪表板数据优先
+- 记录每次预热的耗时、排队时间以及触发它的变更事件
+- 定时全量预热只作为兜底，覆盖不经过 ORM 的写入和日期切换
 """
 
+import os
 import time
 import threading
-from datetime import datetime, timedelta
-from typing import Dict, Any, List, Optional
-from flask import current_app
+from collections import deque
+from datetime import datetime, date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from flask import current_app, has_app_context
 from flask_login import current_user
 
 from .dual_cache_manager import get_dual_cache_manager
 from app.models import Warehouse, User
 
 
+# 预热目标：优先级（数值越小越先执行）和缓存类型
+WARM_TARGETS = {
+    'today_stats': {'priority': 0, 'cache_type': 'today_stats'},
+    'inventory_overview': {'priority': 1, 'cache_type': 'inventory_overview'},
+    'warehouse_summary': {'priority': 2, 'cache_type': 'warehouse_summary'},
+    'global_stats': {'priority': 3, 'cache_type': 'dashboard_summary'},
+    'inventory_stats': {'priority': 3, 'cache_type': 'inventory_overview'},
+    'inventory_list': {'priority': 4, 'cache_type': 'inventory_overview'},
+}
+
+# 不区分仓库的预热目标
+GLOBAL_TARGETS = {'global_stats'}
+
+# 变更来源 -> 受影响的预热目标（客户变更影响所在仓库的库存统计中的客户排行）
+CHANGE_DEPENDENCIES = {
+    'inbound': ('today_stats', 'warehouse_summary', 'global_stats'),
+    'outbound': ('today_stats', 'warehouse_summary', 'global_stats'),
+    'inventory': ('inventory_overview', 'warehouse_summary', 'global_stats', 'inventory_stats', 'inventory_list'),
+}
+
+# 只影响当天统计的变更来源，其他日期的变更不触发预热
+DATE_SCOPED_SOURCES = {'inbound', 'outbound'}
+
+# 预热的库存列表页数
+INVENTORY_LIST_PAGES = 3
+
+# 每个预热任务保留的触发事件数、保留的预热记录数
+MAX_TASK_EVENTS = 20
+HISTORY_SIZE = 200
+
+
 class CacheWarmer:
     """缓存预热器"""
     
@@ -23,6 +61,27 @@ class CacheWarmer:
         self.cache_manager = get_dual_cache_manager()
         self.is_warming = False
         self.warm_lock = threading.RLock()
+        
+        # 变更驱动预热
+        self.debounce_seconds = 2.0
+        self.max_delay_seconds = 30.0
+        self._app = None
+        self._pending: Dict[Tuple[str, Optional[int]], Dict[str, Any]] = {}
+        self._queue_cond = threading.Condition()
+        self._worker = None
+        self._worker_pid = None
+        self._stop = threading.Event()
+        
+        # 预热记录
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.target_stats: Dict[str, Dict[str, Any]] = {}
+        self.stats = {
+            'change_events': 0,
+            'events_skipped': 0,
+            'tasks_queued': 0,
+            'events_coalesced': 0,
+            'tasks_run': 0
+        }
     
     def warm_cache(self, cache_type: str = 'dashboard') -> Dict[str, Any]:
         """
@@ -86,37 +145,14 @@ class CacheWarmer:
             
             for warehouse in warehouses:
                 try:
-                    # 预热今日统计
-                    today_data = self._calculate_today_stats(warehouse.id)
-                    if today_data:
-                        key = f"today_stats:{datetime.now().date()}:{warehouse.id}"
-                        if self.cache_manager.set(key, today_data, cache_type='today_stats'):
-                            result['warmed_items'] += 1
-                    
-                    # 预热库存概览
-                    inventory_data = self._calculate_inventory_overview(warehouse.id)
-                    if inventory_data:
-                        key = f"inventory_overview:{warehouse.id}"
-                        if self.cache_manager.set(key, inventory_data, cache_type='inventory_overview'):
-                            result['warmed_items'] += 1
-                    
-                    # 预热仓库汇总
-                    summary_data = self._calculate_warehouse_summary(warehouse.id)
-                    if summary_data:
-                        key = f"warehouse_summary:{warehouse.id}"
-                        if self.cache_manager.set(key, summary_data, cache_type='warehouse_summary'):
-                            result['warmed_items'] += 1
-                    
+                    for target in ('today_stats', 'inventory_overview', 'warehouse_summary'):
+                        result['warmed_items'] += self.warm_target(target, warehouse.id, trigger='schedule')
                 except Exception as e:
                     result['errors'].append(f'仓库{warehouse.warehouse_name}预热失败: {str(e)}')
             
             # 预热全局统计
             try:
-                global_stats = self._calculate_global_stats()
-                if global_stats:
-                    key = "global_stats:today"
-                    if self.cache_manager.set(key, global_stats, cache_type='dashboard_summary'):
-                        result['warmed_items'] += 1
+                result['warmed_items'] += self.warm_target('global_stats', trigger='schedule')
             except Exception as e:
                 result['errors'].append(f'全局统计预热失败: {str(e)}')
             
@@ -130,28 +166,13 @@ class CacheWarmer:
         result = {'warmed_items': 0, 'errors': []}
         
         try:
-            from app.models import Inventory
-            
             # 获取所有活跃仓库
             warehouses = Warehouse.query.filter_by(status='active').all()
             
             for warehouse in warehouses:
                 try:
-                    # 预热库存列表（分页）
-                    for page in range(1, 4):  # 预热前3页
-                        inventory_list = self._get_inventory_page(warehouse.id, page)
-                        if inventory_list:
-                            key = f"inventory_list:{warehouse.id}:page:{page}"
-                            if self.cache_manager.set(key, inventory_list, cache_type='inventory_overview'):
-                                result['warmed_items'] += 1
-                    
-                    # 预热库存统计
-                    inventory_stats = self._calculate_inventory_stats(warehouse.id)
-                    if inventory_stats:
-                        key = f"inventory_stats:{warehouse.id}"
-                        if self.cache_manager.set(key, inventory_stats, cache_type='inventory_overview'):
-                            result['warmed_items'] += 1
-                    
+                    for target in ('inventory_list', 'inventory_stats'):
+                        result['warmed_items'] += self.warm_target(target, warehouse.id, trigger='schedule')
                 except Exception as e:
                     result['errors'].append(f'仓库{warehouse.warehouse_name}库存预热失败: {str(e)}')
         
@@ -160,6 +181,206 @@ class CacheWarmer:
         
         return result
     
+    # ==================== 预热目标 ====================
+    
+    def _build_target(self, target: str, warehouse_id: Optional[int]) -> Dict[str, Any]:
+        """计算预热目标的缓存数据，返回 {缓存键: 值}（计算失败的值不写入）"""
+        if target == 'today_stats':
+            values = {f"today_stats:{datetime.now().date()}:{warehouse_id}": self._calculate_today_stats(warehouse_id)}
+        elif target == 'inventory_overview':
+            values = {f"inventory_overview:{warehouse_id}": self._calculate_inventory_overview(warehouse_id)}
+        elif target == 'warehouse_summary':
+            values = {f"warehouse_summary:{warehouse_id}": self._calculate_warehouse_summary(warehouse_id)}
+        elif target == 'global_stats':
+            values = {"global_stats:today": self._calculate_global_stats()}
+        elif target == 'inventory_stats':
+            values = {f"inventory_stats:{warehouse_id}": self._calculate_inventory_stats(warehouse_id)}
+        elif target == 'inventory_list':
+            values = {f"inventory_list:{warehouse_id}:page:{page}": self._get_inventory_page(warehouse_id, page)
+                      for page in range(1, INVENTORY_LIST_PAGES + 1)}
+        else:
+            raise ValueError(f'未知的预热目标: {target}')
+        return {key: value for key, value in values.items() if value}
+    
+    def warm_target(self, target: str, warehouse_id: Optional[int] = None, trigger: str = 'manual',
+                    events: Optional[List[Dict[str, Any]]] = None, queued_at: Optional[float] = None) -> int:
+        """
+        预热一个目标并记录耗时
+        
+        Args:
+            target: 预热目标，见 WARM_TARGETS
+            warehouse_id: 仓库ID，全局目标为 None
+            trigger: 触发方式 ('change', 'schedule', 'manual')
+            events: 触发本次预热的变更事件
+            queued_at: 变更驱动预热的首次变更时间，用于计算排队时间
+        
+        Returns:
+            int: 写入的缓存项数
+        """
+        started = time.time()
+        record = {
+            'target': target,
+            'warehouse_id': warehouse_id,
+            'trigger': trigger,
+            'events': events or [],
+            'queue_delay_ms': round((started - queued_at) * 1000, 1) if queued_at else None,
+            'keys': 0,
+            'success': False,
+            'error': None
+        }
+        try:
+            values = self._build_target(target, warehouse_id)
+            if values and self.cache_manager.set_many(values, cache_type=WARM_TARGETS[target]['cache_type']):
+                record['keys'] = len(values)
+            record['success'] = True
+            return record['keys']
+        except Exception as e:
+            record['error'] = str(e)
+            raise
+        finally:
+            record['duration_ms'] = round((time.time() - started) * 1000, 1)
+            record['finished_at'] = datetime.now().isoformat()
+            self._record(record)
+    
+    def _record(self, record: Dict[str, Any]):
+        with self._queue_cond:
+            self.history.append(record)
+            stats = self.target_stats.setdefault(record['target'], {
+                'runs': 0, 'failures': 0, 'keys': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'last_ms': 0.0
+            })
+            stats['runs'] += 1
+            stats['failures'] += 0 if record['success'] else 1
+            stats['keys'] += record['keys']
+            stats['total_ms'] += record['duration_ms']
+            stats['max_ms'] = max(stats['max_ms'], record['duration_ms'])
+            stats['last_ms'] = record['duration_ms']
+    
+    # ==================== 变更驱动预热 ====================
+    
+    def on_cache_changes(self, changes):
+        """
+        变更通知回调（事务提交后调用）：把变更转换为预热任务，防抖后由后台线程执行
+        
+        Args:
+            changes: change_feed.ChangeEvent 列表
+        """
+        if self._app is None and has_app_context():
+            self._app = current_app._get_current_object()
+        now = time.time()
+        today = date.today()
+        queued = False
+        
+        with self._queue_cond:
+            for change in changes:
+                self.stats['change_events'] += 1
+                if change.source in DATE_SCOPED_SOURCES and change.stat_date not in (None, today):
+                    self.stats['events_skipped'] += 1
+                    continue
+                event_info = dict(change._asdict(), at=datetime.now().isoformat())
+                for target in CHANGE_DEPENDENCIES.get(change.source, ()):
+                    warehouse_id = None if target in GLOBAL_TARGETS else change.warehouse_id
+                    if warehouse_id is None and target not in GLOBAL_TARGETS:
+                        continue
+                    task = self._pending.get((target, warehouse_id))
+                    if task is None:
+                        task = {
+                            'target': target,
+                            'warehouse_id': warehouse_id,
+                            'priority': WARM_TARGETS[target]['priority'],
+                            'first_seen': now,
+                            'events': []
+                        }
+                        self._pending[(target, warehouse_id)] = task
+                        self.stats['tasks_queued'] += 1
+                    else:
+                        self.stats['events_coalesced'] += 1
+                    # 防抖：每次变更推迟执行，但不晚于首次变更后 max_delay_seconds
+                    task['due'] = min(now + self.debounce_seconds, task['first_seen'] + self.max_delay_seconds)
+                    if len(task['events']) < MAX_TASK_EVENTS and event_info not in task['events']:
+                        task['events'].append(event_info)
+                    queued = True
+            if queued:
+                self._queue_cond.notify()
+        
+        if queued:
+            self._ensure_worker()
+    
+    def _ensure_worker(self):
+        """启动后台预热线程（每个进程一个，fork 后的子进程重新启动）"""
+        with self._queue_cond:
+            if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+                return
+            if self._app is None:
+                return
+            self._stop.clear()
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run_worker, name='cache-warmer', daemon=True)
+            self._worker.start()
+    
+    def _take_due_tasks(self) -> List[Dict[str, Any]]:
+        """取出已到期的任务，按优先级排序"""
+        now = time.time()
+        due = [task for task in self._pending.values() if task['due'] <= now]
+        for task in due:
+            del self._pending[(task['target'], task['warehouse_id'])]
+        return sorted(due, key=lambda task: (task['priority'], task['due']))
+    
+    def _next_wait(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(0.0, min(task['due'] for task in self._pending.values()) - time.time())
+    
+    def _run_worker(self):
+        while not self._stop.is_set():
+            with self._queue_cond:
+                tasks = self._take_due_tasks()
+                if not tasks:
+                    wait = self._next_wait()
+                    self._queue_cond.wait(5.0 if wait is None else wait)
+                    continue
+            
+            with self._app.app_context():
+                for task in tasks:
+                    try:
+                        self.warm_target(task['target'], task['warehouse_id'], trigger='change',
+                                         events=task['events'], queued_at=task['first_seen'])
+                        self.stats['tasks_run'] += 1
+                    except Exception as e:
+                        self._app.logger.error(f"变更驱动预热失败 {task['target']}:{task['warehouse_id']}: {e}")
+    
+    def flush_pending(self) -> int:
+        """立即执行所有待执行的预热任务（忽略防抖），返回执行的任务数"""
+        with self._queue_cond:
+            for task in self._pending.values():
+                task['due'] = 0
+            tasks = self._take_due_tasks()
+        for task in tasks:
+            self.warm_target(task['target'], task['warehouse_id'], trigger='change',
+                             events=task['events'], queued_at=task['first_seen'])
+            self.stats['tasks_run'] += 1
+        return len(tasks)
+    
+    def stop(self):
+        self._stop.set()
+        with self._queue_cond:
+            self._queue_cond.notify()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """预热统计：各目标的执行次数和耗时、待执行任务数"""
+        with self._queue_cond:
+            targets = {}
+            for target, stats in self.target_stats.items():
+                targets[target] = dict(stats, avg_ms=round(stats['total_ms'] / stats['runs'], 1) if stats['runs'] else 0)
+            return dict(self.stats, pending_tasks=len(self._pending), targets=targets,
+                        debounce_seconds=self.debounce_seconds, max_delay_seconds=self.max_delay_seconds)
+    
+    def get_history(self, limit: int = 50, trigger: Optional[str] = None) -> List[Dict[str, Any]]:
+        """最近的预热记录（新的在前），可按触发方式筛选"""
+        with self._queue_cond:
+            records = [record for record in reversed(self.history)
+                       if trigger is None or record['trigger'] == trigger]
+        return records[:limit]
+    
     def _calculate_today_stats(self, warehouse_id: int) -> Optional[Dict[str, Any]]:
         """计算今日统计数据"""
         try:
@@ -399,3 +620,19 @@ def get_cache_warmer() -> CacheWarmer:
     if _cache_warmer is None:
         _cache_warmer = CacheWarmer()
     return _cache_warmer
+
+
+def start_event_warming(app) -> CacheWarmer:
+    """注册变更通知并让预热器订阅，后台线程在第一次变更时启动"""
+    from .change_feed import register_cache_change_feed, subscribers
+    
+    warmer = get_cache_warmer()
+    if not app.config.get('CACHE_EVENT_WARMING_ENABLED', True):
+        return warmer
+    warmer._app = app
+    warmer.debounce_seconds = app.config.get('CACHE_WARM_DEBOUNCE_SECONDS', warmer.debounce_seconds)
+    warmer.max_delay_seconds = app.config.get('CACHE_WARM_MAX_DELAY_SECONDS', warmer.max_delay_seconds)
+    register_cache_change_feed()
+    if warmer not in subscribers:
+        subscribers.append(warmer)
+    return warmer
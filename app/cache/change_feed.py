@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存数据变更通知
+写入路径（入库、出库、库存、在途货物）提交事务后，按本次触及的 仓库+客户+日期 生成变更事件，
+通知订阅者（缓存预热器、HTTP 条件响应的数据版本号）：
+- flush 后收集新增、修改、删除的记录，修改时同时包含修改前的仓库、客户和日期
+- Query.update()/delete() 批量语句按整表变更通知（仓库为 None）
+- 只在事务提交后通知，回滚的写入不会触发
+- insert() 等 Core 语句不经过 ORM，调用方需通过 mark_cache_changes 显式登记
+"""
+
+import logging
+from collections import namedtuple
+from datetime import date, datetime
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+from app.utils.session_events import on_outermost_rollback
+
+logger = logging.getLogger(__name__)
+
+# 变更事件：来源（inbound/outbound/inventory/transit）、仓库ID（整表变更为 None）、客户名称、业务日期（库存为 None）
+ChangeEvent = namedtuple('ChangeEvent', ['source', 'warehouse_id', 'customer_name', 'stat_date'])
+
+# session.info 中保存待通知变更的键
+_PENDING_CHANGES_KEY = 'cache_change_feed_pending'
+
+# 变更订阅者，事务提交后以 [ChangeEvent] 回调 on_cache_changes
+subscribers = []
+
+
+def _change_sources():
+    """参与变更通知的记录类型：(来源, 模型, 业务时间字段名, 仓库字段名)"""
+    from app.models import InboundRecord, OutboundRecord, Inventory, TransitCargo
+    return (
+        ('inbound', InboundRecord, 'inbound_time', ('operated_warehouse_id',)),
+        ('outbound', OutboundRecord, 'outbound_time', ('operated_warehouse_id',)),
+        ('inventory', Inventory, None, ('operated_warehouse_id',)),
+        ('transit', TransitCargo, 'departure_time', ('source_warehouse_id', 'destination_warehouse_id')),
+    )
+
+
+def _to_date(value):
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return None
+
+
+def _values_with_history(obj, field):
+    """字段当前值及本次修改前的值"""
+    values = {getattr(obj, field, None)}
+    try:
+        values.update(attributes.get_history(obj, field).deleted)
+    except Exception:
+        pass
+    return values
+
+
+def _touched_changes(obj, sources):
+    for source, model, time_field, warehouse_fields in sources:
+        if isinstance(obj, model):
+            break
+    else:
+        return set()
+
+    warehouse_ids = set()
+    for field in warehouse_fields:
+        warehouse_ids.update(_values_with_history(obj, field))
+    warehouse_ids.discard(None)
+    customers = _values_with_history(obj, 'customer_name')
+    dates = {_to_date(value) for value in _values_with_history(obj, time_field)} if time_field else {None}
+    return {ChangeEvent(source, warehouse_id, customer, stat_date)
+            for warehouse_id in warehouse_ids
+            for customer in customers
+            for stat_date in dates}
+
+
+def _collect_changes(session, flush_context):
+    """flush 后收集本次写入涉及的 仓库+客户+日期"""
+    pending = None
+    sources = None
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if sources is None:
+            sources = _change_sources()
+        changes = _touched_changes(obj, sources)
+        if changes:
+            if pending is None:
+                pending = session.info.setdefault(_PENDING_CHANGES_KEY, set())
+            pending.update(changes)
+
+
+def _collect_bulk_changes(context):
+    """Query.update()/delete() 批量语句不经过 flush，按整表变更登记"""
+    mapper = getattr(context, 'mapper', None)
+    if mapper is None:
+        return
+    for source, model, _, _ in _change_sources():
+        if issubclass(mapper.class_, model):
+            context.session.info.setdefault(_PENDING_CHANGES_KEY, set()).add(
+                ChangeEvent(source, None, None, None)
+            )
+            return
+
+
+def mark_cache_changes(changes, session=None):
+    """
+    登记批量语句产生的变更，事务提交后一并通知
+
+    Args:
+        changes: ChangeEvent 或 (来源, 仓库ID, 客户名称, 日期) 元组的集合
+    """
+    if session is None:
+        from app import db
+        session = db.session
+    events = {ChangeEvent(source, warehouse_id, customer, _to_date(stat_date))
+              for source, warehouse_id, customer, stat_date in changes}
+    if events:
+        session.info.setdefault(_PENDING_CHANGES_KEY, set()).update(events)
+
+
+def _notify_after_commit(session):
+    """事务提交后通知订阅者，通知失败不影响业务"""
+    changes = session.info.pop(_PENDING_CHANGES_KEY, None)
+    if not changes:
+        return
+    changes = list(changes)
+    for subscriber in list(subscribers):
+        try:
+            subscriber.on_cache_changes(changes)
+        except Exception as e:
+            logger.error(f"缓存变更通知失败: {e}")
+
+
+def _discard_pending(session):
+    """事务回滚时丢弃待通知的变更"""
+    session.info.pop(_PENDING_CHANGES_KEY, None)
+
+
+def register_cache_change_feed():
+    """注册缓存变更通知的会话事件监听器"""
+    if event.contains(Session, 'after_flush', _collect_changes):
+        return
+    event.listen(Session, 'after_flush', _collect_changes)
+    event.listen(Session, 'after_bulk_update', _collect_bulk_changes)
+    event.listen(Session, 'after_bulk_delete', _collect_bulk_changes)
+    event.listen(Session, 'after_commit', _notify_after_commit)
+    on_outermost_rollback(_discard_pending)
+    logger.info("缓存变更通知事件监听器注册完成")
@@ -0,0 +1,360 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存序列化编解码
+L2 Redis 缓存和旧版缓存管理器统一使用的紧凑二进制编码：
+- 默认使用 msgpack（已安装时），datetime/date/time/Decimal/UUID/set/tuple 通过扩展类型编码，读取后类型不变
+- msgpack 未安装时默认使用 pickle 最高协议：含大量 datetime 的列表数据，pickle 比 orjson
+  加扩展类型还原更快、更小；也可通过 CACHE_SERIALIZER 指定 orjson 或 json
+- 指定的格式无法表示的对象（ORM 对象、非字符串键的字典等）回退为 pickle
+- orjson 原生编码 tuple，读取后为 list；msgpack 和 json 格式保留 tuple
+- 超过 compress_threshold 字节的数据使用 zstd 或 lz4 压缩（未安装时使用 zlib）
+- 编码结果带 4 字节头（魔数、格式、压缩方式），旧的 pickle/json/字符串缓存值仍可读取
+"""
+
+import json
+import pickle
+import threading
+import uuid
+import zlib
+from datetime import datetime, date, time as dt_time
+from decimal import Decimal
+from typing import Any, Dict, Optional
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    msgpack = None
+    MSGPACK_AVAILABLE = False
+
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    zstandard = None
+    ZSTD_AVAILABLE = False
+
+try:
+    import lz4.frame as lz4_frame
+    LZ4_AVAILABLE = True
+except ImportError:
+    lz4_frame = None
+    LZ4_AVAILABLE = False
+
+
+# 编码头：魔数 + 格式 + 压缩方式
+MAGIC = b'\xc7W'
+SERIALIZER_CODES = {'msgpack': b'm', 'orjson': b'o', 'json': b'j', 'pickle': b'p'}
+COMPRESSION_CODES = {'none': b'n', 'zstd': b'z', 'lz4': b'l', 'zlib': b'Z'}
+_SERIALIZER_NAMES = {code: name for name, code in SERIALIZER_CODES.items()}
+_COMPRESSION_NAMES = {code: name for name, code in COMPRESSION_CODES.items()}
+
+# 默认压缩阈值（字节）
+DEFAULT_COMPRESS_THRESHOLD = 1024
+
+# JSON 格式中扩展类型的标记键
+_EXT_KEY = '__ext__'
+
+# msgpack 扩展类型编号
+_MSGPACK_EXT_TYPES = {'datetime': 1, 'date': 2, 'time': 3, 'decimal': 4, 'uuid': 5, 'set': 6, 'tuple': 7}
+_MSGPACK_EXT_NAMES = {code: name for name, code in _MSGPACK_EXT_TYPES.items()}
+
+
+class UnsupportedType(TypeError):
+    """序列化格式无法表示的对象，改用 pickle"""
+
+
+def _encode_scalar(value):
+    """扩展类型转换为 (类型名, 字符串/列表)"""
+    if isinstance(value, datetime):
+        return 'datetime', value.isoformat()
+    if isinstance(value, date):
+        return 'date', value.isoformat()
+    if isinstance(value, dt_time):
+        return 'time', value.isoformat()
+    if isinstance(value, Decimal):
+        return 'decimal', str(value)
+    if isinstance(value, uuid.UUID):
+        return 'uuid', str(value)
+    if isinstance(value, (set, frozenset)):
+        return 'set', list(value)
+    raise UnsupportedType(type(value).__name__)
+
+
+def _decode_scalar(name, data):
+    if name == 'datetime':
+        return datetime.fromisoformat(data)
+    if name == 'date':
+        return date.fromisoformat(data)
+    if name == 'time':
+        return dt_time.fromisoformat(data)
+    if name == 'decimal':
+        return Decimal(data)
+    if name == 'uuid':
+        return uuid.UUID(data)
+    if name == 'set':
+        return set(data)
+    if name == 'tuple':
+        return tuple(data)
+    raise ValueError(f'未知扩展类型: {name}')
+
+
+class CacheCodec:
+    """缓存值编解码器"""
+
+    def __init__(self, serializer: str = 'auto', compression: str = 'auto',
+                 compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD):
+        self.serializer = self._choose_serializer(serializer)
+        self.compression = self._choose_compression(compression)
+        self.compress_threshold = compress_threshold
+        self.lock = threading.Lock()
+        self._zstd_compressor = zstandard.ZstdCompressor(level=3) if ZSTD_AVAILABLE else None
+        self._zstd_decompressor = zstandard.ZstdDecompressor() if ZSTD_AVAILABLE else None
+
+        self.stats = {
+            'encoded': 0,
+            'decoded': 0,
+            'raw_bytes': 0,
+            'stored_bytes': 0,
+            'compressed': 0,
+            'pickle_fallbacks': 0,
+            'legacy_decoded': 0
+        }
+
+    @staticmethod
+    def _choose_serializer(serializer: str) -> str:
+        if serializer == 'msgpack' and MSGPACK_AVAILABLE:
+            return 'msgpack'
+        if serializer == 'orjson' and ORJSON_AVAILABLE:
+            return 'orjson'
+        if serializer in ('json', 'pickle'):
+            return serializer
+        if MSGPACK_AVAILABLE:
+            return 'msgpack'
+        return 'pickle'
+
+    @staticmethod
+    def _choose_compression(compression: str) -> str:
+        if compression == 'zstd' and ZSTD_AVAILABLE:
+            return 'zstd'
+        if compression == 'lz4' and LZ4_AVAILABLE:
+            return 'lz4'
+        if compression in ('zlib', 'none'):
+            return compression
+        if ZSTD_AVAILABLE:
+            return 'zstd'
+        if LZ4_AVAILABLE:
+            return 'lz4'
+        return 'zlib'
+
+    # ==================== 编码 ====================
+
+    def dumps(self, value: Any) -> bytes:
+        """编码缓存值"""
+        serializer = self.serializer
+        try:
+            payload = self._serialize(serializer, value)
+        except (UnsupportedType, TypeError, ValueError, OverflowError):
+            serializer = 'pickle'
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            self._count('pickle_fallbacks')
+
+        compression = 'none'
+        if len(payload) >= self.compress_threshold and self.compression != 'none':
+            compressed = self._compress(payload)
+            if len(compressed) < len(payload):
+                compression = self.compression
+                self._count('compressed')
+                stored = compressed
+            else:
+                stored = payload
+        else:
+            stored = payload
+
+        with self.lock:
+            self.stats['encoded'] += 1
+            self.stats['raw_bytes'] += len(payload)
+            self.stats['stored_bytes'] += len(stored) + 4
+        return MAGIC + SERIALIZER_CODES[serializer] + COMPRESSION_CODES[compression] + stored
+
+    def _serialize(self, serializer: str, value: Any) -> bytes:
+        if serializer == 'msgpack':
+            return msgpack.packb(value, default=self._msgpack_default, use_bin_type=True,
+                                 datetime=False, strict_types=True)
+        if serializer == 'orjson':
+            return orjson.dumps(value, default=self._json_default,
+                                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_SUBCLASS)
+        if serializer == 'json':
+            return json.dumps(self._tag_tuples(value), default=self._json_default, ensure_ascii=False,
+                              separators=(',', ':')).encode('utf-8')
+        return pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _msgpack_default(value):
+        if isinstance(value, tuple):
+            return msgpack.ExtType(_MSGPACK_EXT_TYPES['tuple'], msgpack.packb(
+                list(value), default=CacheCodec._msgpack_default, use_bin_type=True, strict_types=True))
+        name, data = _encode_scalar(value)
+        return msgpack.ExtType(_MSGPACK_EXT_TYPES[name], msgpack.packb(
+            data, default=CacheCodec._msgpack_default, use_bin_type=True, strict_types=True))
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, tuple):
+            return {_EXT_KEY: 'tuple', 'v': list(value)}
+        if isinstance(value, (str, int, float, list, dict)):
+            # 基本类型的子类（如枚举）无法保证还原，改用 pickle
+            raise UnsupportedType(type(value).__name__)
+        name, data = _encode_scalar(value)
+        return {_EXT_KEY: name, 'v': data}
+
+    @staticmethod
+    def _tag_tuples(value):
+        """标准库 json 会把 tuple 编码为列表、把非字符串键转为字符串，预先标记 tuple，遇到非字符串键改用 pickle"""
+        if isinstance(value, tuple):
+            return {_EXT_KEY: 'tuple', 'v': [CacheCodec._tag_tuples(v) for v in value]}
+        if isinstance(value, list):
+            return [CacheCodec._tag_tuples(v) for v in value]
+        if isinstance(value, dict):
+            if not all(isinstance(k, str) for k in value):
+                raise UnsupportedType('non-str dict key')
+            return {k: CacheCodec._tag_tuples(v) for k, v in value.items()}
+        return value
+
+    def _compress(self, payload: bytes) -> bytes:
+        if self.compression == 'zstd':
+            return self._zstd_compressor.compress(payload)
+        if self.compression == 'lz4':
+            return lz4_frame.compress(payload)
+        return zlib.compress(payload, 1)
+
+    # ==================== 解码 ====================
+
+    def loads(self, data: Any) -> Any:
+        """解码缓存值，兼容编解码器之前写入的 pickle/json/字符串"""
+        if data is None:
+            return None
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if not data.startswith(MAGIC) or len(data) < 4:
+            self._count('legacy_decoded')
+            return self._loads_legacy(data)
+
+        serializer = _SERIALIZER_NAMES[data[2:3]]
+        compression = _COMPRESSION_NAMES[data[3:4]]
+        payload = self._decompress(compression, data[4:])
+        self._count('decoded')
+
+        if serializer == 'msgpack':
+            return msgpack.unpackb(payload, ext_hook=self._msgpack_ext_hook, raw=False,
+                                   strict_map_key=False)
+        if serializer == 'orjson':
+            return self._restore(orjson.loads(payload))
+        if serializer == 'json':
+            return self._restore(json.loads(payload.decode('utf-8')))
+        return pickle.loads(payload)
+
+    def _decompress(self, compression: str, payload: bytes) -> bytes:
+        if compression == 'none':
+            return payload
+        if compression == 'zstd':
+            if not ZSTD_AVAILABLE:
+                raise ValueError('缓存值使用 zstd 压缩，但 zstandard 未安装')
+            return self._zstd_decompressor.decompress(payload)
+        if compression == 'lz4':
+            if not LZ4_AVAILABLE:
+                raise ValueError('缓存值使用 lz4 压缩，但 lz4 未安装')
+            return lz4_frame.decompress(payload)
+        return zlib.decompress(payload)
+
+    @staticmethod
+    def _msgpack_ext_hook(code, data):
+        name = _MSGPACK_EXT_NAMES.get(code)
+        if name is None:
+            return msgpack.ExtType(code, data)
+        value = msgpack.unpackb(data, ext_hook=CacheCodec._msgpack_ext_hook, raw=False,
+                                strict_map_key=False)
+        return _decode_scalar(name, value)
+
+    @staticmethod
+    def _restore(value):
+        """还原 JSON 中标记的扩展类型（原地替换，只对容器递归）"""
+        if isinstance(value, dict):
+            if _EXT_KEY in value and len(value) == 2 and 'v' in value:
+                data = value['v']
+                if isinstance(data, list):
+                    data = CacheCodec._restore(data)
+                return _decode_scalar(value[_EXT_KEY], data)
+            for k, v in value.items():
+                if isinstance(v, (dict, list)):
+                    value[k] = CacheCodec._restore(v)
+            return value
+        if isinstance(value, list):
+            for i, v in enumerate(value):
+                if isinstance(v, (dict, list)):
+                    value[i] = CacheCodec._restore(v)
+        return value
+
+    @staticmethod
+    def _loads_legacy(data: bytes) -> Any:
+        try:
+            return pickle.loads(data)
+        except Exception:
+            pass
+        try:
+            return json.loads(data.decode('utf-8'))
+        except Exception:
+            return data.decode('utf-8', errors='replace')
+
+    # ==================== 状态 ====================
+
+    def _count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            stats = self.stats.copy()
+        stats.update({
+            'serializer': self.serializer,
+            'compression': self.compression,
+            'compress_threshold': self.compress_threshold,
+            'compression_ratio': (stats['stored_bytes'] / stats['raw_bytes']) if stats['raw_bytes'] else 1.0
+        })
+        return stats
+
+
+# 全局编解码器实例
+_codec: Optional[CacheCodec] = None
+
+
+def get_codec() -> CacheCodec:
+    """
+    获取全局编解码器实例
+
+    应用配置 CACHE_SERIALIZER（auto/msgpack/orjson/json/pickle）、CACHE_COMPRESSION
+    （auto/zstd/lz4/zlib/none）、CACHE_COMPRESS_THRESHOLD 在首次创建时读取
+    """
+    global _codec
+    if _codec is None:
+        options = {}
+        try:
+            from flask import current_app, has_app_context
+            if has_app_context():
+                config = current_app.config
+                options['serializer'] = config.get('CACHE_SERIALIZER', 'auto')
+                options['compression'] = config.get('CACHE_COMPRESSION', 'auto')
+                options['compress_threshold'] = int(config.get('CACHE_COMPRESS_THRESHOLD',
+                                                               DEFAULT_COMPRESS_THRESHOLD))
+        except ImportError:
+            pass
+        _codec = CacheCodec(**options)
+    return _codec
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+HTTP 条件响应（ETag / 304）
+自动刷新的列表和看板接口每次轮询都要重新查询并下载完整 JSON。这里按数据版本号生成 ETag：
+- 每张业务表维护整表和按仓库的变更计数（见 data_versions），写入事务提交后递增，回滚的写入不会改变 ETag
+- before_request 根据路由声明的依赖表计算 ETag，与 If-None-Match 一致时直接返回 304，不执行视图
+- after_request 为 200 的 JSON 响应加上 ETag 和 Cache-Control: private, no-cache，浏览器每次轮询都会带上 ETag 重新验证
+ETag 还包含请求路径和参数、当前用户、当天日期（默认按当天统计的接口跨天后自动失效）以及版本纪元；
+Redis 不可用时版本号只在进程内有效，纪元取进程启动标识，其他进程签发的 ETag 不会被误判为未修改。
+"""
+
+import hashlib
+import threading
+import time
+import uuid
+from collections import namedtuple
+from datetime import date
+from typing import Dict, Iterable, Optional
+
+from flask import g, request, current_app
+from flask_login import current_user
+
+from .cache_tags import get_tag_registry, VERSION_KEY_PREFIX
+from .data_versions import data_version_tags, register_data_versions
+from .route_cache import IGNORED_ARGS, BYPASS_ARGS
+
+# 路由声明：路径前缀、依赖的数据表、仓库范围
+#   scope 为 'user' 时，绑定仓库的非超级管理员只依赖本仓库的变更计数（仅用于只查询本仓库数据的接口）
+ConditionalRoute = namedtuple('ConditionalRoute', ['prefix', 'tables', 'scope'])
+
+CONDITIONAL_ROUTES = (
+    # 库存列表、搜索、统计会关联在途货物
+    ConditionalRoute('/api/inventory/', ('inventory', 'transit'), None),
+    # 在途货物按前端仓出库记录列出，排除后端仓已有入库记录的识别编码
+    ConditionalRoute('/api/inventory/transit', ('outbound', 'inbound'), None),
+    # 前端仓库存按最近的出库记录、入库记录补充车牌、单据等信息
+    ConditionalRoute('/api/inventory/frontend', ('inventory', 'outbound', 'inbound'), None),
+    # 后端库存按入库记录补充板号等信息
+    ConditionalRoute('/api/backend/inventory', ('inventory', 'inbound'), None),
+    ConditionalRoute('/api/transit/cargo/', ('transit',), None),
+    # 报表按各仓库的入库、出库、库存、在途数据汇总
+    ConditionalRoute('/reports/api/', ('inbound', 'outbound', 'inventory', 'transit'), None),
+)
+
+# 数据版本纪元在 Redis 中的键
+EPOCH_KEY = VERSION_KEY_PREFIX + '__epoch__'
+
+# 本进程启动标识，Redis 不可用时作为纪元
+_PROCESS_EPOCH = uuid.uuid4().hex[:12]
+
+
+class ConditionalResponseMiddleware:
+    """基于数据版本号的条件响应中间件"""
+
+    def __init__(self, app=None, routes: Iterable[ConditionalRoute] = CONDITIONAL_ROUTES):
+        self.routes = tuple(sorted(routes, key=lambda route: len(route.prefix), reverse=True))
+        self.registry = None
+        self.enabled = True
+        # 数据版本纪元: (纪元, 读取时间)
+        self._epoch = None
+        self._epoch_lock = threading.Lock()
+
+        self.stats = {
+            'checked': 0,
+            'not_modified': 0,
+            'tagged': 0
+        }
+
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """初始化应用"""
+        self.enabled = app.config.get('CONDITIONAL_RESPONSES_ENABLED', True)
+        if not self.enabled:
+            return
+        try:
+            self.registry = get_tag_registry()
+        except Exception as e:
+            app.logger.warning(f"条件响应中间件初始化失败: {e}")
+            self.enabled = False
+            return
+
+        register_data_versions()
+        app.before_request(self.before_request)
+        app.after_request(self.after_request)
+        app.extensions['conditional_responses'] = self
+        app.logger.info("条件响应（ETag/304）已启用")
+
+    # ---------------- 数据版本纪元 ----------------
+
+    def _get_epoch(self) -> str:
+        """数据版本纪元：Redis 中的版本号被清空后纪元随之变化，旧 ETag 不会误判为未修改"""
+        client = self.registry._client()
+        if client is None:
+            return _PROCESS_EPOCH
+        now = time.time()
+        if self._epoch is not None and now - self._epoch[1] < self.registry.cache_seconds:
+            return self._epoch[0]
+        try:
+            with self._epoch_lock:
+                epoch = client.get(EPOCH_KEY)
+                if epoch is None:
+                    client.set(EPOCH_KEY, str(int(now * 1000)), nx=True)
+                    epoch = client.get(EPOCH_KEY)
+                epoch = epoch.decode() if isinstance(epoch, bytes) else epoch
+                self._epoch = (epoch or _PROCESS_EPOCH, now)
+            return self._epoch[0]
+        except Exception as e:
+            current_app.logger.warning(f"读取数据版本纪元失败: {e}")
+            return _PROCESS_EPOCH
+
+    # ---------------- 请求处理 ----------------
+
+    def match_route(self, path: str) -> Optional[ConditionalRoute]:
+        for route in self.routes:
+            if path.startswith(route.prefix):
+                return route
+        return None
+
+    def _user_scope(self):
+        """返回 (用户标识, 仓库范围)，仓库范围为 None 表示所有仓库"""
+        try:
+            if not current_user.is_authenticated:
+                return 'anonymous', None
+            if current_user.is_super_admin():
+                return f'user:{current_user.id}', None
+            return f'user:{current_user.id}', getattr(current_user, 'warehouse_id', None)
+        except Exception:
+            return 'anonymous', None
+
+    def compute_etag(self, route: ConditionalRoute) -> str:
+        user_key, warehouse_id = self._user_scope()
+        if route.scope != 'user':
+            warehouse_id = None
+
+        tags = []
+        for table in route.tables:
+            tags.extend(data_version_tags(table, warehouse_id))
+        versions = self.registry.get_versions(tags)
+
+        args = sorted((key, value) for key, value in request.args.items(multi=True)
+                      if key not in IGNORED_ARGS)
+        parts = [
+            request.path,
+            repr(args),
+            user_key,
+            date.today().isoformat(),
+            self._get_epoch(),
+            ','.join(f'{tag}={versions.get(tag, 0)}' for tag in tags),
+        ]
+        return hashlib.sha1('|'.join(parts).encode('utf-8')).hexdigest()[:24]
+
+    def before_request(self):
+        """数据未变化时直接返回 304，不执行视图"""
+        if not self.enabled or request.method != 'GET':
+            return None
+        route = self.match_route(request.path)
+        if route is None:
+            return None
+        if any(request.args.get(arg, '').lower() in ('1', 'true', 'yes') for arg in BYPASS_ARGS):
+            return None
+
+        try:
+            etag = self.compute_etag(route)
+        except Exception as e:
+            current_app.logger.warning(f"计算ETag失败: {e}")
+            return None
+
+        # 版本号在视图执行之前读取，执行期间发生的写入会使下次轮询重新获取
+        g.conditional_etag = etag
+        self.stats['checked'] += 1
+        if request.if_none_match.contains_weak(etag):
+            self.stats['not_modified'] += 1
+            response = current_app.response_class(status=304)
+            self._set_headers(response, etag)
+            return response
+        return None
+
+    def after_request(self, response):
+        """为成功的 JSON 响应加上 ETag"""
+        etag = g.pop('conditional_etag', None)
+        if etag is None or response.status_code != 200:
+            return response
+        if response.mimetype != 'application/json' or response.direct_passthrough:
+            return response
+        self._set_headers(response, etag)
+        self.stats['tagged'] += 1
+        return response
+
+    @staticmethod
+    def _set_headers(response, etag: str):
+        # 响应体中可能包含生成时间等字段，使用弱 ETag
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Cookie')
+
+    def get_stats(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+def init_conditional_responses(app) -> ConditionalResponseMiddleware:
+    """注册条件响应中间件"""
+    return ConditionalResponseMiddleware(app)
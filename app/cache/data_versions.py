@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+业务数据版本号
+每张业务表（inbound/outbound/inventory/transit）维护整表和按仓库的变更计数，
+写入事务提交后由缓存变更通知递增。计数保存为缓存标签版本号（Redis 共享并经失效广播同步），
+HTTP 条件响应的 ETag 和路由响应缓存都以这些标签判断数据是否变化。
+"""
+
+import logging
+import threading
+from typing import List
+
+from .cache_tags import get_tag_registry
+from .change_feed import register_cache_change_feed, subscribers
+
+logger = logging.getLogger(__name__)
+
+
+def data_version_tags(table: str, warehouse_id=None) -> List[str]:
+    """
+    数据表（或其中一个仓库）的变更计数标签
+
+    指定仓库时同时包含整表批量变更标签，Query.update()/delete() 等无法确定仓库的写入也会使其变化。
+    """
+    if warehouse_id is None:
+        return [f'data:{table}']
+    return [f'data:{table}:warehouse:{warehouse_id}', f'data:{table}:bulk']
+
+
+class DataVersionTracker:
+    """变更通知订阅者：写入提交后递增受影响数据表的变更计数"""
+
+    def __init__(self):
+        self.registry = get_tag_registry()
+        self.stats = {
+            'commits': 0,
+            'tags_bumped': 0
+        }
+
+    def on_cache_changes(self, changes):
+        tags = set()
+        for change in changes:
+            tags.add(f'data:{change.source}')
+            if change.warehouse_id is None:
+                tags.add(f'data:{change.source}:bulk')
+            else:
+                tags.add(f'data:{change.source}:warehouse:{change.warehouse_id}')
+        if tags:
+            self.registry.invalidate(*sorted(tags))
+            self.stats['commits'] += 1
+            self.stats['tags_bumped'] += len(tags)
+
+
+_tracker = None
+_tracker_lock = threading.Lock()
+
+
+def register_data_versions() -> DataVersionTracker:
+    """注册数据版本号维护（可重复调用）"""
+    global _tracker
+    with _tracker_lock:
+        if _tracker is None:
+            register_cache_change_feed()
+            _tracker = DataVersionTracker()
+            subscribers.append(_tracker)
+            logger.info("业务数据版本号维护已注册")
+    return _tracker
@@ -7,11 +7,12 @@ Redis + 内存缓存双层架构的核心管理器
 
 import time
 import threading
-from typing import Any, Optional, Dict, List, Callable
-from flask import current_app
+from typing import Any, Optional, Dict, Iterable, List, Callable, Union
+from flask import current_app, has_app_context
 
 from .memory_cache import get_memory_cache, MemoryCache
 from .redis_cache import get_redis_cache, RedisCache
+from .cache_tags import get_tag_registry, CacheTagRegistry, tags_for_key, tags_for_pattern
 
 # 整合现有Redis实现
 try:
@@ -21,6 +22,20 @@ except ImportError:
     LEGACY_CACHE_AVAILABLE = False
 
 
+# 带过期时间的缓存值包装键，用于 stale-while-revalidate
+SWR_VALUE_KEY = '__swr_value__'
+SWR_EXPIRES_KEY = '__swr_expires_at__'
+
+
+class _InflightLoad:
+    """同一缓存键正在进行的回源加载"""
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
 class CacheLevel:
     """缓存级别枚举"""
     L1_ONLY = 'l1'
@@ -34,13 +49,23 @@ class DualCacheManager:
     def __init__(self):
         self.l1_cache: MemoryCache = get_memory_cache()
         self.l2_cache: RedisCache = get_redis_cache()
+        # 标签版本号，两层缓存共用
+        self.tags: CacheTagRegistry = get_tag_registry()
+        # 只保护统计计数，不跨越缓存读取和回源
         self.lock = threading.RLock()
+
+        # 按缓存键合并并发回源：同一键只有一个加载者，其余请求等待其结果
+        self._inflight: Dict[str, _InflightLoad] = {}
+        self._inflight_lock = threading.Lock()
+        # 等待其他请求回源的最长时间，超时后自行回源
+        self.load_wait_timeout = 30
         
         # 全系统缓存策略配置
         self.cache_config = {
             # ==================== 仪表板模块 ====================
-            'dashboard_summary': {'l1_ttl': 300, 'l2_ttl': 1800},      # 5分钟/30分钟
-            'today_stats': {'l1_ttl': 60, 'l2_ttl': 300},              # 1分钟/5分钟
+            # stale_ttl: 过期后仍可返回旧值的时间，由一个后台线程刷新
+            'dashboard_summary': {'l1_ttl': 300, 'l2_ttl': 1800, 'stale_ttl': 600},   # 5分钟/30分钟
+            'today_stats': {'l1_ttl': 60, 'l2_ttl': 300, 'stale_ttl': 120},           # 1分钟/5分钟
             'realtime_metrics': {'l1_ttl': 30, 'l2_ttl': 120},         # 30秒/2分钟
 
             # ==================== 库存管理模块 ====================
@@ -88,6 +113,7 @@ class DualCacheManager:
             'weekly_report': {'l1_ttl': 3600, 'l2_ttl': 21600},        # 1小时/6小时
             'monthly_report': {'l1_ttl': 3600, 'l2_ttl': 86400},       # 1小时/24小时
             'historical_stats': {'l1_ttl': 1800, 'l2_ttl': 21600},     # 30分钟/6小时
+            'trend_analysis': {'l1_ttl': 1800, 'l2_ttl': 7200},        # 30分钟/2小时
 
             # ==================== 打印模块 ====================
             'print_templates': {'l1_ttl': 3600, 'l2_ttl': 86400},      # 1小时/24小时
@@ -108,11 +134,18 @@ class DualCacheManager:
             'l2_hits': 0,
             'misses': 0,
             'errors': 0,
-            'fallback_count': 0
+            'fallback_count': 0,
+            'coalesced_waits': 0,
+            'stale_hits': 0,
+            'background_refreshes': 0,
+            'tag_invalidated_hits': 0,
+            'batch_reads': 0,
+            'batch_writes': 0
         }
     
     def get(self, key: str, fallback: Optional[Callable] = None, 
-            cache_type: str = 'default', max_age: int = 0) -> Optional[Any]:
+            cache_type: str = 'default', max_age: int = 0,
+            stale_ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> Optional[Any]:
         """
         获取缓存数据
         
@@ -121,62 +154,274 @@ class DualCacheManager:
             fallback: 缓存未命中时的回调函数
             cache_type: 缓存类型，用于确定TTL策略
             max_age: 最大可接受的数据年龄（秒），0表示不限制
+            stale_ttl: 过期后仍返回旧值并后台刷新的时间（秒），None则使用缓存类型配置
+            tags: 回源写入时附加的标签，缓存键推导出的默认标签总会附加
         """
-        with self.lock:
-            self.stats['total_requests'] += 1
-            start_time = time.time()
+        self._count('total_requests')
+        start_time = time.time()
+        
+        try:
+            # 1. 尝试L1内存缓存
+            value = self._read_level(self.l1_cache, key)
+            if value is not None:
+                self._count('l1_hits')
+                self._log_cache_hit('L1', key, time.time() - start_time)
+                return self._unwrap(key, value, fallback, cache_type, stale_ttl, tags)
             
-            try:
-                # 1. 尝试L1内存缓存
-                value = self.l1_cache.get(key)
+            # 2. 本请求已登记批量读取的键，从批量结果中取（已回填L1），未命中的不再单独访问Redis
+            batcher = self._request_batcher()
+            if batcher is not None and batcher.covers(key):
+                value = batcher.take(key)
+                if value is not None and not self.tags.is_current(value):
+                    value = None
                 if value is not None:
-                    self.stats['l1_hits'] += 1
-                    self._log_cache_hit('L1', key, time.time() - start_time)
-                    return value
-                
-                # 2. 尝试L2 Redis缓存
-                value = self.l2_cache.get(key)
+                    self._count('l2_hits')
+                    self._log_cache_hit('L2-batch', key, time.time() - start_time)
+                    return self._unwrap(key, value, fallback, cache_type, stale_ttl, tags)
+            else:
+                # 3. 尝试L2 Redis缓存
+                value = self._read_level(self.l2_cache, key)
                 if value is not None:
-                    self.stats['l2_hits'] += 1
+                    self._count('l2_hits')
                     
                     # 回填L1缓存
                     l1_ttl = self._get_ttl(cache_type, 'l1_ttl', 300)
                     self.l1_cache.set(key, value, l1_ttl)
                     
                     self._log_cache_hit('L2', key, time.time() - start_time)
-                    return value
-                
-                # 3. 缓存未命中，使用fallback
-                if fallback:
-                    self.stats['misses'] += 1
+                    return self._unwrap(key, value, fallback, cache_type, stale_ttl, tags)
+            
+            # 4. 缓存未命中，同一键的并发请求只回源一次
+            self._count('misses')
+            if fallback:
+                value = self._load(key, fallback, cache_type, stale_ttl, tags)
+                self._log_cache_miss(key, time.time() - start_time)
+                return value
+            
+            return None
+            
+        except Exception as e:
+            self._count('errors')
+            self._log_error('get', key, e)
+            
+            # 降级处理：如果有fallback，尝试执行
+            if fallback:
+                try:
+                    self._count('fallback_count')
+                    return fallback()
+                except Exception as fallback_error:
+                    self._log_error('fallback', key, fallback_error)
+            
+            return None
+    
+    def _read_level(self, cache, key: str) -> Optional[Any]:
+        """读取一层缓存，标签已失效的缓存项视为未命中并删除"""
+        value = cache.get(key)
+        if value is not None and not self.tags.is_current(value):
+            self._count('tag_invalidated_hits')
+            cache.delete(key)
+            return None
+        return value
+    
+    def get_many(self, keys: Iterable[str], fallback: Optional[Callable] = None,
+                 cache_type: str = 'default',
+                 tags: Optional[Union[List[str], Dict[str, List[str]]]] = None) -> Dict[str, Any]:
+        """
+        批量获取缓存数据：L1逐个读取，L1未命中的键一次 MGET 从L2取回并回填L1
+        
+        Args:
+            keys: 缓存键列表
+            fallback: 以未命中的键列表调用一次，返回 {缓存键: 值}，结果批量写入缓存
+            cache_type: 缓存类型，用于确定TTL策略
+            tags: 回源写入时附加的标签，可以是所有键共用的列表或 {缓存键: 标签列表}
+        
+        Returns:
+            dict: {缓存键: 值}，未命中且无法回源的键不在结果中
+        """
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        with self.lock:
+            self.stats['total_requests'] += len(keys)
+            self.stats['batch_reads'] += 1
+        
+        try:
+            raw = self._read_many(keys, cache_type)
+        except Exception as e:
+            self._count('errors')
+            self._log_error('get_many', f'{len(keys)}个键', e)
+            raw = {}
+        
+        result = {}
+        for key, value in raw.items():
+            key_fallback = self._single_fallback(fallback, key) if fallback else None
+            result[key] = self._unwrap(key, value, key_fallback, cache_type, None, self._tags_of(tags, key))
+        
+        missing = [key for key in keys if key not in raw]
+        if missing and fallback:
+            try:
+                result.update(self._load_many(missing, fallback, cache_type, tags))
+            except Exception as e:
+                self._count('errors')
+                self._log_error('fallback', f'{len(missing)}个键', e)
+        return result
+    
+    def _read_many(self, keys: List[str], cache_type: Union[str, Dict[str, str]] = 'default',
+                   count: bool = True) -> Dict[str, Any]:
+        """
+        批量读取两层缓存，返回仍带包装的原始值；L2命中的值回填L1
+        
+        Args:
+            keys: 缓存键列表
+            cache_type: 缓存类型，或 {缓存键: 缓存类型}（决定回填L1的TTL）
+            count: 是否计入命中统计（请求级批量预取时由之后的 get 计入）
+        """
+        found = {}
+        l2_keys = []
+        for key in keys:
+            value = self._read_level(self.l1_cache, key)
+            if value is not None:
+                found[key] = value
+            else:
+                l2_keys.append(key)
+        l1_hits = len(found)
+        
+        if l2_keys:
+            for key, value in self.l2_cache.mget(l2_keys).items():
+                if not self.tags.is_current(value):
+                    self._count('tag_invalidated_hits')
+                    self.l2_cache.delete(key)
+                    continue
+                key_type = cache_type.get(key, 'default') if isinstance(cache_type, dict) else cache_type
+                self.l1_cache.set(key, value, self._get_ttl(key_type, 'l1_ttl', 300))
+                found[key] = value
+        
+        if count:
+            with self.lock:
+                self.stats['l1_hits'] += l1_hits
+                self.stats['l2_hits'] += len(found) - l1_hits
+                self.stats['misses'] += len(keys) - len(found)
+        return found
+    
+    def _load_many(self, keys: List[str], fallback: Callable, cache_type: str,
+                   tags: Optional[Union[List[str], Dict[str, List[str]]]] = None) -> Dict[str, Any]:
+        """批量回源：一次调用 fallback 取回所有未命中的键，并批量写入两层缓存"""
+        # 回源前读取标签版本号，回源期间发生的失效不会被本次写入覆盖
+        all_tags = [tag for key in keys for tag in self._tags_for(key, self._tags_of(tags, key))]
+        tag_versions = self.tags.get_versions(all_tags)
+        
+        loaded = fallback(keys) or {}
+        values = {key: loaded[key] for key in keys if loaded.get(key) is not None}
+        if values:
+            self.set_many(values, cache_type=cache_type, tags=tags, tag_versions=tag_versions)
+        return values
+    
+    @staticmethod
+    def _single_fallback(fallback: Callable, key: str) -> Callable:
+        """把批量 fallback 转换为单个键的 fallback（用于过期值的后台刷新）"""
+        return lambda: (fallback([key]) or {}).get(key)
+    
+    @staticmethod
+    def _tags_of(tags: Optional[Union[List[str], Dict[str, List[str]]]], key: str) -> Optional[List[str]]:
+        if isinstance(tags, dict):
+            return tags.get(key)
+        return tags
+    
+    @staticmethod
+    def _request_batcher():
+        from .request_batcher import get_request_batcher
+        return get_request_batcher(create=False)
+    
+    def _load(self, key: str, fallback: Callable, cache_type: str,
+              stale_ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> Any:
+        """单飞回源：第一个未命中的请求执行 fallback 并写入缓存，其余请求等待结果"""
+        with self._inflight_lock:
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _InflightLoad()
+                self._inflight[key] = flight
+        
+        if not leader:
+            self._count('coalesced_waits')
+            if flight.event.wait(self.load_wait_timeout) and flight.error is None:
+                return flight.value
+            # 加载者失败或超时，自行回源
+            return fallback()
+        
+        try:
+            # 回源前读取标签版本号，回源期间发生的失效不会被本次写入覆盖
+            tag_versions = self.tags.get_versions(self._tags_for(key, tags))
+            value = fallback()
+            if value is not None:
+                self.set(key, value, cache_type=cache_type, stale_ttl=stale_ttl,
+                         tags=tags, tag_versions=tag_versions)
+            flight.value = value
+            return value
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            flight.event.set()
+    
+    def _unwrap(self, key: str, value: Any, fallback: Optional[Callable], cache_type: str,
+                stale_ttl: Optional[int] = None, tags: Optional[List[str]] = None) -> Any:
+        """取出标签和 stale-while-revalidate 包装的值，已过期时触发后台刷新并返回旧值"""
+        value = self.tags.unwrap(value)
+        if not (isinstance(value, dict) and SWR_VALUE_KEY in value):
+            return value
+        
+        if time.time() >= value.get(SWR_EXPIRES_KEY, 0):
+            self._count('stale_hits')
+            if fallback:
+                self._refresh_in_background(key, fallback, cache_type, stale_ttl, tags)
+        return value[SWR_VALUE_KEY]
+    
+    def _refresh_in_background(self, key: str, fallback: Callable, cache_type: str,
+                               stale_ttl: Optional[int] = None, tags: Optional[List[str]] = None):
+        """启动一个后台线程刷新过期的缓存键，同一键同时只刷新一次"""
+        with self._inflight_lock:
+            if key in self._inflight:
+                return
+            flight = _InflightLoad()
+            self._inflight[key] = flight
+        
+        app = current_app._get_current_object() if has_app_context() else None
+        
+        def refresh():
+            try:
+                tag_versions = self.tags.get_versions(self._tags_for(key, tags))
+                if app is not None:
+                    with app.app_context():
+                        value = fallback()
+                else:
                     value = fallback()
-                    
-                    if value is not None:
-                        # 同时写入两层缓存
-                        self.set(key, value, cache_type=cache_type)
-                    
-                    self._log_cache_miss(key, time.time() - start_time)
-                    return value
-                
-                self.stats['misses'] += 1
-                return None
-                
+                if value is not None:
+                    self.set(key, value, cache_type=cache_type, stale_ttl=stale_ttl,
+                             tags=tags, tag_versions=tag_versions)
+                flight.value = value
+                self._count('background_refreshes')
             except Exception as e:
-                self.stats['errors'] += 1
-                self._log_error('get', key, e)
-                
-                # 降级处理：如果有fallback，尝试执行
-                if fallback:
-                    try:
-                        self.stats['fallback_count'] += 1
-                        return fallback()
-                    except Exception as fallback_error:
-                        self._log_error('fallback', key, fallback_error)
-                
-                return None
+                flight.error = e
+                if app is not None:
+                    app.logger.error(f"缓存后台刷新失败 {key}: {e}")
+            finally:
+                with self._inflight_lock:
+                    self._inflight.pop(key, None)
+                flight.event.set()
+        
+        threading.Thread(target=refresh, name=f'cache-refresh:{key}', daemon=True).start()
+    
+    def _count(self, stat: str):
+        with self.lock:
+            self.stats[stat] += 1
     
     def set(self, key: str, value: Any, cache_type: str = 'default', 
-            l1_ttl: Optional[int] = None, l2_ttl: Optional[int] = None) -> bool:
+            l1_ttl: Optional[int] = None, l2_ttl: Optional[int] = None,
+            stale_ttl: Optional[int] = None, tags: Optional[List[str]] = None,
+            tag_versions: Optional[Dict[str, int]] = None) -> bool:
         """
         设置缓存数据
         
@@ -186,13 +431,14 @@ class DualCacheManager:
             cache_type: 缓存类型
             l1_ttl: L1缓存TTL，None则使用默认配置
             l2_ttl: L2缓存TTL，None则使用默认配置
+            stale_ttl: 过期后仍可返回旧值的时间，None则使用缓存类型配置
+            tags: 附加标签，如 ['inventory', 'customer:X']，缓存键推导出的默认标签总会附加
+            tag_versions: 回源前读取的标签版本号快照
         """
         try:
-            # 获取TTL配置
-            if l1_ttl is None:
-                l1_ttl = self._get_ttl(cache_type, 'l1_ttl', 300)
-            if l2_ttl is None:
-                l2_ttl = self._get_ttl(cache_type, 'l2_ttl', 1800)
+            value, l1_ttl, l2_ttl = self._prepare(key, value, cache_type, l1_ttl, l2_ttl,
+                                                  stale_ttl, tags, tag_versions)
+            self._forget_batched(key)
             
             # 同时写入两层缓存
             l1_success = self.l1_cache.set(key, value, l1_ttl)
@@ -205,11 +451,82 @@ class DualCacheManager:
             self._log_error('set', key, e)
             return False
     
+    def set_many(self, mapping: Dict[str, Any], cache_type: str = 'default',
+                 l1_ttl: Optional[int] = None, l2_ttl: Optional[int] = None,
+                 stale_ttl: Optional[int] = None,
+                 tags: Optional[Union[List[str], Dict[str, List[str]]]] = None,
+                 tag_versions: Optional[Dict[str, int]] = None) -> bool:
+        """
+        批量设置缓存数据，L2通过一次 pipeline 写入
+        
+        Args:
+            mapping: {缓存键: 值}
+            tags: 所有键共用的附加标签列表，或 {缓存键: 标签列表}
+            其余参数与 set 相同，同一批次使用相同的缓存类型和TTL
+        """
+        if not mapping:
+            return False
+        try:
+            if tag_versions is None:
+                # 一次读取整批用到的标签版本号
+                tag_versions = self.tags.get_versions(
+                    tag for key in mapping for tag in self._tags_for(key, self._tags_of(tags, key))
+                )
+            
+            prepared = {}
+            final_l1_ttl = final_l2_ttl = None
+            for key, value in mapping.items():
+                prepared[key], final_l1_ttl, final_l2_ttl = self._prepare(
+                    key, value, cache_type, l1_ttl, l2_ttl, stale_ttl, self._tags_of(tags, key), tag_versions
+                )
+                self._forget_batched(key)
+            self._count('batch_writes')
+            
+            l1_success = all([self.l1_cache.set(key, value, final_l1_ttl) for key, value in prepared.items()])
+            l2_success = self.l2_cache.mset(prepared, final_l2_ttl)
+            return l1_success or l2_success
+            
+        except Exception as e:
+            self._log_error('set_many', f'{len(mapping)}个键', e)
+            return False
+    
+    def _prepare(self, key: str, value: Any, cache_type: str, l1_ttl: Optional[int], l2_ttl: Optional[int],
+                 stale_ttl: Optional[int], tags: Optional[List[str]],
+                 tag_versions: Optional[Dict[str, int]]):
+        """计算两层TTL并包装缓存值（过期时间、标签版本号），返回 (值, L1 TTL, L2 TTL)"""
+        # 获取TTL配置
+        if l1_ttl is None:
+            l1_ttl = self._get_ttl(cache_type, 'l1_ttl', 300)
+        if l2_ttl is None:
+            l2_ttl = self._get_ttl(cache_type, 'l2_ttl', 1800)
+        
+        # 启用 stale-while-revalidate 时记录逻辑过期时间，保存时间延长 stale_ttl
+        stale_ttl = self._get_stale_ttl(cache_type, stale_ttl)
+        if stale_ttl > 0:
+            if self.l2_cache.available:
+                value = {SWR_VALUE_KEY: value, SWR_EXPIRES_KEY: time.time() + l2_ttl}
+                l2_ttl += stale_ttl
+            else:
+                value = {SWR_VALUE_KEY: value, SWR_EXPIRES_KEY: time.time() + l1_ttl}
+                l1_ttl += stale_ttl
+        
+        # 记录标签版本号，失效后读取时视为未命中
+        value = self.tags.wrap(value, self._tags_for(key, tags), tag_versions)
+        return value, l1_ttl, l2_ttl
+    
+    def _forget_batched(self, key: str):
+        """键被重新写入或删除后，丢弃本请求批量读取的旧结果"""
+        batcher = self._request_batcher()
+        if batcher is not None:
+            batcher.discard(key)
+    
     def delete(self, key: str) -> bool:
-        """删除缓存项"""
+        """删除缓存项，并通知其他进程删除各自的L1缓存"""
         try:
+            self._forget_batched(key)
             l1_result = self.l1_cache.delete(key)
             l2_result = self.l2_cache.delete(key)
+            self._publish(keys=[key])
             return l1_result or l2_result
         except Exception as e:
             self._log_error('delete', key, e)
@@ -223,19 +540,45 @@ class DualCacheManager:
             self._log_error('exists', key, e)
             return False
     
+    def invalidate_tags(self, *tags: str) -> int:
+        """
+        按标签失效缓存，两层缓存中带有这些标签的缓存项在下次读取时被视为未命中
+        
+        Returns:
+            int: 失效的标签数
+        """
+        try:
+            return self.tags.invalidate(*tags)
+        except Exception as e:
+            self._log_error('invalidate', ','.join(tags), e)
+            return 0
+    
     def clear_cache(self, level: str = 'both', pattern: str = '*') -> Dict[str, int]:
         """
         清理缓存
         
+        可转换为标签的模式（'*'、'<命名空间>:*'、'*:warehouse:X' 等）按标签失效，
+        不扫描 Redis；其他模式按模式逐个删除。
+        
         Args:
             level: 清理级别 ('l1', 'l2', 'both')
             pattern: 匹配模式
         """
-        result = {'l1_cleared': 0, 'l2_cleared': 0, 'total_cleared': 0}
+        result = {'l1_cleared': 0, 'l2_cleared': 0, 'total_cleared': 0, 'tags_invalidated': 0}
         
         try:
+            pattern_tags = tags_for_pattern(pattern) if level in ['l2', 'both'] else None
+            if pattern_tags:
+                result['tags_invalidated'] = self.invalidate_tags(*pattern_tags)
+                if pattern == '*' and level == 'both':
+                    # 整体清空时顺便释放本进程内存
+                    result['l1_cleared'] = self.l1_cache.clear('*')
+                result['total_cleared'] = result['l1_cleared']
+                return result
+            
             if level in ['l1', 'both']:
                 result['l1_cleared'] = self.l1_cache.clear(pattern)
+                self._publish(patterns=[pattern])
             
             if level in ['l2', 'both']:
                 result['l2_cleared'] = self.l2_cache.clear(pattern)
@@ -271,8 +614,17 @@ class DualCacheManager:
                     'miss_rate': (self.stats['misses'] / total_requests * 100) if total_requests > 0 else 0,
                     'error_rate': (self.stats['errors'] / total_requests * 100) if total_requests > 0 else 0,
                     'avg_response_time': 0,  # TODO: 实现响应时间统计
-                    'fallback_count': self.stats['fallback_count']
-                }
+                    'fallback_count': self.stats['fallback_count'],
+                    'coalesced_waits': self.stats['coalesced_waits'],
+                    'stale_hits': self.stats['stale_hits'],
+                    'background_refreshes': self.stats['background_refreshes'],
+                    'inflight_loads': len(self._inflight),
+                    'tag_invalidated_hits': self.stats['tag_invalidated_hits'],
+                    'batch_reads': self.stats['batch_reads'],
+                    'batch_writes': self.stats['batch_writes']
+                },
+                'tags': self.tags.get_stats(),
+                'invalidation_bus': self._bus_stats()
             }
             
         except Exception as e:
@@ -283,6 +635,11 @@ class DualCacheManager:
                 'overall': {'hit_rate': 0}
             }
     
+    @staticmethod
+    def _bus_stats() -> Dict[str, Any]:
+        from .invalidation_bus import get_invalidation_bus
+        return get_invalidation_bus().get_stats()
+    
     def warm_cache(self, cache_data: Dict[str, Any], cache_type: str = 'default') -> Dict[str, Any]:
         """
         缓存预热
@@ -315,11 +672,28 @@ class DualCacheManager:
         
         return result
     
+    @staticmethod
+    def _publish(**kwargs):
+        """广播L1失效（标签失效由标签登记表自动广播）"""
+        from .invalidation_bus import get_invalidation_bus
+        get_invalidation_bus().publish(**kwargs)
+    
+    @staticmethod
+    def _tags_for(key: str, tags: Optional[List[str]] = None) -> List[str]:
+        """缓存键推导出的默认标签加上调用方附加的标签"""
+        return tags_for_key(key) + list(tags or [])
+    
     def _get_ttl(self, cache_type: str, ttl_type: str, default: int) -> int:
         """获取TTL配置"""
         config = self.cache_config.get(cache_type, {})
         return config.get(ttl_type, default)
     
+    def _get_stale_ttl(self, cache_type: str, stale_ttl: Optional[int] = None) -> int:
+        """获取 stale-while-revalidate 时间，0表示不启用"""
+        if stale_ttl is not None:
+            return stale_ttl
+        return self._get_ttl(cache_type, 'stale_ttl', 0)
+    
     def _log_cache_hit(self, level: str, key: str, duration: float):
         """记录缓存命中日志"""
         if current_app and current_app.config.get('DEBUG'):
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+缓存失效广播
+每个 gunicorn 进程都有自己的 L1 内存缓存，本模块把一个进程内的失效操作广播给其他进程：
+- 标签失效（附带新版本号）、按键删除、按模式清理都会广播
+- Redis 可用时通过 pub/sub 频道广播；不可用时通过本机 Unix 数据报套接字目录广播，
+  每个进程绑定一个套接字文件，发送时逐个投递
+- 收到的失效直接作用于本进程的标签版本号和 L1 缓存，通常在毫秒级生效
+- 广播连接正常时，标签版本号的进程内缓存时间放宽到 CONNECTED_VERSION_CACHE_SECONDS，
+  pub/sub 消息丢失时最多延迟该时间
+gunicorn 预加载应用后 fork 的子进程会在第一个请求时重新启动广播线程。
+"""
+
+import atexit
+import glob
+import json
+import os
+import socket
+import threading
+import uuid
+from typing import Any, Dict, Iterable, Optional
+
+from flask import current_app, has_app_context
+
+from .cache_tags import get_tag_registry, VERSION_CACHE_SECONDS
+from .memory_cache import get_memory_cache
+from .redis_cache import get_redis_cache
+
+# Redis pub/sub 频道
+CHANNEL = 'warehouse_system:cache_invalidation'
+
+# 广播连接正常时标签版本号的进程内缓存时间（秒）
+CONNECTED_VERSION_CACHE_SECONDS = 30.0
+
+# 单个数据报的最大长度，超过时不发送（失效消息通常只有几百字节）
+MAX_DATAGRAM_SIZE = 60000
+
+
+class CacheInvalidationBus:
+    """缓存失效广播"""
+
+    def __init__(self, socket_dir: Optional[str] = None):
+        self.registry = get_tag_registry()
+        self.l1_cache = get_memory_cache()
+        self.redis_cache = get_redis_cache()
+        self.socket_dir = socket_dir
+
+        self.origin = None
+        self.transport = None
+        self.connected = False
+        self._pid = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._socket = None
+        self._socket_path = None
+        self._app = None
+
+        self.stats = {
+            'published': 0,
+            'received': 0,
+            'applied_tags': 0,
+            'applied_keys': 0,
+            'applied_patterns': 0,
+            'errors': 0
+        }
+
+    # ==================== 启动 ====================
+
+    def start(self, app=None):
+        """启动订阅线程（每个进程一个），重复调用无副作用"""
+        if app is not None:
+            self._app = app
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            self._reset_after_fork()
+            self._pid = os.getpid()
+            self.origin = f'{socket.gethostname()}:{self._pid}:{uuid.uuid4().hex[:8]}'
+            self._stop.clear()
+
+            if self.redis_cache.available:
+                self.transport = 'redis'
+                target = self._run_redis_subscriber
+            elif self._open_socket():
+                self.transport = 'socket'
+                target = self._run_socket_receiver
+            else:
+                self.transport = None
+                self._log('warning', '缓存失效广播不可用：Redis 未连接且不支持本机套接字')
+                return
+
+            self._thread = threading.Thread(target=target, name='cache-invalidation-bus', daemon=True)
+            self._thread.start()
+
+        if self not in self.registry.listeners:
+            self.registry.listeners.append(self)
+        self._log('info', f'缓存失效广播已启动: {self.transport}')
+
+    def ensure_started(self):
+        """fork 后的子进程中重新启动订阅线程"""
+        if self._pid != os.getpid():
+            self.start()
+
+    def stop(self):
+        self._stop.set()
+        self._set_connected(False)
+        self._close_socket()
+
+    def _reset_after_fork(self):
+        """fork 继承的套接字和线程状态在子进程中无效，重新初始化"""
+        if self._pid is not None and self._pid != os.getpid():
+            self._socket = None
+            self._socket_path = None
+            self._thread = None
+            self.connected = False
+
+    def _set_connected(self, connected: bool):
+        self.connected = connected
+        self.registry.cache_seconds = CONNECTED_VERSION_CACHE_SECONDS if connected else VERSION_CACHE_SECONDS
+
+    # ==================== 发布 ====================
+
+    def on_tags_invalidated(self, versions: Dict[str, int]):
+        """标签登记表失效回调"""
+        self.publish(tags=versions)
+
+    def publish(self, tags: Optional[Dict[str, int]] = None, keys: Optional[Iterable[str]] = None,
+                patterns: Optional[Iterable[str]] = None) -> bool:
+        """
+        广播失效消息
+
+        Args:
+            tags: {标签: 新版本号}
+            keys: 需要从 L1 删除的缓存键
+            patterns: 需要在 L1 按模式清理的模式
+        """
+        if self.transport is None:
+            return False
+        message = {'origin': self.origin}
+        if tags:
+            message['tags'] = dict(tags)
+        if keys:
+            message['keys'] = list(keys)
+        if patterns:
+            message['patterns'] = list(patterns)
+        if len(message) == 1:
+            return False
+
+        try:
+            data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+            if self.transport == 'redis':
+                self.redis_cache.client.publish(CHANNEL, data)
+            else:
+                self._send_datagram(data)
+            self.stats['published'] += 1
+            return True
+        except Exception as e:
+            self.stats['errors'] += 1
+            self._log('error', f'缓存失效广播发送失败: {e}')
+            return False
+
+    # ==================== 接收 ====================
+
+    def apply(self, message: Dict[str, Any]):
+        """将其他进程的失效消息作用于本进程"""
+        if not message or message.get('origin') == self.origin:
+            return
+        self.stats['received'] += 1
+
+        tags = message.get('tags') or {}
+        if tags:
+            self.registry.apply_remote(tags)
+            self.stats['applied_tags'] += len(tags)
+
+        for key in message.get('keys') or []:
+            self.l1_cache.delete(key)
+            self.stats['applied_keys'] += 1
+
+        for pattern in message.get('patterns') or []:
+            self.l1_cache.clear(pattern)
+            self.stats['applied_patterns'] += 1
+
+    def _handle_raw(self, data):
+        try:
+            if isinstance(data, bytes):
+                data = data.decode('utf-8')
+            self.apply(json.loads(data))
+        except Exception as e:
+            self.stats['errors'] += 1
+            self._log('error', f'缓存失效消息处理失败: {e}')
+
+    def _run_redis_subscriber(self):
+        """Redis pub/sub 订阅循环，连接中断后重连"""
+        retry_delay = 1
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_cache.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(CHANNEL)
+                self._set_connected(True)
+                retry_delay = 1
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message.get('type') == 'message':
+                        self._handle_raw(message['data'])
+            except Exception as e:
+                self._set_connected(False)
+                self.stats['errors'] += 1
+                self._log('warning', f'缓存失效订阅中断，{retry_delay}秒后重连: {e}')
+                self._stop.wait(retry_delay)
+                retry_delay = min(retry_delay * 2, 30)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+        self._set_connected(False)
+
+    # ==================== 本机套接字 ====================
+
+    def _get_socket_dir(self) -> str:
+        if self.socket_dir:
+            return self.socket_dir
+        app = self._app or (current_app._get_current_object() if has_app_context() else None)
+        if app is not None:
+            return app.config.get('CACHE_BUS_SOCKET_DIR') or os.path.join(
+                os.path.dirname(app.root_path), 'var', 'cache_bus'
+            )
+        return os.path.join(os.getcwd(), 'var', 'cache_bus')
+
+    def _open_socket(self) -> bool:
+        if not hasattr(socket, 'AF_UNIX'):
+            return False
+        try:
+            socket_dir = self._get_socket_dir()
+            os.makedirs(socket_dir, exist_ok=True)
+            path = os.path.join(socket_dir, f'{os.getpid()}.sock')
+            if os.path.exists(path):
+                os.remove(path)
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            sock.bind(path)
+            sock.settimeout(1.0)
+            self._socket = sock
+            self._socket_path = path
+            self.socket_dir = socket_dir
+            atexit.register(self._close_socket)
+            return True
+        except OSError as e:
+            self._log('warning', f'缓存失效广播套接字创建失败: {e}')
+            return False
+
+    def _close_socket(self):
+        if self._socket is not None:
+            try:
+                self._socket.close()
+            except OSError:
+                pass
+            self._socket = None
+        if self._socket_path and os.path.exists(self._socket_path):
+            try:
+                os.remove(self._socket_path)
+            except OSError:
+                pass
+        self._socket_path = None
+
+    def _run_socket_receiver(self):
+        self._set_connected(True)
+        sock = self._socket
+        while not self._stop.is_set() and sock is not None:
+            try:
+                data = sock.recv(MAX_DATAGRAM_SIZE + 1024)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            self._handle_raw(data)
+        self._set_connected(False)
+
+    def _send_datagram(self, data: bytes):
+        """逐个投递到本机其他进程的套接字，清理已退出进程遗留的套接字文件"""
+        if len(data) > MAX_DATAGRAM_SIZE:
+            raise ValueError(f'失效消息过大: {len(data)} 字节')
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for path in glob.glob(os.path.join(self.socket_dir, '*.sock')):
+                if path == self._socket_path:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    try:
+                        os.remove(path)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    self._log('warning', f'缓存失效消息投递失败 {path}: {e}')
+        finally:
+            sender.close()
+
+    # ==================== 状态 ====================
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = self.stats.copy()
+        stats.update({
+            'transport': self.transport,
+            'connected': self.connected,
+            'origin': self.origin
+        })
+        return stats
+
+    def _log(self, level: str, message: str):
+        app = self._app or (current_app._get_current_object() if has_app_context() else None)
+        if app is not None:
+            getattr(app.logger, level)(message)
+
+
+# 全局失效广播实例
+_invalidation_bus = None
+
+
+def get_invalidation_bus() -> CacheInvalidationBus:
+    """获取全局失效广播实例"""
+    global _invalidation_bus
+    if _invalidation_bus is None:
+        _invalidation_bus = CacheInvalidationBus()
+    return _invalidation_bus
+
+
+def start_invalidation_bus(app):
+    """在应用中启动失效广播，并在每个请求前检查是否需要在 fork 后的子进程中重启"""
+    bus = get_invalidation_bus()
+    if not app.config.get('CACHE_INVALIDATION_BUS_ENABLED', True):
+        return bus
+    bus.start(app)
+    app.before_request(bus.ensure_started)
+    return bus
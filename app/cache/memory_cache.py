@@ -7,24 +7,78 @@ L1 内存缓存层
 
 import time
 import threading
-import pickle
 import sys
-from typing import Any, Optional, Dict, List
-from datetime import datetime, timedelta
+from typing import Any, Optional, Dict, List, Iterable
 from collections import OrderedDict
-import weakref
 import gc
+from abc import ABC, abstractmethod
+
+from flask import current_app, has_app_context
+
+
+# 估算容器大小时每层最多测量的元素数，超过时按样本平均值推算
+SIZE_SAMPLE_ITEMS = 64
+# 估算嵌套对象大小的最大深度
+SIZE_MAX_DEPTH = 6
+
+_ATOMIC_TYPES = (str, bytes, bytearray, int, float, bool, complex, type(None))
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    估算对象占用的内存字节数
+
+    递归累加 sys.getsizeof，不序列化、不复制对象；大容器只测量前 SIZE_SAMPLE_ITEMS 个元素，
+    按平均值推算整体大小，5000 行的库存列表也只需测量几千个对象。
+    """
+    size = sys.getsizeof(value)
+    if _depth >= SIZE_MAX_DEPTH or isinstance(value, _ATOMIC_TYPES):
+        return size
+
+    if isinstance(value, dict):
+        count = len(value)
+        if not count:
+            return size
+        sampled = 0
+        measured = 0
+        for k, v in value.items():
+            measured += estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+            sampled += 1
+            if sampled >= SIZE_SAMPLE_ITEMS:
+                break
+        return size + measured * count // sampled
+
+    if isinstance(value, (list, tuple, set, frozenset)):
+        count = len(value)
+        if not count:
+            return size
+        sampled = 0
+        measured = 0
+        for element in value:
+            measured += estimate_size(element, _depth + 1)
+            sampled += 1
+            if sampled >= SIZE_SAMPLE_ITEMS:
+                break
+        return size + measured * count // sampled
+
+    attributes = getattr(value, '__dict__', None)
+    if isinstance(attributes, dict):
+        size += estimate_size(attributes, _depth + 1)
+    return size
 
 
 class CacheItem:
-    """缓存项"""
+    """缓存项，大小在写入时计算一次"""
+    
+    __slots__ = ('value', 'created_at', 'ttl', 'access_count', 'last_access', 'size')
     
-    def __init__(self, value: Any, ttl: int = 300):
+    def __init__(self, value: Any, ttl: int = 300, size: Optional[int] = None):
         self.value = value
         self.created_at = time.time()
         self.ttl = ttl
         self.access_count = 1
         self.last_access = self.created_at
+        self.size = estimate_size(value) if size is None else size
     
     def is_expired(self) -> bool:
         """检查是否过期"""
@@ -43,21 +97,295 @@ class CacheItem:
     
     def get_size(self) -> int:
         """获取缓存项大小（字节）"""
-        try:
-            return sys.getsizeof(pickle.dumps(self.value))
-        except:
-            return sys.getsizeof(str(self.value))
+        return self.size
+
+
+# ==================== 淘汰策略 ====================
+
+class EvictionPolicy(ABC):
+    """淘汰策略基类，只记录键的顺序/频率，缓存项和字节数由 MemoryCache 维护"""
+    
+    name = 'base'
+    
+    def __init__(self, max_items: int):
+        self.max_items = max_items
+    
+    @abstractmethod
+    def record_insert(self, key: str):
+        """新写入的键"""
+    
+    @abstractmethod
+    def record_access(self, key: str):
+        """命中的键"""
+    
+    def record_miss(self, key: str):
+        """未命中的键（TinyLFU 用于统计访问频率）"""
+    
+    @abstractmethod
+    def remove(self, key: str):
+        """删除或淘汰的键"""
+    
+    @abstractmethod
+    def victim(self) -> Optional[str]:
+        """下一个应淘汰的键"""
+    
+    @abstractmethod
+    def clear(self):
+        """清空全部记录"""
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {'policy': self.name}
+
+
+class LRUPolicy(EvictionPolicy):
+    """最近最少使用"""
+    
+    name = 'lru'
+    
+    def __init__(self, max_items: int):
+        super().__init__(max_items)
+        self.order: OrderedDict = OrderedDict()
+    
+    def record_insert(self, key: str):
+        self.order[key] = None
+        self.order.move_to_end(key)
+    
+    def record_access(self, key: str):
+        if key in self.order:
+            self.order.move_to_end(key)
+    
+    def remove(self, key: str):
+        self.order.pop(key, None)
+    
+    def victim(self) -> Optional[str]:
+        return next(iter(self.order), None)
+    
+    def clear(self):
+        self.order.clear()
+
+
+class LFUPolicy(EvictionPolicy):
+    """最不经常使用，按访问次数分桶，同一次数内按 LRU 淘汰，操作均为 O(1)"""
+    
+    name = 'lfu'
+    
+    def __init__(self, max_items: int):
+        super().__init__(max_items)
+        self.frequencies: Dict[str, int] = {}
+        self.buckets: Dict[int, OrderedDict] = {}
+        self.min_frequency = 0
+    
+    def _add(self, key: str, frequency: int):
+        self.frequencies[key] = frequency
+        self.buckets.setdefault(frequency, OrderedDict())[key] = None
+    
+    def _discard(self, key: str) -> Optional[int]:
+        frequency = self.frequencies.pop(key, None)
+        if frequency is None:
+            return None
+        bucket = self.buckets[frequency]
+        del bucket[key]
+        if not bucket:
+            del self.buckets[frequency]
+            if self.min_frequency == frequency:
+                self.min_frequency = min(self.buckets) if self.buckets else 0
+        return frequency
+    
+    def record_insert(self, key: str):
+        self._discard(key)
+        self._add(key, 1)
+        self.min_frequency = 1
+    
+    def record_access(self, key: str):
+        frequency = self._discard(key)
+        if frequency is None:
+            return
+        self._add(key, frequency + 1)
+        if not self.min_frequency or frequency + 1 < self.min_frequency:
+            self.min_frequency = min(self.buckets)
+    
+    def remove(self, key: str):
+        self._discard(key)
+    
+    def victim(self) -> Optional[str]:
+        bucket = self.buckets.get(self.min_frequency)
+        if not bucket:
+            if not self.buckets:
+                return None
+            self.min_frequency = min(self.buckets)
+            bucket = self.buckets[self.min_frequency]
+        return next(iter(bucket))
+    
+    def clear(self):
+        self.frequencies.clear()
+        self.buckets.clear()
+        self.min_frequency = 0
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {'policy': self.name, 'min_frequency': self.min_frequency,
+                'frequency_buckets': len(self.buckets)}
+
+
+class FrequencySketch:
+    """
+    Count-Min Sketch 访问频率估计，4 行计数器，单个计数上限 15；
+    累计记录次数达到 sample_size 后所有计数减半，使频率随时间衰减
+    """
+    
+    DEPTH = 4
+    MAX_COUNT = 15
+    
+    def __init__(self, capacity: int):
+        width = 16
+        while width < max(capacity, 16):
+            width <<= 1
+        self.mask = width - 1
+        self.table = [[0] * width for _ in range(self.DEPTH)]
+        self.sample_size = max(capacity, 16) * 10
+        self.additions = 0
+        self.resets = 0
+    
+    def _indexes(self, key: str) -> Iterable[int]:
+        h = hash(key)
+        for i in range(self.DEPTH):
+            h = (h * 0x9E3779B1 + i) & 0xFFFFFFFF
+            yield (h ^ (h >> 16)) & self.mask
+    
+    def increment(self, key: str):
+        added = False
+        for row, index in zip(self.table, self._indexes(key)):
+            if row[index] < self.MAX_COUNT:
+                row[index] += 1
+                added = True
+        if added:
+            self.additions += 1
+            if self.additions >= self.sample_size:
+                self._reset()
+    
+    def frequency(self, key: str) -> int:
+        return min(row[index] for row, index in zip(self.table, self._indexes(key)))
+    
+    def _reset(self):
+        for row in self.table:
+            for i, count in enumerate(row):
+                row[i] = count >> 1
+        self.additions //= 2
+        self.resets += 1
+
+
+class WTinyLFUPolicy(EvictionPolicy):
+    """
+    W-TinyLFU：新键先进入 1% 容量的 LRU 窗口，窗口溢出的键成为主区候选；
+    需要淘汰时候选键与主区（分段 LRU）试用段的淘汰键比较 Count-Min 频率，频率低者被淘汰。
+    兼顾突发访问和长期热点，一次性扫描不会冲掉热点数据。
+    """
+    
+    name = 'tinylfu'
+    WINDOW_RATIO = 0.01
+    PROTECTED_RATIO = 0.8
+    
+    def __init__(self, max_items: int):
+        super().__init__(max_items)
+        self.window_capacity = max(1, int(max_items * self.WINDOW_RATIO))
+        main_capacity = max(1, max_items - self.window_capacity)
+        self.protected_capacity = max(1, int(main_capacity * self.PROTECTED_RATIO))
+        self.window: OrderedDict = OrderedDict()
+        # 窗口溢出、尚未通过准入比较的候选键
+        self.candidates: OrderedDict = OrderedDict()
+        self.probation: OrderedDict = OrderedDict()
+        self.protected: OrderedDict = OrderedDict()
+        self.sketch = FrequencySketch(max_items)
+        self.admitted = 0
+        self.rejected = 0
+    
+    def record_insert(self, key: str):
+        self.remove(key)
+        self.sketch.increment(key)
+        self.window[key] = None
+        while len(self.window) > self.window_capacity:
+            candidate, _ = self.window.popitem(last=False)
+            self.candidates[candidate] = None
+    
+    def record_access(self, key: str):
+        self.sketch.increment(key)
+        if key in self.window:
+            self.window.move_to_end(key)
+        elif key in self.protected:
+            self.protected.move_to_end(key)
+        elif key in self.probation or key in self.candidates:
+            # 主区再次命中，晋升到保护段，保护段溢出时降级其最久未用的键
+            self.probation.pop(key, None)
+            self.candidates.pop(key, None)
+            self.protected[key] = None
+            if len(self.protected) > self.protected_capacity:
+                demoted, _ = self.protected.popitem(last=False)
+                self.probation[demoted] = None
+    
+    def record_miss(self, key: str):
+        self.sketch.increment(key)
+    
+    def remove(self, key: str):
+        self.window.pop(key, None)
+        self.candidates.pop(key, None)
+        self.probation.pop(key, None)
+        self.protected.pop(key, None)
+    
+    def victim(self) -> Optional[str]:
+        main_victim = next(iter(self.probation), None) or next(iter(self.protected), None)
+        if self.candidates:
+            candidate = next(iter(self.candidates))
+            if main_victim is None:
+                return candidate
+            if self.sketch.frequency(candidate) > self.sketch.frequency(main_victim):
+                # 候选键准入试用段，淘汰主区的键
+                del self.candidates[candidate]
+                self.probation[candidate] = None
+                self.admitted += 1
+                return main_victim
+            self.rejected += 1
+            return candidate
+        return main_victim or next(iter(self.window), None)
+    
+    def clear(self):
+        self.window.clear()
+        self.candidates.clear()
+        self.probation.clear()
+        self.protected.clear()
+    
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'policy': self.name,
+            'window_items': len(self.window),
+            'candidate_items': len(self.candidates),
+            'probation_items': len(self.probation),
+            'protected_items': len(self.protected),
+            'admitted': self.admitted,
+            'rejected': self.rejected,
+            'sketch_resets': self.sketch.resets
+        }
+
+
+EVICTION_POLICIES = {
+    LRUPolicy.name: LRUPolicy,
+    LFUPolicy.name: LFUPolicy,
+    WTinyLFUPolicy.name: WTinyLFUPolicy,
+}
 
 
 class MemoryCache:
     """L1 内存缓存"""
     
-    def __init__(self, max_size: int = 500, max_items: int = 10000):
+    def __init__(self, max_size: int = 500, max_items: int = 10000, policy: str = 'lru'):
         self.max_size = max_size * 1024 * 1024  # 转换为字节
         self.max_items = max_items
-        self.cache: OrderedDict[str, CacheItem] = OrderedDict()
+        self.cache: Dict[str, CacheItem] = {}
         self.lock = threading.RLock()
         
+        # 淘汰策略与当前占用字节数（写入、删除、淘汰时增量维护）
+        policy_class = EVICTION_POLICIES.get(policy, LRUPolicy)
+        self.policy: EvictionPolicy = policy_class(max_items)
+        self.current_size = 0
+        
         # 统计信息
         self.stats = {
             'hits': 0,
@@ -66,7 +394,9 @@ class MemoryCache:
             'deletes': 0,
             'evictions': 0,
             'size_evictions': 0,
-            'ttl_evictions': 0
+            'ttl_evictions': 0,
+            'rejected_sets': 0,
+            'evicted_bytes': 0
         }
         
         # 启动清理线程
@@ -79,45 +409,58 @@ class MemoryCache:
             
             if item is None:
                 self.stats['misses'] += 1
+                self.policy.record_miss(key)
                 return None
             
             if item.is_expired():
-                del self.cache[key]
+                self._remove(key)
                 self.stats['misses'] += 1
                 self.stats['ttl_evictions'] += 1
                 return None
             
-            # 更新访问信息并移到末尾（LRU）
+            # 更新访问信息
             item.touch()
-            self.cache.move_to_end(key)
+            self.policy.record_access(key)
             self.stats['hits'] += 1
             
             return item.value
     
     def set(self, key: str, value: Any, ttl: int = 300) -> bool:
-        """设置缓存值"""
+        """设置缓存值，大小在写入时估算一次，超过整个容量的值不缓存"""
+        try:
+            # 估算大小只读取对象，放在锁外
+            item = CacheItem(value, ttl)
+        except Exception as e:
+            print(f"内存缓存设置失败: {e}")
+            return False
+        
         with self.lock:
-            try:
-                item = CacheItem(value, ttl)
-                
-                # 检查是否需要清理空间
-                if key not in self.cache:
-                    self._ensure_space(item.get_size())
-                
-                self.cache[key] = item
-                self.cache.move_to_end(key)
-                self.stats['sets'] += 1
-                
-                return True
-            except Exception as e:
-                print(f"内存缓存设置失败: {e}")
+            if item.size > self.max_size:
+                self.stats['rejected_sets'] += 1
+                self._remove(key)
                 return False
+            
+            old_item = self.cache.get(key)
+            if old_item is not None:
+                # 更新已有键：保留其在淘汰策略中的位置/频率
+                self.current_size += item.size - old_item.size
+                item.access_count = old_item.access_count
+                self.cache[key] = item
+                self.policy.record_access(key)
+                self._ensure_space(0, incoming=0)
+            else:
+                self._ensure_space(item.size)
+                self.cache[key] = item
+                self.current_size += item.size
+                self.policy.record_insert(key)
+            
+            self.stats['sets'] += 1
+            return True
     
     def delete(self, key: str) -> bool:
         """删除缓存项"""
         with self.lock:
-            if key in self.cache:
-                del self.cache[key]
+            if self._remove(key):
                 self.stats['deletes'] += 1
                 return True
             return False
@@ -128,16 +471,14 @@ class MemoryCache:
             if pattern == '*':
                 count = len(self.cache)
                 self.cache.clear()
+                self.policy.clear()
+                self.current_size = 0
                 return count
             
             # 模式匹配删除
-            keys_to_delete = []
-            for key in self.cache:
-                if self._match_pattern(key, pattern):
-                    keys_to_delete.append(key)
-            
+            keys_to_delete = [key for key in self.cache if self._match_pattern(key, pattern)]
             for key in keys_to_delete:
-                del self.cache[key]
+                self._remove(key)
             
             return len(keys_to_delete)
     
@@ -155,41 +496,49 @@ class MemoryCache:
             total_requests = self.stats['hits'] + self.stats['misses']
             hit_rate = (self.stats['hits'] / total_requests * 100) if total_requests > 0 else 0
             
-            current_size = sum(item.get_size() for item in self.cache.values())
-            
             return {
                 'available': True,
                 'hit_rate': hit_rate,
                 'key_count': len(self.cache),
-                'memory_usage': current_size / 1024 / 1024,  # MB
+                'max_items': self.max_items,
+                'memory_usage': self.current_size / 1024 / 1024,  # MB
+                'memory_bytes': self.current_size,
                 'max_memory': self.max_size / 1024 / 1024,  # MB
-                'memory_usage_percent': (current_size / self.max_size * 100) if self.max_size > 0 else 0,
+                'memory_usage_percent': (self.current_size / self.max_size * 100) if self.max_size > 0 else 0,
+                'eviction_policy': self.policy.get_stats(),
                 'stats': self.stats.copy()
             }
     
-    def _ensure_space(self, needed_size: int):
-        """确保有足够空间"""
-        current_size = sum(item.get_size() for item in self.cache.values())
-        
-        # 检查数量限制
-        while len(self.cache) >= self.max_items:
-            self._evict_lru()
-            self.stats['evictions'] += 1
-        
-        # 检查大小限制
-        while current_size + needed_size > self.max_size and self.cache:
-            evicted_size = self._evict_lru()
-            current_size -= evicted_size
-            self.stats['size_evictions'] += 1
-    
-    def _evict_lru(self) -> int:
-        """淘汰最少使用的项"""
-        if not self.cache:
-            return 0
-        
-        # 获取最少使用的键
-        key, item = self.cache.popitem(last=False)
-        return item.get_size()
+    def _remove(self, key: str) -> bool:
+        """移除缓存项并扣减占用字节数"""
+        item = self.cache.pop(key, None)
+        if item is None:
+            return False
+        self.current_size -= item.size
+        self.policy.remove(key)
+        return True
+    
+    def _ensure_space(self, needed_size: int, incoming: int = 1):
+        """按淘汰策略腾出空间，直到数量和字节数都在限制内"""
+        while self.cache:
+            over_items = len(self.cache) + incoming > self.max_items
+            over_size = self.current_size + needed_size > self.max_size
+            if not (over_items or over_size):
+                break
+            
+            victim = self.policy.victim()
+            if victim is None or victim not in self.cache:
+                # 策略与缓存不一致（不应发生），退化为淘汰任意一项
+                if victim is not None:
+                    self.policy.remove(victim)
+                victim = next(iter(self.cache))
+            
+            self.stats['evicted_bytes'] += self.cache[victim].size
+            self._remove(victim)
+            if over_items:
+                self.stats['evictions'] += 1
+            else:
+                self.stats['size_evictions'] += 1
     
     def _cleanup_expired(self):
         """清理过期项"""
@@ -200,7 +549,7 @@ class MemoryCache:
                     expired_keys.append(key)
             
             for key in expired_keys:
-                del self.cache[key]
+                self._remove(key)
                 self.stats['ttl_evictions'] += 1
     
     def _start_cleanup_thread(self):
@@ -236,8 +585,22 @@ class MemoryCache:
 _memory_cache = None
 
 def get_memory_cache() -> MemoryCache:
-    """获取全局内存缓存实例"""
+    """
+    获取全局内存缓存实例
+
+    应用配置 MEMORY_CACHE_MAX_MB、MEMORY_CACHE_MAX_ITEMS、MEMORY_CACHE_POLICY（lru/lfu/tinylfu）
+    可调整容量和淘汰策略，在首次创建时读取
+    """
     global _memory_cache
     if _memory_cache is None:
-        _memory_cache = MemoryCache()
+        options = {}
+        if has_app_context():
+            config = current_app.config
+            if config.get('MEMORY_CACHE_MAX_MB'):
+                options['max_size'] = int(config['MEMORY_CACHE_MAX_MB'])
+            if config.get('MEMORY_CACHE_MAX_ITEMS'):
+                options['max_items'] = int(config['MEMORY_CACHE_MAX_ITEMS'])
+            if config.get('MEMORY_CACHE_POLICY'):
+                options['policy'] = config['MEMORY_CACHE_POLICY']
+        _memory_cache = MemoryCache(**options)
     return _memory_cache
@@ -5,14 +5,14 @@ L2 Redis缓存层
 提供分布式缓存服务
 """
 
-import json
-import pickle
 import time
 import redis
 from typing import Any, Optional, Dict, List, Union
 from flask import current_app
 import threading
 
+from .codec import get_codec
+
 
 class RedisCache:
     """L2 Redis缓存"""
@@ -90,14 +90,8 @@ class RedisCache:
                     self.stats['misses'] += 1
                     return None
                 
-                # 尝试反序列化
-                try:
-                    value = pickle.loads(data)
-                except:
-                    try:
-                        value = json.loads(data.decode('utf-8'))
-                    except:
-                        value = data.decode('utf-8')
+                # 反序列化（兼容编解码器之前写入的 pickle/json/字符串）
+                value = get_codec().loads(data)
                 
                 self.stats['hits'] += 1
                 return value
@@ -113,18 +107,10 @@ class RedisCache:
             return False
         
         try:
+            # 序列化数据（不占用锁）
+            data = get_codec().dumps(value)
+            
             with self.lock:
-                # 序列化数据
-                if isinstance(value, (dict, list, tuple)):
-                    try:
-                        data = json.dumps(value, ensure_ascii=False)
-                    except:
-                        data = pickle.dumps(value)
-                elif isinstance(value, str):
-                    data = value
-                else:
-                    data = pickle.dumps(value)
-                
                 # 设置缓存
                 result = self.client.setex(key, ttl, data)
                 
@@ -167,22 +153,31 @@ class RedisCache:
             self._handle_error(e)
             return False
     
+    # 按模式清理时每批扫描/删除的键数
+    SCAN_BATCH_SIZE = 500
+    
     def clear(self, pattern: str = '*') -> int:
-        """清理缓存"""
+        """
+        按模式清理缓存
+        
+        使用 SCAN 分批遍历、UNLINK 异步删除，不使用 KEYS/FLUSHDB，避免阻塞共享的 Redis。
+        常规失效应使用标签（见 cache_tags），本方法仅用于无法转换为标签的模式。
+        """
         if not self.available:
             return 0
         
         try:
-            with self.lock:
-                if pattern == '*':
-                    # 清理所有键（危险操作，仅用于测试）
-                    return self.client.flushdb()
-                
-                # 模式匹配删除
-                keys = self.client.keys(pattern)
-                if keys:
-                    return self.client.delete(*keys)
-                return 0
+            deleted = 0
+            batch = []
+            for key in self.client.scan_iter(match=pattern, count=self.SCAN_BATCH_SIZE):
+                batch.append(key)
+                if len(batch) >= self.SCAN_BATCH_SIZE:
+                    deleted += self.client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted += self.client.unlink(*batch)
+            self.stats['deletes'] += deleted
+            return deleted
                 
         except Exception as e:
             self.stats['errors'] += 1
@@ -199,15 +194,10 @@ class RedisCache:
                 values = self.client.mget(keys)
                 result = {}
                 
+                codec = get_codec()
                 for key, data in zip(keys, values):
                     if data is not None:
-                        try:
-                            result[key] = pickle.loads(data)
-                        except:
-                            try:
-                                result[key] = json.loads(data.decode('utf-8'))
-                            except:
-                                result[key] = data.decode('utf-8')
+                        result[key] = codec.loads(data)
                 
                 return result
                 
@@ -224,20 +214,10 @@ class RedisCache:
             with self.lock:
                 # 使用pipeline提高性能
                 pipe = self.client.pipeline()
+                codec = get_codec()
                 
                 for key, value in mapping.items():
-                    # 序列化数据
-                    if isinstance(value, (dict, list, tuple)):
-                        try:
-                            data = json.dumps(value, ensure_ascii=False)
-                        except:
-                            data = pickle.dumps(value)
-                    elif isinstance(value, str):
-                        data = value
-                    else:
-                        data = pickle.dumps(value)
-                    
-                    pipe.setex(key, ttl, data)
+                    pipe.setex(key, ttl, codec.dumps(value))
                 
                 results = pipe.execute()
                 success_count = sum(1 for r in results if r)
@@ -274,7 +254,8 @@ class RedisCache:
                     'key_count': info.get('db0', {}).get('keys', 0),
                     'memory_usage': info.get('used_memory', 0) / 1024 / 1024,  # MB
                     'connections': info.get('connected_clients', 0),
-                    'stats': self.stats.copy()
+                    'stats': self.stats.copy(),
+                    'codec': get_codec().get_stats()
                 }
                 
         except Exception as e:
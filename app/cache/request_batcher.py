@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+请求级缓存批量读取
+一个页面往往要读取几十个缓存项，逐个 GET 时每一项都是一次 Redis 往返。
+视图先登记本次请求要用到的缓存键，第一次读取其中任一键时一次 MGET 取回全部登记的键并回填L1：
+- 登记的键保存在 flask.g 中，只在当前请求内有效
+- 批量结果只使用一次，同一键再次读取时走正常路径（L1 命中并重新校验标签）
+- 批量结果中没有的键视为已确认未命中，get 直接回源，不再单独访问 Redis
+请求上下文之外调用 prefetch_cache_keys 时立即批量读取并回填L1。
+"""
+
+from typing import Any, Dict, Iterable, Optional, Union
+
+from flask import g, has_request_context
+
+from .dual_cache_manager import get_dual_cache_manager, DualCacheManager
+
+
+class RequestCacheBatcher:
+    """请求级缓存批量读取器"""
+
+    def __init__(self, cache_manager: Optional[DualCacheManager] = None):
+        self.cache_manager = cache_manager or get_dual_cache_manager()
+        # 待读取的键: 缓存键 -> 缓存类型（决定回填L1的TTL）
+        self._pending: Dict[str, str] = {}
+        # 已批量读取的结果: 缓存键 -> 带包装的原始值，未命中为 None
+        self._loaded: Dict[str, Any] = {}
+
+        self.stats = {
+            'batches': 0,
+            'keys': 0,
+            'served': 0
+        }
+
+    def add(self, keys: Dict[str, str]) -> int:
+        """
+        登记需要批量读取的缓存键
+
+        Args:
+            keys: {缓存键: 缓存类型}
+
+        Returns:
+            int: 新登记的键数
+        """
+        added = 0
+        for key, cache_type in keys.items():
+            if key and key not in self._loaded and key not in self._pending:
+                self._pending[key] = cache_type
+                added += 1
+        return added
+
+    def covers(self, key: str) -> bool:
+        """缓存键是否已登记（待读取或已读取未使用）"""
+        return key in self._pending or key in self._loaded
+
+    def take(self, key: str) -> Optional[Any]:
+        """取出批量读取的原始缓存值，尚未读取时先执行批量读取；未命中返回 None"""
+        if key in self._pending:
+            self.flush()
+        value = self._loaded.pop(key, None)
+        if value is not None:
+            self.stats['served'] += 1
+        return value
+
+    def discard(self, key: str):
+        """丢弃缓存键的登记和批量结果（键被重新写入或删除时调用）"""
+        self._pending.pop(key, None)
+        self._loaded.pop(key, None)
+
+    def flush(self) -> int:
+        """
+        一次 MGET 读取所有待读取的键，结果回填L1并保存到本请求
+
+        Returns:
+            int: 命中的键数
+        """
+        if not self._pending:
+            return 0
+        pending, self._pending = self._pending, {}
+        keys = list(pending)
+        try:
+            found = self.cache_manager._read_many(keys, pending, count=False)
+        except Exception as e:
+            self.cache_manager._log_error('batch', f'{len(keys)}个键', e)
+            # 批量读取失败时不登记结果，各键回到单独读取
+            return 0
+
+        for key in keys:
+            self._loaded[key] = found.get(key)
+        self.stats['batches'] += 1
+        self.stats['keys'] += len(keys)
+        return len(found)
+
+
+def get_request_batcher(create: bool = True) -> Optional[RequestCacheBatcher]:
+    """获取当前请求的批量读取器，请求上下文之外返回 None"""
+    if not has_request_context():
+        return None
+    batcher = g.get('_cache_batcher')
+    if batcher is None and create:
+        batcher = RequestCacheBatcher()
+        g._cache_batcher = batcher
+    return batcher
+
+
+def prefetch_cache_keys(keys: Union[Iterable[str], Dict[str, str]], cache_type: str = 'default') -> int:
+    """
+    登记本次请求要读取的缓存键，第一次读取其中任一键时一次 MGET 全部取回
+
+    Args:
+        keys: 缓存键列表，或 {缓存键: 缓存类型}
+        cache_type: keys 为列表时所有键的缓存类型，决定回填L1的TTL
+
+    Returns:
+        int: 登记（或请求上下文之外直接读取）的键数
+    """
+    if isinstance(keys, dict):
+        key_types = {key: key_type for key, key_type in keys.items() if key}
+    else:
+        key_types = {key: cache_type for key in keys if key}
+    batcher = get_request_batcher()
+    if batcher is not None:
+        return batcher.add(key_types)
+
+    # 请求上下文之外（如后台任务）直接批量读取并回填L1
+    if key_types:
+        get_dual_cache_manager()._read_many(list(key_types), key_types, count=False)
+    return len(key_types)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+路由响应缓存声明
+在蓝图路由旁用 @route_cache 声明视图的缓存规则，AutoCacheMiddleware 按声明查找、写入响应缓存：
+
+    @bp.route('/api/transit/cargo/list')
+    @login_required
+    @route_cache(depends_on=('transit',), vary_by=('user', 'args'), ttl=60)
+    def api_transit_cargo_list():
+        ...
+
+- depends_on: 视图读取的业务表，缓存项带上这些表的数据版本号标签，写入提交后自动失效
+- vary_by: 缓存键区分的维度：user（用户）、warehouse（用户所属仓库）、args（查询参数）
+- args: 参与缓存键的查询参数，None 表示全部（前端防缓存的时间戳参数除外）
+- warehouse_scoped: 视图只查询用户所属仓库的数据时为 True，只依赖本仓库的变更计数
+- ttl / cache_type: 缓存时间，ttl 为 None 时使用缓存类型的配置
+- max_bytes: 响应体超过该大小时不缓存
+- permission: 缓存键不区分用户时，命中前检查的权限代码（缓存命中时不会执行视图上的权限装饰器）
+"""
+
+import hashlib
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+# 路由缓存声明的视图函数属性名，functools.wraps 包装后的视图仍然带有该属性
+SPEC_ATTRIBUTE = '_route_cache_spec'
+
+# 已声明缓存的视图: 视图函数全名 -> 缓存声明
+REGISTERED_ROUTE_CACHES: Dict[str, 'RouteCacheSpec'] = {}
+
+# 不参与缓存键的请求参数（前端防缓存的时间戳）
+IGNORED_ARGS = frozenset({'_', 't', 'timestamp'})
+
+# 请求参数中要求跳过缓存的标记
+BYPASS_ARGS = ('refresh', 'force_refresh', 'no_cache')
+
+VARY_OPTIONS = frozenset({'user', 'warehouse', 'args'})
+
+
+@dataclass(frozen=True)
+class RouteCacheSpec:
+    """路由响应缓存声明"""
+    depends_on: Tuple[str, ...]
+    vary_by: Tuple[str, ...] = ('user', 'args')
+    args: Optional[Tuple[str, ...]] = None
+    warehouse_scoped: bool = False
+    ttl: Optional[int] = None
+    cache_type: str = 'default'
+    max_bytes: int = 512 * 1024
+    permission: Optional[str] = None
+
+    def __post_init__(self):
+        unknown = set(self.vary_by) - VARY_OPTIONS
+        if unknown:
+            raise ValueError(f"未知的缓存区分维度: {', '.join(sorted(unknown))}")
+        if self.warehouse_scoped and 'warehouse' not in self.vary_by and 'user' not in self.vary_by:
+            raise ValueError("按仓库依赖变更计数的缓存必须区分用户或仓库")
+
+    def key_args(self, request_args) -> Tuple[Tuple[str, str], ...]:
+        """参与缓存键的查询参数"""
+        return tuple(sorted(
+            (key, value) for key, value in request_args.items(multi=True)
+            if key not in IGNORED_ARGS and (self.args is None or key in self.args)
+        ))
+
+    def build_key(self, endpoint: str, user_id=None, warehouse_id=None, request_args=None) -> str:
+        """
+        生成缓存键：route:<endpoint>[:user:X][:warehouse:Y][:args:<摘要>]
+
+        user:X / warehouse:Y 段使按用户、仓库清理缓存时一并失效。
+        """
+        parts = ['route', endpoint]
+        if 'user' in self.vary_by:
+            parts.extend(['user', str(user_id)])
+        if 'warehouse' in self.vary_by or self.warehouse_scoped:
+            parts.extend(['warehouse', str(warehouse_id) if warehouse_id is not None else 'all'])
+        if 'args' in self.vary_by and request_args is not None:
+            args = self.key_args(request_args)
+            if args:
+                digest = hashlib.md5(repr(args).encode('utf-8')).hexdigest()[:16]
+                parts.extend(['args', digest])
+        return ':'.join(parts)
+
+
+def route_cache(depends_on, vary_by=('user', 'args'), args=None, warehouse_scoped=False,
+                ttl=None, cache_type='default', max_bytes=512 * 1024, permission=None):
+    """
+    声明视图的响应缓存规则（只登记，不包装视图）
+
+    Args:
+        depends_on: 视图读取的业务表（inbound/outbound/inventory/transit）
+        其余参数见模块说明
+    """
+    if isinstance(depends_on, str):
+        depends_on = (depends_on,)
+    spec = RouteCacheSpec(
+        depends_on=tuple(depends_on),
+        vary_by=tuple(vary_by),
+        args=tuple(args) if args is not None else None,
+        warehouse_scoped=warehouse_scoped,
+        ttl=ttl,
+        cache_type=cache_type,
+        max_bytes=max_bytes,
+        permission=permission
+    )
+
+    def decorator(f):
+        setattr(f, SPEC_ATTRIBUTE, spec)
+        REGISTERED_ROUTE_CACHES[f'{f.__module__}.{f.__qualname__}'] = spec
+        return f
+    return decorator
+
+
+def get_route_cache_spec(view_function) -> Optional[RouteCacheSpec]:
+    """视图函数的缓存声明，未声明返回 None"""
+    return getattr(view_function, SPEC_ATTRIBUTE, None)
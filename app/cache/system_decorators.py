@@ -14,6 +14,7 @@ from flask import current_app
 
 from .dual_cache_manager import get_dual_cache_manager
 from .system_cache_config import SystemCacheConfig
+from .cache_decorators import attach_batch_methods
 
 # 整合现有缓存策略
 try:
@@ -46,17 +47,18 @@ def system_cached(cache_type: str = 'default',
         use_legacy: 是否使用现有的缓存策略
     """
     def decorator(func: Callable) -> Callable:
+        def make_key(*args, **kwargs):
+            if key_generator:
+                return key_generator(*args, **kwargs)
+            return generate_system_cache_key(key_prefix or f"func:{func.__name__}", cache_type, *args, **kwargs)
+        
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
             # 获取缓存配置
             cache_config = SystemCacheConfig.get_cache_config(cache_type)
             
             # 生成缓存键
-            if key_generator:
-                cache_key = key_generator(*args, **kwargs)
-            else:
-                prefix = key_prefix or f"func:{func.__name__}"
-                cache_key = generate_system_cache_key(prefix, cache_type, *args, **kwargs)
+            cache_key = make_key(*args, **kwargs)
             
             # 检查缓存条件
             if condition and not condition(*args, **kwargs):
@@ -87,15 +89,17 @@ def system_cached(cache_type: str = 'default',
             return result
         
         # 添加缓存控制方法
-        wrapper.cache_key = lambda *args, **kwargs: generate_system_cache_key(
-            key_prefix or f"func:{func.__name__}", cache_type, *args, **kwargs
-        )
+        wrapper.cache_key = make_key
         wrapper.invalidate = lambda *args, **kwargs: get_dual_cache_manager().delete(
             wrapper.cache_key(*args, **kwargs)
         )
         wrapper.cache_type = cache_type
         
-        return wrapper
+        # 使用旧缓存策略时批量方法逐个调用
+        return attach_batch_methods(
+            wrapper, func, make_key, cache_type, condition=condition,
+            batchable=not (use_legacy and LEGACY_STRATEGIES_AVAILABLE)
+        )
     return decorator
 
 
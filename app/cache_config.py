@@ -3,8 +3,6 @@ Redis缓存配置和连接管理
 """
 
 import redis
-import json
-import pickle
 import time
 from datetime import datetime, timedelta
 from flask import current_app, g
@@ -53,6 +51,7 @@ class RedisManager:
     _instance = None
     _redis_client = None
     _connection_pool = None
+    _binary_client = None
     
     def __new__(cls):
         if cls._instance is None:
@@ -112,6 +111,16 @@ class RedisManager:
             self._init_redis()
         return self._redis_client
     
+    def get_binary_client(self):
+        """获取不解码响应的Redis客户端，用于读写编解码器生成的二进制缓存值"""
+        if self._binary_client is None and self.get_client() is not None:
+            pool_kwargs = dict(self._connection_pool.connection_kwargs)
+            pool_kwargs['decode_responses'] = False
+            RedisManager._binary_client = redis.Redis(connection_pool=redis.ConnectionPool(
+                max_connections=CacheConfig.REDIS_MAX_CONNECTIONS, **pool_kwargs
+            ))
+        return self._binary_client
+    
     def is_available(self):
         """检查Redis是否可用"""
         try:
@@ -130,12 +139,30 @@ class RedisManager:
             self._redis_client = None
 
 
+def _tag_registry():
+    """标签版本号登记表（延迟导入，避免与 app.cache 循环导入）"""
+    from app.cache.cache_tags import get_tag_registry
+    return get_tag_registry()
+
+
 class CacheManager:
     """缓存管理器"""
     
     def __init__(self):
         self.redis_manager = RedisManager()
     
+    @staticmethod
+    def _get_tags(key_type, user_id=None, warehouse_id=None, tags=None):
+        """缓存项的标签：全局标签、key_type 命名空间、用户、仓库及附加标签"""
+        from app.cache.cache_tags import GLOBAL_TAG, namespace_tag
+        result = [GLOBAL_TAG, namespace_tag(key_type)]
+        if user_id:
+            result.append(f"user:{user_id}")
+        if warehouse_id:
+            result.append(f"warehouse:{warehouse_id}")
+        result.extend(tags or [])
+        return result
+    
     def _get_cache_key(self, key_type, identifier, user_id=None, warehouse_id=None):
         """生成缓存键"""
         key_parts = [CacheConfig.CACHE_KEY_PREFIX, CacheConfig.CACHE_VERSION, key_type]
@@ -150,33 +177,27 @@ class CacheManager:
         return ":".join(key_parts)
     
     def _serialize_data(self, data):
-        """序列化数据"""
+        """序列化数据（与L2缓存使用同一编解码器）"""
         try:
-            # 对于简单数据类型使用JSON
-            if isinstance(data, (dict, list, str, int, float, bool)) or data is None:
-                return json.dumps(data, ensure_ascii=False, default=str)
-            else:
-                # 对于复杂对象使用pickle
-                return pickle.dumps(data)
+            from app.cache.codec import get_codec
+            return get_codec().dumps(data)
         except Exception as e:
             current_app.logger.error(f"数据序列化失败: {str(e)}")
             return None
     
-    def _deserialize_data(self, data, use_pickle=False):
-        """反序列化数据"""
+    def _deserialize_data(self, data):
+        """反序列化数据，兼容编解码器之前写入的JSON"""
         try:
-            if use_pickle:
-                return pickle.loads(data)
-            else:
-                return json.loads(data)
+            from app.cache.codec import get_codec
+            return get_codec().loads(data)
         except Exception as e:
             current_app.logger.error(f"数据反序列化失败: {str(e)}")
             return None
     
-    def set(self, key_type, identifier, data, timeout=None, user_id=None, warehouse_id=None):
-        """设置缓存"""
+    def set(self, key_type, identifier, data, timeout=None, user_id=None, warehouse_id=None, tags=None):
+        """设置缓存，tags 为附加标签（如 ['warehouse:3']），失效时使用 invalidate_tags"""
         try:
-            redis_client = self.redis_manager.get_client()
+            redis_client = self.redis_manager.get_binary_client()
             if not redis_client:
                 return False
             
@@ -186,7 +207,8 @@ class CacheManager:
             if timeout is None:
                 timeout = CacheConfig.CACHE_TIMEOUT.get(key_type, 3600)
             
-            # 序列化数据
+            # 记录标签版本号后序列化数据
+            data = _tag_registry().wrap(data, self._get_tags(key_type, user_id, warehouse_id, tags))
             serialized_data = self._serialize_data(data)
             if serialized_data is None:
                 return False
@@ -214,7 +236,7 @@ class CacheManager:
     def get(self, key_type, identifier, user_id=None, warehouse_id=None):
         """获取缓存"""
         try:
-            redis_client = self.redis_manager.get_client()
+            redis_client = self.redis_manager.get_binary_client()
             if not redis_client:
                 return None
             
@@ -226,12 +248,14 @@ class CacheManager:
                 return None
             
             # 反序列化数据
-            try:
-                # 首先尝试JSON反序列化
-                data = self._deserialize_data(cached_data, use_pickle=False)
-            except:
-                # 如果JSON失败，尝试pickle反序列化
-                data = self._deserialize_data(cached_data, use_pickle=True)
+            data = self._deserialize_data(cached_data)
+            
+            # 标签已失效的缓存项视为未命中并删除
+            registry = _tag_registry()
+            if not registry.is_current(data):
+                redis_client.delete(cache_key)
+                return None
+            data = registry.unwrap(data)
             
             if data is not None:
                 current_app.logger.debug(f"缓存命中: {cache_key}")
@@ -262,8 +286,34 @@ class CacheManager:
             current_app.logger.error(f"删除缓存失败: {str(e)}")
             return False
     
+    def invalidate_tags(self, *tags):
+        """
+        按标签失效缓存（标签版本号加一），不扫描 Redis
+        
+        Returns:
+            int: 失效的标签数
+        """
+        try:
+            count = _tag_registry().invalidate(*tags)
+            current_app.logger.debug(f"缓存标签失效: {', '.join(tags)}")
+            return count
+        except Exception as e:
+            current_app.logger.error(f"缓存标签失效失败: {str(e)}")
+            return 0
+    
     def delete_pattern(self, pattern):
-        """批量删除匹配模式的缓存"""
+        """
+        批量删除匹配模式的缓存
+        
+        'inventory_list*'、'*user_5*'、'*warehouse_3*' 等模式按标签失效，返回失效的标签数；
+        其他模式使用 SCAN 分批删除，返回删除的键数。
+        """
+        from app.cache.cache_tags import tags_for_pattern
+        
+        pattern_tags = tags_for_pattern(pattern)
+        if pattern_tags:
+            return self.invalidate_tags(*pattern_tags)
+        
         try:
             redis_client = self.redis_manager.get_client()
             if not redis_client:
@@ -272,16 +322,20 @@ class CacheManager:
             # 构建完整的模式
             full_pattern = f"{CacheConfig.CACHE_KEY_PREFIX}:{CacheConfig.CACHE_VERSION}:{pattern}"
             
-            # 获取匹配的键
-            keys = redis_client.keys(full_pattern)
-            
-            if keys:
-                # 批量删除
-                deleted_count = redis_client.delete(*keys)
+            # 分批扫描删除，避免 KEYS 阻塞 Redis
+            deleted_count = 0
+            batch = []
+            for key in redis_client.scan_iter(match=full_pattern, count=500):
+                batch.append(key)
+                if len(batch) >= 500:
+                    deleted_count += redis_client.unlink(*batch)
+                    batch = []
+            if batch:
+                deleted_count += redis_client.unlink(*batch)
+            
+            if deleted_count:
                 current_app.logger.info(f"批量删除缓存: {deleted_count} 个键")
-                return deleted_count
-            
-            return 0
+            return deleted_count
             
         except Exception as e:
             current_app.logger.error(f"批量删除缓存失败: {str(e)}")
@@ -289,21 +343,17 @@ class CacheManager:
     
     def clear_user_cache(self, user_id):
         """清除用户相关缓存"""
-        pattern = f"*user_{user_id}*"
-        return self.delete_pattern(pattern)
+        return self.invalidate_tags(f"user:{user_id}")
     
     def clear_warehouse_cache(self, warehouse_id):
         """清除仓库相关缓存"""
-        pattern = f"*warehouse_{warehouse_id}*"
-        return self.delete_pattern(pattern)
+        return self.invalidate_tags(f"warehouse:{warehouse_id}")
     
     def clear_inventory_cache(self):
         """清除库存相关缓存"""
-        patterns = ['inventory_list*', 'aggregated_data*', 'statistics*']
-        total_deleted = 0
-        for pattern in patterns:
-            total_deleted += self.delete_pattern(pattern)
-        return total_deleted
+        from app.cache.cache_tags import namespace_tag
+        return self.invalidate_tags(*[namespace_tag(key_type) for key_type in
+                                      ('inventory_list', 'aggregated_data', 'statistics')])
     
     def get_cache_stats(self):
         """获取缓存统计信息"""
@@ -314,8 +364,10 @@ class CacheManager:
             
             info = redis_client.info()
             
-            # 获取我们的缓存键数量
-            our_keys = redis_client.keys(f"{CacheConfig.CACHE_KEY_PREFIX}:*")
+            # 获取我们的缓存键数量（SCAN 分批遍历，不阻塞 Redis）
+            our_key_count = sum(1 for _ in redis_client.scan_iter(
+                match=f"{CacheConfig.CACHE_KEY_PREFIX}:*", count=500
+            ))
             
             return {
                 'redis_version': info.get('redis_version'),
@@ -324,7 +376,7 @@ class CacheManager:
                 'total_commands_processed': info.get('total_commands_processed'),
                 'keyspace_hits': info.get('keyspace_hits', 0),
                 'keyspace_misses': info.get('keyspace_misses', 0),
-                'our_cache_keys': len(our_keys),
+                'our_cache_keys': our_key_count,
                 'hit_rate': self._calculate_hit_rate(
                     info.get('keyspace_hits', 0),
                     info.get('keyspace_misses', 0)
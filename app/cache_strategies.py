@@ -3,6 +3,7 @@ Redis缓存策略和数据结构设计 - 简化版本
 """
 
 from app.cache_config import get_cache_manager
+from app.cache.cache_tags import namespace_tag
 from flask import current_app, request, g
 from flask_login import current_user
 import time
@@ -13,6 +14,16 @@ from datetime import datetime, timedelta
 class InventoryCacheStrategy:
     """库存数据缓存策略"""
     
+    # 全部仓库的库存列表使用的标签，任一仓库库存变更都会失效
+    ALL_WAREHOUSES_TAG = 'inventory:all_warehouses'
+    
+    @staticmethod
+    def get_cache_tags(warehouse_id=None):
+        """库存列表缓存标签"""
+        if warehouse_id:
+            return [f'inventory:warehouse:{warehouse_id}']
+        return [InventoryCacheStrategy.ALL_WAREHOUSES_TAG]
+    
     @staticmethod
     def get_cache_key(warehouse_id=None, search_params=None, page=1, per_page=50):
         """生成库存查询缓存键"""
@@ -47,7 +58,8 @@ class InventoryCacheStrategy:
             'per_page': per_page
         }
         
-        return get_cache_manager().set('inventory_list', cache_key, cache_data, timeout=3600)
+        return get_cache_manager().set('inventory_list', cache_key, cache_data, timeout=3600,
+                                       tags=InventoryCacheStrategy.get_cache_tags(warehouse_id))
     
     @staticmethod
     def get_cached_inventory_list(warehouse_id, search_params, page, per_page):
@@ -67,13 +79,14 @@ class InventoryCacheStrategy:
     def invalidate_inventory_cache(warehouse_id=None):
         """使库存缓存失效"""
         if warehouse_id:
-            # 清除特定仓库的缓存
-            pattern = f'inventory_list*warehouse_{warehouse_id}*'
-        else:
-            # 清除所有库存缓存
-            pattern = 'inventory_list*'
+            # 清除特定仓库及全部仓库汇总的缓存
+            return get_cache_manager().invalidate_tags(
+                *InventoryCacheStrategy.get_cache_tags(warehouse_id),
+                InventoryCacheStrategy.ALL_WAREHOUSES_TAG
+            )
         
-        return get_cache_manager().delete_pattern(pattern)
+        # 清除所有库存缓存
+        return get_cache_manager().invalidate_tags(namespace_tag('inventory_list'))
 
 
 class UserCacheStrategy:
@@ -82,7 +95,8 @@ class UserCacheStrategy:
     @staticmethod
     def cache_user_info(user_id, user_data):
         """缓存用户信息"""
-        return get_cache_manager().set('user_info', user_id, user_data, timeout=1800)
+        return get_cache_manager().set('user_info', user_id, user_data, timeout=1800,
+                                       tags=[f'user:{user_id}'])
     
     @staticmethod
     def get_cached_user_info(user_id):
@@ -92,7 +106,8 @@ class UserCacheStrategy:
     @staticmethod
     def cache_user_permissions(user_id, permissions):
         """缓存用户权限"""
-        return get_cache_manager().set('permissions', user_id, permissions, timeout=1800)
+        return get_cache_manager().set('permissions', user_id, permissions, timeout=1800,
+                                       tags=[f'user:{user_id}'])
     
     @staticmethod
     def get_cached_user_permissions(user_id):
@@ -123,7 +138,8 @@ class WarehouseCacheStrategy:
     @staticmethod
     def cache_warehouse_info(warehouse_id, warehouse_data):
         """缓存单个仓库信息"""
-        return get_cache_manager().set('warehouse_info', warehouse_id, warehouse_data, timeout=3600)
+        return get_cache_manager().set('warehouse_info', warehouse_id, warehouse_data, timeout=3600,
+                                       tags=[f'warehouse:{warehouse_id}'])
     
     @staticmethod
     def get_cached_warehouse_info(warehouse_id):
@@ -269,7 +285,8 @@ class StatisticsCacheStrategy:
     @staticmethod
     def cache_warehouse_stats(warehouse_id, stats_data):
         """缓存仓库统计数据"""
-        return get_cache_manager().set('statistics', f'warehouse_{warehouse_id}', stats_data, timeout=900)
+        return get_cache_manager().set('statistics', f'warehouse_{warehouse_id}', stats_data, timeout=900,
+                                       tags=[f'warehouse:{warehouse_id}'])
 
     @staticmethod
     def get_cached_warehouse_stats(warehouse_id):
@@ -4,6 +4,7 @@ from app import db, csrf
 from app.customer import bp
 from app.models import InboundRecord, OutboundRecord, User
 from app.decorators import require_permission
+from app.utils.keyset_pagination import keyset_paginate
 from datetime import datetime, timedelta
 
 @bp.route('/dashboard')
@@ -159,8 +160,11 @@ def api_customer_inbound_list():
         if date_end:
             query = query.filter(InboundRecord.inbound_time <= datetime.strptime(date_end + ' 23:59:59', '%Y-%m-%d %H:%M:%S'))
         
-        records = query.order_by(InboundRecord.inbound_time.desc())\
-                      .paginate(page=page, per_page=per_page, error_out=False)
+        records = keyset_paginate(
+            query, InboundRecord.inbound_time, InboundRecord.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            descending=True, count_mode=request.args.get('count', 'exact')
+        )
         
         return jsonify({
             'records': [{
@@ -179,7 +183,10 @@ def api_customer_inbound_list():
             'pages': records.pages,
             'current_page': records.page,
             'has_next': records.has_next,
-            'has_prev': records.has_prev
+            'has_prev': records.has_prev,
+            'total_is_estimate': records.total_is_estimate,
+            'next_cursor': records.next_cursor,
+            'prev_cursor': records.prev_cursor
         })
         
     except Exception as e:
@@ -208,8 +215,11 @@ def api_customer_outbound_list():
         if date_end:
             query = query.filter(OutboundRecord.outbound_time <= datetime.strptime(date_end + ' 23:59:59', '%Y-%m-%d %H:%M:%S'))
         
-        records = query.order_by(OutboundRecord.outbound_time.desc())\
-                      .paginate(page=page, per_page=per_page, error_out=False)
+        records = keyset_paginate(
+            query, OutboundRecord.outbound_time, OutboundRecord.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            descending=True, count_mode=request.args.get('count', 'exact')
+        )
         
         return jsonify({
             'records': [{
@@ -229,7 +239,10 @@ def api_customer_outbound_list():
             'pages': records.pages,
             'current_page': records.page,
             'has_next': records.has_next,
-            'has_prev': records.has_prev
+            'has_prev': records.has_prev,
+            'total_is_estimate': records.total_is_estimate,
+            'next_cursor': records.next_cursor,
+            'prev_cursor': records.prev_cursor
         })
         
     except Exception as e:
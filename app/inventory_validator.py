@@ -2,89 +2,129 @@
 # -*- coding: utf-8 -*-
 """
 库存数据一致性验证器
-在关键业务节点自动验证数据一致性
+在关键业务节点自动验证数据一致性：
+- 写入 flush 后收集涉及的识别编码（接收记录删除、出库记录创建、库存记录更新），同一事务内去重
+- 事务提交后把识别编码放入后台验证队列，回滚的写入不验证；不在请求中执行任何验证查询
+- 后台线程防抖合并多个请求的识别编码，每批用一条
+  GROUP BY identification_code, warehouse_id 的对账查询核对入库、接收、出库和库存
 """
 
 import logging
+import os
+import threading
+import time
+from collections import deque
 from datetime import datetime
 from functools import wraps
-from flask import current_app, g
-from sqlalchemy import event
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, literal, select, union_all
+from sqlalchemy.orm import Session
 from app.models import InboundRecord, OutboundRecord, Inventory, ReceiveRecord, TransitCargo, db
+from app.utils.session_events import on_outermost_rollback
+
+logger = logging.getLogger(__name__)
+
+# session.info 中保存待验证识别编码的键
+_PENDING_CODES_KEY = 'inventory_validation_pending'
+
+# 最近发现的不一致记录数
+HISTORY_SIZE = 200
+
 
 class InventoryValidator:
     """库存数据一致性验证器"""
-    
+
+    # 每条对账查询处理的识别编码数
+    BATCH_SIZE = 500
+
     @staticmethod
-    def validate_identification_code(identification_code):
-        """验证特定识别码的库存一致性"""
-        try:
-            # 计算理论库存
-            inbound_records = InboundRecord.query.filter_by(identification_code=identification_code).all()
-            outbound_records = OutboundRecord.query.filter_by(identification_code=identification_code).all()
-            receive_records = ReceiveRecord.query.filter_by(identification_code=identification_code).all()
-            inventory_records = Inventory.query.filter_by(identification_code=identification_code).all()
-            
-            # 按仓库分组计算理论库存
-            warehouse_balance = {}
-            
-            # 入库增加库存
-            for record in inbound_records:
-                wh_id = record.operated_warehouse_id
-                if wh_id not in warehouse_balance:
-                    warehouse_balance[wh_id] = {'pallets': 0, 'packages': 0}
-                warehouse_balance[wh_id]['pallets'] += record.pallet_count or 0
-                warehouse_balance[wh_id]['packages'] += record.package_count or 0
-            
-            # 接收增加库存
-            for record in receive_records:
-                wh_id = record.operated_warehouse_id
-                if wh_id not in warehouse_balance:
-                    warehouse_balance[wh_id] = {'pallets': 0, 'packages': 0}
-                warehouse_balance[wh_id]['pallets'] += record.pallet_count or 0
-                warehouse_balance[wh_id]['packages'] += record.package_count or 0
-            
-            # 出库减少库存
-            for record in outbound_records:
-                wh_id = record.operated_warehouse_id
-                if wh_id in warehouse_balance:
-                    warehouse_balance[wh_id]['pallets'] -= record.pallet_count or 0
-                    warehouse_balance[wh_id]['packages'] -= record.package_count or 0
-            
-            # 计算实际库存
-            actual_inventory = {}
-            for record in inventory_records:
-                wh_id = record.operated_warehouse_id
-                if wh_id not in actual_inventory:
-                    actual_inventory[wh_id] = {'pallets': 0, 'packages': 0}
-                actual_inventory[wh_id]['pallets'] += record.pallet_count or 0
-                actual_inventory[wh_id]['packages'] += record.package_count or 0
-            
-            # 检查一致性
-            inconsistencies = []
-            all_warehouses = set(warehouse_balance.keys()) | set(actual_inventory.keys())
-            
-            for wh_id in all_warehouses:
-                theoretical = warehouse_balance.get(wh_id, {'pallets': 0, 'packages': 0})
-                actual = actual_inventory.get(wh_id, {'pallets': 0, 'packages': 0})
-                
-                if theoretical['pallets'] != actual['pallets'] or theoretical['packages'] != actual['packages']:
-                    inconsistencies.append({
+    def _flow_select(model, codes, kind):
+        """一张表按 识别编码+仓库 的数量流水，各类流水放在不同的列中"""
+        table = model.__table__
+        pallets = func.coalesce(table.c.pallet_count, 0)
+        packages = func.coalesce(table.c.package_count, 0)
+        zero = literal(0)
+        columns = {
+            'inflow': (pallets, packages, zero, zero, zero, zero, literal(1), zero),
+            'outflow': (zero, zero, pallets, packages, zero, zero, zero, zero),
+            'stock': (zero, zero, zero, zero, pallets, packages, zero, literal(1)),
+        }[kind]
+        labels = ('in_pallets', 'in_packages', 'out_pallets', 'out_packages',
+                  'stock_pallets', 'stock_packages', 'inflow_rows', 'stock_rows')
+        return select(
+            table.c.identification_code.label('identification_code'),
+            table.c.operated_warehouse_id.label('warehouse_id'),
+            *[column.label(label) for column, label in zip(columns, labels)]
+        ).where(table.c.identification_code.in_(codes))
+
+    @classmethod
+    def reconcile(cls, identification_codes):
+        """
+        批量核对识别编码的库存一致性（每批一条对账查询）
+
+        理论库存 = 入库 + 接收 - 出库（仓库没有入库或接收时不扣减出库，与逐条核对的口径一致），
+        与同仓库的实际库存比较。
+
+        Returns:
+            dict: 识别编码 -> 不一致明细列表，一致的识别编码不出现在结果中
+        """
+        codes = sorted({code for code in identification_codes if code})
+        results = {}
+        for start in range(0, len(codes), cls.BATCH_SIZE):
+            chunk = codes[start:start + cls.BATCH_SIZE]
+            flows = union_all(
+                cls._flow_select(InboundRecord, chunk, 'inflow'),
+                cls._flow_select(ReceiveRecord, chunk, 'inflow'),
+                cls._flow_select(OutboundRecord, chunk, 'outflow'),
+                cls._flow_select(Inventory, chunk, 'stock'),
+            ).subquery()
+            rows = db.session.execute(
+                select(
+                    flows.c.identification_code,
+                    flows.c.warehouse_id,
+                    func.sum(flows.c.in_pallets), func.sum(flows.c.in_packages),
+                    func.sum(flows.c.out_pallets), func.sum(flows.c.out_packages),
+                    func.sum(flows.c.stock_pallets), func.sum(flows.c.stock_packages),
+                    func.sum(flows.c.inflow_rows), func.sum(flows.c.stock_rows)
+                ).group_by(flows.c.identification_code, flows.c.warehouse_id)
+            ).all()
+
+            for (code, wh_id, in_pallets, in_packages, out_pallets, out_packages,
+                 stock_pallets, stock_packages, inflow_rows, stock_rows) in rows:
+                # 只有出库流水的仓库不参与核对
+                if not inflow_rows and not stock_rows:
+                    continue
+                theoretical_pallets = int(in_pallets or 0)
+                theoretical_packages = int(in_packages or 0)
+                if inflow_rows:
+                    theoretical_pallets -= int(out_pallets or 0)
+                    theoretical_packages -= int(out_packages or 0)
+                actual_pallets = int(stock_pallets or 0)
+                actual_packages = int(stock_packages or 0)
+
+                if theoretical_pallets != actual_pallets or theoretical_packages != actual_packages:
+                    results.setdefault(code, []).append({
                         'warehouse_id': wh_id,
-                        'theoretical_pallets': theoretical['pallets'],
-                        'actual_pallets': actual['pallets'],
-                        'theoretical_packages': theoretical['packages'],
-                        'actual_packages': actual['packages'],
-                        'pallet_diff': actual['pallets'] - theoretical['pallets'],
-                        'package_diff': actual['packages'] - theoretical['packages']
+                        'theoretical_pallets': theoretical_pallets,
+                        'actual_pallets': actual_pallets,
+                        'theoretical_packages': theoretical_packages,
+                        'actual_packages': actual_packages,
+                        'pallet_diff': actual_pallets - theoretical_pallets,
+                        'package_diff': actual_packages - theoretical_packages
                     })
-            
+        return results
+
+    @classmethod
+    def validate_identification_code(cls, identification_code):
+        """验证特定识别码的库存一致性"""
+        try:
+            inconsistencies = cls.reconcile([identification_code]).get(identification_code, [])
             return len(inconsistencies) == 0, inconsistencies
-            
+
         except Exception as e:
             current_app.logger.error(f"库存一致性验证失败 {identification_code}: {e}")
             return False, [{'error': str(e)}]
-    
+
     @staticmethod
     def log_inconsistency(identification_code, inconsistencies, operation_type="unknown"):
         """记录库存不一致问题"""
@@ -95,13 +135,164 @@ class InventoryValidator:
                     log_message += f"\n  错误: {item['error']}"
                 else:
                     log_message += f"\n  仓库ID {item['warehouse_id']}: 理论{item['theoretical_pallets']}板 vs 实际{item['actual_pallets']}板 (差异{item['pallet_diff']}板)"
-            
-            current_app.logger.warning(log_message)
-            
+
+            logger.warning(log_message)
+
             # 可以在这里添加更多的通知机制，比如发送邮件、钉钉通知等
-            
+
         except Exception as e:
-            current_app.logger.error(f"记录库存不一致日志失败: {e}")
+            logger.error(f"记录库存不一致日志失败: {e}")
+
+
+class ValidationQueue:
+    """后台库存验证队列：合并各请求提交的识别编码，防抖后批量核对"""
+
+    def __init__(self):
+        self.debounce_seconds = 2.0
+        self.max_delay_seconds = 30.0
+        self._app = None
+        # 识别编码 -> 触发验证的操作类型
+        self._pending = {}
+        self._first_seen = None
+        self._last_seen = None
+        self._queue_cond = threading.Condition()
+        self._worker = None
+        self._worker_pid = None
+        self._stop = threading.Event()
+
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.stats = {
+            'codes_queued': 0,
+            'codes_coalesced': 0,
+            'runs': 0,
+            'codes_checked': 0,
+            'inconsistent_codes': 0,
+            'errors': 0,
+            'total_ms': 0.0,
+            'last_run_at': None
+        }
+
+    def enqueue(self, codes):
+        """
+        加入待验证的识别编码
+
+        Args:
+            codes: 识别编码 -> 操作类型 的字典
+        """
+        if not codes:
+            return
+        if self._app is None and has_app_context():
+            self._app = current_app._get_current_object()
+        now = time.time()
+        with self._queue_cond:
+            for code, operation_type in codes.items():
+                if code in self._pending:
+                    self.stats['codes_coalesced'] += 1
+                else:
+                    self.stats['codes_queued'] += 1
+                self._pending[code] = operation_type
+            if self._first_seen is None:
+                self._first_seen = now
+            self._last_seen = now
+            self._queue_cond.notify()
+        self._ensure_worker()
+
+    def _ensure_worker(self):
+        """启动后台验证线程（每个进程一个，fork 后的子进程重新启动）"""
+        with self._queue_cond:
+            if self._worker_pid == os.getpid() and self._worker is not None and self._worker.is_alive():
+                return
+            if self._app is None:
+                return
+            self._stop.clear()
+            self._worker_pid = os.getpid()
+            self._worker = threading.Thread(target=self._run_worker, name='inventory-validator', daemon=True)
+            self._worker.start()
+
+    def _due_at(self):
+        if not self._pending:
+            return None
+        return min(self._last_seen + self.debounce_seconds, self._first_seen + self.max_delay_seconds)
+
+    def _take_pending(self):
+        pending = self._pending
+        self._pending = {}
+        self._first_seen = None
+        self._last_seen = None
+        return pending
+
+    def _run_worker(self):
+        while not self._stop.is_set():
+            with self._queue_cond:
+                due_at = self._due_at()
+                if due_at is None or due_at > time.time():
+                    self._queue_cond.wait(5.0 if due_at is None else max(0.0, due_at - time.time()))
+                    continue
+                pending = self._take_pending()
+
+            with self._app.app_context():
+                try:
+                    self.run(pending)
+                finally:
+                    db.session.remove()
+
+    def run(self, pending):
+        """核对一批识别编码并记录不一致，返回不一致的识别编码数"""
+        started = time.time()
+        try:
+            results = InventoryValidator.reconcile(pending)
+        except Exception as e:
+            with self._queue_cond:
+                self.stats['errors'] += 1
+            logger.error(f"库存一致性批量验证失败: {e}")
+            return 0
+
+        for code, inconsistencies in results.items():
+            InventoryValidator.log_inconsistency(code, inconsistencies, pending.get(code, "批量验证"))
+
+        duration_ms = (time.time() - started) * 1000
+        with self._queue_cond:
+            self.stats['runs'] += 1
+            self.stats['codes_checked'] += len(pending)
+            self.stats['inconsistent_codes'] += len(results)
+            self.stats['total_ms'] += duration_ms
+            self.stats['last_run_at'] = datetime.now().isoformat()
+            for code, inconsistencies in results.items():
+                self.history.append({
+                    'identification_code': code,
+                    'operation_type': pending.get(code),
+                    'inconsistencies': inconsistencies,
+                    'detected_at': self.stats['last_run_at']
+                })
+        return len(results)
+
+    def flush_pending(self):
+        """立即验证所有待验证的识别编码（忽略防抖），返回不一致的识别编码数"""
+        with self._queue_cond:
+            pending = self._take_pending()
+        return self.run(pending) if pending else 0
+
+    def stop(self):
+        self._stop.set()
+        with self._queue_cond:
+            self._queue_cond.notify()
+
+    def get_stats(self):
+        """验证统计：待验证数、已核对数、发现的不一致数和平均耗时"""
+        with self._queue_cond:
+            avg_ms = round(self.stats['total_ms'] / self.stats['runs'], 1) if self.stats['runs'] else 0
+            return dict(self.stats, total_ms=round(self.stats['total_ms'], 1), avg_ms=avg_ms,
+                        pending_codes=len(self._pending), debounce_seconds=self.debounce_seconds)
+
+    def get_history(self, limit=50):
+        """最近发现的不一致记录"""
+        with self._queue_cond:
+            return list(self.history)[-limit:][::-1]
+
+
+# 全局验证队列
+validation_queue = ValidationQueue()
+
 
 def validate_after_operation(operation_type):
     """装饰器：在操作后验证库存一致性"""
@@ -110,157 +301,136 @@ def validate_after_operation(operation_type):
         def wrapper(*args, **kwargs):
             # 执行原始操作
             result = func(*args, **kwargs)
-            
+
             try:
                 # 尝试从请求或参数中获取识别码
                 identification_code = None
-                
+
                 # 从Flask请求中获取
                 from flask import request
                 if request and request.form:
                     identification_code = request.form.get('identification_code')
                 elif request and request.json:
                     identification_code = request.json.get('identification_code')
-                
+
                 # 从函数参数中获取
                 if not identification_code and args:
                     for arg in args:
                         if hasattr(arg, 'identification_code'):
                             identification_code = arg.identification_code
                             break
-                
+
                 # 从kwargs中获取
                 if not identification_code:
                     identification_code = kwargs.get('identification_code')
-                
+
                 if identification_code:
-                    # 验证库存一致性
-                    is_consistent, inconsistencies = InventoryValidator.validate_identification_code(identification_code)
-                    
-                    if not is_consistent:
-                        InventoryValidator.log_inconsistency(identification_code, inconsistencies, operation_type)
-                        current_app.logger.warning(f"操作后检测到库存不一致: {operation_type} - {identification_code}")
-                    else:
-                        current_app.logger.info(f"操作后库存一致性验证通过: {operation_type} - {identification_code}")
-                
+                    # 放入后台验证队列
+                    validation_queue.enqueue({identification_code: operation_type})
+
             except Exception as e:
                 current_app.logger.error(f"操作后库存验证失败: {e}")
-            
+
             return result
         return wrapper
     return decorator
 
-# 数据库事件监听器
-@event.listens_for(ReceiveRecord, 'after_delete')
-def after_receive_record_delete(mapper, connection, target):
-    """接收记录删除后验证库存一致性"""
-    try:
-        # 延迟验证，确保事务完成
-        def delayed_validation():
-            try:
-                is_consistent, inconsistencies = InventoryValidator.validate_identification_code(target.identification_code)
-                if not is_consistent:
-                    InventoryValidator.log_inconsistency(target.identification_code, inconsistencies, "接收记录删除")
-            except Exception as e:
-                current_app.logger.error(f"接收记录删除后验证失败: {e}")
-        
-        # 在请求结束后执行验证
-        if hasattr(g, 'delayed_validations'):
-            g.delayed_validations.append(delayed_validation)
-        else:
-            g.delayed_validations = [delayed_validation]
-            
-    except Exception as e:
-        current_app.logger.error(f"设置接收记录删除后验证失败: {e}")
 
-@event.listens_for(OutboundRecord, 'after_insert')
-def after_outbound_record_insert(mapper, connection, target):
-    """出库记录创建后验证库存一致性"""
-    try:
-        def delayed_validation():
-            try:
-                is_consistent, inconsistencies = InventoryValidator.validate_identification_code(target.identification_code)
-                if not is_consistent:
-                    InventoryValidator.log_inconsistency(target.identification_code, inconsistencies, "出库记录创建")
-            except Exception as e:
-                current_app.logger.error(f"出库记录创建后验证失败: {e}")
-        
-        if hasattr(g, 'delayed_validations'):
-            g.delayed_validations.append(delayed_validation)
-        else:
-            g.delayed_validations = [delayed_validation]
-            
-    except Exception as e:
-        current_app.logger.error(f"设置出库记录创建后验证失败: {e}")
+# ---------------- 数据库事件监听 ----------------
+
+def _collect_validation_codes(session, flush_context):
+    """flush 后收集需要验证的识别编码：接收记录删除、出库记录创建、库存记录更新"""
+    pending = None
+    touched = (
+        (session.deleted, ReceiveRecord, "接收记录删除"),
+        (session.new, OutboundRecord, "出库记录创建"),
+        (session.dirty, Inventory, "库存记录更新"),
+    )
+    for objects, model, operation_type in touched:
+        for obj in objects:
+            if not isinstance(obj, model) or not obj.identification_code:
+                continue
+            if model is Inventory and not session.is_modified(obj):
+                continue
+            if pending is None:
+                pending = session.info.setdefault(_PENDING_CODES_KEY, {})
+            pending.setdefault(obj.identification_code, operation_type)
+
+
+def _enqueue_after_commit(session):
+    pending = session.info.pop(_PENDING_CODES_KEY, None)
+    if pending:
+        validation_queue.enqueue(pending)
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_PENDING_CODES_KEY, None)
+
+
+def register_inventory_validation_events():
+    """注册库存验证的会话事件监听器（可重复调用）"""
+    if event.contains(Session, 'after_flush', _collect_validation_codes):
+        return
+    event.listen(Session, 'after_flush', _collect_validation_codes)
+    event.listen(Session, 'after_commit', _enqueue_after_commit)
+    on_outermost_rollback(_discard_after_rollback)
 
-@event.listens_for(Inventory, 'after_update')
-def after_inventory_update(mapper, connection, target):
-    """库存记录更新后验证一致性"""
-    try:
-        def delayed_validation():
-            try:
-                is_consistent, inconsistencies = InventoryValidator.validate_identification_code(target.identification_code)
-                if not is_consistent:
-                    InventoryValidator.log_inconsistency(target.identification_code, inconsistencies, "库存记录更新")
-            except Exception as e:
-                current_app.logger.error(f"库存记录更新后验证失败: {e}")
-        
-        if hasattr(g, 'delayed_validations'):
-            g.delayed_validations.append(delayed_validation)
-        else:
-            g.delayed_validations = [delayed_validation]
-            
-    except Exception as e:
-        current_app.logger.error(f"设置库存记录更新后验证失败: {e}")
 
 def execute_delayed_validations():
-    """执行延迟的验证任务"""
+    """立即执行队列中等待的验证任务"""
     try:
-        if hasattr(g, 'delayed_validations'):
-            for validation in g.delayed_validations:
-                validation()
-            g.delayed_validations = []
+        return validation_queue.flush_pending()
     except Exception as e:
         current_app.logger.error(f"执行延迟验证失败: {e}")
+        return 0
+
 
 def batch_validate_all_inventory():
-    """批量验证所有库存的一致性"""
+    """
+    批量验证所有库存的一致性
+
+    按识别编码分块执行一轮全量对账（每块独立提交），结果写入对账问题表。
+
+    Returns:
+        (int, int): 核对的识别编码数，存在不一致的识别编码数
+    """
+    from app.services.reconciliation_service import InventoryReconciler
+
     try:
         current_app.logger.info("开始批量库存一致性验证...")
-        
-        # 获取所有有库存的识别码
-        inventory_codes = db.session.query(Inventory.identification_code).distinct().all()
-        inventory_codes = [code[0] for code in inventory_codes if code[0]]
-        
-        inconsistent_count = 0
-        total_count = len(inventory_codes)
-        
-        for code in inventory_codes:
-            is_consistent, inconsistencies = InventoryValidator.validate_identification_code(code)
-            if not is_consistent:
-                inconsistent_count += 1
-                InventoryValidator.log_inconsistency(code, inconsistencies, "批量验证")
-        
+
+        result = InventoryReconciler.run_sweep(restart=True)
+        if not result.get('success') or result.get('skipped'):
+            current_app.logger.error(f"批量库存验证未执行: {result.get('message')}")
+            return 0, 0
+
+        total_count = result['checked_codes']
+        inconsistent_count = len({finding.identification_code for finding in InventoryReconciler.get_open_findings()})
+
         current_app.logger.info(f"批量库存验证完成: 总计{total_count}个识别码，发现{inconsistent_count}个不一致")
-        
+
         return total_count, inconsistent_count
-        
+
     except Exception as e:
         current_app.logger.error(f"批量库存验证失败: {e}")
         return 0, 0
 
-def setup_inventory_validation():
+
+def setup_inventory_validation(app=None):
     """设置库存验证系统"""
     try:
-        current_app.logger.info("库存数据一致性验证系统已启动")
-        
-        # 注册请求结束后的验证执行
-        @current_app.after_request
-        def after_request(response):
-            execute_delayed_validations()
-            return response
-        
+        app = app or current_app._get_current_object()
+        if not app.config.get('INVENTORY_VALIDATION_ENABLED', True):
+            return False
+        validation_queue._app = app
+        validation_queue.debounce_seconds = app.config.get(
+            'INVENTORY_VALIDATION_DEBOUNCE_SECONDS', validation_queue.debounce_seconds)
+        validation_queue.max_delay_seconds = app.config.get(
+            'INVENTORY_VALIDATION_MAX_DELAY_SECONDS', validation_queue.max_delay_seconds)
+        register_inventory_validation_events()
+        app.extensions['inventory_validation'] = validation_queue
+        app.logger.info("库存数据一致性验证系统已启动")
         return True
     except Exception as e:
-        current_app.logger.error(f"设置库存验证系统失败: {e}")
+        logger.error(f"设置库存验证系统失败: {e}")
         return False
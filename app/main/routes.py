@@ -8,16 +8,22 @@ from app.decorators import require_permission, require_any_permission, warehouse
 from app.auth.decorators import register_page_permission, register_operation_permission
 from datetime import datetime, timedelta
 from flask_login import current_user, login_required
-import pandas as pd
 import os
 import tempfile
 import openpyxl
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.styles import Font, Alignment
 from openpyxl.utils import get_column_letter
 import time
 import json
 from app.utils import clean_dict_whitespace, strip_whitespace
 from app.utils.identification_generator import IdentificationCodeGenerator
+from app.utils.keyset_pagination import keyset_paginate
+from app.services.search_index_service import SearchIndexService
+from app.cache.route_cache import route_cache
+from app.utils.lock_service import hold_inventory_locks, LockTimeout
+from app.utils.unit_of_work import transactional_view
+from app.services.export_service import (StreamingExportService, build_inbound_export_query,
+                                         build_outbound_export_query, build_inventory_export_query)
 import csv
 import io
 from io import BytesIO
@@ -689,290 +695,129 @@ PDF预览功能暂时不可用
         # 返回最简单的错误内容
         return b"PDF generation error"
 
+def _parse_code_customer_plate(identification_code, customer_name, plate_number):
+    """从识别编码中提取客户名称和车牌号（格式：仓库前缀/客户名称/车牌/日期/序号）"""
+    try:
+        code_parts = identification_code.split('/')
+        if len(code_parts) >= 3:
+            return code_parts[1], code_parts[2]
+    except Exception as e:
+        current_app.logger.warning(f"解析识别编码失败: {identification_code}, 错误: {e}")
+    return customer_name, plate_number
+
 def get_aggregated_inventory_direct():
-    """直接从数据库获取聚合库存数据（替代缓存）"""
+    """从库存汇总表获取聚合库存数据（单条索引查询，替代逐条识别编码查询）"""
     try:
-        from app.models import Inventory, Warehouse, InboundRecord, TransitCargo, OutboundRecord
-        from sqlalchemy import func
-        from datetime import datetime
+        from app.services.inventory_summary_service import InventorySummaryService
 
-        # 查询库存数据，按识别编码+仓库分组，分别显示不同状态
-        inventory_data = db.session.query(
-            Inventory.identification_code,
-            # 从入库记录获取正确的客户名称和车牌号（因为入库记录是最原始和准确的）
-            func.max(Inventory.customer_name).label('customer_name'),
-            func.max(Inventory.plate_number).label('plate_number'),
-            func.sum(Inventory.pallet_count).label('total_pallet_count'),
-            func.sum(Inventory.package_count).label('total_package_count'),
-            func.sum(Inventory.weight).label('total_weight'),
-            func.sum(Inventory.volume).label('total_volume'),
-            Inventory.operated_warehouse_id,
-            Warehouse.warehouse_name,
-            Warehouse.warehouse_type,
-            # 业务字段聚合逻辑 - 优先获取非空值，处理None字符串
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.order_type, ''), 'None')), '').label('order_type'),
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.export_mode, ''), 'None')), '').label('export_mode'),
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.customs_broker, ''), 'None')), '').label('customs_broker'),
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.documents, ''), 'None')), '').label('documents'),
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.service_staff, ''), 'None')), '').label('service_staff'),
-            func.coalesce(func.max(func.nullif(func.nullif(Inventory.location, ''), 'None')), '').label('location'),
-            # 添加入库时间字段
-            func.max(Inventory.inbound_time).label('latest_inbound_time')
-        ).join(
-            Warehouse, Inventory.operated_warehouse_id == Warehouse.id
-        ).filter(
-            # 只查询有库存的记录
-            db.or_(
-                Inventory.pallet_count > 0,
-                Inventory.package_count > 0
-            )
-        ).group_by(
-            Inventory.identification_code,
-            Inventory.operated_warehouse_id,
-            Warehouse.warehouse_name,
-            Warehouse.warehouse_type
-        ).order_by(
-            Inventory.identification_code,
-            Warehouse.warehouse_type.desc(),  # 前端仓优先显示
-            Warehouse.warehouse_name
-        ).all()
+        # 只读取有库存或仍在途的汇总行
+        summary_rows = [
+            (summary, summary.warehouse.warehouse_name, summary.warehouse.warehouse_type)
+            for summary in InventorySummaryService.load_summaries(active_only=True)
+            if summary.warehouse is not None
+        ]
+        # 按识别编码排序，同一识别编码前端仓优先显示，再按仓库名称
+        summary_rows.sort(key=lambda row: row[1])
+        summary_rows.sort(key=lambda row: row[2] or '', reverse=True)
+        summary_rows.sort(key=lambda row: row[0].identification_code)
+
+        class WarehouseObj:
+            def __init__(self, id, warehouse_name, warehouse_type):
+                self.id = id
+                self.warehouse_name = warehouse_name
+                self.warehouse_type = warehouse_type
 
-        # 转换为字典格式，添加模板需要的字段
         result = []
+        transit_result = []
 
-        # 1. 处理库存记录
-        for item in inventory_data:
-            # 创建仓库对象
-            class WarehouseObj:
-                def __init__(self, id, warehouse_name, warehouse_type):
-                    self.id = id
-                    self.warehouse_name = warehouse_name
-                    self.warehouse_type = warehouse_type
-
-            warehouse_obj = WarehouseObj(
-                item.operated_warehouse_id,
-                item.warehouse_name,
-                item.warehouse_type
+        for summary, warehouse_name, warehouse_type in summary_rows:
+            warehouse_obj = WarehouseObj(summary.warehouse_id, warehouse_name, warehouse_type)
+            customer_name, plate_number = _parse_code_customer_plate(
+                summary.identification_code, summary.customer_name, summary.plate_number
             )
 
-            # 从识别编码中提取正确的客户名称（格式：仓库前缀/客户名称/车牌/日期/序号）
-            correct_customer_name = item.customer_name
-            correct_plate_number = item.plate_number
-
-            try:
-                code_parts = item.identification_code.split('/')
-                if len(code_parts) >= 3:
-                    correct_customer_name = code_parts[1]  # 客户名称在第二部分
-                    correct_plate_number = code_parts[2]   # 车牌号在第三部分
-            except Exception as e:
-                current_app.logger.warning(f"解析识别编码失败: {item.identification_code}, 错误: {e}")
-                # 如果解析失败，尝试从入库记录获取正确信息
-                inbound_record_for_name = InboundRecord.query.filter_by(
-                    identification_code=item.identification_code
-                ).first()
-                if inbound_record_for_name:
-                    correct_customer_name = inbound_record_for_name.customer_name
-                    correct_plate_number = inbound_record_for_name.plate_number
-
-            # 确定货物当前状态 - 库存记录显示实际在仓库的货物状态
-            current_status = item.warehouse_type
-
-            # 后端仓检查是否已出库到春疆货场或工厂
-            if item.warehouse_type == 'backend':
-                outbound_to_chunjiang = OutboundRecord.query.filter(
-                    OutboundRecord.identification_code == item.identification_code,
-                    OutboundRecord.operated_warehouse_id == item.operated_warehouse_id,
-                    OutboundRecord.destination.in_(['春疆货场', '工厂'])
-                ).first()
-
-                if outbound_to_chunjiang:
+            # 1. 库存记录 - 显示实际在仓库的货物状态
+            if (summary.pallet_count or 0) > 0 or (summary.package_count or 0) > 0:
+                current_status = warehouse_type
+                # 后端仓已出库到春疆货场或工厂
+                if warehouse_type == 'backend' and (summary.chunjiang_outbound_count or 0) > 0:
                     current_status = 'shipped_to_chunjiang'
 
-            # 使用库存表中的入库时间，如果没有则使用聚合的最新入库时间
-            inbound_time = item.latest_inbound_time if hasattr(item, 'latest_inbound_time') and item.latest_inbound_time else datetime.now()
-
-            # 获取原始重量和体积（从入库记录获取，不受分批影响）
-            original_weight = item.total_weight or 0
-            original_volume = item.total_volume or 0
-
-            # 如果库存记录中的重量体积为0，从入库记录获取原始数据
-            if original_weight == 0 or original_volume == 0:
-                inbound_record_for_weight = InboundRecord.query.filter_by(
-                    identification_code=item.identification_code
-                ).first()
-
-                if inbound_record_for_weight:
-                    original_weight = inbound_record_for_weight.weight or 0
-                    original_volume = inbound_record_for_weight.volume or 0
-
-            # 业务字段优先级：库存表 -> 出库记录 -> 入库记录
-            # 处理None字符串和空字符串
-            order_type = item.order_type if item.order_type and item.order_type != 'None' else ''
-            export_mode = item.export_mode if item.export_mode and item.export_mode != 'None' else ''
-            customs_broker = item.customs_broker if item.customs_broker and item.customs_broker != 'None' else ''
-            documents = item.documents if item.documents and item.documents != 'None' else ''
-            service_staff = item.service_staff if item.service_staff and item.service_staff != 'None' else ''
-            location = item.location if item.location and item.location != 'None' else ''
-
-            # 如果库存表中的业务字段为空，尝试从出库记录获取
-            if not export_mode or not customs_broker or not service_staff or not order_type:
-                outbound_record = OutboundRecord.query.filter_by(
-                    identification_code=item.identification_code,
-                    operated_warehouse_id=item.operated_warehouse_id
-                ).order_by(OutboundRecord.outbound_time.desc()).first()
-
-                if outbound_record:
-                    export_mode = export_mode or (outbound_record.export_mode if outbound_record.export_mode and outbound_record.export_mode != 'None' else '')
-                    customs_broker = customs_broker or (outbound_record.customs_broker if outbound_record.customs_broker and outbound_record.customs_broker != 'None' else '')
-                    service_staff = service_staff or (outbound_record.service_staff if outbound_record.service_staff and outbound_record.service_staff != 'None' else '')
-                    order_type = order_type or (outbound_record.order_type if outbound_record.order_type and outbound_record.order_type != 'None' else '')
-
-            # 如果仍然为空，尝试从入库记录获取
-            if not export_mode or not customs_broker or not service_staff or not order_type:
-                inbound_record = InboundRecord.query.filter_by(
-                    identification_code=item.identification_code
-                ).first()
+                # 库存记录中的重量体积为0时，使用入库记录的原始数据
+                weight = summary.weight or 0
+                volume = summary.volume or 0
+                if weight == 0 or volume == 0:
+                    weight = summary.original_weight or 0
+                    volume = summary.original_volume or 0
 
-                if inbound_record:
-                    export_mode = export_mode or (inbound_record.export_mode if inbound_record.export_mode and inbound_record.export_mode != 'None' else '')
-                    customs_broker = customs_broker or (inbound_record.customs_broker if inbound_record.customs_broker and inbound_record.customs_broker != 'None' else '')
-                    service_staff = service_staff or (inbound_record.service_staff if inbound_record.service_staff and inbound_record.service_staff != 'None' else '')
-                    order_type = order_type or (inbound_record.order_type if inbound_record.order_type and inbound_record.order_type != 'None' else '')
-
-            result.append({
-                'identification_code': item.identification_code,
-                'customer_name': correct_customer_name,
-                'plate_number': correct_plate_number,
-                'total_pallet_count': int(item.total_pallet_count or 0),
-                'total_package_count': int(item.total_package_count or 0),
-                'total_weight': float(original_weight),
-                'total_volume': float(original_volume),
-                'operated_warehouse_id': item.operated_warehouse_id,
-                # 添加筛选函数需要的字段
-                'pallet_count': int(item.total_pallet_count or 0),
-                'package_count': int(item.total_package_count or 0),
-                'weight': float(original_weight),
-                'volume': float(original_volume),
-                # 添加模板需要的入库字段
-                'inbound_pallet_count': int(item.total_pallet_count or 0),
-                'inbound_package_count': int(item.total_package_count or 0),
-                'current_warehouse_id': item.operated_warehouse_id,
-                'current_warehouse': warehouse_obj,
-                'current_status': current_status,
-                'inbound_time': inbound_time,
-                # 添加业务字段 - 使用聚合结果
-                'order_type': order_type,
-                'export_mode': export_mode,
-                'customs_broker': customs_broker,
-                'documents': documents,
-                'service_staff': service_staff,
-                'location': location
-            })
-
-        # 2. 处理在途记录 - 查询所有在途货物（只显示真正在途的货物）
-        transit_data = db.session.query(
-            TransitCargo.identification_code,
-            TransitCargo.customer_name,
-            TransitCargo.plate_number,
-            func.sum(TransitCargo.pallet_count).label('total_pallet_count'),
-            func.sum(TransitCargo.package_count).label('total_package_count'),
-            func.sum(TransitCargo.weight).label('total_weight'),
-            func.sum(TransitCargo.volume).label('total_volume'),
-            TransitCargo.source_warehouse_id,
-            TransitCargo.destination_warehouse_id,
-            func.coalesce(func.max(func.nullif(TransitCargo.order_type, '')), '').label('order_type'),
-            func.coalesce(func.max(func.nullif(TransitCargo.export_mode, '')), '').label('export_mode'),
-            func.coalesce(func.max(func.nullif(TransitCargo.customs_broker, '')), '').label('customs_broker'),
-            func.coalesce(func.max(func.nullif(TransitCargo.service_staff, '')), '').label('service_staff'),
-            func.max(TransitCargo.departure_time).label('latest_departure_time')
-        ).filter(
-            TransitCargo.status == 'in_transit'  # 只查询真正在途的货物
-        ).filter(
-            db.or_(
-                TransitCargo.pallet_count > 0,
-                TransitCargo.package_count > 0
-            )
-        ).group_by(
-            TransitCargo.identification_code,
-            TransitCargo.customer_name,
-            TransitCargo.plate_number,
-            TransitCargo.source_warehouse_id,
-            TransitCargo.destination_warehouse_id
-        ).order_by(
-            TransitCargo.identification_code
-        ).all()
-
-        # 收集已经在途的识别编码，避免在库存记录中重复显示
-        in_transit_codes = set()
-        for item in transit_data:
-            in_transit_codes.add(item.identification_code)
-
-        # 为在途记录创建虚拟的仓库对象和记录
-        for item in transit_data:
-            # 获取来源仓库信息
-            source_warehouse = Warehouse.query.filter_by(id=item.source_warehouse_id).first()
-            if not source_warehouse:
-                continue
-
-            # 创建仓库对象 - 显示来源仓库，但状态为在途
-            class WarehouseObj:
-                def __init__(self, id, warehouse_name, warehouse_type):
-                    self.id = id
-                    self.warehouse_name = warehouse_name
-                    self.warehouse_type = warehouse_type
-
-            warehouse_obj = WarehouseObj(
-                item.source_warehouse_id,
-                source_warehouse.warehouse_name,
-                source_warehouse.warehouse_type
-            )
-
-            # 使用发货时间作为入库时间
-            inbound_time = item.latest_departure_time if hasattr(item, 'latest_departure_time') and item.latest_departure_time else datetime.now()
-
-            # 从识别编码中提取正确的客户名称和车牌号
-            correct_customer_name = item.customer_name
-            correct_plate_number = item.plate_number
+                pallet_count = int(summary.pallet_count or 0)
+                package_count = int(summary.package_count or 0)
+                result.append({
+                    'identification_code': summary.identification_code,
+                    'customer_name': customer_name,
+                    'plate_number': plate_number,
+                    'total_pallet_count': pallet_count,
+                    'total_package_count': package_count,
+                    'total_weight': float(weight),
+                    'total_volume': float(volume),
+                    'operated_warehouse_id': summary.warehouse_id,
+                    # 添加筛选函数需要的字段
+                    'pallet_count': pallet_count,
+                    'package_count': package_count,
+                    'weight': float(weight),
+                    'volume': float(volume),
+                    # 添加模板需要的入库字段
+                    'inbound_pallet_count': pallet_count,
+                    'inbound_package_count': package_count,
+                    'current_warehouse_id': summary.warehouse_id,
+                    'current_warehouse': warehouse_obj,
+                    'current_status': current_status,
+                    'inbound_time': summary.inbound_time or datetime.now(),
+                    # 业务字段在汇总时已按 库存表 -> 出库记录 -> 入库记录 的优先级合并
+                    'order_type': summary.order_type or '',
+                    'export_mode': summary.export_mode or '',
+                    'customs_broker': summary.customs_broker or '',
+                    'documents': summary.documents or '',
+                    'service_staff': summary.service_staff or '',
+                    'location': summary.location or ''
+                })
 
-            try:
-                code_parts = item.identification_code.split('/')
-                if len(code_parts) >= 3:
-                    correct_customer_name = code_parts[1]  # 客户名称在第二部分
-                    correct_plate_number = code_parts[2]   # 车牌号在第三部分
-            except Exception as e:
-                current_app.logger.warning(f"解析在途记录识别编码失败: {item.identification_code}, 错误: {e}")
-
-            result.append({
-                'identification_code': item.identification_code,
-                'customer_name': correct_customer_name,
-                'plate_number': correct_plate_number,
-                'total_pallet_count': int(item.total_pallet_count or 0),
-                'total_package_count': int(item.total_package_count or 0),
-                'total_weight': float(item.total_weight or 0),
-                'total_volume': float(item.total_volume or 0),
-                'operated_warehouse_id': item.source_warehouse_id,
-                # 添加筛选函数需要的字段
-                'pallet_count': int(item.total_pallet_count or 0),
-                'package_count': int(item.total_package_count or 0),
-                'weight': float(item.total_weight or 0),
-                'volume': float(item.total_volume or 0),
-                # 添加模板需要的入库字段
-                'inbound_pallet_count': int(item.total_pallet_count or 0),
-                'inbound_package_count': int(item.total_package_count or 0),
-                'current_warehouse_id': item.source_warehouse_id,
-                'current_warehouse': warehouse_obj,
-                'current_status': 'in_transit',  # 明确标记为在途状态
-                'inbound_time': inbound_time,
-                # 添加业务字段
-                'order_type': item.order_type or '',
-                'export_mode': item.export_mode or '',
-                'customs_broker': item.customs_broker or '',
-                'documents': '',
-                'service_staff': item.service_staff or '',
-                'location': ''
-            })
+            # 2. 在途记录 - 显示来源仓库，但状态为在途
+            if (summary.in_transit_pallet_count or 0) > 0 or (summary.in_transit_package_count or 0) > 0:
+                transit_pallet = int(summary.in_transit_pallet_count or 0)
+                transit_package = int(summary.in_transit_package_count or 0)
+                transit_result.append({
+                    'identification_code': summary.identification_code,
+                    'customer_name': customer_name,
+                    'plate_number': plate_number,
+                    'total_pallet_count': transit_pallet,
+                    'total_package_count': transit_package,
+                    'total_weight': float(summary.in_transit_weight or 0),
+                    'total_volume': float(summary.in_transit_volume or 0),
+                    'operated_warehouse_id': summary.warehouse_id,
+                    # 添加筛选函数需要的字段
+                    'pallet_count': transit_pallet,
+                    'package_count': transit_package,
+                    'weight': float(summary.in_transit_weight or 0),
+                    'volume': float(summary.in_transit_volume or 0),
+                    # 添加模板需要的入库字段
+                    'inbound_pallet_count': transit_pallet,
+                    'inbound_package_count': transit_package,
+                    'current_warehouse_id': summary.warehouse_id,
+                    'current_warehouse': warehouse_obj,
+                    'current_status': 'in_transit',  # 明确标记为在途状态
+                    # 使用发货时间作为入库时间
+                    'inbound_time': summary.transit_departure_time or datetime.now(),
+                    # 添加业务字段
+                    'order_type': summary.order_type or '',
+                    'export_mode': summary.export_mode or '',
+                    'customs_broker': summary.customs_broker or '',
+                    'documents': '',
+                    'service_staff': summary.service_staff or '',
+                    'location': ''
+                })
 
-        return result
+        return result + transit_result
     except Exception as e:
         current_app.logger.error(f"获取聚合库存数据失败: {e}")
         return []
@@ -986,7 +831,7 @@ def get_customer_list_direct(query_param=None):
         query = db.session.query(InboundRecord.customer_name).distinct()
 
         if query_param:
-            query = query.filter(InboundRecord.customer_name.like(f'%{query_param}%'))
+            query = query.filter(SearchIndexService.match(InboundRecord, 'customer_name', query_param))
 
         # 执行查询并获取结果
         customers = [row.customer_name for row in query.limit(20).all() if row.customer_name]
@@ -1155,155 +1000,84 @@ def apply_inventory_filters(inventory_data, search_field, search_value, warehous
     return filtered_data
 
 def get_aggregated_inventory_data():
-    """获取按货物当前状态聚合的库存数据 - 方案A：分状态显示"""
+    """获取按货物当前状态聚合的库存数据 - 方案A：分状态显示（读取库存汇总表）"""
+    from app.services.inventory_summary_service import InventorySummaryService
 
-    # 1. 获取所有库存记录，按identification_code分组
-    all_inventories = Inventory.query.all()
-    inventory_groups = defaultdict(list)
+    # 1. 一次查询取出全部汇总行，按identification_code分组
+    summary_rows = InventorySummaryService.load_summaries()
 
-    for inv in all_inventories:
-        if inv.identification_code:
-            inventory_groups[inv.identification_code].append(inv)
+    summary_groups = defaultdict(list)
+    for summary in summary_rows:
+        summary_groups[summary.identification_code].append(summary)
 
     aggregated_results = []
 
     # 2. 对每个identification_code进行状态分离处理
-    for identification_code, inventories in inventory_groups.items():
-        if not inventories:
+    for identification_code, summaries in summary_groups.items():
+        stocked = [s for s in summaries if (s.inventory_record_count or 0) > 0]
+        if not stocked:
             continue
 
-        # 获取基础信息（使用最早的入库记录）
-        base_inventory = min(inventories, key=lambda x: x.inbound_time or datetime.min)
-
-        # 获取出库记录
-        outbound_records = OutboundRecord.query.filter_by(identification_code=identification_code).all()
+        # 获取基础信息（使用最早入库的仓库汇总行）
+        base_summary = min(stocked, key=lambda x: x.inbound_time or datetime.min)
 
-        # 计算出库到春疆货场/工厂的总数量
-        chunjiang_outbound_pallet = sum(out.pallet_count or 0 for out in outbound_records
-                                       if out.destination in ['春疆货场', '工厂'])
-        chunjiang_outbound_package = sum(out.package_count or 0 for out in outbound_records
-                                        if out.destination in ['春疆货场', '工厂'])
-
-        # 获取原始入库数量（直接根据识别编码匹配第一条入库记录）
-        original_inbound_record = InboundRecord.query.filter_by(identification_code=identification_code).first()
-        if original_inbound_record:
-            # 直接使用入库记录表中的数量
-            original_pallet_count = original_inbound_record.pallet_count or 0
-            original_package_count = original_inbound_record.package_count or 0
-        else:
-            # 如果没有入库记录，设为0（不应该出现这种情况）
-            original_pallet_count = 0
-            original_package_count = 0
-
-        # 基础信息模板
         base_info = {
             'identification_code': identification_code,
-            'customer_name': base_inventory.customer_name,
-            'plate_number': base_inventory.plate_number or '',  # 添加入库车牌字段
-            'order_type': base_inventory.order_type or '',
-            'export_mode': base_inventory.export_mode or '',
-            'customs_broker': base_inventory.customs_broker or '',
-            'service_staff': base_inventory.service_staff or '',
-            'documents': base_inventory.documents or '',
-            'weight': base_inventory.weight or 0,
-            'volume': base_inventory.volume or 0,
-            'inbound_time': base_inventory.inbound_time,
-            'last_updated': max(inv.last_updated for inv in inventories if inv.last_updated) or datetime.now(),
-            'chunjiang_outbound_pallet': chunjiang_outbound_pallet,
-            'chunjiang_outbound_package': chunjiang_outbound_package,
-            'original_pallet_count': original_pallet_count,  # 添加原始入库数量
-            'original_package_count': original_package_count
+            'customer_name': base_summary.customer_name,
+            'plate_number': base_summary.plate_number or '',
+            'order_type': base_summary.order_type or '',
+            'export_mode': base_summary.export_mode or '',
+            'customs_broker': base_summary.customs_broker or '',
+            'service_staff': base_summary.service_staff or '',
+            'documents': base_summary.documents or '',
+            'weight': base_summary.weight or 0,
+            'volume': base_summary.volume or 0,
+            'inbound_time': base_summary.inbound_time,
+            'last_updated': max((s.last_updated for s in stocked if s.last_updated), default=None) or datetime.now(),
+            'chunjiang_outbound_pallet': sum(s.chunjiang_outbound_pallet or 0 for s in summaries),
+            'chunjiang_outbound_package': sum(s.chunjiang_outbound_package or 0 for s in summaries),
+            'original_pallet_count': base_summary.original_pallet_count or 0,
+            'original_package_count': base_summary.original_package_count or 0
         }
 
         # 3. 处理在途状态
-        in_transit_records = TransitCargo.query.filter_by(
-            identification_code=identification_code,
-            status='in_transit'
-        ).all()
+        total_transit_pallet = sum(s.in_transit_pallet_count or 0 for s in summaries)
+        total_transit_package = sum(s.in_transit_package_count or 0 for s in summaries)
+        if total_transit_pallet > 0 or total_transit_package > 0:
+            transit_item = base_info.copy()
+            transit_item.update({
+                'current_status': 'in_transit',
+                'current_warehouse_id': None,
+                'current_warehouse': None,
+                'pallet_count': total_transit_pallet,
+                'package_count': total_transit_package,
+                'inbound_pallet_count': base_info['original_pallet_count'],  # 使用原始入库数量
+                'inbound_package_count': base_info['original_package_count'],
+                'location': '在途中'
+            })
+            aggregated_results.append(transit_item)
 
-        if in_transit_records:
-            total_transit_pallet = sum(transit.pallet_count or 0 for transit in in_transit_records)
-            total_transit_package = sum(transit.package_count or 0 for transit in in_transit_records)
-
-            if total_transit_pallet > 0 or total_transit_package > 0:
-                transit_item = base_info.copy()
-                transit_item.update({
-                    'current_status': 'in_transit',
-                    'current_warehouse_id': None,
-                    'current_warehouse': None,
-                    'pallet_count': total_transit_pallet,
-                    'package_count': total_transit_package,
-                    'inbound_pallet_count': base_info['original_pallet_count'],  # 使用原始入库数量
-                    'inbound_package_count': base_info['original_package_count'],
-                    'location': '在途中'
-                })
-                aggregated_results.append(transit_item)
-
-        # 4. 处理前端仓状态
-        frontend_inventories = [inv for inv in inventories
-                               if inv.operated_warehouse and inv.operated_warehouse.warehouse_type == 'frontend']
-
-        # 按仓库分组前端库存（只包含有库存的记录）
-        frontend_warehouse_groups = defaultdict(list)
-        for inv in frontend_inventories:
-            if (inv.pallet_count or 0) > 0 or (inv.package_count or 0) > 0:
-                frontend_warehouse_groups[inv.operated_warehouse_id].append(inv)
-
-        for warehouse_id, warehouse_inventories in frontend_warehouse_groups.items():
-            total_pallet = sum(inv.pallet_count or 0 for inv in warehouse_inventories)
-            total_package = sum(inv.package_count or 0 for inv in warehouse_inventories)
-
-            if total_pallet > 0 or total_package > 0:
-                warehouse = warehouse_inventories[0].operated_warehouse
-                location = warehouse_inventories[0].location or ''
-
-                frontend_item = base_info.copy()
-                frontend_item.update({
-                    'current_status': 'frontend',
-                    'current_warehouse_id': warehouse_id,
-                    'current_warehouse': warehouse,
-                    'pallet_count': total_pallet,
-                    'package_count': total_package,
-                    'inbound_pallet_count': base_info['original_pallet_count'],  # 使用原始入库数量
-                    'inbound_package_count': base_info['original_package_count'],
-                    'location': location
-                })
-                aggregated_results.append(frontend_item)
-
-        # 5. 处理后端仓状态
-        backend_inventories = [inv for inv in inventories
-                              if inv.operated_warehouse and inv.operated_warehouse.warehouse_type == 'backend']
-
-        # 按仓库分组后端库存（只包含有库存的记录）
-        backend_warehouse_groups = defaultdict(list)
-        for inv in backend_inventories:
-            if (inv.pallet_count or 0) > 0 or (inv.package_count or 0) > 0:
-                backend_warehouse_groups[inv.operated_warehouse_id].append(inv)
-
-        for warehouse_id, warehouse_inventories in backend_warehouse_groups.items():
-            total_pallet = sum(inv.pallet_count or 0 for inv in warehouse_inventories)
-            total_package = sum(inv.package_count or 0 for inv in warehouse_inventories)
-
-            # 显示所有记录，包括库存为0的记录（因为需要显示原始入库数量）
-            if True:  # 移除库存大于0的限制
-                warehouse = warehouse_inventories[0].operated_warehouse
-                location = warehouse_inventories[0].location or ''
-
-                backend_item = base_info.copy()
-                backend_item.update({
-                    'current_status': 'backend',
-                    'current_warehouse_id': warehouse_id,
-                    'current_warehouse': warehouse,
-                    'pallet_count': total_pallet,
-                    'package_count': total_package,
-                    'inbound_pallet_count': base_info['original_pallet_count'],  # 使用原始入库数量
-                    'inbound_package_count': base_info['original_package_count'],
-                    'location': location
-                })
-                aggregated_results.append(backend_item)
+        # 4. 处理前端仓、后端仓状态（只包含有库存的记录）
+        for summary in sorted(stocked, key=lambda s: s.warehouse_type != 'frontend'):
+            if summary.warehouse_type not in ('frontend', 'backend'):
+                continue
+            if (summary.pallet_count or 0) <= 0 and (summary.package_count or 0) <= 0:
+                continue
 
-    return aggregated_results
+            warehouse_item = base_info.copy()
+            warehouse_item.update({
+                'current_status': summary.warehouse_type,
+                'current_warehouse_id': summary.warehouse_id,
+                'current_warehouse': summary.warehouse,
+                'pallet_count': summary.pallet_count or 0,
+                'package_count': summary.package_count or 0,
+                'inbound_pallet_count': base_info['original_pallet_count'],  # 使用原始入库数量
+                'inbound_package_count': base_info['original_package_count'],
+                'location': summary.location or ''
+            })
+            aggregated_results.append(warehouse_item)
 
+    return aggregated_results
 
 
 def _get_user_warehouse_info(required_type=None):
@@ -1346,6 +1120,11 @@ def _check_warehouse_access(warehouse_type=None):
 
 # 自定义简单分页类，替代flask_sqlalchemy的Pagination
 class SimplePagination:
+    # 与键集分页结果保持相同的模板属性
+    prev_cursor = None
+    next_cursor = None
+    total_is_estimate = False
+
     def __init__(self, items=None, page=1, per_page=50, total=0):
         self.items = items or []
         self.page = page
@@ -1678,11 +1457,11 @@ def inbound_list():
 
         # 按车牌号筛选
         if plate_number:
-            query = query.filter(InboundRecord.plate_number.like(f'%{plate_number}%'))
+            query = query.filter(SearchIndexService.match(InboundRecord, 'plate_number', plate_number))
 
         # 按客户名称筛选
         if customer_name:
-            query = query.filter(InboundRecord.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(InboundRecord, 'customer_name', customer_name))
 
         # 按出境模式筛选
         if export_mode:
@@ -1704,21 +1483,11 @@ def inbound_list():
         if operated_user_id:
             query = query.filter(InboundRecord.operated_by_user_id == operated_user_id)
 
-        # 按入库时间升序排序
-        query = query.order_by(InboundRecord.inbound_time.asc())
-
-        # 获取总记录数
-        total_count = query.count()
-
-        # 分页
-        items = query.offset((page - 1) * per_page).limit(per_page).all()
-
-        # 使用自定义分页类
-        records = SimplePagination(
-            items=items,
-            page=page,
-            per_page=per_page,
-            total=total_count
+        # 按入库时间升序键集分页，总数超过上限时只显示封顶数量
+        records = keyset_paginate(
+            query, InboundRecord.inbound_time, InboundRecord.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            count_mode='approximate'
         )
 
         current_app.logger.info(f"分页信息: 页数={records.pages}, 总记录数={records.total}")
@@ -1754,220 +1523,16 @@ def inbound_list():
 def export_inbound():
     """导出入库记录到Excel"""
     try:
-        # 获取搜索参数（与inbound_list相同的参数处理）
-        date_start = request.args.get('date_start', '')
-        date_end = request.args.get('date_end', '')
-        plate_number = request.args.get('plate_number', '')
-        customer_name = request.args.get('customer_name', '')
-        export_mode = request.args.get('export_mode', '')
-        customs_broker = request.args.get('customs_broker', '')
-        service_staff = request.args.get('service_staff', '')
-
-        # 构建查询
-        query = InboundRecord.query
-
-        # 按日期范围筛选
-        if date_start:
-            try:
-                start_date = datetime.strptime(date_start, '%Y-%m-%d')
-                query = query.filter(InboundRecord.inbound_time >= start_date)
-            except ValueError:
-                flash('开始日期格式无效', 'warning')
-
-        if date_end:
-            try:
-                end_date = datetime.strptime(date_end, '%Y-%m-%d')
-                end_date = end_date.replace(hour=23, minute=59, second=59)
-                query = query.filter(InboundRecord.inbound_time <= end_date)
-            except ValueError:
-                flash('结束日期格式无效', 'warning')
-
-        # 按车牌号筛选
-        if plate_number:
-            query = query.filter(InboundRecord.plate_number.like(f'%{plate_number}%'))
-
-        # 按客户名称筛选
-        if customer_name:
-            query = query.filter(InboundRecord.customer_name.like(f'%{customer_name}%'))
-
-        # 按出境模式筛选
-        if export_mode:
-            query = query.filter(InboundRecord.export_mode.like(f'%{export_mode}%'))
-
-        # 按报关行筛选
-        if customs_broker:
-            query = query.filter(InboundRecord.customs_broker.like(f'%{customs_broker}%'))
-
-        # 按跟单客服筛选
-        if service_staff:
-            query = query.filter(InboundRecord.service_staff.like(f'%{service_staff}%'))
-
-        # 按入库时间升序排序
-        query = query.order_by(InboundRecord.inbound_time.asc())
-
-        # 获取所有符合条件的记录
-        records = query.all()
+        # 构建查询（与inbound_list相同的筛选条件）
+        query = build_inbound_export_query(request.args)
 
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             flash('没有找到符合条件的记录', 'warning')
             return redirect(url_for('main.inbound_list'))
 
-        try:
-            # 尝试导入pandas
-            import pandas as pd
-            from pandas import ExcelWriter
-            from io import BytesIO
-
-            # 构建DataFrame
-            data = []
-            for i, record in enumerate(records, 1):
-                data.append({
-                    '序号': i,
-                    '入库时间': record.inbound_time.strftime('%Y-%m-%d') if record.inbound_time else '',
-                    '入库车牌': record.plate_number,
-                    '客户名称': record.customer_name,
-                    '识别编码': record.identification_code or '',
-                    '板数': record.pallet_count,
-                    '件数': record.package_count,
-                    '重量(kg)': record.weight,
-                    '体积(m³)': record.volume,
-                    '出境模式': record.export_mode,
-                    '报关行': record.customs_broker,
-                    '单据': record.documents,
-                    '跟单客服': record.service_staff,
-                    '创建时间': record.inbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.inbound_time else ''
-                })
-
-            df = pd.DataFrame(data)
-
-            # 创建内存文件对象
-            output = BytesIO()
-
-            # 使用ExcelWriter可以更好地控制格式
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                # 写入数据
-                df.to_excel(writer, sheet_name='入库记录', index=False)
-
-                # 获取workbook和worksheet对象以进行格式调整
-                workbook = writer.book
-                worksheet = writer.sheets['入库记录']
-
-                # 定义格式
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'vcenter',
-                    'align': 'center',
-                    'bg_color': '#D9E1F2',  # 浅蓝色
-                    'border': 1
-                })
-
-                # 为所有列设置宽度
-                for i, col in enumerate(df.columns):
-                    # 根据列名和内容设置适当的列宽
-                    max_len = max(
-                        df[col].astype(str).map(len).max(),  # 最长数据长度
-                        len(str(col))  # 列名长度
-                    ) + 2  # 添加一些额外空间
-
-                    # 限制最大宽度
-                    col_width = min(max_len, 30)
-                    worksheet.set_column(i, i, col_width)
-
-                # 设置表头格式
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # 添加自动筛选
-                worksheet.autofilter(0, 0, len(df), len(df.columns) - 1)
-
-            # 设置文件指针到开始位置
-            output.seek(0)
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"入库记录导出_{timestamp}.xlsx"
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError as e:
-            # 如果pandas或xlsxwriter不可用，尝试使用openpyxl
-            try:
-                # 创建工作簿和工作表
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = "入库记录"
-
-                # 添加表头
-                headers = ['序号', '入库时间', '入库车牌', '客户名称', '识别编码', '板数', '件数',
-                          '重量(kg)', '体积(m³)', '出境模式', '报关行', '单据', '跟单客服', '创建时间']
-
-                for col_idx, header in enumerate(headers, 1):
-                    cell = ws.cell(row=1, column=col_idx)
-                    cell.value = header
-                    cell.font = Font(bold=True)
-                    cell.fill = PatternFill(start_color='D9E1F2', end_color='D9E1F2', fill_type='solid')
-                    cell.alignment = Alignment(horizontal='center', vertical='center')
-                    cell.border = Border(
-                        left=Side(style='thin'),
-                        right=Side(style='thin'),
-                        top=Side(style='thin'),
-                        bottom=Side(style='thin')
-                    )
-
-                # 添加数据
-                for i, record in enumerate(records, 1):
-                    row_idx = i + 1
-                    ws.cell(row=row_idx, column=1).value = i
-                    ws.cell(row=row_idx, column=2).value = record.outbound_time.strftime('%Y-%m-%d') if record.outbound_time else ''
-                    ws.cell(row=row_idx, column=3).value = record.plate_number
-                    ws.cell(row=row_idx, column=4).value = record.customer_name
-                    ws.cell(row=row_idx, column=5).value = record.identification_code or ''
-                    ws.cell(row=row_idx, column=6).value = record.pallet_count
-                    ws.cell(row=row_idx, column=7).value = record.package_count
-                    ws.cell(row=row_idx, column=8).value = record.weight
-                    ws.cell(row=row_idx, column=9).value = record.volume
-                    ws.cell(row=row_idx, column=10).value = record.export_mode
-                    ws.cell(row=row_idx, column=11).value = record.customs_broker
-                    ws.cell(row=row_idx, column=12).value = record.documents
-                    ws.cell(row=row_idx, column=13).value = record.service_staff
-                    ws.cell(row=row_idx, column=14).value = record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else ''
-
-                # 调整列宽
-                for col_idx, header in enumerate(headers, 1):
-                    col_letter = get_column_letter(col_idx)
-                    # 设置一个合理的默认宽度
-                    ws.column_dimensions[col_letter].width = max(len(header) * 1.5, 10)
-
-                # 创建临时文件
-                temp_file = tempfile.NamedTemporaryFile(
-                    suffix='.xlsx',
-                    prefix='inbound_export_',
-                    delete=False
-                )
-
-                # 保存工作簿
-                wb.save(temp_file.name)
-
-                # 返回文件下载响应
-                return send_file(
-                    temp_file.name,
-                    as_attachment=True,
-                    download_name=f"入库记录导出_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx",
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-
-            except ImportError:
-                # 如果openpyxl也不可用，返回错误信息
-                flash("导出Excel需要pandas或openpyxl库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-                return redirect(url_for('main.inbound_list'))
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('inbound', query, request.args.get('format', 'xlsx'))
     except Exception as e:
         current_app.logger.error(f"导出数据时出错: {str(e)}")
         flash(f"导出数据时出错: {str(e)}", "danger")
@@ -2362,9 +1927,6 @@ def api_inbound_batch():
     # 使用清理后的数据
     data = cleaned_data
 
-    success_count = 0
-    errors = []
-
     # 获取当前用户的仓库ID
     operated_warehouse_id = current_user.warehouse_id if current_user.warehouse_id else None
 
@@ -2372,257 +1934,26 @@ def api_inbound_batch():
     if not operated_warehouse_id:
         if current_user.is_super_admin():
             # admin用户可以根据业务逻辑自动匹配仓库
-            # 这里可以根据具体需求来确定仓库ID，暂时允许继续执行
             current_app.logger.info(f"Admin用户 {current_user.username} 执行入库操作，将根据业务逻辑确定仓库")
         else:
             return jsonify({'status': 'error', 'message': '用户未绑定仓库，无法进行入库操作'}), 400
 
-    # 按照客户名称和日期分组，用于生成识别编码序号
-    date_customer_counts = {}
-
-    # 预处理所有记录，准备生成序号
-    for i, item in enumerate(data):
-        try:
-            # 验证和预处理入库时间
-            if 'inbound_time' in item:
-                if isinstance(item['inbound_time'], str):
-                    try:
-                        inbound_time = datetime.strptime(item['inbound_time'], '%Y-%m-%d %H:%M:%S')
-                    except ValueError:
-                        continue  # 日期格式错误，跳过
-                elif isinstance(item['inbound_time'], datetime):
-                    inbound_time = item['inbound_time']
-                else:
-                    continue  # 日期格式无效，跳过
-            else:
-                continue  # 缺少日期，跳过
-
-            if 'customer_name' not in item or not item['customer_name']:
-                continue  # 缺少客户名称，跳过
-
-            if 'plate_number' not in item or not item['plate_number']:
-                continue  # 缺少车牌号，跳过
-
-            # 提取日期部分
-            date_str = inbound_time.strftime('%Y-%m-%d')
-            customer_name = item['customer_name']
-            plate_number = item['plate_number']
-
-            # 初始化计数器 - 基于日期+客户+车牌的组合
-            date_customer_plate_key = f"{date_str}:{customer_name}:{plate_number}"
-            if date_customer_plate_key not in date_customer_counts:
-                # 查询数据库，获取当天该客户该车牌的现有记录数
-                existing_count = InboundRecord.query.filter(
-                    db.func.date(InboundRecord.inbound_time) == date_str,
-                    InboundRecord.customer_name == customer_name,
-                    InboundRecord.plate_number == plate_number
-                ).count()
-                date_customer_counts[date_customer_plate_key] = existing_count
-        except:
-            continue
-
-    # 处理每条记录
-    for i, item in enumerate(data):
-        try:
-            # 验证必填字段
-            required_fields = ['inbound_time', 'plate_number', 'customer_name', 'service_staff', 'order_type', 'export_mode', 'customs_broker']
-            missing_fields = []
-            for field in required_fields:
-                if field not in item or not item[field]:
-                    missing_fields.append(field)
-
-            if missing_fields:
-                errors.append(f"第{i+1}条记录缺少必填字段: {', '.join(missing_fields)}")
-                continue
-
-            # 验证入库时间格式
-            if isinstance(item['inbound_time'], str):
-                try:
-                    # 打印接收到的日期格式，用于调试
-                    current_app.logger.info(f"批量导入第{i+1}条记录接收到的日期格式: {item['inbound_time']}")
-
-                    # 尝试多种日期格式
-                    formats_to_try = [
-                        '%Y-%m-%d',        # 标准日期格式: 2025-06-27
-                        '%Y/%m/%d',        # 斜杠分隔: 2025/06/27
-                        '%Y.%m.%d',        # 点分隔: 2025.06.27
-                        '%Y年%m月%d日',     # 中文格式: 2025年06月27日
-                        '%Y-%m-%dT%H:%M',  # HTML5日期时间格式: 2025-06-27T12:30
-                        '%Y-%m-%d %H:%M:%S' # 完整日期时间: 2025-06-27 12:30:45
-                    ]
-
-                    inbound_time = None
-                    for date_format in formats_to_try:
-                        try:
-                            inbound_time = datetime.strptime(item['inbound_time'], date_format)
-                            break  # 如果成功解析，跳出循环
-                        except ValueError:
-                            continue  # 尝试下一个格式
-
-                    # 如果所有格式都失败
-                    if inbound_time is None:
-                        errors.append(f"第{i+1}条记录入库时间格式错误，请使用YYYY-MM-DD格式（如2025-06-27）")
-                        continue
-
-                    # 设置时间为00:00:00，只保留日期部分
-                    inbound_time = inbound_time.replace(hour=0, minute=0, second=0)
-
-                except Exception as e:
-                    errors.append(f"第{i+1}条记录入库时间格式错误: {str(e)}")
-                    continue
-            elif isinstance(item['inbound_time'], datetime):
-                inbound_time = item['inbound_time']
-                # 设置时间为00:00:00，只保留日期部分
-                inbound_time = inbound_time.replace(hour=0, minute=0, second=0)
-            else:
-                errors.append(f"第{i+1}条记录入库时间格式错误")
-                continue
-
-            # 验证件数和板数不能同时为空，且必须是整数
-            try:
-                pallet_value = item.get('pallet_count', 0) or 0
-                package_value = item.get('package_count', 0) or 0
-
-                # 检查是否为小数
-                if isinstance(pallet_value, (int, float)) and pallet_value != int(pallet_value):
-                    errors.append(f"第{i+1}条记录错误: 板数必须是整数，不能是小数")
-                    continue
-                if isinstance(package_value, (int, float)) and package_value != int(package_value):
-                    errors.append(f"第{i+1}条记录错误: 件数必须是整数，不能是小数")
-                    continue
-
-                pallet_count = int(pallet_value)
-                package_count = int(package_value)
-
-                if pallet_count < 0 or package_count < 0:
-                    errors.append(f"第{i+1}条记录错误: 板数和件数不能为负数")
-                    continue
-
-                if pallet_count == 0 and package_count == 0:
-                    errors.append(f"第{i+1}条记录错误: 板数和件数不能同时为零")
-                    continue
-            except (ValueError, TypeError):
-                errors.append(f"第{i+1}条记录错误: 板数和件数必须是有效的整数")
-                continue
-
-            # 处理重量和体积为空的情况
-            try:
-                weight = float(item.get('weight', 0) or 0)
-                volume = float(item.get('volume', 0) or 0)
-                if weight < 0 or volume < 0:
-                    errors.append(f"第{i+1}条记录错误: 重量和体积必须为非负数")
-                    continue
-            except (ValueError, TypeError):
-                errors.append(f"第{i+1}条记录错误: 重量和体积必须是有效数字")
-                continue
-
-            # 生成识别编码 - 使用新规则：仓库前缀/客户全称/车牌/日期/序号
-            customer_name = item['customer_name']
-            plate_number = item['plate_number']
-
-            # 确定实际的操作仓库ID
-            actual_warehouse_id = operated_warehouse_id or get_admin_warehouse_id('frontend')
-            if not actual_warehouse_id:
-                current_app.logger.error(f"无法确定操作仓库ID，用户: {current_user.username}")
-                continue
-
-            # 使用IdentificationCodeGenerator生成标准格式的识别编码
-            identification_code = IdentificationCodeGenerator.generate_unique_identification_code(
-                warehouse_id=actual_warehouse_id,
-                customer_name=customer_name,
-                plate_number=plate_number,
-                operation_type='inbound',
-                inbound_date=inbound_time
-            )
-
-            # 创建入库记录
-            record = InboundRecord(
-                inbound_time=inbound_time,
-                delivery_plate_number=item.get('delivery_plate_number', ''),
-                plate_number=plate_number,
-                customer_name=customer_name,
-                identification_code=identification_code,
-                pallet_count=pallet_count,
-                package_count=package_count,
-                weight=weight,
-                volume=volume,
-                export_mode=item.get('export_mode', ''),
-                order_type=item.get('order_type', ''),
-                customs_broker=item.get('customs_broker', ''),
-                location=item.get('location', ''),
-                documents=item.get('documents', ''),
-                service_staff=item.get('service_staff', ''),
-                record_type='direct',  # 直接入库记录
-                # 添加操作追踪信息
-                operated_by_user_id=current_user.id,
-                operated_warehouse_id=actual_warehouse_id or current_user.warehouse_id
-            )
-
-            db.session.add(record)
-            success_count += 1
-
-            # 创建或更新库存记录 - 按照识别编码管理库存
-            inventory = Inventory.query.filter_by(identification_code=identification_code).first()
-
-            # 如果该识别编码的库存记录不存在，则创建新记录
-            if not inventory:
-                inventory = Inventory(
-                    customer_name=customer_name,
-                    identification_code=identification_code,
-                    inbound_pallet_count=pallet_count,
-                    inbound_package_count=package_count,
-                    pallet_count=pallet_count,
-                    package_count=package_count,
-                    weight=weight,
-                    volume=volume,
-                    location=item.get('location', ''),  # 使用提供的库位
-                    documents=item.get('documents', ''),
-                    export_mode=item.get('export_mode', ''),
-                    order_type=item.get('order_type', ''),
-                    customs_broker=item.get('customs_broker', ''),
-                    inbound_time=inbound_time,
-                    plate_number=plate_number,
-                    service_staff=item.get('service_staff', ''),
-                    # 添加操作追踪信息
-                    operated_by_user_id=current_user.id,
-                    operated_warehouse_id=actual_warehouse_id or current_user.warehouse_id
-                )
-                db.session.add(inventory)
-            else:
-                # 如果已存在，则更新库位等信息
-                if item.get('location'):
-                    inventory.location = item.get('location', '')
-                if item.get('documents'):
-                    inventory.documents = item.get('documents', '')
-                if item.get('export_mode'):
-                    inventory.export_mode = item.get('export_mode', '')
-                if item.get('customs_broker'):
-                    inventory.customs_broker = item.get('customs_broker', '')
-                if item.get('service_staff'):
-                    inventory.service_staff = item.get('service_staff', '')
-
-        except Exception as e:
-            errors.append(f"第{i+1}条记录处理错误: {str(e)}")
-
-    if success_count > 0:
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            errors.append(f"提交数据库时出错: {str(e)}")
-            return jsonify({
-                'status': 'error',
-                'message': f'提交数据库时出错',
-                'errors': errors
-            }), 500
+    # 确定实际的操作仓库ID
+    actual_warehouse_id = operated_warehouse_id or get_admin_warehouse_id('frontend')
+    if not actual_warehouse_id:
+        current_app.logger.error(f"无法确定操作仓库ID，用户: {current_user.username}")
+        return jsonify({'status': 'error', 'message': '无法确定操作仓库，无法进行入库操作'}), 400
+
+    # 集合方式批量导入：整批校验 -> 分组预留序号 -> 批量写入入库记录 -> 一次合并库存
+    from app.services.inbound_batch_service import InboundBatchImporter
+    importer = InboundBatchImporter(
+        operated_by_user_id=current_user.id,
+        warehouse_id=actual_warehouse_id
+    )
+    result = importer.import_records(data)
+    http_status = result.pop('http_status', 200)
 
-    return jsonify({
-        'status': 'success' if not errors else 'partial_success',
-        'message': f'成功添加 {success_count} 条记录',
-        'success_count': success_count,
-        'total_count': len(data),
-        'errors': errors
-    })
+    return jsonify(result), http_status
 
 @bp.route('/outbound', methods=['GET', 'POST'])
 @require_permission('OUTBOUND_VIEW')
@@ -2727,11 +2058,11 @@ def outbound_list():
 
         # 按车牌号筛选
         if plate_number:
-            query = query.filter(OutboundRecord.plate_number.like(f'%{plate_number}%'))
+            query = query.filter(SearchIndexService.match(OutboundRecord, 'plate_number', plate_number))
 
         # 按客户名称筛选
         if customer_name:
-            query = query.filter(OutboundRecord.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(OutboundRecord, 'customer_name', customer_name))
 
         # 按目的地筛选
         if destination:
@@ -2768,21 +2099,11 @@ def outbound_list():
         if operated_user_id:
             query = query.filter(OutboundRecord.operated_by_user_id == operated_user_id)
 
-        # 按出库时间降序排序
-        query = query.order_by(OutboundRecord.outbound_time.desc())
-
-        # 获取总记录数
-        total_count = query.count()
-
-        # 分页
-        items = query.offset((page - 1) * per_page).limit(per_page).all()
-
-        # 使用自定义分页类
-        records = SimplePagination(
-            items=items,
-            page=page,
-            per_page=per_page,
-            total=total_count
+        # 按出库时间降序键集分页，总数超过上限时只显示封顶数量
+        records = keyset_paginate(
+            query, OutboundRecord.outbound_time, OutboundRecord.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            descending=True, count_mode='approximate'
         )
 
         # 获取仓库和用户选项数据
@@ -2815,128 +2136,11 @@ def outbound_list():
 @bp.route('/export_outbound')
 def export_outbound():
     """导出出库记录"""
-    # 获取搜索参数
-    date_start = request.args.get('date_start', '')
-    date_end = request.args.get('date_end', '')
-
-    # 如果没有指定日期范围，默认导出最近一周的数据
-    if not date_start and not date_end:
-        today = datetime.now().strftime('%Y-%m-%d')
-        week_ago = (datetime.now() - timedelta(days=7)).strftime('%Y-%m-%d')
-        date_start = week_ago
-        date_end = today
-
-    plate_number = request.args.get('plate_number', '')
-    customer_name = request.args.get('customer_name', '')
-    destination = request.args.get('destination', '')
-    service_staff = request.args.get('service_staff', '')
-
-    # 新增字段
-    inbound_plate = request.args.get('inbound_plate', '')
-    order_type = request.args.get('order_type', '')
-    export_mode = request.args.get('export_mode', '')
-    document_no = request.args.get('document_no', '')
-    location = request.args.get('location', '')
-    customs_broker = request.args.get('customs_broker', '')
-
-    # 构建查询
-    query = OutboundRecord.query
-
-    # 按日期范围筛选
-    if date_start:
-        try:
-            start_date = datetime.strptime(date_start, '%Y-%m-%d')
-            query = query.filter(OutboundRecord.outbound_time >= start_date)
-        except ValueError:
-            flash('开始日期格式无效', 'warning')
-
-    if date_end:
-        try:
-            # 将结束日期设置为当天的23:59:59
-            end_date = datetime.strptime(date_end, '%Y-%m-%d')
-            end_date = end_date.replace(hour=23, minute=59, second=59)
-            query = query.filter(OutboundRecord.outbound_time <= end_date)
-        except ValueError:
-            flash('结束日期格式无效', 'warning')
-
-    # 按车牌号筛选
-    if plate_number:
-        query = query.filter(OutboundRecord.plate_number.like(f'%{plate_number}%'))
-
-    # 按客户名称筛选
-    if customer_name:
-        query = query.filter(OutboundRecord.customer_name.like(f'%{customer_name}%'))
-
-    # 按目的地筛选
-    if destination:
-        query = query.filter(OutboundRecord.destination.like(f'%{destination}%'))
-
-    # 按跟单客服筛选
-    if service_staff:
-        query = query.filter(OutboundRecord.service_staff.like(f'%{service_staff}%'))
-
-    # 新增字段筛选
-    if inbound_plate:
-        query = query.filter(OutboundRecord.inbound_plate.like(f'%{inbound_plate}%'))
-
-    if order_type:
-        query = query.filter(OutboundRecord.order_type == order_type)
-
-    if export_mode:
-        query = query.filter(OutboundRecord.export_mode == export_mode)
-
-    if document_no:
-        query = query.filter(OutboundRecord.document_no.like(f'%{document_no}%'))
-
-    if location:
-        query = query.filter(OutboundRecord.location.like(f'%{location}%'))
-
-    if customs_broker:
-        query = query.filter(OutboundRecord.customs_broker.like(f'%{customs_broker}%'))
-
-    # 按出库时间降序排序
-    records = query.order_by(OutboundRecord.outbound_time.desc()).all()
-
-    # 创建DataFrame
-    data = []
-    for record in records:
-        data.append({
-            '出库时间': record.outbound_time.strftime('%Y-%m-%d') if record.outbound_time else '',
-            '出库车牌': record.plate_number,
-            '客户名称': record.customer_name,
-            '入库车牌': record.inbound_plate or '',
-            '订单类型': record.order_type or '',
-            '板数': record.pallet_count,
-            '件数': record.package_count,
-            '重量(kg)': record.weight,
-            '体积(m³)': record.volume,
-            '出境模式': record.export_mode or '',
-            '报关行': record.customs_broker or '',
-            '库位': record.location or '',
-            '单据': record.document_no or '',
-            '目的地': record.destination or '',
-            '跟单客服': record.service_staff or '',
-            '创建时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S')
-        })
-
-    df = pd.DataFrame(data)
-
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(suffix='.xlsx', delete=False) as tmp:
-        # 写入Excel
-        df.to_excel(tmp.name, index=False, engine='openpyxl')
-        tmp_name = tmp.name
+    # 构建查询，未指定日期范围时默认导出最近一周的数据
+    query = build_outbound_export_query(request.args)
 
-    # 设置文件名
-    now = datetime.now().strftime('%Y%m%d_%H%M%S')
-    filename = f"出库记录_{now}.xlsx"
-
-    return send_file(
-        tmp_name,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
+    # 流式导出（format=csv 时导出CSV）
+    return StreamingExportService.export('outbound', query, request.args.get('format', 'xlsx'))
 
 @bp.route('/outbound/view/<int:id>')
 @require_permission('OUTBOUND_VIEW')
@@ -3273,6 +2477,7 @@ def api_optimize_database():
 @csrf.exempt  # 豁免CSRF保护，因为这是API接口
 @require_permission('OUTBOUND_CREATE')
 @log_operation('outbound', 'batch_create', 'outbound_record')
+@transactional_view('outbound')
 def api_outbound_batch():
     """处理批量出库数据提交"""
     if not request.is_json:
@@ -3383,18 +2588,24 @@ def api_outbound_batch():
 
         # 记录更新的库存
         updated_inventories = []
+        inventory_updates = []
 
         # 先查询所有需要更新的库存记录，以减少数据库查询次数
         identification_codes = [item.get('identification_code') for item in items if item.get('identification_code')]
         inventory_dict = {}
         if identification_codes:
+            # 持有这些识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+            try:
+                hold_inventory_locks(identification_codes)
+            except LockTimeout as e:
+                return jsonify({'success': False, 'message': str(e)}), 409
             inventories = Inventory.query.filter(Inventory.identification_code.in_(identification_codes)).all()
             for inv in inventories:
                 inventory_dict[inv.identification_code] = inv
 
         for index, item in enumerate(items, 1):
             # 设置批次序号和总数
-            item['batch_no'] = new_batch_no
+            item['batch_no'] = batch_number
             item['batch_sequence'] = index
             item['batch_total'] = total_items
 
@@ -3455,7 +2666,7 @@ def api_outbound_batch():
                 large_layer=current_large_layer,
                 small_layer=current_small_layer,
                 pallet_board=current_pallet_board,
-                batch_no=new_batch_no,
+                batch_no=batch_number,
                 batch_sequence=index,
                 batch_total=total_items,
                 inbound_date=inbound_date,  # 添加入库日期
@@ -3507,31 +2718,39 @@ def api_outbound_batch():
                         current_app.logger.error(f"板数和件数必须是有效的整数: {item.get('pallet_count')}, {item.get('package_count')}")
                         continue
 
-                    # 记录更新前的库存
-                    before_pallet = inventory.pallet_count
-                    before_package = inventory.package_count
-
-                    # 更新库存数量
-                    inventory.pallet_count = max(0, inventory.pallet_count - outbound_pallet_count)
-                    inventory.package_count = max(0, inventory.package_count - outbound_package_count)
-
-                    # 记录已更新的库存
-                    updated_inventories.append({
-                        'id': inventory.id,
-                        'identification_code': inventory.identification_code,
-                        'customer_name': inventory.customer_name,
-                        'before_pallet': before_pallet,
-                        'before_package': before_package,
-                        'after_pallet': inventory.pallet_count,
-                        'after_package': inventory.package_count,
-                        'outbound_pallet': outbound_pallet_count,
-                        'outbound_package': outbound_package_count
+                    inventory_updates.append({
+                        'identification_code': identification_code,
+                        'operation_type': 'subtract',
+                        'pallet_count': outbound_pallet_count,
+                        'package_count': outbound_package_count
                     })
-
-                    current_app.logger.info(f"更新库存: {identification_code}, 板数: {before_pallet} -> {inventory.pallet_count}, 件数: {before_package} -> {inventory.package_count}")
                 else:
                     current_app.logger.warning(f"未找到库存记录: {identification_code}")
 
+        # 集合方式扣减库存：按ID顺序锁定库存行，CASE 语句批量写入并检查版本号
+        if inventory_updates:
+            from app.services.inventory_mutation_service import InventoryBulkMutator
+            mutation = InventoryBulkMutator(clamp=True, skip_missing=True).apply(inventory_updates)
+            outbound_totals = {}
+            for update_item in inventory_updates:
+                totals = outbound_totals.setdefault(update_item['identification_code'], [0, 0])
+                totals[0] += update_item['pallet_count']
+                totals[1] += update_item['package_count']
+            for applied in mutation['applied']:
+                code = applied['identification_code']
+                updated_inventories.append({
+                    'id': applied['id'],
+                    'identification_code': code,
+                    'customer_name': inventory_dict[code].customer_name if code in inventory_dict else None,
+                    'before_pallet': applied['before']['pallet_count'],
+                    'before_package': applied['before']['package_count'],
+                    'after_pallet': applied['after']['pallet_count'],
+                    'after_package': applied['after']['package_count'],
+                    'outbound_pallet': outbound_totals[code][0],
+                    'outbound_package': outbound_totals[code][1]
+                })
+                current_app.logger.info(f"更新库存: {code}, 板数: {applied['before']['pallet_count']} -> {applied['after']['pallet_count']}, 件数: {applied['before']['package_count']} -> {applied['after']['package_count']}")
+
         # 批量保存记录
         db.session.add_all(records_to_save)
 
@@ -3632,7 +2851,7 @@ def api_outbound_batch():
         cache_invalidation.on_inventory_change()
         current_app.logger.info("已清除所有库存相关缓存")
 
-        current_app.logger.info(f"成功保存 {len(records_to_save)} 条出库记录，批次号: {new_batch_no}")
+        current_app.logger.info(f"成功保存 {len(records_to_save)} 条出库记录，批次号: {batch_number}")
         current_app.logger.info(f"更新了 {len(updated_inventories)} 条库存记录")
 
         # 构建成功消息
@@ -3645,7 +2864,7 @@ def api_outbound_batch():
         return jsonify({
             'success': True,
             'saved_count': len(records_to_save),
-            'batch_no': new_batch_no,
+            'batch_no': batch_number,
             'transit_cargo_count': len(transit_cargo_records),
             'message': '，'.join(message_parts)
         })
@@ -3830,7 +3049,7 @@ def api_customers():
 
         # 如果提供了查询参数，则进行筛选
         if query_param:
-            customers_query = customers_query.filter(Inventory.customer_name.like(f'%{query_param}%'))
+            customers_query = customers_query.filter(SearchIndexService.match(Inventory, 'customer_name', query_param))
 
         # 执行查询并获取结果
         customers = [row[0] for row in customers_query.all()]
@@ -3839,7 +3058,9 @@ def api_customers():
         if len(customers) < 20:
             inbound_customers_query = db.session.query(InboundRecord.customer_name).distinct()
             if query_param:
-                inbound_customers_query = inbound_customers_query.filter(InboundRecord.customer_name.like(f'%{query_param}%'))
+                inbound_customers_query = inbound_customers_query.filter(
+                    SearchIndexService.match(InboundRecord, 'customer_name', query_param)
+                )
             inbound_customers = [row[0] for row in inbound_customers_query.all()]
 
             # 合并客户列表并去重
@@ -3871,137 +3092,11 @@ def api_customers():
 @bp.route('/export_inventory')
 def export_inventory():
     """导出库存记录"""
-    # 获取搜索参数
-    customer_name = request.args.get('customer_name', '')
-    location = request.args.get('location', '')
-
-    # 构建查询
-    query = Inventory.query
-
-    # 只显示库存不为0的记录
-    query = query.filter((Inventory.pallet_count > 0) | (Inventory.package_count > 0))
-
-    # 按客户名称筛选
-    if customer_name:
-        query = query.filter(Inventory.customer_name.like(f'%{customer_name}%'))
-
-    # 按库位筛选
-    if location:
-        query = query.filter(Inventory.location.like(f'%{location}%'))
+    # 构建查询，只导出库存不为0的记录
+    query = build_inventory_export_query(request.args)
 
-    # 按入库日期降序排序
-    query = query.order_by(Inventory.inbound_time.desc())
-
-    # 执行查询
-    records = query.all()
-
-    # 创建工作簿
-    wb = openpyxl.Workbook()
-    ws = wb.active
-    ws.title = "库存记录"
-
-    # 添加表头
-    headers = [
-        '序号', '入库日期', '入库车牌', '客户名称', '识别编码',
-        '入库板数', '入库件数', '库存板数', '库存件数',
-        '重量(kg)', '体积(m³)', '出境模式', '报关行', '单据', '跟单客服', '库位', '最后更新时间'
-    ]
-
-    for col_num, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_num)
-        cell.value = header
-        # 设置表头样式
-        cell.font = Font(bold=True)
-        cell.alignment = Alignment(horizontal='center')
-
-    # 添加数据
-    for row_num, record in enumerate(records, 1):
-        # 序号从1开始
-        ws.cell(row=row_num+1, column=1).value = row_num
-
-        # 入库日期
-        if record.outbound_time:
-            ws.cell(row=row_num+1, column=2).value = record.outbound_time.strftime('%Y-%m-%d')
-        else:
-            ws.cell(row=row_num+1, column=2).value = ''
-
-        # 入库车牌
-        ws.cell(row=row_num+1, column=3).value = record.plate_number or ''
-
-        # 客户名称
-        ws.cell(row=row_num+1, column=4).value = record.customer_name
-
-        # 识别编码
-        ws.cell(row=row_num+1, column=5).value = record.identification_code or ''
-
-        # 入库板数
-        ws.cell(row=row_num+1, column=6).value = record.inbound_pallet_count or record.pallet_count
-
-        # 入库件数
-        ws.cell(row=row_num+1, column=7).value = record.inbound_package_count or record.package_count
-
-        # 库存板数
-        ws.cell(row=row_num+1, column=8).value = record.pallet_count
-
-        # 库存件数
-        ws.cell(row=row_num+1, column=9).value = record.package_count
-
-        # 重量(kg)
-        ws.cell(row=row_num+1, column=10).value = record.weight if record.weight and record.weight > 0 else ''
-
-        # 体积(m³)
-        ws.cell(row=row_num+1, column=11).value = record.volume if record.volume and record.volume > 0 else ''
-
-        # 出境模式
-        ws.cell(row=row_num+1, column=12).value = record.export_mode or ''
-
-        # 报关行
-        ws.cell(row=row_num+1, column=13).value = record.customs_broker or ''
-
-        # 单据
-        ws.cell(row=row_num+1, column=14).value = record.documents or ''
-
-        # 跟单客服
-        ws.cell(row=row_num+1, column=15).value = record.service_staff or ''
-
-        # 库位
-        ws.cell(row=row_num+1, column=16).value = record.location or ''
-
-        # 最后更新时间
-        if record.last_updated:
-            ws.cell(row=row_num+1, column=17).value = record.last_updated.strftime('%Y-%m-%d %H:%M:%S')
-        else:
-            ws.cell(row=row_num+1, column=17).value = ''
-
-    # 调整列宽
-    for col in ws.columns:
-        max_length = 0
-        column = col[0].column_letter  # 获取列字母
-        for cell in col:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = (max_length + 2) * 1.2
-        ws.column_dimensions[column].width = adjusted_width
-
-    # 创建响应
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-
-    # 生成文件名
-    now = datetime.now().strftime('%Y%m%d%H%M%S')
-    filename = f"库存记录_{now}.xlsx"
-
-    # 返回Excel文件
-    return send_file(
-        output,
-        mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-        download_name=filename,
-        as_attachment=True
-    )
+    # 流式导出（format=csv 时导出CSV）
+    return StreamingExportService.export('inventory', query, request.args.get('format', 'xlsx'))
 
 @bp.route('/inventory/edit/<int:id>', methods=['GET', 'POST'])
 @require_permission('INVENTORY_EDIT')
@@ -4640,12 +3735,10 @@ def api_inventory_search():
         return jsonify({'success': False, 'message': '请提供搜索关键词'}), 400
 
     try:
-        # 构建查询 - 在客户名称、识别编码、入库车牌中进行搜索
-        query = Inventory.query.filter(
-            (Inventory.customer_name.like(f'%{search_term}%')) |
-            (Inventory.identification_code.like(f'%{search_term}%')) |
-            (Inventory.plate_number.like(f'%{search_term}%'))
-        )
+        # 构建查询 - 在客户名称、识别编码、入库车牌中进行搜索（使用分词索引）
+        query = Inventory.query.filter(SearchIndexService.match(
+            Inventory, ('customer_name', 'identification_code', 'plate_number'), search_term
+        ))
 
         # 只返回有库存的记录
         query = query.filter(
@@ -6433,6 +5526,7 @@ def api_frontend_pending_receive_batches():
 # 前端仓单个货物接收API
 @bp.route('/api/frontend/receive-item', methods=['POST'])
 @csrf.exempt
+@transactional_view('receive')
 def api_frontend_receive_item():
     """前端仓接收单个货物"""
     try:
@@ -6616,6 +5710,7 @@ def api_frontend_batch_details(batch_key):
 # 前端仓批次接收API
 @bp.route('/api/frontend/batch-receive', methods=['POST'])
 @csrf.exempt
+@transactional_view('receive')
 def api_frontend_batch_receive():
     """前端仓批次接收货物，支持差异录入"""
     try:
@@ -7588,120 +6683,13 @@ def export_frontend_receive():
         # 按批次号排序，然后按接收时间排序
         query = query.order_by(InboundRecord.batch_no.desc(), InboundRecord.inbound_time.desc())
 
-        # 获取所有符合条件的记录
-        records = query.all()
-
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             flash('没有找到符合条件的接收记录', 'warning')
             return redirect(url_for('main.frontend_receive_list'))
 
-        # 准备导出数据
-        data = []
-        for record in records:
-            data.append({
-                '接收时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else '',
-                '批次号': record.batch_no or '',
-                '识别编码': record.identification_code or '',
-                '客户名称': record.customer_name or '',
-                '送货干线车': record.delivery_plate_number or '',
-                '入库车牌': record.plate_number or '',
-                '板数': record.pallet_count or 0,
-                '件数': record.package_count or 0,
-                '重量(kg)': record.weight or 0,
-                '体积(m³)': record.volume or 0,
-                '出境模式': record.export_mode or '',
-                '报关行': record.customs_broker or '',
-                '订单类型': record.order_type or '',
-                '跟单客服': record.service_staff or '',
-                '库位': record.location or '',
-                '单据': record.documents or '',
-                '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                '操作用户': record.operated_by_user.username if record.operated_by_user else '',
-                '创建时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else ''
-            })
-
-        # 使用pandas导出Excel
-        try:
-            import pandas as pd
-            from io import BytesIO
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='前端仓接收记录', index=False)
-
-                # 获取workbook和worksheet对象以进行格式调整
-                workbook = writer.book
-                worksheet = writer.sheets['前端仓接收记录']
-
-                # 定义格式
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
-
-                # 应用表头格式
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # 设置列宽
-                worksheet.set_column('A:S', 15)
-
-            output.seek(0)
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"前端仓接收记录导出_{timestamp}.xlsx"
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError:
-            # 如果pandas不可用，使用openpyxl
-            try:
-                import openpyxl
-                from tempfile import NamedTemporaryFile
-
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = "前端仓接收记录"
-
-                # 添加表头
-                headers = list(data[0].keys()) if data else []
-                for col, header in enumerate(headers, 1):
-                    ws.cell(row=1, column=col, value=header)
-
-                # 添加数据
-                for row, record_data in enumerate(data, 2):
-                    for col, value in enumerate(record_data.values(), 1):
-                        ws.cell(row=row, column=col, value=value)
-
-                # 保存到临时文件
-                temp_file = NamedTemporaryFile(delete=False, suffix='.xlsx')
-                wb.save(temp_file.name)
-                temp_file.close()
-
-                # 返回文件下载响应
-                return send_file(
-                    temp_file.name,
-                    as_attachment=True,
-                    download_name=f"前端仓接收记录导出_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx",
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-
-            except ImportError:
-                flash("导出Excel需要pandas或openpyxl库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-                return redirect(url_for('main.frontend_receive_list'))
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('frontend_receive', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         current_app.logger.error(f"导出前端仓接收记录时出错: {str(e)}")
@@ -7795,111 +6783,16 @@ def export_frontend_inbound():
         if location:
             query = query.filter(InboundRecord.location.like(f'%{location}%'))
 
-        # 执行查询，限制记录数量避免超时
-        current_app.logger.info("开始查询数据库记录")
-        records = query.order_by(InboundRecord.inbound_time.desc()).limit(5000).all()
-        current_app.logger.info(f"查询到 {len(records)} 条记录")
+        # 限制记录数量避免超时
+        query = query.order_by(InboundRecord.inbound_time.desc()).limit(5000)
 
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             flash('没有找到符合条件的入库记录', 'warning')
             return redirect(url_for('main.frontend_inbound_list'))
 
-        # 准备导出数据
-        current_app.logger.info("开始处理导出数据")
-        data = []
-        for i, record in enumerate(records):
-            try:
-                data.append({
-                    '入库时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else '',
-                    '批次号': record.batch_no or '',
-                    '客户名称': record.customer_name or '',
-                    '车牌号': record.plate_number or '',
-                    '识别编码': record.identification_code or '',
-                    '板数': record.pallet_count or 0,
-                    '件数': record.package_count or 0,
-                    '重量(kg)': record.weight or 0,
-                    '体积(m³)': record.volume or 0,
-                    '订单类型': record.order_type or '',
-                    '出境模式': record.export_mode or '',
-                    '报关行': record.customs_broker or '',
-                    '库位': record.location or '',
-                    '单据': record.documents or '',
-                    '跟单客服': record.service_staff or '',
-                    '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                    '操作用户': record.operated_by_user.username if record.operated_by_user else '',
-                    '创建时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else ''
-                })
-
-                # 每处理100条记录输出一次日志
-                if (i + 1) % 100 == 0:
-                    current_app.logger.info(f"已处理 {i + 1}/{len(records)} 条记录")
-
-            except Exception as e:
-                current_app.logger.error(f"处理第 {i+1} 条记录时出错: {str(e)}")
-                current_app.logger.error(f"记录详情: ID={getattr(record, 'id', 'N/A')}, 客户={getattr(record, 'customer_name', 'N/A')}")
-                continue
-
-        current_app.logger.info(f"数据处理完成，共 {len(data)} 条有效记录")
-
-        # 使用pandas导出Excel
-        try:
-            current_app.logger.info("开始生成Excel文件")
-            import pandas as pd
-            from io import BytesIO
-
-            if not data:
-                flash('没有数据可以导出', 'warning')
-                return redirect(url_for('main.frontend_inbound_list'))
-
-            df = pd.DataFrame(data)
-
-            # 创建Excel文件
-            output = BytesIO()
-            current_app.logger.info("开始写入Excel数据")
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='前端仓入库记录', index=False)
-
-                # 获取工作表和工作簿对象
-                workbook = writer.book
-                worksheet = writer.sheets['前端仓入库记录']
-
-                # 定义格式
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
-
-                # 应用表头格式
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # 设置列宽
-                for i, col in enumerate(df.columns):
-                    max_len = max(df[col].astype(str).map(len).max(), len(col))
-                    worksheet.set_column(i, i, min(max_len + 2, 50))
-
-            output.seek(0)
-            current_app.logger.info("Excel文件生成完成")
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"前端仓入库记录导出_{timestamp}.xlsx"
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError:
-            flash("导出Excel需要pandas或xlsxwriter库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-            return redirect(url_for('main.frontend_inbound_list'))
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('frontend_inbound', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         current_app.logger.error(f"导出前端仓入库记录时出错: {str(e)}")
@@ -8036,9 +6929,11 @@ def frontend_inbound_list():
             'total_volume': 0.0
         }
 
-    # 排序和分页 - 按操作时间降序排序
-    records = query.order_by(InboundRecord.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    # 排序和分页 - 按操作时间降序键集分页
+    records = keyset_paginate(
+        query, InboundRecord.created_at, InboundRecord.id,
+        cursor=request.args.get('cursor'), page=page, per_page=per_page,
+        descending=True, count_mode='approximate'
     )
 
     # 性能优化：缓存仓库列表查询
@@ -8419,6 +7314,7 @@ def api_backend_pending_receive_batches():
 # 批次接收货物API
 @bp.route('/api/backend/batch-receive', methods=['POST'])
 @csrf.exempt
+@transactional_view('receive')
 def api_backend_batch_receive():
     """批次接收货物，支持差异录入"""
     try:
@@ -8619,6 +7515,7 @@ def api_backend_batch_receive():
 # 快速接收货物API
 @bp.route('/api/backend/quick-receive', methods=['POST'])
 @csrf.exempt
+@transactional_view('receive')
 def api_backend_quick_receive():
     """快速接收单个货物"""
     try:
@@ -9263,9 +8160,11 @@ def backend_inbound_list():
         except ValueError:
             pass
 
-    # 排序和分页
-    records = query.order_by(InboundRecord.inbound_time.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
+    # 按入库时间降序键集分页
+    records = keyset_paginate(
+        query, InboundRecord.inbound_time, InboundRecord.id,
+        cursor=request.args.get('cursor'), page=page, per_page=per_page,
+        descending=True, count_mode='approximate'
     )
 
     from app.utils import render_ajax_aware
@@ -9377,109 +8276,15 @@ def export_backend_inbound():
         # 按入库时间升序排序
         query = query.order_by(InboundRecord.inbound_time.asc())
 
-        # 获取所有符合条件的记录
-        records = query.all()
-        current_app.logger.info(f"查询到 {len(records)} 条后端仓入库记录")
-
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             current_app.logger.info("没有找到符合条件的后端仓入库记录")
             flash('没有找到符合条件的后端仓入库记录', 'warning')
             return redirect(url_for('main.backend_inbound_list'))
 
-        try:
-            # 尝试导入pandas
-            import pandas as pd
-            from pandas import ExcelWriter
-            from io import BytesIO
-
-            # 构建DataFrame
-            data = []
-            for i, record in enumerate(records, 1):
-                data.append({
-                    '序号': i,
-                    '入库时间': record.outbound_time.strftime('%Y-%m-%d') if record.outbound_time else '',
-                    '入库车牌': record.plate_number or '',
-                    '客户名称': record.customer_name or '',
-                    '识别编码': record.identification_code or '',
-                    '板数': record.pallet_count or 0,
-                    '件数': record.package_count or 0,
-                    '重量(kg)': record.weight or 0,
-                    '体积(m³)': record.volume or 0,
-                    '订单类型': record.order_type or '',
-                    '出境模式': record.export_mode or '',
-                    '报关行': record.customs_broker or '',
-                    '库位': record.location or '',
-                    '单据': record.documents or '',
-                    '跟单客服': record.service_staff or '',
-                    '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                    '创建时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else ''
-                })
-
-            df = pd.DataFrame(data)
-
-            # 创建内存文件对象
-            output = BytesIO()
-
-            # 使用ExcelWriter可以更好地控制格式
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                # 写入数据
-                df.to_excel(writer, sheet_name='后端仓入库记录', index=False)
-
-                # 获取workbook和worksheet对象以进行格式调整
-                workbook = writer.book
-                worksheet = writer.sheets['后端仓入库记录']
-
-                # 定义格式
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'vcenter',
-                    'align': 'center',
-                    'bg_color': '#FFE6E6',  # 浅红色，符合后端仓主题
-                    'border': 1
-                })
-
-                # 为所有列设置宽度
-                for i, col in enumerate(df.columns):
-                    # 根据列名和内容设置适当的列宽
-                    max_len = max(
-                        df[col].astype(str).map(len).max(),  # 最长数据长度
-                        len(str(col))  # 列名长度
-                    ) + 2  # 添加一些额外空间
-
-                    # 限制最大宽度
-                    col_width = min(max_len, 30)
-                    worksheet.set_column(i, i, col_width)
-
-                # 设置表头格式
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # 添加自动筛选
-                worksheet.autofilter(0, 0, len(df), len(df.columns) - 1)
-
-            # 设置文件指针到开始位置
-            output.seek(0)
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"后端仓入库记录导出_{timestamp}.xlsx"
-
-            # 记录成功导出
-            current_app.logger.info(f"用户 {current_user.username} 成功导出 {len(records)} 条后端仓入库记录，文件名: {filename}")
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError:
-            flash("导出Excel需要pandas或xlsxwriter库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-            return redirect(url_for('main.backend_inbound_list'))
+        current_app.logger.info(f"用户 {current_user.username} 导出后端仓入库记录")
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('backend_inbound', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         current_app.logger.error(f"导出后端仓入库记录时出错: {str(e)}")
@@ -10111,171 +8916,13 @@ def export_backend_receive():
         # 按接收时间降序排序，限制记录数量避免超时
         query = query.order_by(ReceiveRecord.receive_time.desc()).limit(5000)
 
-        # 获取所有符合条件的记录
-        current_app.logger.info("开始查询数据库记录")
-        records = query.all()
-        current_app.logger.info(f"查询到 {len(records)} 条记录")
-
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             flash('没有找到符合条件的接收记录', 'warning')
             return redirect(url_for('main.backend_receive_records'))
 
-        # 准备导出数据，添加来源仓库信息
-        current_app.logger.info("开始处理导出数据")
-        data = []
-        for i, record in enumerate(records):
-            try:
-                # 确定来源仓库
-                if record.batch_no:
-                    if record.batch_no.startswith('PH'):
-                        source_warehouse_name = '平湖仓'
-                    elif record.batch_no.startswith('KS'):
-                        source_warehouse_name = '昆山仓'
-                    elif record.batch_no.startswith('CD'):
-                        source_warehouse_name = '成都仓'
-                    elif record.batch_no.startswith('PX'):
-                        source_warehouse_name = '凭祥北投仓'
-                    else:
-                        if record.shipping_warehouse and record.shipping_warehouse != 'None' and record.shipping_warehouse.strip():
-                            source_warehouse_name = record.shipping_warehouse
-                        else:
-                            source_warehouse_name = '未知来源'
-                else:
-                    if record.shipping_warehouse and record.shipping_warehouse != 'None' and record.shipping_warehouse.strip():
-                        source_warehouse_name = record.shipping_warehouse
-                    else:
-                        source_warehouse_name = '未知来源'
-
-                data.append({
-                    '接收时间': record.receive_time.strftime('%Y-%m-%d %H:%M:%S') if record.receive_time else '',
-                    '批次号': record.batch_no or '',
-                    '来源仓库': source_warehouse_name,
-                    '接收状态': record.receive_status or '已接收',
-                    '识别编码': record.identification_code or '',
-                    '客户名称': record.customer_name or '',
-                    '送货干线车': record.delivery_plate_number or '',
-                    '入库车牌': record.inbound_plate or '',
-                    '板数': record.pallet_count or 0,
-                    '件数': record.package_count or 0,
-                    '重量(kg)': record.weight or 0,
-                    '体积(m³)': record.volume or 0,
-                    '出境模式': record.export_mode or '',
-                    '报关行': record.customs_broker or '',
-                    '订单类型': record.order_type or '',
-                    '跟单客服': record.service_staff or '',
-                    '库位': record.storage_location or '',
-                    '单据': record.documents or '',
-                    '批次序号': f"{record.batch_sequence}/{record.batch_total}" if record.batch_sequence and record.batch_total else '',
-                    '备注1': record.remark1 or '',
-                    '备注2': record.remark2 or '',
-                    '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                    '操作用户': record.created_by_user.username if record.created_by_user else '',
-                    '创建时间': record.created_at.strftime('%Y-%m-%d %H:%M:%S') if record.created_at else ''
-                })
-
-                # 每处理100条记录输出一次日志
-                if (i + 1) % 100 == 0:
-                    current_app.logger.info(f"已处理 {i + 1}/{len(records)} 条记录")
-
-            except Exception as e:
-                current_app.logger.error(f"处理第 {i+1} 条记录时出错: {str(e)}")
-                current_app.logger.error(f"记录详情: ID={getattr(record, 'id', 'N/A')}, 客户={getattr(record, 'customer_name', 'N/A')}")
-                current_app.logger.error(f"operated_warehouse类型: {type(record.operated_warehouse) if hasattr(record, 'operated_warehouse') else 'N/A'}")
-                if hasattr(record, 'operated_warehouse') and record.operated_warehouse:
-                    current_app.logger.error(f"operated_warehouse属性: {dir(record.operated_warehouse)}")
-                continue
-
-        current_app.logger.info(f"数据处理完成，共 {len(data)} 条有效记录")
-
-        # 使用pandas导出Excel
-        try:
-            current_app.logger.info("开始生成Excel文件")
-            import pandas as pd
-            from io import BytesIO
-
-            if not data:
-                flash('没有数据可以导出', 'warning')
-                return redirect(url_for('main.backend_receive_records'))
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-
-            current_app.logger.info("开始写入Excel数据")
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='后端仓接收记录', index=False)
-
-                # 获取workbook和worksheet对象以进行格式调整
-                workbook = writer.book
-                worksheet = writer.sheets['后端仓接收记录']
-
-                # 定义格式
-                header_format = workbook.add_format({
-                    'bold': True,
-                    'text_wrap': True,
-                    'valign': 'top',
-                    'fg_color': '#D7E4BC',
-                    'border': 1
-                })
-
-                # 应用表头格式
-                for col_num, value in enumerate(df.columns.values):
-                    worksheet.write(0, col_num, value, header_format)
-
-                # 设置列宽
-                worksheet.set_column('A:S', 15)
-
-            output.seek(0)
-            current_app.logger.info("Excel文件生成完成")
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"后端仓接收记录导出_{timestamp}.xlsx"
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError:
-            # 如果pandas不可用，使用openpyxl
-            try:
-                import openpyxl
-                from tempfile import NamedTemporaryFile
-
-                wb = openpyxl.Workbook()
-                ws = wb.active
-                ws.title = "后端仓接收记录"
-
-                # 添加表头
-                headers = list(data[0].keys()) if data else []
-                for col, header in enumerate(headers, 1):
-                    ws.cell(row=1, column=col, value=header)
-
-                # 添加数据
-                for row, record_data in enumerate(data, 2):
-                    for col, value in enumerate(record_data.values(), 1):
-                        ws.cell(row=row, column=col, value=value)
-
-                # 保存到临时文件
-                temp_file = NamedTemporaryFile(delete=False, suffix='.xlsx')
-                wb.save(temp_file.name)
-                temp_file.close()
-
-                # 返回文件下载响应
-                return send_file(
-                    temp_file.name,
-                    as_attachment=True,
-                    download_name=f"后端仓接收记录导出_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx",
-                    mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
-
-            except ImportError:
-                flash("导出Excel需要pandas或openpyxl库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-                return redirect(url_for('main.backend_receive_records'))
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('backend_receive', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         current_app.logger.error(f"导出后端仓接收记录时出错: {str(e)}")
@@ -10730,6 +9377,7 @@ def api_outbound_batch_history():
 @csrf.exempt
 @login_required
 @require_permission('OUTBOUND_CREATE')
+@transactional_view('outbound')
 def api_frontend_outbound_to_backend():
     """前端仓发货到后端仓API"""
 
@@ -10789,6 +9437,12 @@ def api_frontend_outbound_to_backend():
         if not records:
             return jsonify({'success': False, 'message': '没有出库记录'}), 400
 
+        # 持有本批识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+        try:
+            hold_inventory_locks(record.get('identification_code') for record in records if isinstance(record, dict))
+        except LockTimeout as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+
         # 验证公共字段
         required_common_fields = ['trunkPlate', 'driverName', 'driverPhone', 'originWarehouse', 'destinationWarehouse']
         current_app.logger.info(f'开始验证公共字段: {required_common_fields}')
@@ -10804,6 +9458,8 @@ def api_frontend_outbound_to_backend():
 
         success_count = 0
         errors = []
+        # 待扣减的库存: (库存ID, 板数, 件数, 重量, 体积)，全部记录处理完后集合方式一次扣减
+        inventory_deductions = []
 
         # 使用公共字段中的干线车牌作为统一的车牌号
         trunk_plate = common_data.get('trunkPlate')
@@ -10934,19 +9590,13 @@ def api_frontend_outbound_to_backend():
                 # 处理库存：减少相应数量
                 inventory_id = record_data.get('inventory_id')
                 if inventory_id:
-                    inventory = Inventory.query.get(inventory_id)
-                    if inventory:
-                        out_pallet = int(record_data.get('pallet_count', 0))
-                        out_package = int(record_data.get('package_count', 0))
-                        out_weight = float(record_data.get('weight', 0))
-                        out_volume = float(record_data.get('volume', 0))
-
-                        inventory.pallet_count = max(0, inventory.pallet_count - out_pallet)
-                        inventory.package_count = max(0, inventory.package_count - out_package)
-                        inventory.weight = max(0, inventory.weight - out_weight)
-                        inventory.volume = max(0, inventory.volume - out_volume)
-                        inventory.last_updated = datetime.now()
-                        current_app.logger.info(f'出库减少库存：库存ID {inventory_id}，目的仓：{destination_warehouse}')
+                    inventory_deductions.append((
+                        int(inventory_id),
+                        int(record_data.get('pallet_count', 0)),
+                        int(record_data.get('package_count', 0)),
+                        float(record_data.get('weight', 0)),
+                        float(record_data.get('volume', 0))
+                    ))
 
                 # 根据目的仓类型决定是否创建在途记录
                 if destination_warehouse == '凭祥北投仓':
@@ -11001,6 +9651,22 @@ def api_frontend_outbound_to_backend():
                 continue
 
         if success_count > 0:
+            # 集合方式扣减库存：按ID顺序锁定库存行，CASE 语句批量写入并检查版本号
+            if inventory_deductions:
+                from app.services.inventory_mutation_service import InventoryBulkMutator
+                inventory_codes = dict(db.session.query(Inventory.id, Inventory.identification_code).filter(
+                    Inventory.id.in_({deduction[0] for deduction in inventory_deductions})
+                ).all())
+                now = datetime.now()
+                mutation = InventoryBulkMutator(clamp=True, skip_missing=True).apply([
+                    {'identification_code': inventory_codes[inventory_id], 'operation_type': 'subtract',
+                     'pallet_count': out_pallet, 'package_count': out_package,
+                     'weight': out_weight, 'volume': out_volume, 'last_updated': now}
+                    for inventory_id, out_pallet, out_package, out_weight, out_volume in inventory_deductions
+                    if inventory_id in inventory_codes
+                ])
+                current_app.logger.info(f'出库减少库存：{len(mutation["applied"])}条，目的仓：{destination_warehouse}')
+
             db.session.commit()
             current_app.logger.info(f'前端仓发货到后端仓成功：{success_count}条记录，车牌：{trunk_plate}')
 
@@ -11044,6 +9710,12 @@ def api_frontend_outbound_to_customer():
         if not records:
             return jsonify({'success': False, 'message': '没有出库记录'}), 400
 
+        # 持有本批识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+        try:
+            hold_inventory_locks(record.get('identification_code') for record in records if isinstance(record, dict))
+        except LockTimeout as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+
         # 生成批次号
         from app.utils.batch_generator import generate_batch_number
         batch_number = generate_batch_number(
@@ -11209,6 +9881,12 @@ def api_frontend_outbound_direct_batch():
         if not check_warehouse_permission('frontend', 'add'):
             return jsonify({'success': False, 'message': '您没有权限执行前端仓出库操作'}), 403
 
+        # 持有本批识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+        try:
+            hold_inventory_locks(record.get('identification_code') for record in records if isinstance(record, dict))
+        except LockTimeout as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+
         # 生成批次号
         from app.utils.batch_generator import generate_batch_number
 
@@ -11569,7 +10247,8 @@ def export_frontend_outbound():
         # 构建查询，只显示前端仓的数据
         query = OutboundRecord.query.options(
             db.joinedload(OutboundRecord.operated_warehouse),
-            db.joinedload(OutboundRecord.destination_warehouse)
+            db.joinedload(OutboundRecord.destination_warehouse),
+            db.joinedload(OutboundRecord.operated_by_user)
         )
 
         # 获取前端仓库ID列表
@@ -11623,90 +10302,16 @@ def export_frontend_outbound():
             except ValueError:
                 pass
 
-        # 获取所有记录
-        records = query.order_by(OutboundRecord.outbound_time.desc()).all()
-
-        # 准备导出数据
-        data = []
-        for record in records:
-            try:
-                data.append({
-                    '批次号': record.batch_no or '',
-                    '识别编码': record.identification_code or '',
-                    '客户名称': record.customer_name or '',
-                    '出库车牌': record.plate_number or '',
-                    '目的地': record.destination or '',
-                    '送货干线车': record.delivery_plate_number or '',
-                    '报关行': record.customs_broker or '',
-                    '出境模式': record.export_mode or '',
-                    '大层数': record.large_layer or 0,
-                    '小层数': record.small_layer or 0,
-                    '托板数': record.pallet_board or 0,
-                    '重量(KG)': record.weight or 0,
-                    '体积(CBM)': record.volume or 0,
-                    '单据': record.documents or '',
-                    '入库日期': record.inbound_date.strftime('%Y-%m-%d') if record.inbound_date else '',
-                    '出库时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else '',
-                    '出发时间': record.departure_time.strftime('%Y-%m-%d %H:%M:%S') if record.departure_time else '',
-                    '备注1': record.remark1 or '',
-                    '备注2': record.remark2 or '',
-                    '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                    '目标仓库': record.destination_warehouse.warehouse_name if record.destination_warehouse else '',
-                    '操作用户': record.operated_by_user.username if record.operated_by_user else '',
-                })
-            except Exception as e:
-                current_app.logger.error(f"处理出库记录时出错: {str(e)}")
-                continue
-
-        # 使用pandas导出Excel
-        try:
-            import pandas as pd
-            from io import BytesIO
-
-            if not data:
-                flash('没有数据可以导出', 'warning')
-                return redirect(url_for('main.frontend_outbound_list'))
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='前端仓出库记录', index=False)
-
-                # 获取工作表和工作簿对象
-                workbook = writer.book
-                worksheet = writer.sheets['前端仓出库记录']
-
-                # 设置列宽
-                worksheet.set_column('A:A', 15)  # 批次号
-                worksheet.set_column('B:B', 20)  # 识别编码
-                worksheet.set_column('C:C', 15)  # 客户名称
-                worksheet.set_column('D:D', 12)  # 出库车牌
-                worksheet.set_column('E:E', 12)  # 目的地
-                worksheet.set_column('F:F', 12)  # 送货干线车
-                worksheet.set_column('G:G', 12)  # 报关行
-                worksheet.set_column('H:H', 12)  # 出境模式
-                worksheet.set_column('I:K', 8)   # 大层数、小层数、托板数
-                worksheet.set_column('L:M', 10)  # 重量、体积
-                worksheet.set_column('N:N', 10)  # 单据
-                worksheet.set_column('O:Q', 18)  # 日期时间列
-                worksheet.set_column('R:S', 15)  # 备注列
-                worksheet.set_column('T:V', 12)  # 仓库、用户列
-
-            output.seek(0)
-            filename = f"前端仓出库记录导出_{datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
-
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
+        query = query.order_by(OutboundRecord.outbound_time.desc())
 
-        except ImportError:
-            flash("导出Excel需要pandas或xlsxwriter库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
+        # 如果没有记录，返回提示
+        if query.first() is None:
+            flash('没有数据可以导出', 'warning')
             return redirect(url_for('main.frontend_outbound_list'))
 
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('frontend_outbound', query, request.args.get('format', 'xlsx'))
+
     except Exception as e:
         current_app.logger.error(f"导出前端仓出库记录时出错: {str(e)}")
         flash(f"导出数据时出错: {str(e)}", "danger")
@@ -12660,35 +11265,22 @@ def frontend_inventory_list():
 
         # 按客户名称筛选
         if customer_name:
-            query = query.filter(Inventory.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(Inventory, 'customer_name', customer_name))
 
         # 按库位筛选
         if location:
             query = query.filter(Inventory.location.like(f'%{location}%'))
 
-        # 按入库日期升序排序
-        query = query.order_by(Inventory.inbound_time.asc())
-
-        # 获取总记录数
-        total_count = query.count()
-
-        # 分页
-        items = query.offset((page - 1) * per_page).limit(per_page).all()
+        # 按入库日期升序键集分页
+        records = keyset_paginate(
+            query, Inventory.inbound_time, Inventory.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            count_mode='approximate'
+        )
 
         # 为每个库存记录补充完整信息（使用与全库存查询相同的逻辑）
-        enriched_items = []
-        for inventory in items:
-            # 使用与全库存查询相同的多表关联逻辑
+        for inventory in records.items:
             _enrich_inventory_record(inventory)
-            enriched_items.append(inventory)
-
-        # 使用自定义分页类
-        records = SimplePagination(
-            items=enriched_items,
-            page=page,
-            per_page=per_page,
-            total=total_count
-        )
 
         return render_template(
             'frontend/inventory_list.html',
@@ -12743,125 +11335,9 @@ def export_frontend_inventory():
         # 按入库日期升序排序
         query = query.order_by(Inventory.inbound_time.asc())
 
-        # 执行查询
-        inventory_records = query.all()
-
-        # 为每个库存记录补充完整信息（使用与全库存查询相同的逻辑）
-        for inventory in inventory_records:
-            _enrich_inventory_record(inventory)
-
-        records = inventory_records
-
-        # 创建工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "前端仓库存记录"
-
-        # 添加表头
-        headers = [
-            '序号', '入库日期', '入库车牌', '客户名称', '订单类型', '识别编码',
-            '入库板数', '入库件数', '库存板数', '库存件数',
-            '重量(kg)', '体积(m³)', '出境模式', '报关行', '单据', '跟单客服', '库位', '备注', '仓库'
-        ]
-
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            # 设置表头样式
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # 添加数据
-        for row_num, record in enumerate(records, 1):
-            # 序号从1开始
-            ws.cell(row=row_num+1, column=1).value = row_num
-
-            # 入库日期
-            if record.outbound_time:
-                ws.cell(row=row_num+1, column=2).value = record.outbound_time.strftime('%Y-%m-%d')
-            else:
-                ws.cell(row=row_num+1, column=2).value = ''
-
-            # 入库车牌
-            ws.cell(row=row_num+1, column=3).value = record.plate_number or ''
-
-            # 客户名称
-            ws.cell(row=row_num+1, column=4).value = record.customer_name
-
-            # 订单类型
-            ws.cell(row=row_num+1, column=5).value = record.order_type or ''
-
-            # 识别编码
-            ws.cell(row=row_num+1, column=6).value = record.identification_code or ''
-
-            # 入库板数
-            ws.cell(row=row_num+1, column=7).value = record.inbound_pallet_count or record.pallet_count
-
-            # 入库件数
-            ws.cell(row=row_num+1, column=8).value = record.inbound_package_count or record.package_count
-
-            # 库存板数
-            ws.cell(row=row_num+1, column=9).value = record.pallet_count
-
-            # 库存件数
-            ws.cell(row=row_num+1, column=10).value = record.package_count
-
-            # 重量(kg)
-            ws.cell(row=row_num+1, column=11).value = record.weight if record.weight and record.weight > 0 else ''
-
-            # 体积(m³)
-            ws.cell(row=row_num+1, column=12).value = record.volume if record.volume and record.volume > 0 else ''
-
-            # 出境模式
-            ws.cell(row=row_num+1, column=13).value = record.export_mode or ''
-
-            # 报关行
-            ws.cell(row=row_num+1, column=14).value = record.customs_broker or ''
-
-            # 单据
-            ws.cell(row=row_num+1, column=15).value = record.documents or ''
-
-            # 跟单客服
-            ws.cell(row=row_num+1, column=16).value = record.service_staff or ''
-
-            # 库位
-            ws.cell(row=row_num+1, column=17).value = record.location or ''
-
-            # 备注
-            ws.cell(row=row_num+1, column=18).value = getattr(record, 'remark1', '') or ''
-
-            # 仓库
-            ws.cell(row=row_num+1, column=19).value = record.operated_warehouse.warehouse_name if record.operated_warehouse else ''
-
-        # 调整列宽
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter  # 获取列字母
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2
-            ws.column_dimensions[column].width = adjusted_width
-
-        # 创建响应
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        # 生成文件名
-        now = datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"前端仓库存记录_{now}.xlsx"
-
-        # 返回Excel文件
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            download_name=filename,
-            as_attachment=True
-        )
+        # 逐行补充完整信息（使用与全库存查询相同的逻辑）后流式导出
+        return StreamingExportService.export('frontend_inventory', query, request.args.get('format', 'xlsx'),
+                                             row_hook=_enrich_inventory_record)
 
     except Exception as e:
         import traceback
@@ -12911,27 +11387,17 @@ def backend_inventory_list():
 
         # 按客户名称筛选
         if customer_name:
-            query = query.filter(Inventory.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(Inventory, 'customer_name', customer_name))
 
         # 按库位筛选
         if location:
             query = query.filter(Inventory.location.like(f'%{location}%'))
 
-        # 按入库日期升序排序
-        query = query.order_by(Inventory.inbound_time.asc())
-
-        # 获取总记录数
-        total_count = query.count()
-
-        # 分页
-        items = query.offset((page - 1) * per_page).limit(per_page).all()
-
-        # 使用自定义分页类
-        records = SimplePagination(
-            items=items,
-            page=page,
-            per_page=per_page,
-            total=total_count
+        # 按入库日期升序键集分页
+        records = keyset_paginate(
+            query, Inventory.inbound_time, Inventory.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            count_mode='approximate'
         )
 
         # 为模板添加辅助函数
@@ -13000,116 +11466,8 @@ def export_backend_inventory():
         # 按入库日期升序排序
         query = query.order_by(Inventory.inbound_time.asc())
 
-        # 执行查询
-        records = query.all()
-
-        # 创建工作簿
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "后端仓库存记录"
-
-        # 添加表头
-        headers = [
-            '序号', '入库日期', '入库车牌', '客户名称', '订单类型', '识别编码',
-            '入库板数', '入库件数', '库存板数', '库存件数',
-            '重量(kg)', '体积(m³)', '出境模式', '报关行', '单据', '跟单客服', '库位', '备注'
-        ]
-
-        for col_num, header in enumerate(headers, 1):
-            cell = ws.cell(row=1, column=col_num)
-            cell.value = header
-            # 设置表头样式
-            cell.font = Font(bold=True)
-            cell.alignment = Alignment(horizontal='center')
-
-        # 添加数据
-        for row_num, record in enumerate(records, 1):
-            # 序号从1开始
-            ws.cell(row=row_num+1, column=1).value = row_num
-
-            # 入库日期
-            if record.outbound_time:
-                ws.cell(row=row_num+1, column=2).value = record.outbound_time.strftime('%Y-%m-%d')
-            else:
-                ws.cell(row=row_num+1, column=2).value = ''
-
-            # 入库车牌
-            ws.cell(row=row_num+1, column=3).value = record.plate_number or ''
-
-            # 客户名称
-            ws.cell(row=row_num+1, column=4).value = record.customer_name
-
-            # 订单类型
-            ws.cell(row=row_num+1, column=5).value = record.order_type or ''
-
-            # 识别编码
-            ws.cell(row=row_num+1, column=6).value = record.identification_code or ''
-
-            # 入库板数
-            ws.cell(row=row_num+1, column=7).value = record.inbound_pallet_count or record.pallet_count
-
-            # 入库件数
-            ws.cell(row=row_num+1, column=8).value = record.inbound_package_count or record.package_count
-
-            # 库存板数
-            ws.cell(row=row_num+1, column=9).value = record.pallet_count
-
-            # 库存件数
-            ws.cell(row=row_num+1, column=10).value = record.package_count
-
-            # 重量(kg)
-            ws.cell(row=row_num+1, column=11).value = record.weight if record.weight and record.weight > 0 else ''
-
-            # 体积(m³)
-            ws.cell(row=row_num+1, column=12).value = record.volume if record.volume and record.volume > 0 else ''
-
-            # 出境模式
-            ws.cell(row=row_num+1, column=13).value = record.export_mode or ''
-
-            # 报关行
-            ws.cell(row=row_num+1, column=14).value = record.customs_broker or ''
-
-            # 单据
-            ws.cell(row=row_num+1, column=15).value = record.documents or ''
-
-            # 跟单客服
-            ws.cell(row=row_num+1, column=16).value = record.service_staff or ''
-
-            # 库位
-            ws.cell(row=row_num+1, column=17).value = record.location or ''
-
-            # 备注
-            ws.cell(row=row_num+1, column=18).value = getattr(record, 'remark1', '') or ''
-
-        # 调整列宽
-        for col in ws.columns:
-            max_length = 0
-            column = col[0].column_letter  # 获取列字母
-            for cell in col:
-                try:
-                    if len(str(cell.value)) > max_length:
-                        max_length = len(str(cell.value))
-                except:
-                    pass
-            adjusted_width = (max_length + 2) * 1.2
-            ws.column_dimensions[column].width = adjusted_width
-
-        # 创建响应
-        output = BytesIO()
-        wb.save(output)
-        output.seek(0)
-
-        # 生成文件名
-        now = datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"后端仓库存记录_{now}.xlsx"
-
-        # 返回Excel文件
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            download_name=filename,
-            as_attachment=True
-        )
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('backend_inventory', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         import traceback
@@ -13125,6 +11483,8 @@ def export_backend_inventory():
 @bp.route('/api/backend/inventory')
 @csrf.exempt
 @require_permission('INVENTORY_VIEW')
+@route_cache(depends_on=('inventory', 'inbound'), vary_by=('args',), permission='INVENTORY_VIEW',
+             ttl=60, cache_type='inventory_list')
 def api_backend_inventory():
     """获取后端仓库存数据"""
     try:
@@ -13226,6 +11586,12 @@ def api_backend_outbound_to_final():
         if not records:
             return jsonify({'success': False, 'message': '没有出库记录'}), 400
 
+        # 持有本批识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+        try:
+            hold_inventory_locks(record.get('identification_code') for record in records if isinstance(record, dict))
+        except LockTimeout as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+
         # 生成批次号
         from app.utils.batch_generator import generate_batch_number
 
@@ -13331,6 +11697,12 @@ def api_backend_outbound_return_frontend():
         if not records:
             return jsonify({'success': False, 'message': '没有出库记录'}), 400
 
+        # 持有本批识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+        try:
+            hold_inventory_locks(record.get('identification_code') for record in records if isinstance(record, dict))
+        except LockTimeout as e:
+            return jsonify({'success': False, 'message': str(e)}), 409
+
         # 获取公共数据
         delivery_plate_number = common_data.get('plate_number', '')
         driver_name = common_data.get('driver_name', '')
@@ -13667,6 +12039,11 @@ def api_backend_outbound_return():
         identification_codes = [item.get('identification_code') for item in items if item.get('identification_code')]
         inventory_dict = {}
         if identification_codes:
+            # 持有这些识别编码的库存锁直到请求结束，其他进程的出库请求等待本次提交
+            try:
+                hold_inventory_locks(identification_codes)
+            except LockTimeout as e:
+                return jsonify({'success': False, 'message': str(e)}), 409
             inventories = Inventory.query.filter(Inventory.identification_code.in_(identification_codes)).all()
             for inv in inventories:
                 inventory_dict[inv.identification_code] = inv
@@ -13828,6 +12205,7 @@ def api_backend_outbound_return():
 @bp.route('/api/transit/cargo/list', methods=['GET'])
 @csrf.exempt
 @login_required
+@route_cache(depends_on=('transit',), vary_by=('args',), ttl=60, cache_type='transit_list')
 def api_transit_cargo_list():
     """获取在途货物列表"""
     try:
@@ -13851,9 +12229,9 @@ def api_transit_cargo_list():
 
         # 应用搜索条件
         if customer_name:
-            query = query.filter(TransitCargo.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(TransitCargo, 'customer_name', customer_name))
         if identification_code:
-            query = query.filter(TransitCargo.identification_code.like(f'%{identification_code}%'))
+            query = query.filter(SearchIndexService.match(TransitCargo, 'identification_code', identification_code))
         if batch_no:
             query = query.filter(TransitCargo.batch_no.like(f'%{batch_no}%'))
         if plate_number:
@@ -13880,11 +12258,12 @@ def api_transit_cargo_list():
         if destination_warehouse_id:
             query = query.filter(TransitCargo.destination_warehouse_id == destination_warehouse_id)
 
-        # 按创建时间降序排序
-        query = query.order_by(TransitCargo.created_at.desc())
-
-        # 分页
-        transit_cargos = query.paginate(page=page, per_page=per_page, error_out=False)
+        # 按创建时间降序键集分页，count=approximate/none 时不做全量计数
+        transit_cargos = keyset_paginate(
+            query, TransitCargo.created_at, TransitCargo.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            descending=True, count_mode=request.args.get('count', 'exact')
+        )
 
         # 转换为字典列表
         cargo_list = [cargo.to_dict() for cargo in transit_cargos.items]
@@ -13893,9 +12272,13 @@ def api_transit_cargo_list():
             'success': True,
             'cargos': cargo_list,
             'total': transit_cargos.total,
-            'page': page,
+            'total_is_estimate': transit_cargos.total_is_estimate,
+            'page': transit_cargos.page,
             'per_page': per_page,
-            'pages': transit_cargos.pages
+            'pages': transit_cargos.pages,
+            'has_next': transit_cargos.has_next,
+            'next_cursor': transit_cargos.next_cursor,
+            'prev_cursor': transit_cargos.prev_cursor
         })
 
     except Exception as e:
@@ -13906,6 +12289,7 @@ def api_transit_cargo_list():
 @bp.route('/api/transit/cargo/list/by-batch', methods=['GET'])
 @csrf.exempt
 @login_required
+@route_cache(depends_on=('transit',), vary_by=('args',), ttl=60, cache_type='transit_batch')
 def api_transit_cargo_list_by_batch():
     """按批次获取在途货物列表"""
     try:
@@ -14944,6 +13328,8 @@ def api_import_inbound_data():
 @bp.route('/api/inventory/statistics', methods=['GET'])
 @csrf.exempt
 @require_permission('INVENTORY_VIEW')
+@route_cache(depends_on=('inventory',), vary_by=('args',), permission='INVENTORY_VIEW',
+             ttl=120, cache_type='inventory_stats')
 def api_inventory_statistics():
     """获取正确的库存统计信息 - 区分原始库存和转移库存"""
     try:
@@ -15083,11 +13469,11 @@ def api_backend_inventory_search():
 
         # 添加搜索条件
         if customer_name:
-            query = query.filter(Inventory.customer_name.like(f'%{customer_name}%'))
+            query = query.filter(SearchIndexService.match(Inventory, 'customer_name', customer_name))
         if identification_code:
-            query = query.filter(Inventory.identification_code.like(f'%{identification_code}%'))
+            query = query.filter(SearchIndexService.match(Inventory, 'identification_code', identification_code))
         if plate_number:
-            query = query.filter(Inventory.plate_number.like(f'%{plate_number}%'))
+            query = query.filter(SearchIndexService.match(Inventory, 'plate_number', plate_number))
 
         # 只查询有库存的记录
         query = query.filter(
@@ -15539,6 +13925,7 @@ def api_backend_outbound_delete_batch(batch_no):
 @bp.route('/api/backend/outbound/save', methods=['POST'])
 @login_required
 @csrf.exempt
+@transactional_view('outbound')
 def api_backend_outbound_save():
     """后端仓出库保存API"""
     try:
@@ -15560,19 +13947,18 @@ def api_backend_outbound_save():
         from app.utils.batch_generator import generate_batch_number
         batch_no = generate_batch_number(4)  # 4是凭祥北投仓的ID，不传递db_session避免事务冲突
 
+        # 一次查询本批全部库存记录
+        inventories = {inventory.id: inventory for inventory in Inventory.query.filter(
+            Inventory.id.in_({int(cargo['id']) for cargo in cargo_list})
+        ).all()}
+        inventory_updates = []
+
         # 创建出库记录
         for cargo in cargo_list:
-            # 检查库存是否足够
-            inventory = Inventory.query.get(cargo['id'])
+            inventory = inventories.get(int(cargo['id']))
             if not inventory:
                 raise Exception(f'库存记录不存在: {cargo["id"]}')
 
-            if (inventory.pallet_count or 0) < (cargo.get('pallet_count', 0) or 0):
-                raise Exception(f'库存板数不足: {cargo["customer_name"]}')
-
-            if (inventory.package_count or 0) < (cargo.get('package_count', 0) or 0):
-                raise Exception(f'库存件数不足: {cargo["customer_name"]}')
-
             # 使用用户输入的备注，不自动添加车挂和柜号信息
             remarks = cargo.get('remarks', '')
 
@@ -15614,13 +14000,21 @@ def api_backend_outbound_save():
 
             db.session.add(outbound_record)
 
-            # 更新库存
-            inventory.pallet_count = (inventory.pallet_count or 0) - (cargo.get('pallet_count', 0) or 0)
-            inventory.package_count = (inventory.package_count or 0) - (cargo.get('package_count', 0) or 0)
+            inventory_updates.append({
+                'identification_code': inventory.identification_code,
+                'operation_type': 'subtract',
+                'pallet_count': cargo.get('pallet_count', 0) or 0,
+                'package_count': cargo.get('package_count', 0) or 0
+            })
+
+        # 集合方式扣减库存：按ID顺序锁定库存行并检查库存是否足够，CASE 语句批量写入
+        from app.services.inventory_mutation_service import InventoryBulkMutator
+        mutation = InventoryBulkMutator().apply(inventory_updates)
 
-            # 如果库存为0，删除库存记录
-            if (inventory.pallet_count or 0) <= 0 and (inventory.package_count or 0) <= 0:
-                db.session.delete(inventory)
+        # 如果库存为0，删除库存记录
+        for applied in mutation['applied']:
+            if (applied['after']['pallet_count'] or 0) <= 0 and (applied['after']['package_count'] or 0) <= 0:
+                db.session.delete(inventories[applied['id']])
 
         # 提交事务
         db.session.commit()
@@ -15757,7 +14151,8 @@ def export_backend_outbound():
         # 构建查询，只查询后端仓的出库记录
         query = OutboundRecord.query.options(
             db.joinedload(OutboundRecord.operated_warehouse),
-            db.joinedload(OutboundRecord.destination_warehouse)
+            db.joinedload(OutboundRecord.destination_warehouse),
+            db.joinedload(OutboundRecord.operated_by_user)
         ).filter(OutboundRecord.operated_warehouse_id == backend_warehouse.id)
 
         # 根据用户权限过滤数据
@@ -15802,79 +14197,15 @@ def export_backend_outbound():
             query = query.filter(OutboundRecord.service_staff.like(f'%{service_staff}%'))
 
         # 按出库时间降序排序
-        records = query.order_by(OutboundRecord.outbound_time.desc()).all()
+        query = query.order_by(OutboundRecord.outbound_time.desc())
 
         # 如果没有记录，返回提示
-        if not records:
+        if query.first() is None:
             flash('没有找到符合条件的后端仓出库记录', 'warning')
             return redirect(url_for('main.backend_outbound_list'))
 
-        # 准备导出数据
-        data = []
-        for record in records:
-            data.append({
-                '出库时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else '',
-                '批次号': record.batch_no or '',
-                '送货干线车': record.delivery_plate_number or '',
-                '出库/出境车牌': record.plate_number or '',
-                '入库车牌': record.inbound_plate or '',
-                '客户名称': record.customer_name or '',
-                '识别编码': record.identification_code or '',
-                '目的地': record.destination or '',
-                '出境模式': record.export_mode or '',
-                '报关行': record.customs_broker or '',
-                '订单类型': record.order_type or '',
-                '出库板数': record.pallet_count or 0,
-                '出库件数': record.package_count or 0,
-                '重量(KG)': record.weight or 0,
-                '体积(CBM)': record.volume or 0,
-                '单据': record.document_no or '',
-                '跟单客服': record.service_staff or '',
-                '备注': record.remarks or '',
-                '入库日期': record.inbound_date.strftime('%Y-%m-%d') if record.inbound_date else '',
-                '操作仓库': record.operated_warehouse.warehouse_name if record.operated_warehouse else '',
-                '操作用户': record.operated_by_user.username if record.operated_by_user else '',
-                '创建时间': record.outbound_time.strftime('%Y-%m-%d %H:%M:%S') if record.outbound_time else ''
-            })
-
-        # 使用pandas导出Excel
-        try:
-            import pandas as pd
-            from io import BytesIO
-
-            df = pd.DataFrame(data)
-            output = BytesIO()
-
-            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-                df.to_excel(writer, sheet_name='后端仓出库记录', index=False)
-
-                # 获取工作表和工作簿对象
-                workbook = writer.book
-                worksheet = writer.sheets['后端仓出库记录']
-
-                # 设置列宽
-                for i, col in enumerate(df.columns):
-                    max_len = max(df[col].astype(str).map(len).max(), len(col)) + 2
-                    worksheet.set_column(i, i, min(max_len, 50))
-
-            # 设置文件指针到开始位置
-            output.seek(0)
-
-            # 生成下载文件名
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"后端仓出库记录导出_{timestamp}.xlsx"
-
-            # 返回Excel文件
-            return send_file(
-                output,
-                as_attachment=True,
-                download_name=filename,
-                mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            )
-
-        except ImportError:
-            flash("导出Excel需要pandas或xlsxwriter库，请安装: pip install pandas xlsxwriter 或 pip install openpyxl", "danger")
-            return redirect(url_for('main.backend_outbound_list'))
+        # 流式导出（format=csv 时导出CSV）
+        return StreamingExportService.export('backend_outbound', query, request.args.get('format', 'xlsx'))
 
     except Exception as e:
         current_app.logger.error(f"导出后端仓出库记录时出错: {str(e)}")
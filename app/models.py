@@ -42,7 +42,7 @@ class InboundRecord(db.Model):
     operated_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), comment='操作用户ID')
     operated_warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), comment='操作仓库ID')
     created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     # 乐观锁版本字段
     version = db.Column(db.Integer, default=1, comment='版本号，用于乐观锁控制')
@@ -144,7 +144,7 @@ class OutboundRecord(db.Model):
     operated_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), comment='操作用户ID')
     operated_warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), comment='操作仓库ID')
     created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     # 乐观锁版本字段
     version = db.Column(db.Integer, default=1, comment='版本号，用于乐观锁控制')
@@ -245,7 +245,7 @@ class Inventory(db.Model):
     # 操作追踪字段
     operated_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), comment='操作用户ID')
     operated_warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), comment='操作仓库ID')
-    last_updated = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)  # 最后更新时间
+    last_updated = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)  # 最后更新时间
     version = db.Column(db.Integer, default=1)  # 版本号，用于乐观锁并发控制
 
     # 关联关系
@@ -479,12 +479,9 @@ class User(UserMixin, db.Model):
         return [ur.role for ur in query.all()]
 
     def has_role(self, role_code):
-        """检查用户是否有指定角色"""
-        roles = self.get_roles()
-        for role in roles:
-            if role.role_code == role_code:
-                return True
-        return False
+        """检查用户是否有指定角色（使用有效权限缓存中的角色集合）"""
+        from app.utils.permission_cache import PermissionCache
+        return PermissionCache.get(self.id).has_role(role_code)
 
     def is_super_admin(self):
         """检查是否为超级管理员"""
@@ -496,24 +493,12 @@ class User(UserMixin, db.Model):
         if self.is_super_admin():
             return True
 
-        # 使用新的权限管理器检查权限
-        from app.utils.permission_manager import PermissionManager
-
-        # 检查页面权限（新权限系统）
-        if PermissionManager.has_page_permission(self.id, permission_code):
-            return True
-
-        # 检查菜单权限（新权限系统）
-        if PermissionManager.has_menu_permission(self.id, permission_code):
-            return True
-
-        # 检查操作权限（新权限系统）
-        if PermissionManager.has_operation_permission(self.id, permission_code):
-            return True
+        # 检查页面、菜单、操作权限（新权限系统，使用有效权限缓存）
+        from app.utils.permission_cache import PermissionCache
 
         # 权限检查严格按照数据库中的权限分配进行
         # 不再提供临时的基本权限，确保权限控制的准确性
-        return False
+        return PermissionCache.get(self.id).has_permission(permission_code)
 
     def __repr__(self):
         return f'<User {self.username}>'
@@ -851,7 +836,7 @@ class ReceiveRecord(db.Model):
     operated_warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), comment='操作仓库ID')
     created_by = db.Column(db.Integer, db.ForeignKey('user.id'), comment='操作用户ID')
     created_at = db.Column(db.DateTime, default=datetime.now)
-    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now, index=True)
 
     # 关联关系
     operated_warehouse = db.relationship('Warehouse', foreign_keys=[operated_warehouse_id], backref='receive_records')
@@ -898,6 +883,261 @@ class ReceiveRecord(db.Model):
         }
 
 
+# ==================== 库存汇总模型 ====================
+
+class InventorySummary(db.Model):
+    """库存汇总表 - 按识别编码+仓库物化的库存聚合，由写入路径实时维护"""
+    __tablename__ = 'inventory_summary'
+
+    id = db.Column(db.Integer, primary_key=True)
+    identification_code = db.Column(db.String(100), nullable=False, comment='识别编码')
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), nullable=False, comment='仓库ID')
+    warehouse_type = db.Column(db.String(20), index=True, comment='仓库类型: frontend/backend')
+    # 基础信息
+    customer_name = db.Column(db.String(100), index=True, comment='客户名称')
+    plate_number = db.Column(db.String(20), comment='入库车牌')
+    inbound_time = db.Column(db.DateTime, index=True, comment='入库时间')
+    location = db.Column(db.String(50), comment='库位')
+    documents = db.Column(db.String(100), comment='单据')
+    export_mode = db.Column(db.String(50), comment='出境模式')
+    order_type = db.Column(db.String(50), comment='订单类型')
+    customs_broker = db.Column(db.String(100), comment='报关行')
+    service_staff = db.Column(db.String(50), comment='跟单客服')
+    # 当前库存（该仓库所有库存记录之和）
+    inventory_record_count = db.Column(db.Integer, default=0, comment='库存记录条数')
+    pallet_count = db.Column(db.Integer, default=0, comment='库存板数')
+    package_count = db.Column(db.Integer, default=0, comment='库存件数')
+    weight = db.Column(db.Float, default=0, comment='库存重量(kg)')
+    volume = db.Column(db.Float, default=0, comment='库存体积(m³)')
+    # 从该仓库发出、仍在途的数量
+    in_transit_pallet_count = db.Column(db.Integer, default=0, comment='在途板数')
+    in_transit_package_count = db.Column(db.Integer, default=0, comment='在途件数')
+    in_transit_weight = db.Column(db.Float, default=0, comment='在途重量(kg)')
+    in_transit_volume = db.Column(db.Float, default=0, comment='在途体积(m³)')
+    transit_departure_time = db.Column(db.DateTime, comment='最近在途发车时间')
+    # 从该仓库出库到春疆货场/工厂的数量
+    chunjiang_outbound_count = db.Column(db.Integer, default=0, comment='出库到春疆的记录条数')
+    chunjiang_outbound_pallet = db.Column(db.Integer, default=0, comment='出库到春疆板数')
+    chunjiang_outbound_package = db.Column(db.Integer, default=0, comment='出库到春疆件数')
+    # 原始入库数量（来自入库记录，与仓库无关）
+    original_pallet_count = db.Column(db.Integer, default=0, comment='原始入库板数')
+    original_package_count = db.Column(db.Integer, default=0, comment='原始入库件数')
+    original_weight = db.Column(db.Float, default=0, comment='原始入库重量(kg)')
+    original_volume = db.Column(db.Float, default=0, comment='原始入库体积(m³)')
+    last_updated = db.Column(db.DateTime, default=datetime.now, comment='库存最后更新时间')
+    refreshed_at = db.Column(db.DateTime, default=datetime.now, comment='汇总刷新时间')
+
+    # 关联关系
+    warehouse = db.relationship('Warehouse', foreign_keys=[warehouse_id])
+
+    __table_args__ = (
+        db.UniqueConstraint('identification_code', 'warehouse_id', name='unique_summary_code_warehouse'),
+        db.Index('idx_summary_warehouse_inbound', 'warehouse_id', 'inbound_time'),
+    )
+
+    def __repr__(self):
+        return f'<InventorySummary {self.identification_code}@{self.warehouse_id}>'
+
+
+class SequenceCounter(db.Model):
+    """序号计数器表 - 识别编码、批次号等按 前缀+日期 原子递增分配序号"""
+    __tablename__ = 'sequence_counters'
+
+    id = db.Column(db.Integer, primary_key=True)
+    scope = db.Column(db.String(30), nullable=False, comment='序号类别: inbound_code/outbound_code/batch_no')
+    sequence_key = db.Column(db.String(255), nullable=False, comment='序号键，通常为 前缀+日期')
+    sequence_date = db.Column(db.Date, index=True, comment='序号所属日期，用于清理过期计数器')
+    current_value = db.Column(db.Integer, nullable=False, default=0, comment='已分配的最大序号')
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    updated_at = db.Column(db.DateTime, default=datetime.now, onupdate=datetime.now)
+
+    __table_args__ = (db.UniqueConstraint('scope', 'sequence_key', name='unique_sequence_scope_key'),)
+
+    def __repr__(self):
+        return f'<SequenceCounter {self.scope}:{self.sequence_key}={self.current_value}>'
+
+
+class DailyOperationsRollup(db.Model):
+    """每日作业汇总表 - 按 日期+仓库+客户+进出库类型 预聚合的进出库数据，供报表服务读取"""
+    __tablename__ = 'daily_operations_rollup'
+
+    id = db.Column(db.Integer, primary_key=True)
+    stat_date = db.Column(db.Date, nullable=False, comment='统计日期')
+    warehouse_id = db.Column(db.Integer, db.ForeignKey('warehouse.id'), comment='操作仓库ID')
+    customer_name = db.Column(db.String(100), nullable=False, default='', comment='客户名称')
+    record_type = db.Column(db.String(20), nullable=False, comment='记录类型: inbound/outbound')
+    record_count = db.Column(db.Integer, nullable=False, default=0, comment='记录票数')
+    pallet_count = db.Column(db.Integer, nullable=False, default=0, comment='板数合计')
+    package_count = db.Column(db.Integer, nullable=False, default=0, comment='件数合计')
+    weight = db.Column(db.Float, nullable=False, default=0, comment='重量合计(kg)')
+    volume = db.Column(db.Float, nullable=False, default=0, comment='体积合计(m³)')
+    refreshed_at = db.Column(db.DateTime, default=datetime.now, comment='汇总刷新时间')
+
+    __table_args__ = (
+        db.UniqueConstraint('stat_date', 'warehouse_id', 'customer_name', 'record_type',
+                            name='unique_rollup_date_warehouse_customer_type'),
+        db.Index('idx_rollup_warehouse_date', 'warehouse_id', 'stat_date'),
+    )
+
+    def __repr__(self):
+        return f'<DailyOperationsRollup {self.stat_date} {self.warehouse_id} {self.customer_name} {self.record_type}>'
+
+
+class ExportJob(db.Model):
+    """后台导出任务表 - 异步生成的导出/报表文件及其进度"""
+    __tablename__ = 'export_jobs'
+
+    id = db.Column(db.String(32), primary_key=True, comment='任务ID')
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True, comment='提交用户ID')
+    job_type = db.Column(db.String(20), nullable=False, default='export', comment='任务类型: export/report')
+    job_name = db.Column(db.String(50), nullable=False, comment='导出名称或报表类型')
+    file_format = db.Column(db.String(10), nullable=False, default='xlsx', comment='文件格式')
+    params = db.Column(db.Text, comment='任务参数(JSON)')
+    status = db.Column(db.String(20), nullable=False, default='pending', index=True,
+                       comment='状态: pending/running/finished/failed/expired')
+    progress = db.Column(db.Integer, nullable=False, default=0, comment='进度百分比')
+    total_rows = db.Column(db.Integer, comment='预计行数')
+    row_count = db.Column(db.Integer, default=0, comment='已写入行数')
+    file_path = db.Column(db.String(255), comment='生成文件路径')
+    filename = db.Column(db.String(255), comment='下载文件名')
+    error_message = db.Column(db.Text, comment='失败原因')
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    started_at = db.Column(db.DateTime, comment='开始执行时间')
+    finished_at = db.Column(db.DateTime, comment='完成时间')
+    expires_at = db.Column(db.DateTime, index=True, comment='文件过期时间')
+
+    user = db.relationship('User', foreign_keys=[user_id], backref='export_jobs')
+
+    def __repr__(self):
+        return f'<ExportJob {self.id} {self.job_name} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'job_type': self.job_type,
+            'job_name': self.job_name,
+            'file_format': self.file_format,
+            'status': self.status,
+            'progress': self.progress,
+            'total_rows': self.total_rows,
+            'row_count': self.row_count,
+            'filename': self.filename,
+            'error_message': self.error_message,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'finished_at': self.finished_at.strftime('%Y-%m-%d %H:%M:%S') if self.finished_at else None,
+            'expires_at': self.expires_at.strftime('%Y-%m-%d %H:%M:%S') if self.expires_at else None
+        }
+
+
+class SearchToken(db.Model):
+    """搜索分词表 - 客户名称、识别编码、车牌按二元分词建立的倒排索引，由写入路径实时维护"""
+    __tablename__ = 'search_tokens'
+
+    id = db.Column(db.Integer, primary_key=True)
+    entity_type = db.Column(db.String(20), nullable=False, comment='记录类型: inventory/inbound/outbound/transit')
+    entity_id = db.Column(db.Integer, nullable=False, comment='记录ID')
+    field = db.Column(db.String(30), nullable=False, comment='字段名')
+    gram = db.Column(db.String(8), nullable=False, comment='二元分词（小写）')
+
+    __table_args__ = (
+        db.Index('idx_search_token_lookup', 'entity_type', 'gram', 'field', 'entity_id'),
+        db.Index('idx_search_token_entity', 'entity_type', 'entity_id'),
+    )
+
+    def __repr__(self):
+        return f'<SearchToken {self.entity_type}:{self.entity_id} {self.field}={self.gram}>'
+
+
+class ConsistencyChangeLog(db.Model):
+    """一致性变更日志表 - 记录删除、修改识别编码等不会留下更新时间的写入，供增量对账读取"""
+    __tablename__ = 'consistency_change_log'
+
+    id = db.Column(db.Integer, primary_key=True)
+    identification_code = db.Column(db.String(100), comment='识别编码，为空表示无法确定范围的批量写入')
+    source = db.Column(db.String(30), nullable=False, comment='来源表')
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.now, index=True, comment='变更时间')
+
+    def __repr__(self):
+        return f'<ConsistencyChangeLog {self.source} {self.identification_code}>'
+
+
+class ConsistencyFinding(db.Model):
+    """一致性问题表 - 对账发现的库存不一致，同一问题重复发现时累加次数，恢复一致后标记为已解决"""
+    __tablename__ = 'consistency_findings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    identification_code = db.Column(db.String(100), nullable=False, comment='识别编码')
+    warehouse_id = db.Column(db.Integer, comment='仓库ID')
+    finding_type = db.Column(db.String(40), nullable=False, comment='问题类型: inventory_balance_mismatch/negative_inventory')
+    severity = db.Column(db.String(10), nullable=False, default='high', comment='严重程度: high/medium/low')
+    theoretical_pallets = db.Column(db.Integer, comment='理论板数')
+    actual_pallets = db.Column(db.Integer, comment='实际板数')
+    theoretical_packages = db.Column(db.Integer, comment='理论件数')
+    actual_packages = db.Column(db.Integer, comment='实际件数')
+    details = db.Column(db.Text, comment='问题描述')
+    status = db.Column(db.String(20), nullable=False, default='open', comment='状态: open/resolved')
+    detection_count = db.Column(db.Integer, nullable=False, default=1, comment='发现次数')
+    detected_by = db.Column(db.String(20), comment='最近发现方式: incremental/sweep')
+    first_detected_at = db.Column(db.DateTime, default=datetime.now, comment='首次发现时间')
+    last_detected_at = db.Column(db.DateTime, default=datetime.now, comment='最近发现时间')
+    resolved_at = db.Column(db.DateTime, comment='解决时间')
+
+    __table_args__ = (
+        db.Index('idx_finding_code_status', 'identification_code', 'status'),
+        db.Index('idx_finding_status_detected', 'status', 'last_detected_at'),
+    )
+
+    def __repr__(self):
+        return f'<ConsistencyFinding {self.finding_type} {self.identification_code}@{self.warehouse_id} {self.status}>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'identification_code': self.identification_code,
+            'warehouse_id': self.warehouse_id,
+            'finding_type': self.finding_type,
+            'severity': self.severity,
+            'theoretical_pallets': self.theoretical_pallets,
+            'actual_pallets': self.actual_pallets,
+            'theoretical_packages': self.theoretical_packages,
+            'actual_packages': self.actual_packages,
+            'details': self.details,
+            'status': self.status,
+            'detection_count': self.detection_count,
+            'detected_by': self.detected_by,
+            'first_detected_at': self.first_detected_at.strftime('%Y-%m-%d %H:%M:%S') if self.first_detected_at else None,
+            'last_detected_at': self.last_detected_at.strftime('%Y-%m-%d %H:%M:%S') if self.last_detected_at else None,
+            'resolved_at': self.resolved_at.strftime('%Y-%m-%d %H:%M:%S') if self.resolved_at else None
+        }
+
+
+class ReconciliationState(db.Model):
+    """对账进度表 - 增量对账的水位线和全量扫描的断点"""
+    __tablename__ = 'reconciliation_state'
+
+    name = db.Column(db.String(50), primary_key=True, comment='对账任务名称')
+    watermark = db.Column(db.DateTime, comment='增量对账已覆盖到的时间')
+    sweep_cursor = db.Column(db.String(100), comment='全量扫描已处理到的识别编码')
+    sweep_requested = db.Column(db.Boolean, nullable=False, default=False, comment='是否需要全量扫描')
+    sweep_started_at = db.Column(db.DateTime, comment='本轮全量扫描开始时间')
+    sweep_completed_at = db.Column(db.DateTime, comment='最近一轮全量扫描完成时间')
+    last_run_at = db.Column(db.DateTime, comment='最近一次对账时间')
+
+    def __repr__(self):
+        return f'<ReconciliationState {self.name} {self.watermark}>'
+
+
+class BackfillState(db.Model):
+    """派生表回填状态表 - 汇总表等全量回填完成的标记，所有进程共享"""
+    __tablename__ = 'backfill_state'
+
+    name = db.Column(db.String(50), primary_key=True, comment='派生表名称')
+    completed_at = db.Column(db.DateTime, nullable=False, comment='最近一次全量回填完成时间')
+
+    def __repr__(self):
+        return f'<BackfillState {self.name} {self.completed_at}>'
+
+
 # ==================== 精细化权限管理模型 ====================
 
 class MenuPermission(db.Model):
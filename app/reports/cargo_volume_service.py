@@ -13,10 +13,14 @@ from app.models import (
     InboundRecord, OutboundRecord, Inventory, TransitCargo,
     ReceiveRecord, Warehouse, User
 )
+from app.services.daily_rollup_service import DailyRollupService
 
 class CargoVolumeService:
     """货量报表服务类"""
 
+    # 日期范围统计最多支持的天数
+    MAX_DAY_RANGE_DAYS = 31
+
     def __init__(self):
         self.warehouse_names = {
             1: '平湖仓', 2: '昆山仓', 3: '成都仓', 4: '凭祥北投仓'
@@ -153,56 +157,14 @@ class CargoVolumeService:
             raise ValueError('日期格式错误，请使用YYYY-MM-DD格式')
 
         # 验证日期范围
-        if (end_date - start_date).days > 7:
-            raise ValueError('日期范围不能超过7天')
+        if (end_date - start_date).days >= self.MAX_DAY_RANGE_DAYS:
+            raise ValueError(f'日期范围不能超过{self.MAX_DAY_RANGE_DAYS}天')
 
         if start_date > end_date:
             raise ValueError('开始日期不能晚于结束日期')
 
         accessible_warehouses = self._get_accessible_warehouses(user)
-
-        # 生成日期列表
-        current_date = start_date
-        daily_data = []
-        summary = {'total_count': 0, 'total_pallets': 0, 'total_packages': 0}
-
-        while current_date <= end_date:
-            day_data = {
-                'date': current_date.strftime('%Y-%m-%d'),
-                'total': 0,
-                'total_pallets': 0,
-                'total_packages': 0
-            }
-
-            for warehouse_id in [1, 2, 3, 4]:
-                if warehouse_id in accessible_warehouses:
-                    # 获取当日进出库数据
-                    inbound = self._get_warehouse_daily_inbound(warehouse_id, current_date)
-                    outbound = self._get_warehouse_daily_outbound(warehouse_id, current_date)
-
-                    warehouse_total = inbound['count'] + outbound['count']
-                    warehouse_pallets = inbound['pallets'] + outbound['pallets']
-                    warehouse_packages = inbound['packages'] + outbound['packages']
-
-                    day_data[f'warehouse_{warehouse_id}'] = warehouse_total
-                    day_data[f'warehouse_{warehouse_id}_pallets'] = warehouse_pallets
-                    day_data[f'warehouse_{warehouse_id}_packages'] = warehouse_packages
-
-                    day_data['total'] += warehouse_total
-                    day_data['total_pallets'] += warehouse_pallets
-                    day_data['total_packages'] += warehouse_packages
-
-                    # 累计汇总数据
-                    summary['total_count'] += warehouse_total
-                    summary['total_pallets'] += warehouse_pallets
-                    summary['total_packages'] += warehouse_packages
-                else:
-                    day_data[f'warehouse_{warehouse_id}'] = 0
-                    day_data[f'warehouse_{warehouse_id}_pallets'] = 0
-                    day_data[f'warehouse_{warehouse_id}_packages'] = 0
-
-            daily_data.append(day_data)
-            current_date += timedelta(days=1)
+        daily_data, summary = self._get_daily_rows(accessible_warehouses, start_date, end_date)
 
         return {
             'daily_data': daily_data,
@@ -342,47 +304,7 @@ class CargoVolumeService:
 
     def _get_week_data(self, accessible_warehouses, start_date, end_date, week_name):
         """获取指定周的数据"""
-        current_date = start_date
-        daily_data = []
-        summary = {'total_count': 0, 'total_pallets': 0, 'total_packages': 0}
-
-        while current_date <= end_date:
-            day_data = {
-                'date': current_date.strftime('%Y-%m-%d'),
-                'total': 0,
-                'total_pallets': 0,
-                'total_packages': 0
-            }
-
-            for warehouse_id in [1, 2, 3, 4]:
-                if warehouse_id in accessible_warehouses:
-                    # 获取当日进出库数据
-                    inbound = self._get_warehouse_daily_inbound(warehouse_id, current_date)
-                    outbound = self._get_warehouse_daily_outbound(warehouse_id, current_date)
-
-                    warehouse_total = inbound['count'] + outbound['count']
-                    warehouse_pallets = inbound['pallets'] + outbound['pallets']
-                    warehouse_packages = inbound['packages'] + outbound['packages']
-
-                    day_data[f'warehouse_{warehouse_id}'] = warehouse_total
-                    day_data[f'warehouse_{warehouse_id}_pallets'] = warehouse_pallets
-                    day_data[f'warehouse_{warehouse_id}_packages'] = warehouse_packages
-
-                    day_data['total'] += warehouse_total
-                    day_data['total_pallets'] += warehouse_pallets
-                    day_data['total_packages'] += warehouse_packages
-
-                    # 累计汇总数据
-                    summary['total_count'] += warehouse_total
-                    summary['total_pallets'] += warehouse_pallets
-                    summary['total_packages'] += warehouse_packages
-                else:
-                    day_data[f'warehouse_{warehouse_id}'] = 0
-                    day_data[f'warehouse_{warehouse_id}_pallets'] = 0
-                    day_data[f'warehouse_{warehouse_id}_packages'] = 0
-
-            daily_data.append(day_data)
-            current_date += timedelta(days=1)
+        daily_data, summary = self._get_daily_rows(accessible_warehouses, start_date, end_date)
 
         return {
             'name': week_name,
@@ -424,53 +346,17 @@ class CargoVolumeService:
 
             accessible_warehouses = self._get_accessible_warehouses(user)
 
-            # 生成月份数据
-            month_data = []
-            summary = {'total_count': 0, 'total_pallets': 0, 'total_packages': 0}
-
+            # 生成月份列表
+            periods = []
             current_year = start_year
             current_month = start_month
 
             while (current_year < end_year) or (current_year == end_year and current_month <= end_month):
-                month_info = {
+                periods.append(((current_year, current_month), {
                     'year': current_year,
                     'month': current_month,
-                    'month_name': f"{current_year}年{current_month}月",
-                    'total': 0,
-                    'total_pallets': 0,
-                    'total_packages': 0
-                }
-
-                # 计算当月的日期范围
-                month_start = date(current_year, current_month, 1)
-                if current_month == 12:
-                    month_end = date(current_year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    month_end = date(current_year, current_month + 1, 1) - timedelta(days=1)
-
-                # 获取各仓库当月数据
-                for warehouse_id in [1, 2, 3, 4]:
-                    if warehouse_id in accessible_warehouses:
-                        month_stats = self._get_warehouse_monthly_stats(warehouse_id, month_start, month_end)
-
-                        month_info[f'warehouse_{warehouse_id}'] = month_stats['count']
-                        month_info[f'warehouse_{warehouse_id}_pallets'] = month_stats['pallets']
-                        month_info[f'warehouse_{warehouse_id}_packages'] = month_stats['packages']
-
-                        month_info['total'] += month_stats['count']
-                        month_info['total_pallets'] += month_stats['pallets']
-                        month_info['total_packages'] += month_stats['packages']
-
-                        # 累计汇总数据
-                        summary['total_count'] += month_stats['count']
-                        summary['total_pallets'] += month_stats['pallets']
-                        summary['total_packages'] += month_stats['packages']
-                    else:
-                        month_info[f'warehouse_{warehouse_id}'] = 0
-                        month_info[f'warehouse_{warehouse_id}_pallets'] = 0
-                        month_info[f'warehouse_{warehouse_id}_packages'] = 0
-
-                month_data.append(month_info)
+                    'month_name': f"{current_year}年{current_month}月"
+                }))
 
                 # 移动到下一个月
                 if current_month == 12:
@@ -479,6 +365,11 @@ class CargoVolumeService:
                 else:
                     current_month += 1
 
+            daily_totals = self._aggregate_daily_volume(accessible_warehouses, start_date, end_date)
+            month_data, summary = self._pivot_volume(
+                daily_totals, periods, lambda day: (day.year, day.month), accessible_warehouses
+            )
+
             return {
                 'month_data': month_data,
                 'summary': summary,
@@ -494,41 +385,6 @@ class CargoVolumeService:
         except Exception as e:
             raise ValueError(f'月份统计数据获取失败: {str(e)}')
 
-    def _get_warehouse_monthly_stats(self, warehouse_id, start_date, end_date):
-        """获取指定仓库在指定月份的统计数据"""
-        try:
-            # 获取月度进库数据
-            inbound_stats = db.session.query(
-                func.coalesce(func.sum(InboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(InboundRecord.package_count), 0).label('packages'),
-                func.count(InboundRecord.id).label('count')
-            ).filter(
-                InboundRecord.operated_warehouse_id == warehouse_id,
-                InboundRecord.inbound_time >= start_date,
-                InboundRecord.inbound_time <= end_date
-            ).first()
-
-            # 获取月度出库数据
-            outbound_stats = db.session.query(
-                func.coalesce(func.sum(OutboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(OutboundRecord.package_count), 0).label('packages'),
-                func.count(OutboundRecord.id).label('count')
-            ).filter(
-                OutboundRecord.operated_warehouse_id == warehouse_id,
-                OutboundRecord.outbound_time >= start_date,
-                OutboundRecord.outbound_time <= end_date
-            ).first()
-
-            return {
-                'count': (inbound_stats.count or 0) + (outbound_stats.count or 0),
-                'pallets': (inbound_stats.pallets or 0) + (outbound_stats.pallets or 0),
-                'packages': (inbound_stats.packages or 0) + (outbound_stats.packages or 0)
-            }
-
-        except Exception as e:
-            current_app.logger.error(f'获取仓库{warehouse_id}月度统计失败: {str(e)}')
-            return {'count': 0, 'pallets': 0, 'packages': 0}
-
     def get_year_range_stats(self, user, start_year, end_year):
         """获取年份范围统计数据"""
         try:
@@ -545,46 +401,15 @@ class CargoVolumeService:
 
             accessible_warehouses = self._get_accessible_warehouses(user)
 
-            # 生成年度数据
-            year_data = []
-            summary = {'total_count': 0, 'total_pallets': 0, 'total_packages': 0}
-
-            for year in range(start_year, end_year + 1):
-                year_info = {
-                    'year': year,
-                    'year_name': f"{year}年",
-                    'total': 0,
-                    'total_pallets': 0,
-                    'total_packages': 0
-                }
-
-                # 计算当年的日期范围
-                year_start = date(year, 1, 1)
-                year_end = date(year, 12, 31)
+            periods = [(year, {'year': year, 'year_name': f"{year}年"})
+                       for year in range(start_year, end_year + 1)]
 
-                # 获取各仓库当年数据
-                for warehouse_id in [1, 2, 3, 4]:
-                    if warehouse_id in accessible_warehouses:
-                        year_stats = self._get_warehouse_yearly_stats(warehouse_id, year_start, year_end)
-
-                        year_info[f'warehouse_{warehouse_id}'] = year_stats['count']
-                        year_info[f'warehouse_{warehouse_id}_pallets'] = year_stats['pallets']
-                        year_info[f'warehouse_{warehouse_id}_packages'] = year_stats['packages']
-
-                        year_info['total'] += year_stats['count']
-                        year_info['total_pallets'] += year_stats['pallets']
-                        year_info['total_packages'] += year_stats['packages']
-
-                        # 累计汇总数据
-                        summary['total_count'] += year_stats['count']
-                        summary['total_pallets'] += year_stats['pallets']
-                        summary['total_packages'] += year_stats['packages']
-                    else:
-                        year_info[f'warehouse_{warehouse_id}'] = 0
-                        year_info[f'warehouse_{warehouse_id}_pallets'] = 0
-                        year_info[f'warehouse_{warehouse_id}_packages'] = 0
-
-                year_data.append(year_info)
+            daily_totals = self._aggregate_daily_volume(
+                accessible_warehouses, date(start_year, 1, 1), date(end_year, 12, 31)
+            )
+            year_data, summary = self._pivot_volume(
+                daily_totals, periods, lambda day: day.year, accessible_warehouses
+            )
 
             return {
                 'year_data': year_data,
@@ -599,51 +424,100 @@ class CargoVolumeService:
         except Exception as e:
             raise ValueError(f'年度统计数据获取失败: {str(e)}')
 
-    def _get_warehouse_yearly_stats(self, warehouse_id, start_date, end_date):
-        """获取指定仓库在指定年份的统计数据"""
-        try:
-            from datetime import datetime
+    def _get_daily_rows(self, accessible_warehouses, start_date, end_date):
+        """获取日期范围内逐日的各仓库数据行及汇总"""
+        periods = []
+        current_date = start_date
+        while current_date <= end_date:
+            periods.append((current_date, {'date': current_date.strftime('%Y-%m-%d')}))
+            current_date += timedelta(days=1)
 
-            # 将date转换为datetime，确保正确的日期范围比较
-            start_datetime = datetime.combine(start_date, datetime.min.time())
-            end_datetime = datetime.combine(end_date, datetime.max.time())
+        daily_totals = self._aggregate_daily_volume(accessible_warehouses, start_date, end_date)
+        return self._pivot_volume(daily_totals, periods, lambda day: day, accessible_warehouses)
 
-            current_app.logger.info(f'查询仓库{warehouse_id}年度数据: {start_datetime} 到 {end_datetime}')
+    def _aggregate_daily_volume(self, warehouse_ids, start_date, end_date):
+        """
+        按 日期+仓库 聚合进出库数据
 
-            # 获取年度进库数据
-            inbound_stats = db.session.query(
-                func.coalesce(func.sum(InboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(InboundRecord.package_count), 0).label('packages'),
-                func.count(InboundRecord.id).label('count')
-            ).filter(
-                InboundRecord.operated_warehouse_id == warehouse_id,
-                InboundRecord.inbound_time >= start_datetime,
-                InboundRecord.inbound_time <= end_datetime
-            ).first()
+        读取每日作业汇总表，一条 GROUP BY stat_date, warehouse_id 查询完成，
+        查询代价与日期跨度成正比，与进出库记录数量无关。
 
-            # 获取年度出库数据
-            outbound_stats = db.session.query(
-                func.coalesce(func.sum(OutboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(OutboundRecord.package_count), 0).label('packages'),
-                func.count(OutboundRecord.id).label('count')
-            ).filter(
-                OutboundRecord.operated_warehouse_id == warehouse_id,
-                OutboundRecord.outbound_time >= start_datetime,
-                OutboundRecord.outbound_time <= end_datetime
-            ).first()
-
-            result = {
-                'count': (inbound_stats.count or 0) + (outbound_stats.count or 0),
-                'pallets': (inbound_stats.pallets or 0) + (outbound_stats.pallets or 0),
-                'packages': (inbound_stats.packages or 0) + (outbound_stats.packages or 0)
+        Returns:
+            dict: {(日期, 仓库ID): {'count': 票数, 'pallets': 板数, 'packages': 件数}}
+        """
+        daily_totals = {}
+        if not warehouse_ids:
+            return daily_totals
+
+        rows = DailyRollupService.aggregate(
+            'stat_date', 'warehouse_id',
+            start_date=start_date, end_date=end_date, warehouse_ids=warehouse_ids
+        )
+
+        for row in rows:
+            daily_totals[(row.stat_date, row.warehouse_id)] = {
+                'count': int(row.record_count or 0),
+                'pallets': float(row.pallet_count or 0),
+                'packages': int(row.package_count or 0)
             }
 
-            current_app.logger.info(f'仓库{warehouse_id}年度统计结果: {result}')
-            return result
+        return daily_totals
+
+    def _pivot_volume(self, daily_totals, periods, period_of, accessible_warehouses):
+        """
+        将按日聚合结果透视为按周期排列的数据行
+
+        Args:
+            daily_totals: _aggregate_daily_volume 的结果
+            periods: [(周期键, 周期行的基础字段)]，按展示顺序排列
+            period_of: 将日期映射为周期键的函数
+            accessible_warehouses: 用户可访问的仓库ID列表
+
+        Returns:
+            tuple: (数据行列表, 汇总数据)
+        """
+        warehouse_ids = self._get_warehouse_ids()
+
+        rows = {}
+        for key, fields in periods:
+            row = dict(fields, total=0, total_pallets=0, total_packages=0)
+            for warehouse_id in warehouse_ids:
+                row[f'warehouse_{warehouse_id}'] = 0
+                row[f'warehouse_{warehouse_id}_pallets'] = 0
+                row[f'warehouse_{warehouse_id}_packages'] = 0
+            rows[key] = row
+
+        summary = {'total_count': 0, 'total_pallets': 0, 'total_packages': 0}
+
+        for (day, warehouse_id), stats in sorted(daily_totals.items()):
+            row = rows.get(period_of(day))
+            if row is None or warehouse_id not in accessible_warehouses:
+                continue
+
+            row[f'warehouse_{warehouse_id}'] = row.get(f'warehouse_{warehouse_id}', 0) + stats['count']
+            row[f'warehouse_{warehouse_id}_pallets'] = row.get(f'warehouse_{warehouse_id}_pallets', 0) + stats['pallets']
+            row[f'warehouse_{warehouse_id}_packages'] = row.get(f'warehouse_{warehouse_id}_packages', 0) + stats['packages']
 
+            row['total'] += stats['count']
+            row['total_pallets'] += stats['pallets']
+            row['total_packages'] += stats['packages']
+
+            # 累计汇总数据
+            summary['total_count'] += stats['count']
+            summary['total_pallets'] += stats['pallets']
+            summary['total_packages'] += stats['packages']
+
+        return list(rows.values()), summary
+
+    def _get_warehouse_ids(self):
+        """从仓库表动态获取仓库ID列表，查询失败时使用默认仓库"""
+        try:
+            warehouse_ids = [row.id for row in db.session.query(Warehouse.id).order_by(Warehouse.id).all()]
+            if warehouse_ids:
+                return warehouse_ids
         except Exception as e:
-            current_app.logger.error(f'获取仓库{warehouse_id}年度统计失败: {str(e)}')
-            return {'count': 0, 'pallets': 0, 'packages': 0}
+            current_app.logger.error(f'获取仓库列表失败: {str(e)}')
+        return list(self.warehouse_names.keys())
 
     def _get_warehouse_detailed_stats(self, warehouse_id, today, yesterday, last_year):
         """获取仓库详细统计数据（包含同比数据）"""
@@ -837,49 +711,35 @@ class CargoVolumeService:
                 is_super_admin = True
 
             if is_super_admin:
-                return list(self.warehouse_names.keys())
+                return self._get_warehouse_ids()
             elif hasattr(user, 'warehouse_id') and user.warehouse_id:
                 return [user.warehouse_id]
             else:
                 # 默认返回所有仓库（用于管理员或测试）
-                return list(self.warehouse_names.keys())
+                return self._get_warehouse_ids()
         except Exception as e:
             current_app.logger.error(f'获取用户可访问仓库失败: {str(e)}')
             # 出错时返回所有仓库
-            return list(self.warehouse_names.keys())
+            return self._get_warehouse_ids()
 
     def _get_warehouse_daily_inbound(self, warehouse_id, date):
         """获取指定仓库指定日期的入库统计"""
-        result = db.session.query(
-            func.count(InboundRecord.id).label('count'),
-            func.coalesce(func.sum(InboundRecord.pallet_count), 0).label('pallets'),
-            func.coalesce(func.sum(InboundRecord.package_count), 0).label('packages')
-        ).filter(
-            InboundRecord.operated_warehouse_id == warehouse_id,
-            func.date(InboundRecord.inbound_time) == date
-        ).first()
-        
-        return {
-            'count': result.count or 0,
-            'pallets': float(result.pallets or 0),
-            'packages': int(result.packages or 0)
-        }
+        return self._get_warehouse_daily_rollup(warehouse_id, date, 'inbound')
 
     def _get_warehouse_daily_outbound(self, warehouse_id, date):
         """获取指定仓库指定日期的出库统计"""
-        result = db.session.query(
-            func.count(OutboundRecord.id).label('count'),
-            func.coalesce(func.sum(OutboundRecord.pallet_count), 0).label('pallets'),
-            func.coalesce(func.sum(OutboundRecord.package_count), 0).label('packages')
-        ).filter(
-            OutboundRecord.operated_warehouse_id == warehouse_id,
-            func.date(OutboundRecord.outbound_time) == date
-        ).first()
-        
+        return self._get_warehouse_daily_rollup(warehouse_id, date, 'outbound')
+
+    def _get_warehouse_daily_rollup(self, warehouse_id, date, record_type):
+        """从每日作业汇总表读取指定仓库指定日期的进出库统计"""
+        result = DailyRollupService.aggregate(
+            start_date=date, end_date=date, warehouse_ids=[warehouse_id], record_type=record_type
+        )[0]
+
         return {
-            'count': result.count or 0,
-            'pallets': float(result.pallets or 0),
-            'packages': int(result.packages or 0)
+            'count': int(result.record_count or 0),
+            'pallets': float(result.pallet_count or 0),
+            'packages': int(result.package_count or 0)
         }
 
     def _get_warehouse_inventory(self, warehouse_id):
@@ -1381,43 +1241,20 @@ class CargoVolumeService:
         }
 
     def _get_period_stats(self, start_date, end_date, user, record_type):
-        """获取指定时间段的统计数据"""
-        if record_type == 'inbound':
-            query = db.session.query(
-                func.count(InboundRecord.id).label('count'),
-                func.coalesce(func.sum(InboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(InboundRecord.package_count), 0).label('packages'),
-                func.coalesce(func.sum(InboundRecord.weight), 0).label('weight'),
-                func.coalesce(func.sum(InboundRecord.volume), 0).label('volume')
-            ).filter(
-                func.date(InboundRecord.inbound_time) >= start_date,
-                func.date(InboundRecord.inbound_time) <= end_date
-            )
-
-            if not user.is_super_admin() and user.warehouse_id:
-                query = query.filter(InboundRecord.operated_warehouse_id == user.warehouse_id)
-
-        else:  # outbound
-            query = db.session.query(
-                func.count(OutboundRecord.id).label('count'),
-                func.coalesce(func.sum(OutboundRecord.pallet_count), 0).label('pallets'),
-                func.coalesce(func.sum(OutboundRecord.package_count), 0).label('packages'),
-                func.coalesce(func.sum(OutboundRecord.weight), 0).label('weight'),
-                func.coalesce(func.sum(OutboundRecord.volume), 0).label('volume')
-            ).filter(
-                func.date(OutboundRecord.outbound_time) >= start_date,
-                func.date(OutboundRecord.outbound_time) <= end_date
-            )
-
-            if not user.is_super_admin() and user.warehouse_id:
-                query = query.filter(OutboundRecord.operated_warehouse_id == user.warehouse_id)
+        """获取指定时间段的统计数据（读取每日作业汇总表）"""
+        warehouse_ids = None
+        if not user.is_super_admin() and user.warehouse_id:
+            warehouse_ids = [user.warehouse_id]
 
-        result = query.first()
+        result = DailyRollupService.aggregate(
+            start_date=start_date, end_date=end_date,
+            warehouse_ids=warehouse_ids, record_type=record_type
+        )[0]
 
         return {
-            'count': result.count or 0,
-            'pallets': float(result.pallets or 0),
-            'packages': int(result.packages or 0),
+            'count': int(result.record_count or 0),
+            'pallets': float(result.pallet_count or 0),
+            'packages': int(result.package_count or 0),
             'weight': float(result.weight or 0),
             'volume': float(result.volume or 0)
         }
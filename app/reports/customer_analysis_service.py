@@ -13,6 +13,7 @@ from app.models import (
     InboundRecord, OutboundRecord, Inventory, TransitCargo,
     ReceiveRecord, Warehouse, User
 )
+from app.services.daily_rollup_service import DailyRollupService
 
 class CustomerAnalysisService:
     """客户业务分析服务类"""
@@ -43,68 +44,16 @@ class CustomerAnalysisService:
             # 获取用户可访问的仓库
             accessible_warehouses = self._get_accessible_warehouses(user)
 
-            # 查询入库数据
-            inbound_query = db.session.query(
-                InboundRecord.customer_name,
-                func.count(InboundRecord.id).label('inbound_count'),
-                func.sum(InboundRecord.pallet_count).label('inbound_pallets'),
-                func.sum(InboundRecord.package_count).label('inbound_packages'),
-                func.sum(InboundRecord.weight).label('inbound_weight'),
-                func.sum(InboundRecord.volume).label('inbound_volume')
-            ).filter(
-                and_(
-                    InboundRecord.inbound_time >= start_date,
-                    InboundRecord.inbound_time <= end_date,
-                    InboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                )
-            ).group_by(InboundRecord.customer_name)
-
-            # 查询出库数据
-            outbound_query = db.session.query(
-                OutboundRecord.customer_name,
-                func.count(OutboundRecord.id).label('outbound_count'),
-                func.sum(OutboundRecord.pallet_count).label('outbound_pallets'),
-                func.sum(OutboundRecord.package_count).label('outbound_packages'),
-                func.sum(OutboundRecord.weight).label('outbound_weight'),
-                func.sum(OutboundRecord.volume).label('outbound_volume')
-            ).filter(
-                and_(
-                    OutboundRecord.outbound_time >= start_date,
-                    OutboundRecord.outbound_time <= end_date,
-                    OutboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                )
-            ).group_by(OutboundRecord.customer_name)
+            # 读取每日作业汇总表，按客户+进出库类型一次分组
+            rows = DailyRollupService.aggregate(
+                'customer_name', 'record_type', start_date=start_date, end_date=end_date,
+                warehouse_ids=accessible_warehouses
+            )
 
             # 合并数据
             customer_data = {}
-            
-            # 处理入库数据
-            for row in inbound_query.all():
-                customer_data[row.customer_name] = {
-                    'customer_name': row.customer_name,
-                    'inbound_count': row.inbound_count or 0,
-                    'inbound_pallets': row.inbound_pallets or 0,
-                    'inbound_packages': row.inbound_packages or 0,
-                    'inbound_weight': row.inbound_weight or 0,
-                    'inbound_volume': row.inbound_volume or 0,
-                    'outbound_count': 0,
-                    'outbound_pallets': 0,
-                    'outbound_packages': 0,
-                    'outbound_weight': 0,
-                    'outbound_volume': 0
-                }
-
-            # 处理出库数据
-            for row in outbound_query.all():
-                if row.customer_name in customer_data:
-                    customer_data[row.customer_name].update({
-                        'outbound_count': row.outbound_count or 0,
-                        'outbound_pallets': row.outbound_pallets or 0,
-                        'outbound_packages': row.outbound_packages or 0,
-                        'outbound_weight': row.outbound_weight or 0,
-                        'outbound_volume': row.outbound_volume or 0
-                    })
-                else:
+            for row in rows:
+                if row.customer_name not in customer_data:
                     customer_data[row.customer_name] = {
                         'customer_name': row.customer_name,
                         'inbound_count': 0,
@@ -112,12 +61,19 @@ class CustomerAnalysisService:
                         'inbound_packages': 0,
                         'inbound_weight': 0,
                         'inbound_volume': 0,
-                        'outbound_count': row.outbound_count or 0,
-                        'outbound_pallets': row.outbound_pallets or 0,
-                        'outbound_packages': row.outbound_packages or 0,
-                        'outbound_weight': row.outbound_weight or 0,
-                        'outbound_volume': row.outbound_volume or 0
+                        'outbound_count': 0,
+                        'outbound_pallets': 0,
+                        'outbound_packages': 0,
+                        'outbound_weight': 0,
+                        'outbound_volume': 0
                     }
+                customer_data[row.customer_name].update({
+                    f'{row.record_type}_count': int(row.record_count or 0),
+                    f'{row.record_type}_pallets': int(row.pallet_count or 0),
+                    f'{row.record_type}_packages': int(row.package_count or 0),
+                    f'{row.record_type}_weight': float(row.weight or 0),
+                    f'{row.record_type}_volume': float(row.volume or 0)
+                })
 
             # 计算总货量并排序
             for customer in customer_data.values():
@@ -168,29 +124,9 @@ class CustomerAnalysisService:
             sleeping_customers = [c for c in old_customers if c not in month_active]
 
             # 新客户（最近30天首次出现）
-            new_customers = []
-            for customer in month_active:
-                # 检查该客户在30天前是否有记录
-                old_records = db.session.query(InboundRecord).filter(
-                    and_(
-                        InboundRecord.customer_name == customer,
-                        InboundRecord.inbound_time < month_ago,
-                        InboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                    )
-                ).first()
-                
-                if not old_records:
-                    # 也检查出库记录
-                    old_outbound = db.session.query(OutboundRecord).filter(
-                        and_(
-                            OutboundRecord.customer_name == customer,
-                            OutboundRecord.outbound_time < month_ago,
-                            OutboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                        )
-                    ).first()
-                    
-                    if not old_outbound:
-                        new_customers.append(customer)
+            first_dates = self._get_customer_first_dates(month_active, accessible_warehouses)
+            new_customers = [customer for customer in month_active
+                             if first_dates.get(customer) and first_dates[customer] >= month_ago]
 
             return {
                 'recent_active_count': len(recent_active),
@@ -223,33 +159,28 @@ class CustomerAnalysisService:
             return [user.warehouse_id] if user.warehouse_id else []
 
     def _get_active_customers_in_period(self, start_date, end_date, accessible_warehouses):
-        """获取指定时间段内的活跃客户"""
-        # 入库客户
-        inbound_customers = db.session.query(InboundRecord.customer_name.distinct()).filter(
-            and_(
-                InboundRecord.inbound_time >= start_date,
-                InboundRecord.inbound_time <= end_date,
-                InboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-            )
-        ).all()
-
-        # 出库客户
-        outbound_customers = db.session.query(OutboundRecord.customer_name.distinct()).filter(
-            and_(
-                OutboundRecord.outbound_time >= start_date,
-                OutboundRecord.outbound_time <= end_date,
-                OutboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-            )
-        ).all()
-
-        # 合并去重
-        all_customers = set()
-        for customer in inbound_customers:
-            all_customers.add(customer[0])
-        for customer in outbound_customers:
-            all_customers.add(customer[0])
-
-        return list(all_customers)
+        """获取指定时间段内的活跃客户（入库或出库，读取每日作业汇总表）"""
+        rows = DailyRollupService.aggregate(
+            'customer_name', start_date=start_date, end_date=end_date,
+            warehouse_ids=accessible_warehouses
+        )
+        return [row.customer_name for row in rows]
+
+    def _get_customer_first_dates(self, customers, accessible_warehouses):
+        """一次查询获取客户首次出现（入库或出库）的日期"""
+        if not customers or not accessible_warehouses:
+            return {}
+
+        rollup = DailyRollupService.source()
+        rows = db.session.query(
+            rollup.c.customer_name,
+            func.min(rollup.c.stat_date).label('first_date')
+        ).filter(
+            rollup.c.customer_name.in_(list(customers)),
+            rollup.c.warehouse_id.in_(accessible_warehouses)
+        ).group_by(rollup.c.customer_name).all()
+
+        return {row.customer_name: row.first_date for row in rows}
 
     def get_customer_value_analysis(self, user, limit=20):
         """获取客户价值分析"""
@@ -375,27 +306,9 @@ class CustomerAnalysisService:
                 active_customers = self._get_active_customers_in_period(month_start, month_end, accessible_warehouses)
 
                 # 该月新客户数（在该月首次出现的客户）
-                new_customers = []
-                for customer in active_customers:
-                    # 检查该客户在该月之前是否有记录
-                    old_inbound = db.session.query(InboundRecord).filter(
-                        and_(
-                            InboundRecord.customer_name == customer,
-                            InboundRecord.inbound_time < month_start,
-                            InboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                        )
-                    ).first()
-
-                    old_outbound = db.session.query(OutboundRecord).filter(
-                        and_(
-                            OutboundRecord.customer_name == customer,
-                            OutboundRecord.outbound_time < month_start,
-                            OutboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                        )
-                    ).first()
-
-                    if not old_inbound and not old_outbound:
-                        new_customers.append(customer)
+                first_dates = self._get_customer_first_dates(active_customers, accessible_warehouses)
+                new_customers = [customer for customer in active_customers
+                                 if first_dates.get(customer) and first_dates[customer] >= month_start]
 
                 monthly_data.append({
                     'month': month_start.strftime('%Y-%m'),
@@ -425,34 +338,27 @@ class CustomerAnalysisService:
             end_date = datetime.now().date()
             start_date = end_date - timedelta(days=90)  # 最近3个月
 
+            # 读取每日作业汇总表，按仓库+客户+进出库类型一次分组
+            rows = DailyRollupService.aggregate(
+                'warehouse_id', 'customer_name', 'record_type',
+                start_date=start_date, end_date=end_date, warehouse_ids=accessible_warehouses
+            )
+
+            warehouse_customers = {warehouse_id: set() for warehouse_id in accessible_warehouses}
+            all_inbound_customers = set()
+            all_outbound_customers = set()
+            for row in rows:
+                warehouse_customers.setdefault(row.warehouse_id, set()).add(row.customer_name)
+                if row.record_type == 'inbound':
+                    all_inbound_customers.add(row.customer_name)
+                else:
+                    all_outbound_customers.add(row.customer_name)
+
             # 按仓库分布
             warehouse_distribution = {}
             for warehouse_id in accessible_warehouses:
                 warehouse_name = self.warehouse_names.get(warehouse_id, f'仓库{warehouse_id}')
-
-                # 该仓库的客户
-                inbound_customers = db.session.query(InboundRecord.customer_name.distinct()).filter(
-                    and_(
-                        InboundRecord.inbound_time >= start_date,
-                        InboundRecord.inbound_time <= end_date,
-                        InboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).all()
-
-                outbound_customers = db.session.query(OutboundRecord.customer_name.distinct()).filter(
-                    and_(
-                        OutboundRecord.outbound_time >= start_date,
-                        OutboundRecord.outbound_time <= end_date,
-                        OutboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).all()
-
-                # 合并客户
-                customers = set()
-                for customer in inbound_customers:
-                    customers.add(customer[0])
-                for customer in outbound_customers:
-                    customers.add(customer[0])
+                customers = warehouse_customers.get(warehouse_id, set())
 
                 warehouse_distribution[warehouse_name] = {
                     'warehouse_id': warehouse_id,
@@ -468,31 +374,6 @@ class CustomerAnalysisService:
                 'both': []           # 既有入库又有出库
             }
 
-            # 获取所有客户
-            all_inbound_customers = set()
-            all_outbound_customers = set()
-
-            inbound_customers = db.session.query(InboundRecord.customer_name.distinct()).filter(
-                and_(
-                    InboundRecord.inbound_time >= start_date,
-                    InboundRecord.inbound_time <= end_date,
-                    InboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                )
-            ).all()
-
-            outbound_customers = db.session.query(OutboundRecord.customer_name.distinct()).filter(
-                and_(
-                    OutboundRecord.outbound_time >= start_date,
-                    OutboundRecord.outbound_time <= end_date,
-                    OutboundRecord.operated_warehouse_id.in_(accessible_warehouses)
-                )
-            ).all()
-
-            for customer in inbound_customers:
-                all_inbound_customers.add(customer[0])
-            for customer in outbound_customers:
-                all_outbound_customers.add(customer[0])
-
             # 分类客户
             for customer in all_inbound_customers:
                 if customer in all_outbound_customers:
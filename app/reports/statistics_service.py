@@ -14,13 +14,12 @@ from app.models import (
     InboundRecord, OutboundRecord, Inventory, TransitCargo,
     ReceiveRecord, Warehouse, User
 )
+from app.services.daily_rollup_service import DailyRollupService
 
 # 导入缓存组件
 from app.cache.dual_cache_manager import get_dual_cache_manager
-from app.cache.cache_decorators import (
-    dashboard_cached, stats_cached, inventory_cached,
-    realtime_cached, historical_cached
-)
+from app.cache.request_batcher import prefetch_cache_keys
+from app.cache.cache_decorators import dashboard_cached
 
 class StatisticsService:
     """统计报表服务类 - 集成双层缓存"""
@@ -49,6 +48,22 @@ class StatisticsService:
         this_month_start = today.replace(day=1)
         last_month_start = (this_month_start - timedelta(days=1)).replace(day=1)
 
+        # 一次 MGET 预取下面各项统计的缓存，各方法读取时直接命中L1
+        prefetch_cache_keys({
+            self._stats_cache_key('daily_stats', user, today): 'today_stats',
+            self._stats_cache_key('daily_stats', user, yesterday): 'today_stats',
+            self._stats_cache_key('period_stats', user, this_week_start, today): 'historical_stats',
+            self._stats_cache_key('period_stats', user, this_month_start, today): 'historical_stats',
+            self._stats_cache_key('period_stats', user, last_month_start,
+                                  this_month_start - timedelta(days=1)): 'historical_stats',
+            self._stats_cache_key('warehouse_summary', user): 'warehouse_summary',
+            self._stats_cache_key('inventory_overview', user): 'inventory_overview',
+            self._stats_cache_key('transit_overview', user): 'transit_overview',
+            self._stats_cache_key('customer_overview', user): 'customer_ranking',
+            self._stats_cache_key('top_customers', user, limit=10): 'customer_ranking',
+            self._stats_cache_key('top_routes', user, limit=10): 'warehouse_summary',
+        })
+
         # 基础统计
         data = {}
 
@@ -201,10 +216,18 @@ class StatisticsService:
 
     # 缓存版本的统计方法
 
-    @stats_cached('daily_stats')
+    @staticmethod
+    def _stats_cache_key(name, user, *parts, limit=None):
+        """统计缓存键：名称:参数...:user:X:warehouse:Y[:limit:N]"""
+        key_parts = [name, *(str(part) for part in parts),
+                     f"user:{user.id}", f"warehouse:{getattr(user, 'warehouse_id', 'all')}"]
+        if limit is not None:
+            key_parts.append(f"limit:{limit}")
+        return ':'.join(key_parts)
+
     def _get_daily_stats_cached(self, date, user):
         """获取日统计数据 - 缓存版本"""
-        cache_key = f"daily_stats:{date}:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('daily_stats', user, date)
 
         def fetch_daily_stats():
             # 尝试使用异步版本
@@ -232,10 +255,9 @@ class StatisticsService:
             cache_type='today_stats'
         )
 
-    @stats_cached('period_stats')
     def _get_period_stats_cached(self, start_date, end_date, user):
         """获取期间统计数据 - 缓存版本"""
-        cache_key = f"period_stats:{start_date}:{end_date}:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('period_stats', user, start_date, end_date)
 
         def fetch_period_stats():
             return self._get_period_stats(start_date, end_date, user)
@@ -246,10 +268,9 @@ class StatisticsService:
             cache_type='historical_stats'
         )
 
-    @inventory_cached('warehouse_summary')
     def _get_warehouse_summary_cached(self, user):
         """获取仓库汇总 - 缓存版本"""
-        cache_key = f"warehouse_summary:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('warehouse_summary', user)
 
         def fetch_warehouse_summary():
             return self._get_warehouse_summary(user)
@@ -260,10 +281,9 @@ class StatisticsService:
             cache_type='warehouse_summary'
         )
 
-    @inventory_cached('inventory_overview')
     def _get_inventory_overview_cached(self, user):
         """获取库存概览 - 缓存版本"""
-        cache_key = f"inventory_overview:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('inventory_overview', user)
 
         def fetch_inventory_overview():
             return self._get_inventory_overview(user)
@@ -274,10 +294,9 @@ class StatisticsService:
             cache_type='inventory_overview'
         )
 
-    @realtime_cached('transit_overview')
     def _get_transit_overview_cached(self, user):
         """获取在途概览 - 缓存版本"""
-        cache_key = f"transit_overview:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('transit_overview', user)
 
         def fetch_transit_overview():
             return self._get_transit_overview(user)
@@ -288,10 +307,9 @@ class StatisticsService:
             cache_type='transit_overview'
         )
 
-    @stats_cached('customer_overview')
     def _get_customer_overview_cached(self, user):
         """获取客户概览 - 缓存版本"""
-        cache_key = f"customer_overview:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}"
+        cache_key = self._stats_cache_key('customer_overview', user)
 
         def fetch_customer_overview():
             return self._get_customer_overview(user)
@@ -302,10 +320,9 @@ class StatisticsService:
             cache_type='customer_ranking'
         )
 
-    @stats_cached('top_customers')
     def _get_top_customers_cached(self, user, limit=10):
         """获取TOP客户 - 缓存版本"""
-        cache_key = f"top_customers:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}:limit:{limit}"
+        cache_key = self._stats_cache_key('top_customers', user, limit=limit)
 
         def fetch_top_customers():
             return self._get_top_customers(user, limit)
@@ -316,10 +333,9 @@ class StatisticsService:
             cache_type='customer_ranking'
         )
 
-    @stats_cached('top_routes')
     def _get_top_routes_cached(self, user, limit=10):
         """获取热门路线 - 缓存版本"""
-        cache_key = f"top_routes:user:{user.id}:warehouse:{getattr(user, 'warehouse_id', 'all')}:limit:{limit}"
+        cache_key = self._stats_cache_key('top_routes', user, limit=limit)
 
         def fetch_top_routes():
             return self._get_top_routes(user, limit)
@@ -334,6 +350,7 @@ class StatisticsService:
 
     def invalidate_dashboard_cache(self, user_id=None, warehouse_id=None):
         """失效仪表板缓存"""
+        # 以下模式均按标签失效；命名空间已整体失效，无需再按用户细分
         patterns = [
             'dashboard_summary:*',
             'daily_stats:*',
@@ -341,17 +358,8 @@ class StatisticsService:
             'inventory_overview:*'
         ]
 
-        if user_id:
-            patterns.extend([
-                f'dashboard_summary:user:{user_id}:*',
-                f'daily_stats:*:user:{user_id}:*'
-            ])
-
         if warehouse_id:
-            patterns.extend([
-                f'*:warehouse:{warehouse_id}',
-                f'warehouse_summary:*:warehouse:{warehouse_id}'
-            ])
+            patterns.append(f'*:warehouse:{warehouse_id}')
 
         for pattern in patterns:
             try:
@@ -362,17 +370,12 @@ class StatisticsService:
 
     def invalidate_inventory_cache(self, warehouse_id=None):
         """失效库存缓存"""
+        # 按标签失效，命名空间已整体失效，无需再按仓库细分
         patterns = [
             'inventory_overview:*',
             'warehouse_summary:*'
         ]
 
-        if warehouse_id:
-            patterns.extend([
-                f'inventory_overview:*:warehouse:{warehouse_id}',
-                f'warehouse_summary:*:warehouse:{warehouse_id}'
-            ])
-
         for pattern in patterns:
             try:
                 self.cache_manager.clear_cache(pattern=pattern)
@@ -382,20 +385,15 @@ class StatisticsService:
 
     def invalidate_stats_cache(self, date=None, warehouse_id=None):
         """失效统计缓存"""
+        # 以下模式均按标签失效；daily_stats 已整体失效，无需再按日期细分
         patterns = [
             'daily_stats:*',
             'period_stats:*',
             'today_stats:*'
         ]
 
-        if date:
-            patterns.append(f'daily_stats:{date}:*')
-
         if warehouse_id:
-            patterns.extend([
-                f'*:warehouse:{warehouse_id}',
-                f'daily_stats:*:warehouse:{warehouse_id}'
-            ])
+            patterns.append(f'*:warehouse:{warehouse_id}')
 
         for pattern in patterns:
             try:
@@ -405,172 +403,66 @@ class StatisticsService:
                     current_app.logger.error(f"清理统计缓存失败 {pattern}: {e}")
 
     def _get_daily_stats(self, date, user):
-        """获取指定日期的统计数据"""
-        date_start = datetime.combine(date, datetime.min.time())
-        date_end = datetime.combine(date, datetime.max.time())
-        
-        # 构建查询条件
-        warehouse_filter = self._get_warehouse_filter(user)
-        
-        # 入库统计
-        inbound_query = InboundRecord.query.filter(
-            InboundRecord.inbound_time.between(date_start, date_end)
-        )
-        if warehouse_filter:
-            inbound_query = inbound_query.filter(warehouse_filter)
-        
-        inbound_stats = inbound_query.with_entities(
-            func.count(InboundRecord.id).label('count'),
-            func.sum(InboundRecord.pallet_count).label('total_pallets'),
-            func.sum(InboundRecord.package_count).label('total_packages'),
-            func.sum(InboundRecord.weight).label('total_weight'),
-            func.sum(InboundRecord.volume).label('total_volume')
-        ).first()
-        
-        # 出库统计
-        outbound_query = OutboundRecord.query.filter(
-            OutboundRecord.outbound_time.between(date_start, date_end)
+        """获取指定日期的统计数据（读取每日作业汇总表）"""
+        rows = DailyRollupService.aggregate(
+            'record_type', start_date=date, end_date=date,
+            warehouse_ids=self._get_rollup_warehouse_ids(user)
         )
-        if warehouse_filter:
-            outbound_query = outbound_query.filter(warehouse_filter)
-        
-        outbound_stats = outbound_query.with_entities(
-            func.count(OutboundRecord.id).label('count'),
-            func.sum(OutboundRecord.pallet_count).label('total_pallets'),
-            func.sum(OutboundRecord.package_count).label('total_packages'),
-            func.sum(OutboundRecord.weight).label('total_weight'),
-            func.sum(OutboundRecord.volume).label('total_volume')
-        ).first()
-        
+        stats = {row.record_type: row for row in rows}
+
+        def totals(record_type):
+            row = stats.get(record_type)
+            if row is None:
+                return {'count': 0, 'pallets': 0, 'packages': 0, 'weight': 0.0, 'volume': 0.0}
+            return {
+                'count': int(row.record_count or 0),
+                'pallets': int(row.pallet_count or 0),
+                'packages': int(row.package_count or 0),
+                'weight': float(row.weight or 0),
+                'volume': float(row.volume or 0)
+            }
+
         return {
             'date': date.strftime('%Y-%m-%d'),
-            'inbound': {
-                'count': inbound_stats.count or 0,
-                'pallets': inbound_stats.total_pallets or 0,
-                'packages': inbound_stats.total_packages or 0,
-                'weight': float(inbound_stats.total_weight or 0),
-                'volume': float(inbound_stats.total_volume or 0)
-            },
-            'outbound': {
-                'count': outbound_stats.count or 0,
-                'pallets': outbound_stats.total_pallets or 0,
-                'packages': outbound_stats.total_packages or 0,
-                'weight': float(outbound_stats.total_weight or 0),
-                'volume': float(outbound_stats.total_volume or 0)
-            }
+            'inbound': totals('inbound'),
+            'outbound': totals('outbound')
         }
     
     def _get_period_stats(self, start_date, end_date, user):
-        """获取时间段统计数据"""
-        start_datetime = datetime.combine(start_date, datetime.min.time())
-        end_datetime = datetime.combine(end_date, datetime.max.time())
-        
-        warehouse_filter = self._get_warehouse_filter(user)
-        
-        # 按日期分组的统计
-        inbound_daily = db.session.query(
-            func.date(InboundRecord.inbound_time).label('date'),
-            func.count(InboundRecord.id).label('count'),
-            func.sum(InboundRecord.pallet_count).label('pallets'),
-            func.sum(InboundRecord.package_count).label('packages')
-        ).filter(
-            InboundRecord.inbound_time.between(start_datetime, end_datetime)
+        """获取时间段统计数据（读取每日作业汇总表）"""
+        rows = DailyRollupService.aggregate(
+            'stat_date', 'record_type', start_date=start_date, end_date=end_date,
+            warehouse_ids=self._get_rollup_warehouse_ids(user)
         )
-        
-        if warehouse_filter:
-            inbound_daily = inbound_daily.filter(warehouse_filter)
-        
-        inbound_daily = inbound_daily.group_by(
-            func.date(InboundRecord.inbound_time)
-        ).all()
-        
-        outbound_daily = db.session.query(
-            func.date(OutboundRecord.outbound_time).label('date'),
-            func.count(OutboundRecord.id).label('count'),
-            func.sum(OutboundRecord.pallet_count).label('pallets'),
-            func.sum(OutboundRecord.package_count).label('packages')
-        ).filter(
-            OutboundRecord.outbound_time.between(start_datetime, end_datetime)
-        )
-        
-        if warehouse_filter:
-            outbound_daily = outbound_daily.filter(warehouse_filter)
-        
-        outbound_daily = outbound_daily.group_by(
-            func.date(OutboundRecord.outbound_time)
-        ).all()
-        
+
+        daily = {'inbound': [], 'outbound': []}
+        for row in sorted(rows, key=lambda item: item.stat_date):
+            daily[row.record_type].append({
+                'date': row.stat_date.strftime('%Y-%m-%d'),
+                'count': int(row.record_count or 0),
+                'pallets': int(row.pallet_count or 0),
+                'packages': int(row.package_count or 0)
+            })
+
         return {
             'period': f"{start_date} 至 {end_date}",
-            'inbound_daily': [
-                {
-                    'date': item.date.strftime('%Y-%m-%d'),
-                    'count': item.count,
-                    'pallets': item.pallets or 0,
-                    'packages': item.packages or 0
-                } for item in inbound_daily
-            ],
-            'outbound_daily': [
-                {
-                    'date': item.date.strftime('%Y-%m-%d'),
-                    'count': item.count,
-                    'pallets': item.pallets or 0,
-                    'packages': item.packages or 0
-                } for item in outbound_daily
-            ]
+            'inbound_daily': daily['inbound'],
+            'outbound_daily': daily['outbound']
         }
     
     def _get_warehouse_summary(self, user):
-        """获取仓库汇总数据"""
-        warehouse_filter = self._get_warehouse_filter(user)
-        
-        # 各仓库入库统计
-        inbound_by_warehouse = db.session.query(
-            InboundRecord.operated_warehouse_id,
-            func.count(InboundRecord.id).label('inbound_count'),
-            func.sum(InboundRecord.pallet_count).label('inbound_pallets'),
-            func.sum(InboundRecord.package_count).label('inbound_packages')
-        ).filter(InboundRecord.operated_warehouse_id.isnot(None))  # 过滤NULL值
-
-        if warehouse_filter:
-            inbound_by_warehouse = inbound_by_warehouse.filter(warehouse_filter)
-
-        inbound_by_warehouse = inbound_by_warehouse.group_by(
-            InboundRecord.operated_warehouse_id
-        ).all()
-        
-        # 各仓库出库统计
-        outbound_by_warehouse = db.session.query(
-            OutboundRecord.operated_warehouse_id,
-            func.count(OutboundRecord.id).label('outbound_count'),
-            func.sum(OutboundRecord.pallet_count).label('outbound_pallets'),
-            func.sum(OutboundRecord.package_count).label('outbound_packages')
-        ).filter(OutboundRecord.operated_warehouse_id.isnot(None))  # 过滤NULL值
-
-        if warehouse_filter:
-            outbound_by_warehouse = outbound_by_warehouse.filter(warehouse_filter)
+        """获取仓库汇总数据（读取每日作业汇总表）"""
+        rows = DailyRollupService.aggregate(
+            'warehouse_id', 'record_type',
+            warehouse_ids=self._get_rollup_warehouse_ids(user)
+        )
 
-        outbound_by_warehouse = outbound_by_warehouse.group_by(
-            OutboundRecord.operated_warehouse_id
-        ).all()
-        
         # 合并数据
         warehouse_data = {}
-        for item in inbound_by_warehouse:
-            warehouse_id = item.operated_warehouse_id
-            warehouse_data[warehouse_id] = {
-                'warehouse_id': warehouse_id,
-                'warehouse_name': self.warehouse_names.get(warehouse_id, f'仓库{warehouse_id}'),
-                'inbound_count': item.inbound_count,
-                'inbound_pallets': item.inbound_pallets or 0,
-                'inbound_packages': item.inbound_packages or 0,
-                'outbound_count': 0,
-                'outbound_pallets': 0,
-                'outbound_packages': 0
-            }
-        
-        for item in outbound_by_warehouse:
-            warehouse_id = item.operated_warehouse_id
+        for row in rows:
+            warehouse_id = row.warehouse_id
+            if warehouse_id is None:  # 过滤NULL值
+                continue
             if warehouse_id not in warehouse_data:
                 warehouse_data[warehouse_id] = {
                     'warehouse_id': warehouse_id,
@@ -578,16 +470,15 @@ class StatisticsService:
                     'inbound_count': 0,
                     'inbound_pallets': 0,
                     'inbound_packages': 0,
-                    'outbound_count': item.outbound_count,
-                    'outbound_pallets': item.outbound_pallets or 0,
-                    'outbound_packages': item.outbound_packages or 0
+                    'outbound_count': 0,
+                    'outbound_pallets': 0,
+                    'outbound_packages': 0
                 }
-            else:
-                warehouse_data[warehouse_id].update({
-                    'outbound_count': item.outbound_count,
-                    'outbound_pallets': item.outbound_pallets or 0,
-                    'outbound_packages': item.outbound_packages or 0
-                })
+            warehouse_data[warehouse_id].update({
+                f'{row.record_type}_count': int(row.record_count or 0),
+                f'{row.record_type}_pallets': int(row.pallet_count or 0),
+                f'{row.record_type}_packages': int(row.package_count or 0)
+            })
         
         return list(warehouse_data.values())
     
@@ -669,32 +560,21 @@ class StatisticsService:
         }
     
     def _get_top_customers(self, user, limit=10):
-        """获取TOP客户"""
-        warehouse_filter = self._get_warehouse_filter(user)
-        
-        # 按入库量排序的客户
-        customer_stats = db.session.query(
-            InboundRecord.customer_name,
-            func.count(InboundRecord.id).label('inbound_count'),
-            func.sum(InboundRecord.pallet_count).label('total_pallets'),
-            func.sum(InboundRecord.package_count).label('total_packages')
+        """获取TOP客户（读取每日作业汇总表）"""
+        customer_stats = DailyRollupService.aggregate(
+            'customer_name', record_type='inbound',
+            warehouse_ids=self._get_rollup_warehouse_ids(user)
         )
-        
-        if warehouse_filter:
-            customer_stats = customer_stats.filter(warehouse_filter)
-        
-        customer_stats = customer_stats.group_by(
-            InboundRecord.customer_name
-        ).order_by(
-            func.sum(InboundRecord.package_count).desc()
-        ).limit(limit).all()
-        
+
+        # 按入库件数排序
+        customer_stats = sorted(customer_stats, key=lambda item: item.package_count or 0, reverse=True)[:limit]
+
         return [
             {
                 'customer_name': item.customer_name,
-                'inbound_count': item.inbound_count,
-                'total_pallets': item.total_pallets or 0,
-                'total_packages': item.total_packages or 0
+                'inbound_count': int(item.record_count or 0),
+                'total_pallets': int(item.pallet_count or 0),
+                'total_packages': int(item.package_count or 0)
             } for item in customer_stats
         ]
     
@@ -748,6 +628,14 @@ class StatisticsService:
         
         return None
     
+    def _get_rollup_warehouse_ids(self, user):
+        """根据用户权限获取每日作业汇总表的仓库范围，None 表示不限制"""
+        if user.is_super_admin():
+            return None
+        if user.warehouse_id:
+            return [user.warehouse_id]
+        return None
+    
     def _get_status_name(self, status):
         """获取状态中文名称"""
         status_map = {
@@ -759,38 +647,46 @@ class StatisticsService:
         return status_map.get(status, status)
 
     def _get_customer_overview(self, user):
-        """获取客户概览"""
-        warehouse_filter = self._get_warehouse_filter(user)
+        """获取客户概览（读取每日作业汇总表）"""
+        rollup = DailyRollupService.source()
+        this_month_start = datetime.now().date().replace(day=1)
+
+        # 每个客户最近一次入库日期
+        customer_query = db.session.query(
+            rollup.c.customer_name,
+            func.max(rollup.c.stat_date).label('last_date')
+        ).filter(rollup.c.record_type == 'inbound')
+
+        warehouse_ids = self._get_rollup_warehouse_ids(user)
+        if warehouse_ids is not None:
+            customer_query = customer_query.filter(rollup.c.warehouse_id.in_(warehouse_ids))
+        customers = customer_query.group_by(rollup.c.customer_name).all()
 
         # 客户总数
-        customer_query = db.session.query(InboundRecord.customer_name).distinct()
-        if warehouse_filter:
-            customer_query = customer_query.filter(warehouse_filter)
-        total_customers = customer_query.count()
+        total_customers = len(customers)
 
         # 活跃客户（本月有业务）
-        this_month_start = datetime.now().replace(day=1)
-        active_customers = db.session.query(InboundRecord.customer_name).distinct().filter(
-            InboundRecord.inbound_time >= this_month_start
-        )
-        if warehouse_filter:
-            active_customers = active_customers.filter(warehouse_filter)
-        active_count = active_customers.count()
+        active_customers = [item.customer_name for item in customers if item.last_date >= this_month_start]
+        active_count = len(active_customers)
 
         # 新客户（本月首次入库）
-        new_customers = []
-        for customer in active_customers.all():
-            first_inbound = InboundRecord.query.filter_by(
-                customer_name=customer.customer_name
-            ).order_by(InboundRecord.inbound_time.asc()).first()
-
-            if first_inbound and first_inbound.inbound_time >= this_month_start:
-                new_customers.append(customer.customer_name)
+        new_count = 0
+        if active_customers:
+            new_count = db.session.query(func.count()).select_from(
+                db.session.query(rollup.c.customer_name).filter(
+                    rollup.c.record_type == 'inbound',
+                    rollup.c.customer_name.in_(active_customers)
+                ).group_by(
+                    rollup.c.customer_name
+                ).having(
+                    func.min(rollup.c.stat_date) >= this_month_start
+                ).subquery()
+            ).scalar() or 0
 
         return {
             'total_customers': total_customers,
             'active_customers': active_count,
-            'new_customers': len(new_customers),
+            'new_customers': new_count,
             'customer_retention_rate': round((active_count / total_customers * 100) if total_customers > 0 else 0, 2)
         }
 
@@ -830,65 +726,35 @@ class StatisticsService:
         ]
 
     def _get_busy_warehouses(self, user, limit=4):
-        """获取最繁忙的仓库"""
+        """获取最繁忙的仓库（读取每日作业汇总表）"""
         today = datetime.now().date()
         week_start = today - timedelta(days=today.weekday())
 
-        warehouse_filter = self._get_warehouse_filter(user)
-
         # 本周业务量统计
-        inbound_stats = db.session.query(
-            InboundRecord.operated_warehouse_id,
-            func.count(InboundRecord.id).label('inbound_count')
-        ).filter(
-            InboundRecord.inbound_time >= week_start,
-            InboundRecord.operated_warehouse_id.isnot(None)  # 过滤NULL值
-        )
-
-        if warehouse_filter:
-            inbound_stats = inbound_stats.filter(warehouse_filter)
-
-        inbound_stats = inbound_stats.group_by(
-            InboundRecord.operated_warehouse_id
-        ).subquery()
-
-        outbound_stats = db.session.query(
-            OutboundRecord.operated_warehouse_id,
-            func.count(OutboundRecord.id).label('outbound_count')
-        ).filter(
-            OutboundRecord.outbound_time >= week_start,
-            OutboundRecord.operated_warehouse_id.isnot(None)  # 过滤NULL值
-        )
-
-        if warehouse_filter:
-            outbound_stats = outbound_stats.filter(warehouse_filter)
-
-        outbound_stats = outbound_stats.group_by(
-            OutboundRecord.operated_warehouse_id
-        ).subquery()
+        operations = {}
+        for row in DailyRollupService.aggregate(
+            'warehouse_id', 'record_type', start_date=week_start,
+            warehouse_ids=self._get_rollup_warehouse_ids(user)
+        ):
+            if row.warehouse_id is None:  # 过滤NULL值
+                continue
+            counts = operations.setdefault(row.warehouse_id, {'inbound': 0, 'outbound': 0})
+            counts[row.record_type] = int(row.record_count or 0)
 
         # 合并统计
-        combined_stats = db.session.query(
-            inbound_stats.c.operated_warehouse_id,
-            func.coalesce(inbound_stats.c.inbound_count, 0).label('inbound'),
-            func.coalesce(outbound_stats.c.outbound_count, 0).label('outbound')
-        ).outerjoin(
-            outbound_stats,
-            inbound_stats.c.operated_warehouse_id == outbound_stats.c.operated_warehouse_id
-        ).order_by(
-            (func.coalesce(inbound_stats.c.inbound_count, 0) +
-             func.coalesce(outbound_stats.c.outbound_count, 0)).desc()
-        ).limit(limit).all()
+        busy_warehouses = sorted(
+            operations.items(), key=lambda item: item[1]['inbound'] + item[1]['outbound'], reverse=True
+        )[:limit]
 
         return [
             {
-                'warehouse_id': item.operated_warehouse_id,
-                'warehouse_name': self.warehouse_names.get(item.operated_warehouse_id, f'仓库{item.operated_warehouse_id}'),
-                'inbound_count': item.inbound or 0,
-                'outbound_count': item.outbound or 0,
-                'total_operations': (item.inbound or 0) + (item.outbound or 0),
-                'activity_level': self._get_activity_level((item.inbound or 0) + (item.outbound or 0))
-            } for item in combined_stats
+                'warehouse_id': warehouse_id,
+                'warehouse_name': self.warehouse_names.get(warehouse_id, f'仓库{warehouse_id}'),
+                'inbound_count': counts['inbound'],
+                'outbound_count': counts['outbound'],
+                'total_operations': counts['inbound'] + counts['outbound'],
+                'activity_level': self._get_activity_level(counts['inbound'] + counts['outbound'])
+            } for warehouse_id, counts in busy_warehouses
         ]
 
     def _get_activity_level(self, operations_count):
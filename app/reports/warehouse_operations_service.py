@@ -14,6 +14,7 @@ from app.models import (
     ReceiveRecord, Warehouse, User
 )
 from collections import defaultdict
+from app.services.daily_rollup_service import DailyRollupService
 
 class WarehouseOperationsService:
     """仓库运营分析服务类"""
@@ -34,54 +35,29 @@ class WarehouseOperationsService:
 
             efficiency_data = []
 
+            # 读取每日作业汇总表，按仓库+日期+进出库类型一次分组，同时得到票数、板件数和活跃天数
+            operation_stats = defaultdict(lambda: {
+                'inbound': {'count': 0, 'pallets': 0, 'packages': 0, 'days': set()},
+                'outbound': {'count': 0, 'pallets': 0, 'packages': 0, 'days': set()}
+            })
+            for row in DailyRollupService.aggregate(
+                'warehouse_id', 'stat_date', 'record_type',
+                start_date=start_date, end_date=end_date, warehouse_ids=accessible_warehouses
+            ):
+                stats = operation_stats[row.warehouse_id][row.record_type]
+                stats['count'] += int(row.record_count or 0)
+                stats['pallets'] += int(row.pallet_count or 0)
+                stats['packages'] += int(row.package_count or 0)
+                stats['days'].add(row.stat_date)
+
             for warehouse_id in accessible_warehouses:
                 warehouse_name = self.warehouse_names.get(warehouse_id, f'仓库{warehouse_id}')
 
-                # 入库效率
-                inbound_stats = db.session.query(
-                    func.count(InboundRecord.id).label('inbound_count'),
-                    func.sum(InboundRecord.pallet_count).label('total_pallets'),
-                    func.sum(InboundRecord.package_count).label('total_packages')
-                ).filter(
-                    and_(
-                        InboundRecord.inbound_time >= start_date,
-                        InboundRecord.inbound_time <= end_date,
-                        InboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).first()
-
-                # 计算活跃天数（入库）
-                inbound_dates = db.session.query(InboundRecord.inbound_time).filter(
-                    and_(
-                        InboundRecord.inbound_time >= start_date,
-                        InboundRecord.inbound_time <= end_date,
-                        InboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).all()
-                inbound_active_days = len(set(record.inbound_time.date() for record in inbound_dates if record.inbound_time))
-
-                # 出库效率
-                outbound_stats = db.session.query(
-                    func.count(OutboundRecord.id).label('outbound_count'),
-                    func.sum(OutboundRecord.pallet_count).label('total_pallets'),
-                    func.sum(OutboundRecord.package_count).label('total_packages')
-                ).filter(
-                    and_(
-                        OutboundRecord.outbound_time >= start_date,
-                        OutboundRecord.outbound_time <= end_date,
-                        OutboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).first()
-
-                # 计算活跃天数（出库）
-                outbound_dates = db.session.query(OutboundRecord.outbound_time).filter(
-                    and_(
-                        OutboundRecord.outbound_time >= start_date,
-                        OutboundRecord.outbound_time <= end_date,
-                        OutboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).all()
-                outbound_active_days = len(set(record.outbound_time.date() for record in outbound_dates if record.outbound_time))
+                # 入库、出库效率及活跃天数
+                inbound_stats = operation_stats[warehouse_id]['inbound']
+                outbound_stats = operation_stats[warehouse_id]['outbound']
+                inbound_active_days = len(inbound_stats['days'])
+                outbound_active_days = len(outbound_stats['days'])
 
                 # 当前库存
                 current_inventory = db.session.query(
@@ -91,20 +67,20 @@ class WarehouseOperationsService:
                 ).filter(Inventory.warehouse_id == warehouse_id).first()
 
                 # 计算效率指标
-                total_operations = (inbound_stats.inbound_count or 0) + (outbound_stats.outbound_count or 0)
+                total_operations = inbound_stats['count'] + outbound_stats['count']
                 total_active_days = max(inbound_active_days, outbound_active_days, 1)
                 daily_throughput = total_operations / total_active_days
 
                 # 库存周转率（简化计算：月出库量/平均库存）
-                monthly_outbound = outbound_stats.outbound_count or 0
+                monthly_outbound = outbound_stats['count']
                 avg_inventory = current_inventory.inventory_count or 1
                 turnover_rate = (monthly_outbound / avg_inventory) if avg_inventory > 0 else 0
 
                 efficiency_data.append({
                     'warehouse_id': warehouse_id,
                     'warehouse_name': warehouse_name,
-                    'inbound_count': inbound_stats.inbound_count or 0,
-                    'outbound_count': outbound_stats.outbound_count or 0,
+                    'inbound_count': inbound_stats['count'],
+                    'outbound_count': outbound_stats['count'],
                     'total_operations': total_operations,
                     'daily_throughput': round(daily_throughput, 2),
                     'inventory_count': current_inventory.inventory_count or 0,
@@ -171,21 +147,11 @@ class WarehouseOperationsService:
                 end_date = current_date
                 start_date = end_date - timedelta(days=30)
 
-                monthly_inbound = db.session.query(func.count(InboundRecord.id)).filter(
-                    and_(
-                        InboundRecord.inbound_time >= start_date,
-                        InboundRecord.inbound_time <= end_date,
-                        InboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).scalar() or 0
-
-                monthly_outbound = db.session.query(func.count(OutboundRecord.id)).filter(
-                    and_(
-                        OutboundRecord.outbound_time >= start_date,
-                        OutboundRecord.outbound_time <= end_date,
-                        OutboundRecord.operated_warehouse_id == warehouse_id
-                    )
-                ).scalar() or 0
+                monthly_counts = {row.record_type: int(row.record_count or 0) for row in DailyRollupService.aggregate(
+                    'record_type', start_date=start_date, end_date=end_date, warehouse_ids=[warehouse_id]
+                )}
+                monthly_inbound = monthly_counts.get('inbound', 0)
+                monthly_outbound = monthly_counts.get('outbound', 0)
 
                 # 库存健康度评分
                 inventory_count = inventory_stats.count or 0
@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+"""
+每日作业汇总服务模块
+维护 daily_operations_rollup 预聚合事实表：
+- 以 日期+仓库+客户+进出库类型 为粒度保存票数、板数、件数、重量、体积
+- 写入路径（入库/出库）提交事务前，按本次触及的 日期+仓库 切片重算汇总行
+- 定时任务增量刷新最近几天；首次部署的全量回填由命令行或调度器执行，回填前读取方按进出库记录即时统计
+报表服务读取该表，按年同比等长周期统计的代价为 O(天数) 而非 O(记录数)。
+"""
+import logging
+from datetime import datetime, date, timedelta
+from itertools import chain
+from sqlalchemy import Date, func, literal, select, union_all
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import InboundRecord, OutboundRecord, DailyOperationsRollup
+from app.utils.backfill import BackfillMarker
+from app.utils.session_events import mark_pending, register_pending_refresh
+
+logger = logging.getLogger(__name__)
+
+# 参与汇总的记录类型：(记录类型, 模型, 时间字段名)
+ROLLUP_SOURCES = (
+    ('inbound', InboundRecord, 'inbound_time'),
+    ('outbound', OutboundRecord, 'outbound_time'),
+)
+
+# session.info 中保存待刷新切片的键
+_PENDING_SLICES_KEY = 'daily_rollup_pending_slices'
+
+
+def _to_date(value):
+    """将 date()/datetime 结果统一转换为 date（SQLite 的 date() 返回字符串）"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value)[:10], '%Y-%m-%d').date()
+
+
+class DailyRollupService:
+    """每日作业汇总服务类"""
+
+    # 全量重建时每次提交的天数
+    REBUILD_CHUNK_DAYS = 31
+
+    # 定时增量刷新覆盖的天数（含今天）
+    INCREMENTAL_DAYS = 3
+
+    # 全量回填完成标记（首次部署时由命令行或调度器回填）
+    backfill = BackfillMarker('daily_operations_rollup', '每日作业汇总表')
+
+    @classmethod
+    def refresh_slices(cls, slices, session=None):
+        """
+        重算指定 日期+仓库 切片的汇总行
+
+        Args:
+            slices: {(日期, 仓库ID)} 集合
+            session: 使用的数据库会话，默认 db.session（在调用方事务内执行，不提交）
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        session = session or db.session
+        slices = {(_to_date(stat_date), warehouse_id) for stat_date, warehouse_id in slices if stat_date}
+        if not slices:
+            return 0
+
+        # 按日期分组，同一天的多个仓库一次重算
+        warehouses_by_date = {}
+        for stat_date, warehouse_id in slices:
+            warehouses_by_date.setdefault(stat_date, set()).add(warehouse_id)
+
+        rollup_table = DailyOperationsRollup.__table__
+        written = 0
+        for stat_date, warehouse_ids in sorted(warehouses_by_date.items(), key=lambda item: item[0]):
+            rows = [row for row in cls._build_rows(session, stat_date, stat_date)
+                    if row['warehouse_id'] in warehouse_ids]
+
+            session.execute(rollup_table.delete().where(
+                rollup_table.c.stat_date == stat_date,
+                cls._warehouse_condition(rollup_table.c.warehouse_id, warehouse_ids)
+            ))
+            if rows:
+                session.execute(rollup_table.insert(), rows)
+            written += len(rows)
+        return written
+
+    @staticmethod
+    def _warehouse_condition(column, warehouse_ids):
+        """仓库过滤条件，兼容未设置操作仓库的记录"""
+        known_ids = [warehouse_id for warehouse_id in warehouse_ids if warehouse_id is not None]
+        if None in warehouse_ids:
+            return db.or_(column.in_(known_ids), column.is_(None))
+        return column.in_(known_ids)
+
+    @staticmethod
+    def _grouped_select(record_type, model, time_field):
+        """按 日期+仓库+客户 分组统计一种记录的集合查询，列与汇总表相同"""
+        day_column = func.date(getattr(model, time_field), type_=Date)
+        customer_column = func.coalesce(model.customer_name, '')
+        return select(
+            day_column.label('stat_date'),
+            model.operated_warehouse_id.label('warehouse_id'),
+            customer_column.label('customer_name'),
+            literal(record_type).label('record_type'),
+            func.count(model.id).label('record_count'),
+            func.coalesce(func.sum(model.pallet_count), 0).label('pallet_count'),
+            func.coalesce(func.sum(model.package_count), 0).label('package_count'),
+            func.coalesce(func.sum(model.weight), 0).label('weight'),
+            func.coalesce(func.sum(model.volume), 0).label('volume')
+        ).group_by(day_column, model.operated_warehouse_id, customer_column)
+
+    @classmethod
+    def _build_rows(cls, session, start_date, end_date):
+        """用 GROUP BY 日期+仓库+客户 的集合查询构建日期范围内的汇总行"""
+        now = datetime.now()
+        start_datetime = datetime.combine(start_date, datetime.min.time())
+        end_datetime = datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+
+        rows = []
+        for record_type, model, time_field in ROLLUP_SOURCES:
+            time_column = getattr(model, time_field)
+            results = session.execute(cls._grouped_select(record_type, model, time_field).where(
+                time_column >= start_datetime,
+                time_column < end_datetime
+            )).all()
+
+            for result in results:
+                rows.append({
+                    'stat_date': _to_date(result.stat_date),
+                    'warehouse_id': result.warehouse_id,
+                    'customer_name': result.customer_name,
+                    'record_type': record_type,
+                    'record_count': int(result.record_count or 0),
+                    'pallet_count': int(result.pallet_count or 0),
+                    'package_count': int(result.package_count or 0),
+                    'weight': float(result.weight or 0),
+                    'volume': float(result.volume or 0),
+                    'refreshed_at': now
+                })
+        return rows
+
+    @classmethod
+    def rebuild_range(cls, start_date, end_date, chunk_days=None):
+        """
+        重建日期范围内的汇总行，按天数分块提交，避免长事务
+
+        Returns:
+            dict: 重建结果
+        """
+        chunk_days = chunk_days or cls.REBUILD_CHUNK_DAYS
+        start_time = datetime.now()
+        rollup_table = DailyOperationsRollup.__table__
+        try:
+            written = 0
+            chunk_start = start_date
+            while chunk_start <= end_date:
+                chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+                rows = cls._build_rows(db.session, chunk_start, chunk_end)
+                db.session.execute(rollup_table.delete().where(
+                    rollup_table.c.stat_date.between(chunk_start, chunk_end)
+                ))
+                if rows:
+                    db.session.execute(rollup_table.insert(), rows)
+                db.session.commit()
+                written += len(rows)
+                chunk_start = chunk_end + timedelta(days=1)
+
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"每日作业汇总重建完成: {start_date} 至 {end_date}, {written} 行, 耗时 {duration:.2f}秒")
+            return {'success': True, 'start_date': start_date.strftime('%Y-%m-%d'),
+                    'end_date': end_date.strftime('%Y-%m-%d'), 'row_count': written, 'duration': duration}
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"每日作业汇总重建失败: {e}")
+            return {'success': False, 'message': str(e)}
+
+    @classmethod
+    def rebuild_all(cls, chunk_days=None):
+        """按业务数据的最早、最晚日期全量重建汇总表"""
+        bounds = []
+        for _, model, time_field in ROLLUP_SOURCES:
+            time_column = getattr(model, time_field)
+            first, last = db.session.query(func.min(time_column), func.max(time_column)).first()
+            if first and last:
+                bounds.extend([_to_date(first), _to_date(last)])
+
+        if not bounds:
+            db.session.execute(DailyOperationsRollup.__table__.delete())
+            db.session.commit()
+            result = {'success': True, 'row_count': 0, 'duration': 0}
+        else:
+            result = cls.rebuild_range(min(bounds), max(bounds), chunk_days)
+
+        if result.get('success'):
+            try:
+                cls.backfill.mark_populated()
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"写入每日作业汇总回填标记失败: {e}")
+                return {'success': False, 'message': str(e)}
+        return result
+
+    @classmethod
+    def refresh_recent(cls, days=None):
+        """增量刷新最近几天（含今天）的汇总行，纠正写入路径遗漏的变更"""
+        days = days or cls.INCREMENTAL_DAYS
+        backfill = cls.backfill_if_needed()
+        if not backfill.get('skipped'):
+            # 本次执行了首次全量回填（或回填失败），无需再刷新最近几天
+            return backfill
+        today = datetime.now().date()
+        return cls.rebuild_range(today - timedelta(days=days - 1), today)
+
+    @classmethod
+    def aggregate(cls, *group_by, start_date=None, end_date=None, warehouse_ids=None,
+                  record_type=None, customer_name=None):
+        """
+        按指定维度读取汇总数据
+
+        Args:
+            group_by: 分组字段名，可选 stat_date/warehouse_id/customer_name/record_type
+            start_date: 开始日期（含）
+            end_date: 结束日期（含）
+            warehouse_ids: 仓库ID列表，None 表示不限制
+            record_type: 记录类型 inbound/outbound，None 表示两者
+            customer_name: 客户名称，None 表示不限制
+
+        Returns:
+            list: 查询结果行，包含分组字段及 record_count/pallet_count/package_count/weight/volume
+        """
+        if warehouse_ids is not None and not warehouse_ids:
+            return []
+
+        rollup = cls.source()
+        columns = [rollup.c[name] for name in group_by]
+        query = db.session.query(
+            *columns,
+            func.coalesce(func.sum(rollup.c.record_count), 0).label('record_count'),
+            func.coalesce(func.sum(rollup.c.pallet_count), 0).label('pallet_count'),
+            func.coalesce(func.sum(rollup.c.package_count), 0).label('package_count'),
+            func.coalesce(func.sum(rollup.c.weight), 0).label('weight'),
+            func.coalesce(func.sum(rollup.c.volume), 0).label('volume')
+        )
+
+        if start_date is not None:
+            query = query.filter(rollup.c.stat_date >= _to_date(start_date))
+        if end_date is not None:
+            query = query.filter(rollup.c.stat_date <= _to_date(end_date))
+        if warehouse_ids is not None:
+            query = query.filter(rollup.c.warehouse_id.in_(warehouse_ids))
+        if record_type is not None:
+            query = query.filter(rollup.c.record_type == record_type)
+        if customer_name is not None:
+            query = query.filter(rollup.c.customer_name == customer_name)
+
+        if columns:
+            query = query.group_by(*columns)
+        return query.all()
+
+    @classmethod
+    def is_populated(cls):
+        """汇总表是否已完成全量回填（只读取回填标记）"""
+        return cls.backfill.is_populated()
+
+    @classmethod
+    def backfill_if_needed(cls):
+        """汇总表尚未回填时（首次部署）在命名锁下执行一次全量回填，供命令行和调度器调用"""
+        return cls.backfill.backfill_if_needed(cls.rebuild_all)
+
+    @classmethod
+    def source(cls):
+        """
+        读取汇总数据的表
+
+        已回填时为汇总表；尚未回填时不在请求中回填，改为按进出库记录即时分组统计的子查询，列与汇总表相同。
+        """
+        if cls.is_populated():
+            return DailyOperationsRollup.__table__
+        logger.warning("每日作业汇总表尚未回填，按进出库记录即时统计")
+        return union_all(*[
+            cls._grouped_select(record_type, model, time_field)
+            for record_type, model, time_field in ROLLUP_SOURCES
+        ]).subquery('daily_operations_rollup_live')
+
+
+def _touched_slices(obj):
+    """获取记录当前和修改前所在的 日期+仓库 切片"""
+    for _, model, time_field in ROLLUP_SOURCES:
+        if isinstance(obj, model):
+            break
+    else:
+        return set()
+
+    times = {getattr(obj, time_field, None)}
+    warehouse_ids = {getattr(obj, 'operated_warehouse_id', None)}
+    times.update(attributes.get_history(obj, time_field).deleted)
+    warehouse_ids.update(attributes.get_history(obj, 'operated_warehouse_id').deleted)
+
+    return {(_to_date(value), warehouse_id)
+            for value in times if value
+            for warehouse_id in warehouse_ids}
+
+
+def _collect_touched_slices(session):
+    """flush 后收集本次写入涉及的 日期+仓库 切片"""
+    slices = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        slices.update(_touched_slices(obj))
+    return slices
+
+
+def mark_slices_dirty(slices, session=None):
+    """
+    标记需要刷新汇总的 日期+仓库 切片
+
+    批量 insert()/update() 语句不经过 ORM flush，调用方需显式标记，
+    汇总行会在本事务提交前一并刷新。
+    """
+    slices = {(_to_date(stat_date), warehouse_id) for stat_date, warehouse_id in slices if stat_date}
+    mark_pending(_PENDING_SLICES_KEY, slices, session or db.session)
+
+
+def _refresh_slices(session, slices):
+    """重算触及切片的汇总行"""
+    DailyRollupService.refresh_slices(slices, session=session)
+
+
+def register_daily_rollup_events():
+    """注册每日作业汇总的会话事件监听器"""
+    register_pending_refresh(_PENDING_SLICES_KEY, _collect_touched_slices, _refresh_slices, name='每日作业汇总')
+    logger.info("每日作业汇总事件监听器注册完成")
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+后台导出任务服务模块
+大数据量导出和报表生成不再占用请求线程：
+1. 提交时写入 export_jobs 表并立即返回任务ID，由线程池在后台生成文件
+2. 文件写入 var/exports 目录，按已写入行数更新进度
+3. 限制每个用户同时进行的任务数
+4. 完成的文件保留 ARTIFACT_TTL_HOURS 小时，过期后由调度器清理
+任务状态保存在数据库中，任意 gunicorn 进程都可以查询状态和下载文件。
+"""
+import json
+import logging
+import os
+import shutil
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import db
+from app.models import ExportJob, User
+from app.services.export_service import StreamingExportService, EXPORT_SPECS, EXPORT_QUERY_BUILDERS
+
+logger = logging.getLogger(__name__)
+
+
+class ExportJobService:
+    """后台导出任务服务"""
+
+    # 每个进程的后台工作线程数
+    MAX_WORKERS = 2
+    # 每个用户同时进行（排队中+执行中）的任务上限
+    MAX_ACTIVE_JOBS_PER_USER = 2
+    # 生成文件的保留时间
+    ARTIFACT_TTL_HOURS = 24
+    # 超过该时间仍未完成的任务视为失效（进程重启等原因）
+    STALE_JOB_HOURS = 2
+    # 过期/失败任务记录的保留天数
+    HISTORY_KEEP_DAYS = 7
+
+    ACTIVE_STATUSES = ('pending', 'running')
+    REPORT_TYPES = ('dashboard',)
+    REPORT_FORMATS = ('excel', 'pdf', 'csv')
+
+    # 导出对应的查看权限
+    EXPORT_PERMISSIONS = {
+        'inbound': 'INBOUND_VIEW',
+        'outbound': 'OUTBOUND_VIEW',
+        'inventory': 'INVENTORY_VIEW',
+    }
+    REPORT_PERMISSION = 'STATISTICS_VIEW'
+
+    _executor = None
+    _executor_lock = threading.Lock()
+
+    @classmethod
+    def _get_executor(cls):
+        """按需创建进程内线程池"""
+        with cls._executor_lock:
+            if cls._executor is None:
+                cls._executor = ThreadPoolExecutor(max_workers=cls.MAX_WORKERS,
+                                                   thread_name_prefix='export-job')
+            return cls._executor
+
+    @staticmethod
+    def get_export_dir(app=None):
+        """导出文件目录，默认为项目根目录下的 var/exports"""
+        app = app or current_app
+        path = app.config.get('EXPORT_JOB_DIR') or os.path.join(os.path.dirname(app.root_path), 'var', 'exports')
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @classmethod
+    def required_permission(cls, job_type, job_name):
+        """任务所需的权限代码"""
+        if job_type == 'report':
+            return cls.REPORT_PERMISSION
+        return cls.EXPORT_PERMISSIONS.get(job_name)
+
+    @classmethod
+    def submit(cls, user, job_type, job_name, params=None, file_format=None):
+        """
+        提交后台导出任务
+
+        Args:
+            user: 提交用户
+            job_type: export（记录导出）或 report（报表生成）
+            job_name: 导出名称（inbound/outbound/inventory）或报表类型（dashboard）
+            params: 筛选参数，与同步导出接口的查询参数一致
+            file_format: 导出为 xlsx/csv，报表为 excel/pdf/csv
+
+        Returns:
+            dict: {'success': bool, 'message': str, 'job_id': str}
+        """
+        if job_type == 'report':
+            file_format = file_format or 'excel'
+            if job_name not in cls.REPORT_TYPES or file_format not in cls.REPORT_FORMATS:
+                return {'success': False, 'message': f'不支持的报表: {job_name} ({file_format})'}
+        elif job_type == 'export':
+            file_format = file_format or 'xlsx'
+            if job_name not in EXPORT_QUERY_BUILDERS or file_format not in StreamingExportService.FORMATS:
+                return {'success': False, 'message': f'不支持的导出: {job_name} ({file_format})'}
+        else:
+            return {'success': False, 'message': f'不支持的任务类型: {job_type}'}
+
+        try:
+            active_count = ExportJob.query.filter(
+                ExportJob.user_id == user.id,
+                ExportJob.status.in_(cls.ACTIVE_STATUSES)
+            ).count()
+            if active_count >= cls.MAX_ACTIVE_JOBS_PER_USER:
+                return {
+                    'success': False,
+                    'message': f'每个用户最多同时进行 {cls.MAX_ACTIVE_JOBS_PER_USER} 个导出任务，请等待已有任务完成'
+                }
+
+            job = ExportJob(
+                id=uuid.uuid4().hex,
+                user_id=user.id,
+                job_type=job_type,
+                job_name=job_name,
+                file_format=file_format,
+                params=json.dumps(params or {}, ensure_ascii=False)
+            )
+            db.session.add(job)
+            db.session.commit()
+
+            app = current_app._get_current_object()
+            cls._get_executor().submit(cls._run_job, app, job.id)
+
+            logger.info(f"用户 {user.id} 提交导出任务 {job.id}: {job_type}/{job_name}")
+            return {'success': True, 'message': '导出任务已提交', 'job_id': job.id}
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"提交导出任务失败: {str(e)}")
+            return {'success': False, 'message': f'提交导出任务失败: {str(e)}'}
+
+    @classmethod
+    def get_job(cls, job_id, user):
+        """获取用户自己的任务"""
+        return ExportJob.query.filter_by(id=job_id, user_id=user.id).first()
+
+    @classmethod
+    def list_jobs(cls, user, limit=20):
+        """用户最近的任务"""
+        return ExportJob.query.filter_by(user_id=user.id).order_by(
+            ExportJob.created_at.desc()
+        ).limit(limit).all()
+
+    @classmethod
+    def _run_job(cls, app, job_id):
+        """后台线程执行任务"""
+        with app.app_context():
+            path = None
+            try:
+                job = db.session.get(ExportJob, job_id)
+                if job is None or job.status != 'pending':
+                    return
+
+                cls._update(job_id, status='running', started_at=datetime.now())
+
+                if job.job_type == 'report':
+                    path, filename, row_count = cls._build_report(app, job)
+                else:
+                    path, filename, row_count = cls._build_export(app, job)
+
+                now = datetime.now()
+                cls._update(
+                    job_id,
+                    status='finished',
+                    progress=100,
+                    row_count=row_count,
+                    file_path=path,
+                    filename=filename,
+                    finished_at=now,
+                    expires_at=now + timedelta(hours=cls.ARTIFACT_TTL_HOURS)
+                )
+                logger.info(f"导出任务 {job_id} 完成，共 {row_count} 行")
+
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"导出任务 {job_id} 执行失败: {str(e)}")
+                if path:
+                    cls._remove_file(path)
+                cls._update(job_id, status='failed', error_message=str(e), finished_at=datetime.now())
+            finally:
+                db.session.remove()
+
+    @classmethod
+    def _build_export(cls, app, job):
+        """按导出定义生成记录导出文件，返回 (路径, 下载文件名, 行数)"""
+        params = json.loads(job.params or '{}')
+        query = EXPORT_QUERY_BUILDERS[job.job_name](params)
+
+        total_rows = query.order_by(None).count()
+        cls._update(job.id, total_rows=total_rows)
+
+        def progress(row_count):
+            percent = min(99, row_count * 100 // total_rows) if total_rows else 0
+            try:
+                cls._update(job.id, row_count=row_count, progress=percent)
+            except Exception as e:
+                # 进度仅供展示，更新失败不影响导出
+                logger.warning(f"更新导出任务 {job.id} 进度失败: {e}")
+
+        # SQLite 在读游标未结束时无法由其他连接写入，只在完成时更新进度
+        supports_progress = db.engine.dialect.name != 'sqlite'
+
+        path = os.path.join(cls.get_export_dir(app), f'{job.id}.{job.file_format}')
+        try:
+            row_count = StreamingExportService.write_file(job.job_name, query, path, job.file_format,
+                                                          progress=progress if supports_progress else None)
+        except Exception:
+            cls._remove_file(path)
+            raise
+
+        spec = EXPORT_SPECS[job.job_name]
+        filename = f"{spec.filename}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{job.file_format}"
+        return path, filename, row_count
+
+    @classmethod
+    def _build_report(cls, app, job):
+        """调用报表生成器生成报表文件，返回 (路径, 下载文件名, 行数)"""
+        from app.reports.report_generator import ReportGenerator
+
+        params = json.loads(job.params or '{}')
+        user = db.session.get(User, job.user_id)
+        source_path = ReportGenerator().generate_report(
+            job.job_name, job.file_format, user,
+            start_date=params.get('start_date'),
+            end_date=params.get('end_date')
+        )
+
+        extension = os.path.splitext(source_path)[1]
+        path = os.path.join(cls.get_export_dir(app), f'{job.id}{extension}')
+        shutil.move(source_path, path)
+        return path, os.path.basename(source_path), None
+
+    @staticmethod
+    def _update(job_id, **values):
+        """使用独立连接更新任务状态，不影响导出查询所在的会话和游标"""
+        table = ExportJob.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update().where(table.c.id == job_id).values(**values))
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            if path and os.path.exists(path):
+                os.remove(path)
+        except OSError as e:
+            logger.warning(f"删除导出文件失败 {path}: {e}")
+
+    @classmethod
+    def cleanup_expired(cls):
+        """
+        清理过期导出文件和失效任务
+
+        Returns:
+            dict: 清理结果
+        """
+        try:
+            now = datetime.now()
+
+            # 1. 删除过期文件，任务标记为已过期
+            expired_jobs = ExportJob.query.filter(
+                ExportJob.status == 'finished',
+                ExportJob.expires_at < now
+            ).all()
+            for job in expired_jobs:
+                cls._remove_file(job.file_path)
+                job.status = 'expired'
+                job.file_path = None
+
+            # 2. 长时间未完成的任务（进程重启后不会再执行）标记为失败
+            stale_count = ExportJob.query.filter(
+                ExportJob.status.in_(cls.ACTIVE_STATUSES),
+                ExportJob.created_at < now - timedelta(hours=cls.STALE_JOB_HOURS)
+            ).update({
+                'status': 'failed',
+                'error_message': '任务执行超时或服务已重启',
+                'finished_at': now
+            }, synchronize_session=False)
+
+            # 3. 删除历史任务记录
+            deleted_count = ExportJob.query.filter(
+                ExportJob.status.in_(('expired', 'failed')),
+                ExportJob.created_at < now - timedelta(days=cls.HISTORY_KEEP_DAYS)
+            ).delete(synchronize_session=False)
+
+            db.session.commit()
+            return {
+                'success': True,
+                'expired_count': len(expired_jobs),
+                'stale_count': stale_count,
+                'deleted_count': deleted_count
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"清理导出任务失败: {str(e)}")
+            return {'success': False, 'message': str(e)}
@@ -0,0 +1,630 @@
+#!/usr/bin/env python3
+"""
+流式导出服务模块
+入库/出库/库存/接收记录导出共用的导出引擎：
+1. 每种导出的列定义（表头、取值、列宽）只在 EXPORT_SPECS 中声明一次
+2. 查询结果通过 yield_per 分块读取（服务端游标），不再一次性 .all() 载入内存
+3. Excel 使用 xlsxwriter 的 constant_memory 模式逐行写入临时文件，再分块流式返回
+4. CSV 使用分块生成器边查询边输出
+"""
+import csv
+import io
+import logging
+import os
+import tempfile
+from collections import namedtuple
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from flask import Response, stream_with_context
+
+logger = logging.getLogger(__name__)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_MIMETYPE = 'text/csv; charset=utf-8'
+
+# 导出列：表头、取值函数(record -> value)、列宽
+ExportColumn = namedtuple('ExportColumn', ['header', 'value', 'width'])
+
+# 导出定义：工作表名、文件名前缀、列、表头底色、是否带序号列、是否添加自动筛选
+ExportSpec = namedtuple('ExportSpec', ['sheet_name', 'filename', 'columns', 'header_color',
+                                       'numbered', 'autofilter'])
+
+
+def _text(attr):
+    """文本字段，空值输出空字符串"""
+    return lambda record: getattr(record, attr) or ''
+
+
+def _number(attr):
+    """数值字段，空值输出0"""
+    return lambda record: getattr(record, attr) or 0
+
+
+def _positive(attr):
+    """数值字段，仅输出大于0的值"""
+    def getter(record):
+        value = getattr(record, attr)
+        return value if value and value > 0 else ''
+    return getter
+
+
+def _time(attr, fmt='%Y-%m-%d %H:%M:%S'):
+    """时间字段按格式输出"""
+    def getter(record):
+        value = getattr(record, attr)
+        return value.strftime(fmt) if value else ''
+    return getter
+
+
+def _date(attr):
+    """时间字段只输出日期"""
+    return _time(attr, '%Y-%m-%d')
+
+
+def _related(relation, attr):
+    """关联对象的字段"""
+    def getter(record):
+        related = getattr(record, relation)
+        return getattr(related, attr) or '' if related else ''
+    return getter
+
+
+def _col(header, value, width=12):
+    return ExportColumn(header, value, width)
+
+
+# 批次号前缀对应的来源仓库
+BATCH_SOURCE_WAREHOUSES = {
+    'PH': '平湖仓',
+    'KS': '昆山仓',
+    'CD': '成都仓',
+    'PX': '凭祥北投仓'
+}
+
+
+def _receive_source_warehouse(record):
+    """接收记录的来源仓库：优先按批次号前缀识别，其次取发货仓库"""
+    if record.batch_no:
+        source = BATCH_SOURCE_WAREHOUSES.get(record.batch_no[:2])
+        if source:
+            return source
+    if record.shipping_warehouse and record.shipping_warehouse != 'None' and record.shipping_warehouse.strip():
+        return record.shipping_warehouse
+    return '未知来源'
+
+
+def _receive_batch_sequence(record):
+    """接收记录的批次序号，格式 序号/总数"""
+    if record.batch_sequence and record.batch_total:
+        return f"{record.batch_sequence}/{record.batch_total}"
+    return ''
+
+
+# 常用列
+COL_CUSTOMER = _col('客户名称', _text('customer_name'), 20)
+COL_IDENTIFICATION_CODE = _col('识别编码', _text('identification_code'), 24)
+COL_BATCH_NO = _col('批次号', _text('batch_no'), 15)
+COL_DELIVERY_PLATE = _col('送货干线车', _text('delivery_plate_number'))
+COL_EXPORT_MODE = _col('出境模式', _text('export_mode'))
+COL_CUSTOMS_BROKER = _col('报关行', _text('customs_broker'), 15)
+COL_ORDER_TYPE = _col('订单类型', _text('order_type'))
+COL_SERVICE_STAFF = _col('跟单客服', _text('service_staff'))
+COL_LOCATION = _col('库位', _text('location'))
+COL_DOCUMENTS = _col('单据', _text('documents'))
+COL_REMARK1 = _col('备注1', _text('remark1'), 15)
+COL_REMARK2 = _col('备注2', _text('remark2'), 15)
+COL_OPERATED_WAREHOUSE = _col('操作仓库', _related('operated_warehouse', 'warehouse_name'))
+COL_OPERATED_USER = _col('操作用户', _related('operated_by_user', 'username'))
+COL_WEIGHT = _col('重量(kg)', _number('weight'), 10)
+COL_VOLUME = _col('体积(m³)', _number('volume'), 10)
+
+# 板数/件数/重量/体积
+INBOUND_CARGO_COLUMNS = [
+    _col('板数', _number('pallet_count'), 8),
+    _col('件数', _number('package_count'), 8),
+    COL_WEIGHT,
+    COL_VOLUME
+]
+
+# 库存记录列
+INVENTORY_COLUMNS = [
+    _col('入库日期', _date('inbound_time'), 12),
+    _col('入库车牌', _text('plate_number')),
+    COL_CUSTOMER,
+    COL_ORDER_TYPE,
+    COL_IDENTIFICATION_CODE,
+    _col('入库板数', lambda record: record.inbound_pallet_count or record.pallet_count, 10),
+    _col('入库件数', lambda record: record.inbound_package_count or record.package_count, 10),
+    _col('库存板数', _number('pallet_count'), 10),
+    _col('库存件数', _number('package_count'), 10),
+    _col('重量(kg)', _positive('weight'), 10),
+    _col('体积(m³)', _positive('volume'), 10),
+    COL_EXPORT_MODE,
+    COL_CUSTOMS_BROKER,
+    COL_DOCUMENTS,
+    COL_SERVICE_STAFF,
+    COL_LOCATION
+]
+# 库存表没有备注字段，保留列位置
+COL_INVENTORY_REMARK = _col('备注', lambda record: getattr(record, 'remark1', '') or '', 15)
+
+# 各导出的列定义
+EXPORT_SPECS = {
+    'inbound': ExportSpec('入库记录', '入库记录导出', [
+        _col('入库时间', _date('inbound_time'), 12),
+        _col('入库车牌', _text('plate_number')),
+        COL_CUSTOMER,
+        COL_IDENTIFICATION_CODE,
+        *INBOUND_CARGO_COLUMNS,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_DOCUMENTS,
+        COL_SERVICE_STAFF,
+        _col('创建时间', _time('inbound_time'), 20)
+    ], '#D9E1F2', True, True),
+
+    'outbound': ExportSpec('出库记录', '出库记录', [
+        _col('出库时间', _date('outbound_time'), 12),
+        _col('出库车牌', _text('plate_number')),
+        COL_CUSTOMER,
+        _col('入库车牌', _text('inbound_plate')),
+        COL_ORDER_TYPE,
+        _col('板数', _number('pallet_count'), 8),
+        _col('件数', _number('package_count'), 8),
+        COL_WEIGHT,
+        COL_VOLUME,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_LOCATION,
+        _col('单据', _text('document_no')),
+        _col('目的地', _text('destination'), 15),
+        COL_SERVICE_STAFF,
+        _col('创建时间', _time('outbound_time'), 20)
+    ], '#D9E1F2', False, False),
+
+    'inventory': ExportSpec('库存记录', '库存记录', [
+        column for column in INVENTORY_COLUMNS if column is not COL_ORDER_TYPE
+    ] + [
+        _col('最后更新时间', _time('last_updated'), 20)
+    ], '#D9E1F2', True, False),
+
+    'frontend_receive': ExportSpec('前端仓接收记录', '前端仓接收记录导出', [
+        _col('接收时间', _time('inbound_time'), 20),
+        COL_BATCH_NO,
+        COL_IDENTIFICATION_CODE,
+        COL_CUSTOMER,
+        COL_DELIVERY_PLATE,
+        _col('入库车牌', _text('plate_number')),
+        *INBOUND_CARGO_COLUMNS,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_ORDER_TYPE,
+        COL_SERVICE_STAFF,
+        COL_LOCATION,
+        COL_DOCUMENTS,
+        COL_OPERATED_WAREHOUSE,
+        COL_OPERATED_USER,
+        _col('创建时间', _time('created_at'), 20)
+    ], '#D7E4BC', False, False),
+
+    'frontend_inbound': ExportSpec('前端仓入库记录', '前端仓入库记录导出', [
+        _col('入库时间', _time('inbound_time'), 20),
+        COL_BATCH_NO,
+        COL_CUSTOMER,
+        _col('车牌号', _text('plate_number')),
+        COL_IDENTIFICATION_CODE,
+        *INBOUND_CARGO_COLUMNS,
+        COL_ORDER_TYPE,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_LOCATION,
+        COL_DOCUMENTS,
+        COL_SERVICE_STAFF,
+        COL_OPERATED_WAREHOUSE,
+        COL_OPERATED_USER,
+        _col('创建时间', _time('created_at'), 20)
+    ], '#D7E4BC', False, False),
+
+    'backend_inbound': ExportSpec('后端仓入库记录', '后端仓入库记录导出', [
+        _col('入库时间', _date('inbound_time'), 12),
+        _col('入库车牌', _text('plate_number')),
+        COL_CUSTOMER,
+        COL_IDENTIFICATION_CODE,
+        *INBOUND_CARGO_COLUMNS,
+        COL_ORDER_TYPE,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_LOCATION,
+        COL_DOCUMENTS,
+        COL_SERVICE_STAFF,
+        COL_OPERATED_WAREHOUSE,
+        _col('创建时间', _time('created_at'), 20)
+    ], '#FFE6E6', True, True),
+
+    'backend_receive': ExportSpec('后端仓接收记录', '后端仓接收记录导出', [
+        _col('接收时间', _time('receive_time'), 20),
+        COL_BATCH_NO,
+        _col('来源仓库', _receive_source_warehouse),
+        _col('接收状态', lambda record: record.receive_status or '已接收', 10),
+        COL_IDENTIFICATION_CODE,
+        COL_CUSTOMER,
+        COL_DELIVERY_PLATE,
+        _col('入库车牌', _text('inbound_plate')),
+        *INBOUND_CARGO_COLUMNS,
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_ORDER_TYPE,
+        COL_SERVICE_STAFF,
+        _col('库位', _text('storage_location')),
+        COL_DOCUMENTS,
+        _col('批次序号', _receive_batch_sequence, 10),
+        COL_REMARK1,
+        COL_REMARK2,
+        COL_OPERATED_WAREHOUSE,
+        _col('操作用户', _related('created_by_user', 'username')),
+        _col('创建时间', _time('created_at'), 20)
+    ], '#D7E4BC', False, False),
+
+    'frontend_outbound': ExportSpec('前端仓出库记录', '前端仓出库记录导出', [
+        COL_BATCH_NO,
+        COL_IDENTIFICATION_CODE,
+        COL_CUSTOMER,
+        _col('出库车牌', _text('plate_number')),
+        _col('目的地', _text('destination')),
+        COL_DELIVERY_PLATE,
+        COL_CUSTOMS_BROKER,
+        COL_EXPORT_MODE,
+        _col('大层数', _number('large_layer'), 8),
+        _col('小层数', _number('small_layer'), 8),
+        _col('托板数', _number('pallet_board'), 8),
+        _col('重量(KG)', _number('weight'), 10),
+        _col('体积(CBM)', _number('volume'), 10),
+        COL_DOCUMENTS,
+        _col('入库日期', _date('inbound_date'), 18),
+        _col('出库时间', _time('outbound_time'), 18),
+        _col('出发时间', _time('departure_time'), 18),
+        COL_REMARK1,
+        COL_REMARK2,
+        COL_OPERATED_WAREHOUSE,
+        _col('目标仓库', _related('destination_warehouse', 'warehouse_name')),
+        COL_OPERATED_USER
+    ], '#D7E4BC', False, False),
+
+    'backend_outbound': ExportSpec('后端仓出库记录', '后端仓出库记录导出', [
+        _col('出库时间', _time('outbound_time'), 20),
+        COL_BATCH_NO,
+        COL_DELIVERY_PLATE,
+        _col('出库/出境车牌', _text('plate_number'), 14),
+        _col('入库车牌', _text('inbound_plate')),
+        COL_CUSTOMER,
+        COL_IDENTIFICATION_CODE,
+        _col('目的地', _text('destination'), 15),
+        COL_EXPORT_MODE,
+        COL_CUSTOMS_BROKER,
+        COL_ORDER_TYPE,
+        _col('出库板数', _number('pallet_count'), 10),
+        _col('出库件数', _number('package_count'), 10),
+        _col('重量(KG)', _number('weight'), 10),
+        _col('体积(CBM)', _number('volume'), 10),
+        _col('单据', _text('document_no')),
+        COL_SERVICE_STAFF,
+        _col('备注', _text('remarks'), 15),
+        _col('入库日期', _date('inbound_date'), 12),
+        COL_OPERATED_WAREHOUSE,
+        COL_OPERATED_USER,
+        _col('创建时间', _time('outbound_time'), 20)
+    ], '#D7E4BC', False, False),
+
+    'frontend_inventory': ExportSpec('前端仓库存记录', '前端仓库存记录', INVENTORY_COLUMNS + [
+        COL_INVENTORY_REMARK,
+        _col('仓库', _related('operated_warehouse', 'warehouse_name'))
+    ], '#D9E1F2', True, False),
+
+    'backend_inventory': ExportSpec('后端仓库存记录', '后端仓库存记录', INVENTORY_COLUMNS + [
+        COL_INVENTORY_REMARK
+    ], '#D9E1F2', True, False),
+}
+
+
+
+def _parse_date_range(args, default_days=None):
+    """解析 date_start/date_end 参数，无效日期忽略；未指定时可默认最近 default_days 天"""
+    date_start = args.get('date_start', '')
+    date_end = args.get('date_end', '')
+
+    if not date_start and not date_end and default_days:
+        date_start = (datetime.now() - timedelta(days=default_days)).strftime('%Y-%m-%d')
+        date_end = datetime.now().strftime('%Y-%m-%d')
+
+    start = end = None
+    try:
+        start = datetime.strptime(date_start, '%Y-%m-%d') if date_start else None
+    except ValueError:
+        logger.warning(f"无效的开始日期格式: {date_start}")
+    try:
+        end = datetime.strptime(date_end, '%Y-%m-%d').replace(hour=23, minute=59, second=59) if date_end else None
+    except ValueError:
+        logger.warning(f"无效的结束日期格式: {date_end}")
+    return start, end
+
+
+def _apply_like_filters(query, model, args, fields, exact_fields=()):
+    """按参数名对同名字段做模糊匹配（exact_fields 中的字段精确匹配）"""
+    for field in fields:
+        value = args.get(field, '')
+        if not value:
+            continue
+        column = getattr(model, field)
+        query = query.filter(column == value if field in exact_fields else column.like(f'%{value}%'))
+    return query
+
+
+def build_inbound_export_query(args):
+    """入库记录导出查询（与入库列表相同的筛选条件）"""
+    from app.models import InboundRecord
+
+    query = InboundRecord.query
+    start, end = _parse_date_range(args)
+    if start:
+        query = query.filter(InboundRecord.inbound_time >= start)
+    if end:
+        query = query.filter(InboundRecord.inbound_time <= end)
+
+    query = _apply_like_filters(query, InboundRecord, args, [
+        'plate_number', 'customer_name', 'export_mode', 'customs_broker', 'service_staff'
+    ])
+    # 按入库时间升序排序
+    return query.order_by(InboundRecord.inbound_time.asc())
+
+
+def build_outbound_export_query(args):
+    """出库记录导出查询，未指定日期时默认导出最近一周"""
+    from app.models import OutboundRecord
+
+    query = OutboundRecord.query
+    start, end = _parse_date_range(args, default_days=7)
+    if start:
+        query = query.filter(OutboundRecord.outbound_time >= start)
+    if end:
+        query = query.filter(OutboundRecord.outbound_time <= end)
+
+    query = _apply_like_filters(query, OutboundRecord, args, [
+        'plate_number', 'customer_name', 'destination', 'service_staff', 'inbound_plate',
+        'order_type', 'export_mode', 'document_no', 'location', 'customs_broker'
+    ], exact_fields=('order_type', 'export_mode'))
+    # 按出库时间降序排序
+    return query.order_by(OutboundRecord.outbound_time.desc())
+
+
+def build_inventory_export_query(args):
+    """库存记录导出查询，只包含库存不为0的记录"""
+    from app.models import Inventory
+
+    query = Inventory.query.filter((Inventory.pallet_count > 0) | (Inventory.package_count > 0))
+    query = _apply_like_filters(query, Inventory, args, ['customer_name', 'location'])
+    # 按入库日期降序排序
+    return query.order_by(Inventory.inbound_time.desc())
+
+
+# 可按参数重建查询的导出（后台导出任务使用）
+EXPORT_QUERY_BUILDERS = {
+    'inbound': build_inbound_export_query,
+    'outbound': build_outbound_export_query,
+    'inventory': build_inventory_export_query,
+}
+
+class StreamingExportService:
+    """流式导出服务"""
+
+    # 每次从数据库游标读取的行数
+    CHUNK_SIZE = 1000
+    # 文件流式返回的块大小
+    FILE_CHUNK_SIZE = 64 * 1024
+    # 支持的导出格式
+    FORMATS = ('xlsx', 'csv')
+
+    @classmethod
+    def export(cls, export_name, query, file_format='xlsx', row_hook=None):
+        """
+        将查询结果导出为流式下载响应
+
+        Args:
+            export_name: EXPORT_SPECS 中的导出名称
+            query: 已构建好筛选和排序条件的 ORM 查询
+            file_format: xlsx 或 csv
+            row_hook: 写入每行前对记录做补充处理的函数（会执行额外查询时使用）
+
+        Returns:
+            Response: 流式下载响应
+        """
+        spec = EXPORT_SPECS[export_name]
+        file_format = file_format if file_format in cls.FORMATS else 'xlsx'
+        filename = f"{spec.filename}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{file_format}"
+
+        if file_format == 'csv':
+            body = stream_with_context(cls._iter_csv(spec, query, row_hook))
+            response = Response(body, mimetype=CSV_MIMETYPE)
+        else:
+            fd, path = tempfile.mkstemp(suffix='.xlsx', prefix='export_')
+            os.close(fd)
+            try:
+                row_count = cls.write_file(export_name, query, path, row_hook=row_hook)
+            except Exception:
+                cls._remove_file(path)
+                raise
+            response = Response(cls._iter_file(path), mimetype=XLSX_MIMETYPE)
+            response.headers['Content-Length'] = str(os.path.getsize(path))
+            response.call_on_close(lambda: cls._remove_file(path))
+            logger.info(f"导出 {export_name} 完成，共 {row_count} 条记录")
+
+        response.headers['Content-Disposition'] = (
+            f"attachment; filename=export.{file_format}; filename*=UTF-8''{quote(filename)}"
+        )
+        return response
+
+    @classmethod
+    def iter_records(cls, query, row_hook=None):
+        """
+        分块读取查询结果
+
+        没有补充处理时直接使用 yield_per 服务端游标；
+        row_hook 需要在同一连接上执行额外查询，此时先取出主键，再按主键分块加载，
+        避免在未读完的服务端游标上发起新查询。
+        """
+        from app import db
+
+        if row_hook is None:
+            for record in query.yield_per(cls.CHUNK_SIZE):
+                yield record
+            return
+
+        model = query.column_descriptions[0]['entity']
+        ids = [row[0] for row in query.with_entities(model.id)]
+        chunk_query = query.limit(None).offset(None)
+
+        for start in range(0, len(ids), cls.CHUNK_SIZE):
+            chunk_ids = ids[start:start + cls.CHUNK_SIZE]
+            records = {record.id: record for record in chunk_query.filter(model.id.in_(chunk_ids))}
+            with db.session.no_autoflush:
+                for record_id in chunk_ids:
+                    record = records.get(record_id)
+                    if record is None:
+                        continue
+                    row_hook(record)
+                    yield record
+            # 补充处理修改过的记录不写回数据库，也不在会话中累积
+            for record in records.values():
+                db.session.expunge(record)
+
+    @classmethod
+    def _iter_rows(cls, spec, query, row_hook):
+        """按列定义生成每行的值"""
+        for index, record in enumerate(cls.iter_records(query, row_hook), 1):
+            values = [column.value(record) for column in spec.columns]
+            if spec.numbered:
+                values.insert(0, index)
+            yield values
+
+    @staticmethod
+    def _headers(spec):
+        headers = [column.header for column in spec.columns]
+        return ['序号'] + headers if spec.numbered else headers
+
+    @staticmethod
+    def _widths(spec):
+        widths = [column.width for column in spec.columns]
+        return [6] + widths if spec.numbered else widths
+
+    @classmethod
+    def write_file(cls, export_name, query, path, file_format='xlsx', row_hook=None, progress=None):
+        """
+        将查询结果写入文件（后台导出任务使用）
+
+        Args:
+            export_name: EXPORT_SPECS 中的导出名称
+            query: ORM 查询
+            path: 输出文件路径
+            file_format: xlsx 或 csv
+            row_hook: 写入每行前对记录做补充处理的函数
+            progress: 每写入 CHUNK_SIZE 行调用一次，参数为已写入行数
+
+        Returns:
+            int: 写入的行数
+        """
+        spec = EXPORT_SPECS[export_name]
+        rows = cls._iter_rows(spec, query, row_hook)
+        if progress:
+            rows = cls._report_progress(rows, progress)
+
+        if file_format == 'csv':
+            return cls._write_csv(spec, rows, path)
+        return cls._write_xlsx(spec, rows, path)
+
+    @classmethod
+    def _report_progress(cls, rows, progress):
+        for row_count, values in enumerate(rows, 1):
+            yield values
+            if row_count % cls.CHUNK_SIZE == 0:
+                progress(row_count)
+
+    @classmethod
+    def _write_xlsx(cls, spec, rows, path):
+        """使用 constant_memory 模式将结果逐行写入文件，返回行数"""
+        import xlsxwriter
+
+        workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+        try:
+            worksheet = workbook.add_worksheet(spec.sheet_name)
+            header_format = workbook.add_format({
+                'bold': True,
+                'text_wrap': True,
+                'valign': 'vcenter',
+                'align': 'center',
+                'bg_color': spec.header_color,
+                'border': 1
+            })
+
+            headers = cls._headers(spec)
+            for col_num, width in enumerate(cls._widths(spec)):
+                worksheet.set_column(col_num, col_num, width)
+            worksheet.write_row(0, 0, headers, header_format)
+
+            row_count = 0
+            for row_count, values in enumerate(rows, 1):
+                worksheet.write_row(row_count, 0, values)
+
+            if spec.autofilter:
+                worksheet.autofilter(0, 0, row_count, len(headers) - 1)
+        finally:
+            workbook.close()
+        return row_count
+
+    @classmethod
+    def _write_csv(cls, spec, rows, path):
+        """将结果逐行写入CSV文件（带BOM），返回行数"""
+        row_count = 0
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(cls._headers(spec))
+            for row_count, values in enumerate(rows, 1):
+                writer.writerow(values)
+        return row_count
+
+    @classmethod
+    def _iter_csv(cls, spec, query, row_hook):
+        """分块生成CSV内容（带BOM，便于Excel识别中文）"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write('\ufeff')
+        writer.writerow(cls._headers(spec))
+
+        try:
+            for row_count, values in enumerate(cls._iter_rows(spec, query, row_hook), 1):
+                writer.writerow(values)
+                if row_count % cls.CHUNK_SIZE == 0:
+                    yield buffer.getvalue().encode('utf-8')
+                    buffer.seek(0)
+                    buffer.truncate(0)
+        except Exception as e:
+            # 响应头已发送，只能记录错误并结束输出
+            logger.error(f"CSV导出过程中出错: {str(e)}")
+
+        yield buffer.getvalue().encode('utf-8')
+
+    @classmethod
+    def _iter_file(cls, path):
+        """分块读取导出文件"""
+        with open(path, 'rb') as f:
+            while True:
+                chunk = f.read(cls.FILE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+入库批量导入服务模块
+以集合方式处理批量入库：
+1. 预先校验整批数据，逐行收集错误
+2. 按 仓库/客户/车牌/日期 分组，一次性预留识别编码序号
+3. 使用 insert().values() 批量写入入库记录
+4. 一次查询合并库存记录，新库存批量写入
+"""
+import logging
+from datetime import datetime
+from sqlalchemy import insert
+from app import db
+from app.models import InboundRecord, Inventory
+from app.utils.identification_generator import IdentificationCodeGenerator
+from app.services.inventory_summary_service import mark_codes_dirty
+from app.services.daily_rollup_service import mark_slices_dirty
+from app.services.search_index_service import mark_search_codes_dirty
+from app.cache.change_feed import mark_cache_changes
+
+logger = logging.getLogger(__name__)
+
+
+class InboundBatchImporter:
+    """入库批量导入器"""
+
+    REQUIRED_FIELDS = ['inbound_time', 'plate_number', 'customer_name', 'service_staff',
+                       'order_type', 'export_mode', 'customs_broker']
+
+    DATE_FORMATS = [
+        '%Y-%m-%d',         # 标准日期格式: 2025-06-27
+        '%Y/%m/%d',         # 斜杠分隔: 2025/06/27
+        '%Y.%m.%d',         # 点分隔: 2025.06.27
+        '%Y年%m月%d日',      # 中文格式: 2025年06月27日
+        '%Y-%m-%dT%H:%M',   # HTML5日期时间格式: 2025-06-27T12:30
+        '%Y-%m-%d %H:%M:%S'  # 完整日期时间: 2025-06-27 12:30:45
+    ]
+
+    # 库存已存在时允许覆盖的字段
+    INVENTORY_MERGE_FIELDS = ['location', 'documents', 'export_mode', 'customs_broker', 'service_staff']
+
+    def __init__(self, operated_by_user_id, warehouse_id):
+        self.operated_by_user_id = operated_by_user_id
+        self.warehouse_id = warehouse_id
+
+    def import_records(self, data):
+        """
+        执行批量导入
+
+        Args:
+            data: 已清理空格的入库数据列表
+
+        Returns:
+            dict: 与 /api/inbound/batch 相同的返回结构，额外包含 http_status
+        """
+        valid_rows, errors = self.validate(data)
+
+        if not valid_rows:
+            return self._result(0, len(data), errors)
+
+        try:
+            codes = self._assign_identification_codes(valid_rows)
+            self._insert_inbound_records(valid_rows)
+            self._merge_inventory(valid_rows)
+            mark_codes_dirty(codes)
+            mark_search_codes_dirty(codes)
+            mark_slices_dirty({(row['inbound_time'], self.warehouse_id) for row in valid_rows})
+            mark_cache_changes(
+                {('inbound', self.warehouse_id, row['customer_name'], row['inbound_time']) for row in valid_rows} |
+                {('inventory', self.warehouse_id, row['customer_name'], None) for row in valid_rows}
+            )
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"批量入库提交失败: {e}")
+            errors.append(f"提交数据库时出错: {str(e)}")
+            return {
+                'status': 'error',
+                'message': '提交数据库时出错',
+                'errors': errors,
+                'http_status': 500
+            }
+
+        logger.info(f"批量入库完成: {len(valid_rows)}/{len(data)} 条")
+        return self._result(len(valid_rows), len(data), errors)
+
+    def validate(self, data):
+        """
+        预先校验整批数据
+
+        Returns:
+            tuple: (有效行列表, 错误信息列表)
+        """
+        valid_rows = []
+        errors = []
+
+        for i, item in enumerate(data):
+            if not isinstance(item, dict):
+                errors.append(f"第{i+1}条记录处理错误: 数据格式无效")
+                continue
+
+            row, error = self._validate_item(i, item)
+            if error:
+                errors.append(error)
+            else:
+                valid_rows.append(row)
+
+        return valid_rows, errors
+
+    def _validate_item(self, i, item):
+        """校验单条数据，返回 (规范化后的行, 错误信息)"""
+        missing_fields = [field for field in self.REQUIRED_FIELDS if field not in item or not item[field]]
+        if missing_fields:
+            return None, f"第{i+1}条记录缺少必填字段: {', '.join(missing_fields)}"
+
+        # 验证入库时间格式，只保留日期部分
+        raw_time = item['inbound_time']
+        if isinstance(raw_time, datetime):
+            inbound_time = raw_time
+        elif isinstance(raw_time, str):
+            inbound_time = None
+            for date_format in self.DATE_FORMATS:
+                try:
+                    inbound_time = datetime.strptime(raw_time, date_format)
+                    break
+                except ValueError:
+                    continue
+            if inbound_time is None:
+                return None, f"第{i+1}条记录入库时间格式错误，请使用YYYY-MM-DD格式（如2025-06-27）"
+        else:
+            return None, f"第{i+1}条记录入库时间格式错误"
+        inbound_time = inbound_time.replace(hour=0, minute=0, second=0)
+
+        # 验证件数和板数不能同时为空，且必须是整数
+        try:
+            pallet_value = item.get('pallet_count', 0) or 0
+            package_value = item.get('package_count', 0) or 0
+
+            if isinstance(pallet_value, (int, float)) and pallet_value != int(pallet_value):
+                return None, f"第{i+1}条记录错误: 板数必须是整数，不能是小数"
+            if isinstance(package_value, (int, float)) and package_value != int(package_value):
+                return None, f"第{i+1}条记录错误: 件数必须是整数，不能是小数"
+
+            pallet_count = int(pallet_value)
+            package_count = int(package_value)
+        except (ValueError, TypeError):
+            return None, f"第{i+1}条记录错误: 板数和件数必须是有效的整数"
+
+        if pallet_count < 0 or package_count < 0:
+            return None, f"第{i+1}条记录错误: 板数和件数不能为负数"
+        if pallet_count == 0 and package_count == 0:
+            return None, f"第{i+1}条记录错误: 板数和件数不能同时为零"
+
+        # 处理重量和体积为空的情况
+        try:
+            weight = float(item.get('weight', 0) or 0)
+            volume = float(item.get('volume', 0) or 0)
+        except (ValueError, TypeError):
+            return None, f"第{i+1}条记录错误: 重量和体积必须是有效数字"
+        if weight < 0 or volume < 0:
+            return None, f"第{i+1}条记录错误: 重量和体积必须为非负数"
+
+        return {
+            'inbound_time': inbound_time,
+            'delivery_plate_number': item.get('delivery_plate_number', ''),
+            'plate_number': item['plate_number'],
+            'customer_name': item['customer_name'],
+            'pallet_count': pallet_count,
+            'package_count': package_count,
+            'weight': weight,
+            'volume': volume,
+            'export_mode': item.get('export_mode', ''),
+            'order_type': item.get('order_type', ''),
+            'customs_broker': item.get('customs_broker', ''),
+            'location': item.get('location', ''),
+            'documents': item.get('documents', ''),
+            'service_staff': item.get('service_staff', ''),
+        }, None
+
+    def _assign_identification_codes(self, rows):
+        """按编码前缀分组预留序号，并为每行分配识别编码"""
+        prefix_counts = {}
+        for row in rows:
+            prefix = IdentificationCodeGenerator.build_code_prefix(
+                self.warehouse_id, row['customer_name'], row['plate_number'], row['inbound_time']
+            )
+            row['_code_prefix'] = prefix
+            prefix_counts[prefix] = prefix_counts.get(prefix, 0) + 1
+
+        next_sequences = IdentificationCodeGenerator.reserve_sequences(prefix_counts, operation_type='inbound')
+
+        codes = []
+        for row in rows:
+            prefix = row.pop('_code_prefix')
+            sequence = next_sequences[prefix]
+            next_sequences[prefix] = sequence + 1
+            row['identification_code'] = IdentificationCodeGenerator.format_code(prefix, sequence)
+            codes.append(row['identification_code'])
+        return codes
+
+    def _insert_inbound_records(self, rows):
+        """批量写入入库记录"""
+        now = datetime.now()
+        records = [dict(
+            row,
+            record_type='direct',  # 直接入库记录
+            operated_by_user_id=self.operated_by_user_id,
+            operated_warehouse_id=self.warehouse_id,
+            created_at=now,
+            updated_at=now,
+            version=1
+        ) for row in rows]
+        db.session.execute(insert(InboundRecord), records)
+
+    def _merge_inventory(self, rows):
+        """一次查询合并库存：已存在的更新库位等信息，其余批量新建"""
+        codes = [row['identification_code'] for row in rows]
+        existing = {
+            inventory.identification_code: inventory
+            for inventory in Inventory.query.filter(Inventory.identification_code.in_(codes)).all()
+        }
+
+        now = datetime.now()
+        new_inventory = []
+        for row in rows:
+            inventory = existing.get(row['identification_code'])
+            if inventory is not None:
+                for field in self.INVENTORY_MERGE_FIELDS:
+                    if row.get(field):
+                        setattr(inventory, field, row[field])
+                continue
+
+            new_inventory.append({
+                'customer_name': row['customer_name'],
+                'identification_code': row['identification_code'],
+                'inbound_pallet_count': row['pallet_count'],
+                'inbound_package_count': row['package_count'],
+                'pallet_count': row['pallet_count'],
+                'package_count': row['package_count'],
+                'weight': row['weight'],
+                'volume': row['volume'],
+                'location': row['location'],
+                'documents': row['documents'],
+                'export_mode': row['export_mode'],
+                'order_type': row['order_type'],
+                'customs_broker': row['customs_broker'],
+                'inbound_time': row['inbound_time'],
+                'plate_number': row['plate_number'],
+                'service_staff': row['service_staff'],
+                'inventory_type': 'normal',
+                'operated_by_user_id': self.operated_by_user_id,
+                'operated_warehouse_id': self.warehouse_id,
+                'last_updated': now,
+                'version': 1
+            })
+
+        if new_inventory:
+            db.session.execute(insert(Inventory), new_inventory)
+
+    @staticmethod
+    def _result(success_count, total_count, errors):
+        """构建与原接口一致的返回结构"""
+        return {
+            'status': 'success' if not errors else 'partial_success',
+            'message': f'成功添加 {success_count} 条记录',
+            'success_count': success_count,
+            'total_count': total_count,
+            'errors': errors,
+            'http_status': 200
+        }
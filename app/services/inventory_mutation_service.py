@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+库存批量变更服务模块
+以集合方式在一个事务内修改一批识别编码的库存：
+1. 一次查询取得涉及的库存ID，按ID顺序分块 SELECT ... FOR UPDATE 锁定（所有调用方加锁顺序一致，避免死锁）
+2. 在锁定的快照上合并同一识别编码的多次变更，校验库存是否存在、是否足够、期望版本号是否一致
+3. 每块一条 UPDATE，各字段用 CASE id WHEN ... 写入新值，WHERE 条件同时检查快照版本号，版本号加一
+4. 更新行数不足时重新查询，准确报告版本冲突的记录
+
+UPDATE 是 Core 语句，不经过 ORM flush，服务内显式标记库存汇总和缓存变更；
+事务由调用方提交或回滚。
+"""
+import logging
+from sqlalchemy import select, update, case, func
+from app import db
+from app.models import Inventory
+from app.utils.exception_handler import BusinessException
+from app.services.inventory_summary_service import mark_codes_dirty
+from app.services.search_index_service import mark_search_codes_dirty
+from app.cache.change_feed import mark_cache_changes
+
+logger = logging.getLogger(__name__)
+
+
+class InventoryConflictError(BusinessException):
+    """库存批量变更失败（记录不存在、库存不足或版本冲突），details 为完整的变更结果"""
+    def __init__(self, message, result):
+        self.result = result
+        super().__init__(message, code=409, details=result)
+
+
+class InventoryBulkMutator:
+    """库存批量变更器"""
+
+    QUANTITY_FIELDS = ('pallet_count', 'package_count', 'weight', 'volume')
+
+    # 不允许通过批量变更修改的字段
+    PROTECTED_FIELDS = frozenset({'id', 'identification_code', 'version'})
+
+    # 参与分词索引的字段，修改时需要重建分词
+    SEARCH_FIELDS = frozenset({'customer_name', 'plate_number'})
+
+    OPERATION_TYPES = ('add', 'subtract', 'set')
+
+    def __init__(self, session=None, clamp=False, skip_missing=False, chunk_size=500):
+        """
+        Args:
+            session: 数据库会话，默认 db.session
+            clamp: 扣减后小于0时按0处理（出库沿用的口径），否则视为库存不足
+            skip_missing: 跳过不存在的识别编码，否则视为失败
+            chunk_size: 每条 SELECT/UPDATE 处理的记录数
+        """
+        self.session = session or db.session
+        self.clamp = clamp
+        self.skip_missing = skip_missing
+        self.chunk_size = chunk_size
+        self.table = Inventory.__table__
+
+    def apply(self, updates):
+        """
+        执行批量变更
+
+        Args:
+            updates: 变更列表，每个元素为 {identification_code, operation_type, pallet_count,
+                     package_count, weight, volume, version(可选，期望版本号), 其他字段}
+
+        Returns:
+            dict: {success, message, applied, missing, insufficient, conflicts}，
+                  applied 中每项包含 id、identification_code、before、after、version
+
+        Raises:
+            InventoryConflictError: 存在未跳过的缺失记录、库存不足或版本冲突，调用方应回滚
+        """
+        grouped = self._group_updates(updates)
+        result = {'success': True, 'message': '', 'applied': [], 'missing': [], 'insufficient': [], 'conflicts': []}
+        if not grouped:
+            result['message'] = '没有需要更新的库存'
+            return result
+
+        # 未 flush 的 ORM 修改先写入，避免被 Core UPDATE 覆盖
+        self.session.flush()
+
+        ids = self._lookup_ids(list(grouped))
+        result['missing'] = sorted(code for code in grouped if code not in ids)
+
+        rows = []
+        for chunk in self._chunks(sorted(ids.values())):
+            rows.extend(self._lock_rows(chunk))
+
+        planned = []
+        for row in rows:
+            code = row['identification_code']
+            after, problem = self._plan_row(row, grouped[code])
+            if problem is not None:
+                result[problem[0]].append(problem[1])
+            else:
+                planned.append((row, after))
+
+        failures = result['insufficient'] or result['conflicts'] or (result['missing'] and not self.skip_missing)
+        if failures:
+            return self._fail(result)
+
+        for start in range(0, len(planned), self.chunk_size):
+            chunk = planned[start:start + self.chunk_size]
+            conflicts = self._write_chunk(chunk)
+            if conflicts:
+                result['conflicts'].extend(conflicts)
+                return self._fail(result)
+
+        for row, after in planned:
+            result['applied'].append({
+                'id': row['id'],
+                'identification_code': row['identification_code'],
+                'before': {field: row[field] for field in self.QUANTITY_FIELDS},
+                'after': {field: after[field] for field in self.QUANTITY_FIELDS},
+                'version': (row['version'] or 0) + 1
+            })
+
+        self._mark_changes(planned)
+        self._expire_loaded(row['id'] for row, _ in planned)
+
+        result['message'] = f'成功更新{len(planned)}条库存记录'
+        if result['missing']:
+            result['message'] += f'，{len(result["missing"])}个识别编码不存在已跳过'
+        logger.info(f"库存批量变更完成: 更新{len(planned)}条, 跳过{len(result['missing'])}条")
+        return result
+
+    def _group_updates(self, updates):
+        """按识别编码合并变更，保持同一编码内的先后顺序"""
+        grouped = {}
+        for item in updates:
+            code = item.get('identification_code')
+            if not code:
+                continue
+            operation_type = item.get('operation_type', 'set')
+            if operation_type not in self.OPERATION_TYPES:
+                raise ValueError(f"不支持的库存操作类型: {operation_type}")
+            unknown = [key for key in item if key not in ('identification_code', 'operation_type', 'version')
+                       and (key in self.PROTECTED_FIELDS or key not in self.table.c)]
+            if unknown:
+                raise ValueError(f"不支持更新的库存字段: {', '.join(unknown)}")
+            grouped.setdefault(code, []).append(item)
+        return grouped
+
+    def _lookup_ids(self, codes):
+        """识别编码 -> 库存ID"""
+        ids = {}
+        for chunk in self._chunks(codes):
+            rows = self.session.execute(
+                select(self.table.c.identification_code, self.table.c.id)
+                .where(self.table.c.identification_code.in_(chunk))
+            ).all()
+            ids.update((row[0], row[1]) for row in rows)
+        return ids
+
+    def _lock_rows(self, ids):
+        """按ID顺序锁定库存行，返回锁定时的快照"""
+        columns = [self.table.c[name] for name in
+                   ('id', 'identification_code', 'customer_name', 'operated_warehouse_id', 'version')
+                   + self.QUANTITY_FIELDS]
+        return [dict(row._mapping) for row in self.session.execute(
+            select(*columns).where(self.table.c.id.in_(ids)).order_by(self.table.c.id).with_for_update()
+        )]
+
+    def _plan_row(self, row, items):
+        """
+        在锁定快照上计算一条库存的新值
+
+        Returns:
+            (新值字典, None) 或 (None, (问题类型, 问题详情))
+        """
+        after = {field: row[field] for field in self.QUANTITY_FIELDS}
+        code = row['identification_code']
+        current_version = row['version'] or 0
+
+        for item in items:
+            expected_version = item.get('version')
+            if expected_version is not None and int(expected_version) != current_version:
+                return None, ('conflicts', {
+                    'id': row['id'], 'identification_code': code,
+                    'expected_version': int(expected_version), 'current_version': current_version
+                })
+
+            operation_type = item.get('operation_type', 'set')
+            for field in self.QUANTITY_FIELDS:
+                value = item.get(field)
+                if value is None:
+                    continue
+                if operation_type == 'add':
+                    after[field] = (after[field] or 0) + value
+                elif operation_type == 'subtract':
+                    after[field] = (after[field] or 0) - value
+                    if self.clamp:
+                        after[field] = max(0, after[field])
+                else:
+                    after[field] = value
+
+            if operation_type == 'subtract' and ((after['pallet_count'] or 0) < 0 or (after['package_count'] or 0) < 0):
+                return None, ('insufficient', {
+                    'id': row['id'], 'identification_code': code,
+                    'pallet_count': row['pallet_count'] or 0, 'package_count': row['package_count'] or 0,
+                    'message': f"库存不足: 当前板数{row['pallet_count'] or 0}, 件数{row['package_count'] or 0}"
+                })
+
+            for key, value in item.items():
+                if key not in self.QUANTITY_FIELDS and key not in ('identification_code', 'operation_type', 'version'):
+                    after[key] = value
+        return after, None
+
+    def _write_chunk(self, chunk):
+        """一条 UPDATE 写入一块库存的新值，返回版本冲突的记录"""
+        table = self.table
+        ids = [row['id'] for row, _ in chunk]
+        versions = {row['id']: row['version'] or 0 for row, _ in chunk}
+
+        fields = []
+        for _, after in chunk:
+            fields.extend(field for field in after if field not in fields)
+
+        values = {}
+        for field in fields:
+            whens = {row['id']: after[field] for row, after in chunk if field in after}
+            values[field] = case(whens, value=table.c.id, else_=table.c[field])
+        values['version'] = func.coalesce(table.c.version, 0) + 1
+
+        statement = update(table).where(
+            table.c.id.in_(ids),
+            func.coalesce(table.c.version, 0) == case(versions, value=table.c.id)
+        ).values(values)
+        updated = self.session.execute(statement).rowcount
+        if updated == len(ids):
+            return []
+
+        # 锁定期间版本号被其他写入修改（未使用行锁的数据库），找出未更新的记录
+        current = dict(self.session.execute(
+            select(table.c.id, func.coalesce(table.c.version, 0)).where(table.c.id.in_(ids))
+        ).all())
+        conflicts = []
+        for row, _ in chunk:
+            if current.get(row['id']) != versions[row['id']] + 1:
+                conflicts.append({
+                    'id': row['id'], 'identification_code': row['identification_code'],
+                    'expected_version': versions[row['id']], 'current_version': current.get(row['id'])
+                })
+        return conflicts
+
+    def _mark_changes(self, planned):
+        """Core UPDATE 不经过 flush，显式标记库存汇总、分词和缓存变更"""
+        codes = {row['identification_code'] for row, _ in planned}
+        mark_codes_dirty(codes, session=self.session)
+        search_codes = {row['identification_code'] for row, after in planned if self.SEARCH_FIELDS & set(after)}
+        if search_codes:
+            mark_search_codes_dirty(search_codes, session=self.session)
+        mark_cache_changes(
+            {('inventory', row['operated_warehouse_id'], row['customer_name'], None)
+             for row, _ in planned if row['operated_warehouse_id'] is not None},
+            session=self.session
+        )
+
+    def _expire_loaded(self, ids):
+        """会话中已加载的库存对象过期，下次访问时重新读取"""
+        for inventory_id in ids:
+            obj = self.session.identity_map.get(self.session.identity_key(Inventory, inventory_id))
+            if obj is not None:
+                self.session.expire(obj)
+
+    def _fail(self, result):
+        result['success'] = False
+        parts = []
+        if result['missing'] and not self.skip_missing:
+            parts.append(f"库存记录不存在: {', '.join(result['missing'][:10])}")
+        if result['insufficient']:
+            parts.append(f"库存不足: {', '.join(item['identification_code'] for item in result['insufficient'][:10])}")
+        if result['conflicts']:
+            parts.append(f"数据已被其他用户修改: {', '.join(item['identification_code'] for item in result['conflicts'][:10])}")
+        result['message'] = '；'.join(parts)
+        logger.warning(f"库存批量变更失败: {result['message']}")
+        raise InventoryConflictError(result['message'], result)
+
+    def _chunks(self, items):
+        for start in range(0, len(items), self.chunk_size):
+            yield items[start:start + self.chunk_size]
+
+
+def apply_inventory_updates(updates, clamp=False, skip_missing=False):
+    """使用默认会话执行库存批量变更，事务由调用方提交"""
+    return InventoryBulkMutator(clamp=clamp, skip_missing=skip_missing).apply(updates)
@@ -0,0 +1,419 @@
+#!/usr/bin/env python3
+"""
+库存汇总服务模块
+维护 inventory_summary 物化汇总表：
+- 写入路径（入库/出库/接收/在途）提交事务前，按本次触及的识别编码集合重算汇总行
+- 重算使用按识别编码+仓库分组的集合查询，不随识别编码数量产生 N+1 查询
+- 提供全量重建，用于首次部署回填和定时纠偏
+"""
+import logging
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import func, case, select, union
+from sqlalchemy.orm import attributes, joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db
+from app.models import (Inventory, InboundRecord, OutboundRecord, TransitCargo,
+                        ReceiveRecord, Warehouse, InventorySummary)
+from app.utils.backfill import BackfillMarker
+from app.utils.session_events import mark_pending, register_pending_refresh
+
+logger = logging.getLogger(__name__)
+
+# 出库到这些目的地视为“已出库到春疆”
+CHUNJIANG_DESTINATIONS = ('春疆货场', '工厂')
+
+# 会影响库存汇总的模型
+TRACKED_MODELS = (Inventory, InboundRecord, OutboundRecord, TransitCargo, ReceiveRecord)
+
+# session.info 中保存待刷新识别编码的键
+_PENDING_CODES_KEY = 'inventory_summary_pending_codes'
+
+
+def _non_empty_max(column):
+    """取非空值的最大值，忽略空字符串和 'None' 字符串"""
+    return func.max(func.nullif(func.nullif(column, ''), 'None'))
+
+
+def _clean(value):
+    """清洗业务字段中的 None / 'None'"""
+    if value is None or value == 'None':
+        return ''
+    return value
+
+
+class InventorySummaryService:
+    """库存汇总服务类"""
+
+    CHUNK_SIZE = 500
+
+    # 全量回填完成标记（首次部署时由命令行或调度器回填）
+    backfill = BackfillMarker('inventory_summary', '库存汇总表')
+
+    @classmethod
+    def refresh_codes(cls, identification_codes, session=None):
+        """
+        重算指定识别编码的汇总行
+
+        Args:
+            identification_codes: 识别编码集合
+            session: 使用的数据库会话，默认 db.session（在调用方事务内执行，不提交）
+
+        Returns:
+            int: 写入的汇总行数
+        """
+        session = session or db.session
+        codes = sorted({code for code in identification_codes if code})
+        if not codes:
+            return 0
+
+        warehouse_types = dict(session.query(Warehouse.id, Warehouse.warehouse_type).all())
+        written = 0
+        for start in range(0, len(codes), cls.CHUNK_SIZE):
+            chunk = codes[start:start + cls.CHUNK_SIZE]
+            rows = cls._build_rows(session, chunk, warehouse_types)
+            summary_table = InventorySummary.__table__
+            session.execute(
+                summary_table.delete().where(summary_table.c.identification_code.in_(chunk))
+            )
+            if rows:
+                session.execute(summary_table.insert(), rows)
+            written += len(rows)
+        return written
+
+    @classmethod
+    def _build_rows(cls, session, codes, warehouse_types):
+        """用四条分组查询构建一批识别编码的汇总行"""
+        now = datetime.now()
+        rows = {}
+
+        def row_for(code, warehouse_id):
+            key = (code, warehouse_id)
+            if key not in rows:
+                rows[key] = {
+                    'identification_code': code,
+                    'warehouse_id': warehouse_id,
+                    'warehouse_type': warehouse_types.get(warehouse_id),
+                    'customer_name': None,
+                    'plate_number': None,
+                    'inbound_time': None,
+                    'location': '',
+                    'documents': '',
+                    'export_mode': '',
+                    'order_type': '',
+                    'customs_broker': '',
+                    'service_staff': '',
+                    'inventory_record_count': 0,
+                    'pallet_count': 0,
+                    'package_count': 0,
+                    'weight': 0.0,
+                    'volume': 0.0,
+                    'in_transit_pallet_count': 0,
+                    'in_transit_package_count': 0,
+                    'in_transit_weight': 0.0,
+                    'in_transit_volume': 0.0,
+                    'transit_departure_time': None,
+                    'chunjiang_outbound_count': 0,
+                    'chunjiang_outbound_pallet': 0,
+                    'chunjiang_outbound_package': 0,
+                    'original_pallet_count': 0,
+                    'original_package_count': 0,
+                    'original_weight': 0.0,
+                    'original_volume': 0.0,
+                    'last_updated': None,
+                    'refreshed_at': now,
+                }
+            return rows[key]
+
+        # 1. 库存：按识别编码+仓库汇总
+        inventory_rows = session.query(
+            Inventory.identification_code,
+            Inventory.operated_warehouse_id,
+            func.count(Inventory.id).label('record_count'),
+            func.max(Inventory.customer_name).label('customer_name'),
+            func.max(Inventory.plate_number).label('plate_number'),
+            func.sum(Inventory.pallet_count).label('pallet_count'),
+            func.sum(Inventory.package_count).label('package_count'),
+            func.sum(Inventory.weight).label('weight'),
+            func.sum(Inventory.volume).label('volume'),
+            func.min(Inventory.inbound_time).label('inbound_time'),
+            func.max(Inventory.last_updated).label('last_updated'),
+            _non_empty_max(Inventory.location).label('location'),
+            _non_empty_max(Inventory.documents).label('documents'),
+            _non_empty_max(Inventory.export_mode).label('export_mode'),
+            _non_empty_max(Inventory.order_type).label('order_type'),
+            _non_empty_max(Inventory.customs_broker).label('customs_broker'),
+            _non_empty_max(Inventory.service_staff).label('service_staff'),
+        ).filter(
+            Inventory.identification_code.in_(codes),
+            Inventory.operated_warehouse_id.isnot(None)
+        ).group_by(
+            Inventory.identification_code,
+            Inventory.operated_warehouse_id
+        ).all()
+
+        for item in inventory_rows:
+            row = row_for(item.identification_code, item.operated_warehouse_id)
+            row.update({
+                'customer_name': item.customer_name,
+                'plate_number': item.plate_number,
+                'inbound_time': item.inbound_time,
+                'last_updated': item.last_updated,
+                'inventory_record_count': int(item.record_count or 0),
+                'pallet_count': int(item.pallet_count or 0),
+                'package_count': int(item.package_count or 0),
+                'weight': float(item.weight or 0),
+                'volume': float(item.volume or 0),
+                'location': _clean(item.location),
+                'documents': _clean(item.documents),
+                'export_mode': _clean(item.export_mode),
+                'order_type': _clean(item.order_type),
+                'customs_broker': _clean(item.customs_broker),
+                'service_staff': _clean(item.service_staff),
+            })
+
+        # 2. 出库：出库到春疆货场/工厂的数量，以及业务字段兜底
+        is_chunjiang = OutboundRecord.destination.in_(CHUNJIANG_DESTINATIONS)
+        outbound_rows = session.query(
+            OutboundRecord.identification_code,
+            OutboundRecord.operated_warehouse_id,
+            func.sum(case((is_chunjiang, 1), else_=0)).label('chunjiang_count'),
+            func.sum(case((is_chunjiang, OutboundRecord.pallet_count), else_=0)).label('chunjiang_pallet'),
+            func.sum(case((is_chunjiang, OutboundRecord.package_count), else_=0)).label('chunjiang_package'),
+            _non_empty_max(OutboundRecord.export_mode).label('export_mode'),
+            _non_empty_max(OutboundRecord.order_type).label('order_type'),
+            _non_empty_max(OutboundRecord.customs_broker).label('customs_broker'),
+            _non_empty_max(OutboundRecord.service_staff).label('service_staff'),
+        ).filter(
+            OutboundRecord.identification_code.in_(codes),
+            OutboundRecord.operated_warehouse_id.isnot(None)
+        ).group_by(
+            OutboundRecord.identification_code,
+            OutboundRecord.operated_warehouse_id
+        ).all()
+
+        outbound_fallback = {}
+        for item in outbound_rows:
+            key = (item.identification_code, item.operated_warehouse_id)
+            outbound_fallback[key] = item
+            if int(item.chunjiang_count or 0) > 0:
+                row = row_for(*key)
+                row.update({
+                    'chunjiang_outbound_count': int(item.chunjiang_count or 0),
+                    'chunjiang_outbound_pallet': int(item.chunjiang_pallet or 0),
+                    'chunjiang_outbound_package': int(item.chunjiang_package or 0),
+                })
+
+        # 3. 在途：按识别编码+起始仓库汇总仍在运输中的货物
+        transit_rows = session.query(
+            TransitCargo.identification_code,
+            TransitCargo.source_warehouse_id,
+            func.max(TransitCargo.customer_name).label('customer_name'),
+            func.max(TransitCargo.plate_number).label('plate_number'),
+            func.sum(TransitCargo.pallet_count).label('pallet_count'),
+            func.sum(TransitCargo.package_count).label('package_count'),
+            func.sum(TransitCargo.weight).label('weight'),
+            func.sum(TransitCargo.volume).label('volume'),
+            func.max(TransitCargo.departure_time).label('departure_time'),
+            _non_empty_max(TransitCargo.export_mode).label('export_mode'),
+            _non_empty_max(TransitCargo.order_type).label('order_type'),
+            _non_empty_max(TransitCargo.customs_broker).label('customs_broker'),
+            _non_empty_max(TransitCargo.service_staff).label('service_staff'),
+        ).filter(
+            TransitCargo.identification_code.in_(codes),
+            TransitCargo.status == 'in_transit'
+        ).group_by(
+            TransitCargo.identification_code,
+            TransitCargo.source_warehouse_id
+        ).all()
+
+        for item in transit_rows:
+            pallets = int(item.pallet_count or 0)
+            packages = int(item.package_count or 0)
+            if pallets <= 0 and packages <= 0:
+                continue
+            row = row_for(item.identification_code, item.source_warehouse_id)
+            row.update({
+                'in_transit_pallet_count': pallets,
+                'in_transit_package_count': packages,
+                'in_transit_weight': float(item.weight or 0),
+                'in_transit_volume': float(item.volume or 0),
+                'transit_departure_time': item.departure_time,
+            })
+            row['customer_name'] = row['customer_name'] or item.customer_name
+            row['plate_number'] = row['plate_number'] or item.plate_number
+            for field in ('export_mode', 'order_type', 'customs_broker', 'service_staff'):
+                row[field] = row[field] or _clean(getattr(item, field))
+
+        # 4. 原始入库记录（识别编码唯一，取最早一条）
+        inbound_records = {}
+        for record in session.query(InboundRecord).filter(
+            InboundRecord.identification_code.in_(codes)
+        ).order_by(InboundRecord.id).all():
+            inbound_records.setdefault(record.identification_code, record)
+
+        # 业务字段优先级：库存表 -> 出库记录 -> 入库记录
+        for (code, warehouse_id), row in rows.items():
+            outbound = outbound_fallback.get((code, warehouse_id))
+            inbound = inbound_records.get(code)
+            for field in ('export_mode', 'order_type', 'customs_broker', 'service_staff'):
+                if not row[field] and outbound is not None:
+                    row[field] = _clean(getattr(outbound, field))
+                if not row[field] and inbound is not None:
+                    row[field] = _clean(getattr(inbound, field))
+
+            if inbound is not None:
+                row.update({
+                    'original_pallet_count': inbound.pallet_count or 0,
+                    'original_package_count': inbound.package_count or 0,
+                    'original_weight': float(inbound.weight or 0),
+                    'original_volume': float(inbound.volume or 0),
+                })
+                row['customer_name'] = row['customer_name'] or inbound.customer_name
+                row['plate_number'] = row['plate_number'] or inbound.plate_number
+                row['inbound_time'] = row['inbound_time'] or inbound.inbound_time
+                row['documents'] = row['documents'] or _clean(inbound.documents)
+
+            row['last_updated'] = row['last_updated'] or row['transit_departure_time'] or now
+
+        return list(rows.values())
+
+    @classmethod
+    def rebuild_all(cls, chunk_size=None):
+        """
+        全量重建汇总表，按识别编码分块替换并提交，重建期间汇总数据保持完整
+
+        Returns:
+            dict: 重建结果
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        summary_table = InventorySummary.__table__
+        start_time = datetime.now()
+        try:
+            code_query = cls._code_query()
+            codes = sorted({row[0] for row in db.session.execute(code_query) if row[0]})
+
+            # 每块的删除和插入在同一事务内完成
+            written = 0
+            for start in range(0, len(codes), chunk_size):
+                written += cls.refresh_codes(codes[start:start + chunk_size])
+                db.session.commit()
+
+            # 清除已不再需要汇总的识别编码残留的汇总行
+            db.session.execute(summary_table.delete().where(
+                summary_table.c.identification_code.notin_(code_query.subquery().select())
+            ))
+            db.session.commit()
+            cls.backfill.mark_populated()
+
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"库存汇总全量重建完成: {len(codes)} 个识别编码, {written} 行, 耗时 {duration:.2f}秒")
+            return {'success': True, 'code_count': len(codes), 'row_count': written, 'duration': duration}
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"库存汇总全量重建失败: {e}")
+            return {'success': False, 'message': str(e)}
+
+    @staticmethod
+    def _code_query():
+        """需要汇总的识别编码：有库存、在途或已出库到春疆"""
+        # 排除空识别编码，NOT IN 子查询中出现 NULL 时不会删除任何行
+        return union(
+            select(Inventory.identification_code).where(Inventory.identification_code.isnot(None)),
+            select(TransitCargo.identification_code).where(
+                TransitCargo.status == 'in_transit', TransitCargo.identification_code.isnot(None)
+            ),
+            select(OutboundRecord.identification_code).where(
+                OutboundRecord.destination.in_(CHUNJIANG_DESTINATIONS),
+                OutboundRecord.identification_code.isnot(None)
+            )
+        )
+
+    @classmethod
+    def is_populated(cls):
+        """汇总表是否已完成全量回填（只读取回填标记）"""
+        return cls.backfill.is_populated()
+
+    @classmethod
+    def backfill_if_needed(cls):
+        """汇总表尚未回填时（首次部署）在命名锁下执行一次全量回填，供命令行和调度器调用"""
+        return cls.backfill.backfill_if_needed(cls.rebuild_all)
+
+    @classmethod
+    def load_summaries(cls, active_only=False):
+        """
+        读取汇总行（已加载仓库），按识别编码排序
+
+        汇总表尚未回填时不在请求中回填，按业务表即时计算同样的汇总行（不写入）。
+
+        Args:
+            active_only: 只返回有库存或仍在途的汇总行
+        """
+        if cls.is_populated():
+            query = InventorySummary.query.options(joinedload(InventorySummary.warehouse))
+            if active_only:
+                query = query.filter(db.or_(
+                    InventorySummary.pallet_count > 0,
+                    InventorySummary.package_count > 0,
+                    InventorySummary.in_transit_pallet_count > 0,
+                    InventorySummary.in_transit_package_count > 0
+                ))
+            return query.order_by(InventorySummary.identification_code).all()
+
+        logger.warning("库存汇总表尚未回填，按业务表即时计算汇总数据")
+        warehouses = {warehouse.id: warehouse for warehouse in Warehouse.query.all()}
+        warehouse_types = {warehouse_id: warehouse.warehouse_type for warehouse_id, warehouse in warehouses.items()}
+        codes = sorted({row[0] for row in db.session.execute(cls._code_query()) if row[0]})
+        summaries = []
+        for start in range(0, len(codes), cls.CHUNK_SIZE):
+            for row in cls._build_rows(db.session, codes[start:start + cls.CHUNK_SIZE], warehouse_types):
+                if active_only and not (row['pallet_count'] > 0 or row['package_count'] > 0 or
+                                        row['in_transit_pallet_count'] > 0 or row['in_transit_package_count'] > 0):
+                    continue
+                summary = InventorySummary(**row)
+                set_committed_value(summary, 'warehouse', warehouses.get(row['warehouse_id']))
+                summaries.append(summary)
+        summaries.sort(key=lambda summary: summary.identification_code)
+        return summaries
+
+
+def _touched_codes(obj):
+    """获取对象当前和修改前的识别编码"""
+    codes = set()
+    current_code = getattr(obj, 'identification_code', None)
+    if current_code:
+        codes.add(current_code)
+    history = attributes.get_history(obj, 'identification_code')
+    codes.update(code for code in history.deleted if code)
+    return codes
+
+
+def _collect_touched_codes(session):
+    """flush 后收集本次写入涉及的识别编码"""
+    codes = set()
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, TRACKED_MODELS):
+            codes.update(_touched_codes(obj))
+    return codes
+
+
+def mark_codes_dirty(identification_codes, session=None):
+    """
+    标记需要刷新汇总的识别编码
+
+    批量 insert()/update() 语句不经过 ORM flush，调用方需显式标记，
+    汇总行会在本事务提交前一并刷新。
+    """
+    mark_pending(_PENDING_CODES_KEY, identification_codes, session or db.session)
+
+
+def _refresh_codes(session, codes):
+    """重算触及识别编码的汇总行"""
+    InventorySummaryService.refresh_codes(codes, session=session)
+
+
+def register_inventory_summary_events():
+    """注册库存汇总的会话事件监听器"""
+    register_pending_refresh(_PENDING_CODES_KEY, _collect_touched_codes, _refresh_codes, name='库存汇总')
+    logger.info("库存汇总事件监听器注册完成")
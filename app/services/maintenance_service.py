@@ -310,93 +310,85 @@ class MaintenanceService:
         return recommendations
 
     def check_inventory_consistency(self):
-        """检查库存一致性"""
+        """
+        检查库存一致性
+
+        先执行增量对账（有待处理的全量扫描时一并完成），只对对账发现不平衡的识别编码
+        重新核对并修复库存，不再逐条库存记录重算全部出入库历史。
+        """
         try:
-            from app.models import Inventory, InboundRecord, OutboundRecord, Warehouse
-            from app import db
+            from app.models import Inventory, InboundRecord, Warehouse
+            from app.services.reconciliation_service import InventoryReconciler, BALANCE_MISMATCH
 
             self.logger.info("开始检查库存一致性...")
 
-            # 获取所有仓库
-            warehouses = Warehouse.query.all()
-            total_checked = 0
+            result = InventoryReconciler.run_incremental()
+            if result.get('sweep_requested'):
+                result = InventoryReconciler.run_sweep(throttle_seconds=0)
+            if not result.get('success'):
+                return {'success': False, 'message': f"库存对账失败: {result.get('message')}"}
+            total_checked = result.get('checked_codes', 0)
+
+            candidate_codes = {finding.identification_code
+                               for finding in InventoryReconciler.get_open_findings([BALANCE_MISMATCH])}
+            # 没有入库记录的识别编码无法确定理论库存，不自动修复
+            inbound_codes = {row[0] for row in db.session.query(InboundRecord.identification_code).filter(
+                InboundRecord.identification_code.in_(candidate_codes)
+            ).distinct()} if candidate_codes else set()
+
+            warehouse_names = dict(db.session.query(Warehouse.id, Warehouse.warehouse_name).all())
+            findings = [item for item in InventoryReconciler.check_codes(inbound_codes)
+                        if item['finding_type'] == BALANCE_MISMATCH]
+            inventories = {}
+            if findings:
+                for inv in Inventory.query.filter(
+                    Inventory.identification_code.in_({item['identification_code'] for item in findings})
+                ).all():
+                    inventories[(inv.identification_code, inv.operated_warehouse_id)] = inv
+
             total_fixed = 0
             problems_found = []
-
-            for warehouse in warehouses:
-                warehouse_ids = [warehouse.id]
-
-                # 获取该仓库的库存记录
-                inventory_records = Inventory.query.filter_by(
-                    operated_warehouse_id=warehouse.id
-                ).all()
-
-                for inv in inventory_records:
-                    if not inv.identification_code:
-                        continue
-
-                    total_checked += 1
-
-                    # 查找对应的入库记录
-                    inbound_record = InboundRecord.query.filter_by(
-                        identification_code=inv.identification_code
-                    ).first()
-
-                    if not inbound_record:
-                        continue
-
-                    # 查找对应的出库记录
-                    outbound_records = OutboundRecord.query.filter_by(
-                        identification_code=inv.identification_code
-                    ).filter(
-                        OutboundRecord.operated_warehouse_id.in_(warehouse_ids)
-                    ).all()
-
-                    # 计算理论库存
-                    original_pallet = inbound_record.pallet_count or 0
-                    original_package = inbound_record.package_count or 0
-
-                    total_out_pallet = sum(rec.pallet_count or 0 for rec in outbound_records)
-                    total_out_package = sum(rec.package_count or 0 for rec in outbound_records)
-
-                    theoretical_pallet = max(0, original_pallet - total_out_pallet)
-                    theoretical_package = max(0, original_package - total_out_package)
-
-                    current_pallet = inv.pallet_count or 0
-                    current_package = inv.package_count or 0
-
-                    # 检查是否需要修复
-                    if (current_pallet != theoretical_pallet or
-                        current_package != theoretical_package):
-
-                        problems_found.append({
-                            'warehouse': warehouse.warehouse_name,
-                            'identification_code': inv.identification_code,
-                            'customer_name': inv.customer_name,
-                            'current_pallet': current_pallet,
-                            'current_package': current_package,
-                            'theoretical_pallet': theoretical_pallet,
-                            'theoretical_package': theoretical_package
-                        })
-
-                        # 自动修复
-                        inv.pallet_count = theoretical_pallet
-                        inv.package_count = theoretical_package
-                        inv.last_updated = datetime.now()
-                        total_fixed += 1
-
-                        self.logger.info(f"修复库存不一致: {warehouse.warehouse_name} - {inv.identification_code}")
+            for item in findings:
+                inv = inventories.get((item['identification_code'], item['warehouse_id']))
+                if inv is None:
+                    continue
+
+                theoretical_pallet = max(0, item['theoretical_pallets'])
+                theoretical_package = max(0, item['theoretical_packages'])
+                current_pallet = inv.pallet_count or 0
+                current_package = inv.package_count or 0
+                if current_pallet == theoretical_pallet and current_package == theoretical_package:
+                    continue
+
+                problems_found.append({
+                    'warehouse': warehouse_names.get(inv.operated_warehouse_id),
+                    'identification_code': inv.identification_code,
+                    'customer_name': inv.customer_name,
+                    'current_pallet': current_pallet,
+                    'current_package': current_package,
+                    'theoretical_pallet': theoretical_pallet,
+                    'theoretical_package': theoretical_package
+                })
+
+                # 自动修复
+                inv.pallet_count = theoretical_pallet
+                inv.package_count = theoretical_package
+                inv.last_updated = datetime.now()
+                total_fixed += 1
+
+                self.logger.info(f"修复库存不一致: {warehouse_names.get(inv.operated_warehouse_id)} - {inv.identification_code}")
 
             # 提交修复
             if total_fixed > 0:
                 db.session.commit()
+                InventoryReconciler.reconcile_codes({problem['identification_code'] for problem in problems_found})
                 self.logger.info(f"库存一致性检查完成，修复了 {total_fixed} 条记录")
             else:
                 self.logger.info("库存一致性检查完成，未发现问题")
 
             return {
                 'success': True,
-                'message': f'检查了 {total_checked} 条记录，修复了 {total_fixed} 条不一致记录',
+                'message': f'检查了 {total_checked} 个识别编码，修复了 {total_fixed} 条不一致记录',
                 'total_checked': total_checked,
                 'total_fixed': total_fixed,
                 'problems_found': len(problems_found),
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""
+库存对账服务模块
+以增量方式持续核对库存与出入库流水，发现的问题写入 consistency_findings：
+- 增量对账：只核对上次水位线之后有写入的识别编码（入库、出库、接收记录的 updated_at，库存的 last_updated，
+  以及变更日志中记录的删除和识别编码修改），水位线向前重叠一段时间，覆盖提交晚于时间戳的事务
+- 全量扫描：按识别编码顺序分块核对全部数据，每块独立提交并记录断点，块之间休眠，不持有长事务；
+  批量 delete/update 无法确定识别编码时，由增量对账安排一次全量扫描
+- 同一问题再次发现时累加次数，恢复一致后标记为已解决
+核对口径与 InventoryValidator.reconcile 一致，另外检查负库存。
+"""
+import logging
+import time
+from datetime import datetime, timedelta
+from itertools import chain
+from flask import current_app, has_app_context
+from sqlalchemy import event, insert, select, union, or_
+from sqlalchemy.orm import Session, attributes
+from app import db
+from app.models import (Inventory, InboundRecord, OutboundRecord, ReceiveRecord,
+                        ConsistencyChangeLog, ConsistencyFinding, ReconciliationState)
+from app.utils.session_events import on_outermost_rollback
+
+logger = logging.getLogger(__name__)
+
+# 参与对账的流水表及其更新时间列
+TRACKED_TIMESTAMPS = (
+    (InboundRecord, 'updated_at'),
+    (OutboundRecord, 'updated_at'),
+    (ReceiveRecord, 'updated_at'),
+    (Inventory, 'last_updated'),
+)
+TRACKED_MODELS = tuple(model for model, _ in TRACKED_TIMESTAMPS)
+
+# 对账产生的问题类型
+BALANCE_MISMATCH = 'inventory_balance_mismatch'
+NEGATIVE_INVENTORY = 'negative_inventory'
+
+# session.info 中保存待写入变更日志的键，值为 {识别编码: 来源表}，识别编码为 None 表示需要全量扫描
+_PENDING_CHANGES_KEY = 'reconciliation_pending_changes'
+
+
+class InventoryReconciler:
+    """库存增量对账器"""
+
+    STATE_NAME = 'inventory'
+    LOCK_NAME = 'inventory_reconciliation'
+
+    # 每块核对的识别编码数
+    CHUNK_SIZE = 500
+    # 水位线向前重叠的秒数（事务提交晚于写入时间戳的最大间隔）
+    WATERMARK_OVERLAP_SECONDS = 300
+    # 全量扫描每块之间休眠的秒数
+    SWEEP_THROTTLE_SECONDS = 0.2
+    # 变更日志保留天数
+    CHANGE_LOG_RETENTION_DAYS = 7
+
+    @staticmethod
+    def _config(key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    # ---------------- 对账入口 ----------------
+
+    @classmethod
+    def run_incremental(cls):
+        """
+        增量对账：核对水位线之后有写入的识别编码
+
+        首次运行没有水位线时只记录水位线并安排全量扫描。
+
+        Returns:
+            dict: {success, message, checked_codes, new_findings, resolved_findings, sweep_requested}
+        """
+        handle = cls._acquire_run_lock()
+        if handle is None:
+            return {'success': True, 'skipped': True, 'message': '对账任务正在其他进程中运行，跳过本次'}
+
+        start_time = datetime.now()
+        try:
+            state = cls._get_state()
+            if state.watermark is None:
+                state.watermark = start_time
+                state.sweep_requested = True
+                state.last_run_at = start_time
+                db.session.commit()
+                logger.info("首次增量对账，已记录水位线并安排全量扫描")
+                return {'success': True, 'message': '首次运行，已安排全量扫描', 'checked_codes': 0,
+                        'new_findings': 0, 'resolved_findings': 0, 'sweep_requested': True}
+
+            overlap = cls._config('RECONCILIATION_WATERMARK_OVERLAP_SECONDS', cls.WATERMARK_OVERLAP_SECONDS)
+            since = state.watermark - timedelta(seconds=overlap)
+            codes, needs_sweep = cls.touched_codes(since)
+            db.session.commit()
+
+            totals = cls._check_in_chunks(sorted(codes), 'incremental', throttle_seconds=0)
+
+            state = cls._get_state()
+            state.watermark = start_time
+            state.last_run_at = start_time
+            if needs_sweep:
+                state.sweep_requested = True
+            cls._purge_change_log(min(since, start_time - timedelta(days=cls.CHANGE_LOG_RETENTION_DAYS)))
+            db.session.commit()
+
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"增量对账完成: {len(codes)} 个识别编码, 新发现{totals['new_findings']}个问题, "
+                        f"解决{totals['resolved_findings']}个, 耗时 {duration:.2f}秒")
+            return {
+                'success': True,
+                'message': f"核对了 {len(codes)} 个识别编码",
+                'checked_codes': len(codes),
+                'new_findings': totals['new_findings'],
+                'resolved_findings': totals['resolved_findings'],
+                'sweep_requested': bool(needs_sweep or state.sweep_requested),
+                'duration': duration
+            }
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"增量对账失败: {e}")
+            return {'success': False, 'message': str(e)}
+        finally:
+            cls._release_run_lock(handle)
+
+    @classmethod
+    def run_sweep(cls, chunk_size=None, throttle_seconds=None, max_chunks=None, restart=False):
+        """
+        全量扫描：按识别编码顺序分块核对，每块提交一次并记录断点
+
+        Args:
+            chunk_size: 每块识别编码数
+            throttle_seconds: 块之间休眠的秒数
+            max_chunks: 本次最多处理的块数，达到后保留断点，下次从断点继续
+            restart: 忽略断点，从头开始新一轮扫描
+
+        Returns:
+            dict: {success, message, checked_codes, new_findings, resolved_findings, completed, cursor}
+        """
+        handle = cls._acquire_run_lock()
+        if handle is None:
+            return {'success': True, 'skipped': True, 'message': '对账任务正在其他进程中运行，跳过本次'}
+
+        chunk_size = chunk_size or cls._config('RECONCILIATION_CHUNK_SIZE', cls.CHUNK_SIZE)
+        if throttle_seconds is None:
+            throttle_seconds = cls._config('RECONCILIATION_SWEEP_THROTTLE_SECONDS', cls.SWEEP_THROTTLE_SECONDS)
+        start_time = datetime.now()
+        totals = {'checked_codes': 0, 'new_findings': 0, 'resolved_findings': 0}
+        try:
+            state = cls._get_state()
+            if restart or state.sweep_cursor is None:
+                state.sweep_cursor = None
+                state.sweep_started_at = start_time
+            cursor = state.sweep_cursor
+            db.session.commit()
+
+            chunks = 0
+            completed = False
+            while True:
+                codes = cls._next_sweep_codes(cursor, chunk_size)
+                if not codes:
+                    completed = True
+                    break
+                if chunks:
+                    time.sleep(throttle_seconds)
+                counts = cls._check_chunk(codes, 'sweep')
+                cursor = codes[-1]
+                state = cls._get_state()
+                state.sweep_cursor = cursor
+                db.session.commit()
+
+                chunks += 1
+                totals['checked_codes'] += len(codes)
+                totals['new_findings'] += counts['new_findings']
+                totals['resolved_findings'] += counts['resolved_findings']
+                if max_chunks and chunks >= max_chunks:
+                    break
+
+            state = cls._get_state()
+            state.last_run_at = datetime.now()
+            if completed:
+                state.sweep_cursor = None
+                state.sweep_requested = False
+                state.sweep_completed_at = state.last_run_at
+                cursor = None
+            db.session.commit()
+
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"全量对账{'完成' if completed else '暂停'}: {totals['checked_codes']} 个识别编码, "
+                        f"新发现{totals['new_findings']}个问题, 解决{totals['resolved_findings']}个, 耗时 {duration:.2f}秒")
+            return dict(totals, success=True, completed=completed, cursor=cursor, duration=duration,
+                        message=f"核对了 {totals['checked_codes']} 个识别编码" + ('' if completed else '，下次从断点继续'))
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"全量对账失败: {e}")
+            return dict(totals, success=False, message=str(e))
+        finally:
+            cls._release_run_lock(handle)
+
+    # ---------------- 核对 ----------------
+
+    @classmethod
+    def touched_codes(cls, since):
+        """
+        水位线之后有写入的识别编码
+
+        Returns:
+            (set, bool): 识别编码集合，是否存在需要全量扫描的批量写入
+        """
+        sources = []
+        for model, column_name in TRACKED_TIMESTAMPS:
+            column = getattr(model, column_name)
+            sources.append(
+                select(model.identification_code.label('identification_code'))
+                .where(column > since, model.identification_code.isnot(None))
+            )
+        sources.append(
+            select(ConsistencyChangeLog.identification_code.label('identification_code'))
+            .where(ConsistencyChangeLog.changed_at > since)
+        )
+        codes = set()
+        needs_sweep = False
+        for (code,) in db.session.execute(union(*sources)):
+            if code is None:
+                needs_sweep = True
+            elif code:
+                codes.add(code)
+        return codes, needs_sweep
+
+    @staticmethod
+    def check_codes(identification_codes):
+        """
+        核对一批识别编码，返回当前存在的问题（不写入问题表）
+
+        Returns:
+            list: 问题字典列表，包含 identification_code、warehouse_id、finding_type、数量和描述
+        """
+        from app.inventory_validator import InventoryValidator
+
+        codes = sorted({code for code in identification_codes if code})
+        if not codes:
+            return []
+
+        findings = []
+        for code, items in InventoryValidator.reconcile(codes).items():
+            for item in items:
+                findings.append({
+                    'identification_code': code,
+                    'warehouse_id': item['warehouse_id'],
+                    'finding_type': BALANCE_MISMATCH,
+                    'severity': 'high',
+                    'theoretical_pallets': item['theoretical_pallets'],
+                    'actual_pallets': item['actual_pallets'],
+                    'theoretical_packages': item['theoretical_packages'],
+                    'actual_packages': item['actual_packages'],
+                    'details': (f"库存不平衡: 理论值(板:{item['theoretical_pallets']},件:{item['theoretical_packages']}) "
+                                f"vs 实际值(板:{item['actual_pallets']},件:{item['actual_packages']})")
+                })
+
+        for start in range(0, len(codes), InventoryValidator.BATCH_SIZE):
+            chunk = codes[start:start + InventoryValidator.BATCH_SIZE]
+            rows = db.session.execute(
+                select(Inventory.identification_code, Inventory.operated_warehouse_id,
+                       Inventory.pallet_count, Inventory.package_count)
+                .where(Inventory.identification_code.in_(chunk),
+                       or_(Inventory.pallet_count < 0, Inventory.package_count < 0))
+            ).all()
+            for code, warehouse_id, pallets, packages in rows:
+                findings.append({
+                    'identification_code': code,
+                    'warehouse_id': warehouse_id,
+                    'finding_type': NEGATIVE_INVENTORY,
+                    'severity': 'high',
+                    'theoretical_pallets': None,
+                    'actual_pallets': pallets,
+                    'theoretical_packages': None,
+                    'actual_packages': packages,
+                    'details': f'负库存: 板数={pallets}, 件数={packages}'
+                })
+        return findings
+
+    @classmethod
+    def reconcile_codes(cls, identification_codes, mode='incremental'):
+        """立即核对指定识别编码并更新问题表（如修复库存之后），每块提交一次"""
+        codes = sorted({code for code in identification_codes if code})
+        return cls._check_in_chunks(codes, mode, throttle_seconds=0)
+
+    @classmethod
+    def _check_in_chunks(cls, codes, mode, throttle_seconds):
+        """分块核对并提交，返回合计的新发现和解决数"""
+        chunk_size = cls._config('RECONCILIATION_CHUNK_SIZE', cls.CHUNK_SIZE)
+        totals = {'new_findings': 0, 'resolved_findings': 0}
+        for start in range(0, len(codes), chunk_size):
+            if start and throttle_seconds:
+                time.sleep(throttle_seconds)
+            counts = cls._check_chunk(codes[start:start + chunk_size], mode)
+            db.session.commit()
+            totals['new_findings'] += counts['new_findings']
+            totals['resolved_findings'] += counts['resolved_findings']
+        return totals
+
+    @classmethod
+    def _check_chunk(cls, codes, mode):
+        """核对一块识别编码并写入问题表（由调用方提交）"""
+        return cls._record_findings(codes, cls.check_codes(codes), mode)
+
+    @staticmethod
+    def _record_findings(codes, findings, mode):
+        """
+        把一块识别编码的核对结果合并到问题表：
+        已有的未解决问题更新数量和次数，新问题插入，这些识别编码中不再出现的问题标记为已解决
+        """
+        now = datetime.now()
+        open_findings = {}
+        for finding in ConsistencyFinding.query.filter(
+            ConsistencyFinding.identification_code.in_(codes),
+            ConsistencyFinding.status == 'open'
+        ).all():
+            open_findings[(finding.identification_code, finding.warehouse_id, finding.finding_type)] = finding
+
+        new_count = 0
+        for item in findings:
+            key = (item['identification_code'], item['warehouse_id'], item['finding_type'])
+            finding = open_findings.pop(key, None)
+            if finding is None:
+                finding = ConsistencyFinding(
+                    identification_code=item['identification_code'],
+                    warehouse_id=item['warehouse_id'],
+                    finding_type=item['finding_type'],
+                    first_detected_at=now,
+                    detection_count=0,
+                    status='open'
+                )
+                db.session.add(finding)
+                new_count += 1
+            finding.severity = item['severity']
+            finding.theoretical_pallets = item['theoretical_pallets']
+            finding.actual_pallets = item['actual_pallets']
+            finding.theoretical_packages = item['theoretical_packages']
+            finding.actual_packages = item['actual_packages']
+            finding.details = item['details']
+            finding.detection_count = (finding.detection_count or 0) + 1
+            finding.detected_by = mode
+            finding.last_detected_at = now
+
+        for finding in open_findings.values():
+            finding.status = 'resolved'
+            finding.resolved_at = now
+            finding.detected_by = mode
+
+        if new_count:
+            logger.warning(f"对账发现 {new_count} 个新的库存不一致问题")
+        return {'new_findings': new_count, 'resolved_findings': len(open_findings)}
+
+    @staticmethod
+    def _next_sweep_codes(cursor, limit):
+        """断点之后的下一块识别编码（库存、入库、接收记录及未解决问题中的识别编码）"""
+        sources = []
+        for model in (Inventory, InboundRecord, ReceiveRecord):
+            query = select(model.identification_code.label('identification_code')).where(
+                model.identification_code.isnot(None))
+            if cursor is not None:
+                query = query.where(model.identification_code > cursor)
+            sources.append(query)
+        query = select(ConsistencyFinding.identification_code.label('identification_code')).where(
+            ConsistencyFinding.status == 'open')
+        if cursor is not None:
+            query = query.where(ConsistencyFinding.identification_code > cursor)
+        sources.append(query)
+
+        codes = union(*sources).subquery()
+        return [row[0] for row in db.session.execute(
+            select(codes.c.identification_code).order_by(codes.c.identification_code).limit(limit)
+        ) if row[0]]
+
+    # ---------------- 状态 ----------------
+
+    @classmethod
+    def _get_state(cls):
+        state = db.session.get(ReconciliationState, cls.STATE_NAME)
+        if state is None:
+            state = ReconciliationState(name=cls.STATE_NAME, sweep_requested=False)
+            db.session.add(state)
+        return state
+
+    @staticmethod
+    def _purge_change_log(before):
+        """删除已经核对过的旧变更日志"""
+        db.session.execute(
+            ConsistencyChangeLog.__table__.delete().where(ConsistencyChangeLog.changed_at < before)
+        )
+
+    @classmethod
+    def _acquire_run_lock(cls):
+        """同一时间只允许一个进程对账，锁被占用时返回 None"""
+        from app.utils.lock_service import get_lock_service
+        return get_lock_service('named').acquire(cls.LOCK_NAME, timeout=0)
+
+    @staticmethod
+    def _release_run_lock(handle):
+        from app.utils.lock_service import get_lock_service
+        get_lock_service('named').release(handle)
+
+    # ---------------- 查询 ----------------
+
+    @staticmethod
+    def get_open_findings(finding_types=None, identification_codes=None, limit=None):
+        """未解决的问题，按最近发现时间倒序"""
+        query = ConsistencyFinding.query.filter(ConsistencyFinding.status == 'open')
+        if finding_types:
+            query = query.filter(ConsistencyFinding.finding_type.in_(finding_types))
+        if identification_codes is not None:
+            query = query.filter(ConsistencyFinding.identification_code.in_(list(identification_codes)))
+        query = query.order_by(ConsistencyFinding.last_detected_at.desc())
+        if limit:
+            query = query.limit(limit)
+        return query.all()
+
+    @classmethod
+    def get_status(cls):
+        """对账进度和未解决问题数"""
+        state = db.session.get(ReconciliationState, cls.STATE_NAME)
+        open_count = ConsistencyFinding.query.filter(ConsistencyFinding.status == 'open').count()
+
+        def fmt(value):
+            return value.strftime('%Y-%m-%d %H:%M:%S') if value else None
+
+        return {
+            'watermark': fmt(state.watermark) if state else None,
+            'last_run_at': fmt(state.last_run_at) if state else None,
+            'sweep_requested': bool(state.sweep_requested) if state else True,
+            'sweep_cursor': state.sweep_cursor if state else None,
+            'sweep_started_at': fmt(state.sweep_started_at) if state else None,
+            'sweep_completed_at': fmt(state.sweep_completed_at) if state else None,
+            'open_findings': open_count
+        }
+
+
+# ---------------- 变更日志 ----------------
+
+def _add_pending(session, code, source):
+    session.info.setdefault(_PENDING_CHANGES_KEY, {})[code] = source
+
+
+def _collect_untimestamped_changes(session, flush_context):
+    """flush 后收集不会留下更新时间的写入：删除的记录和被修改的原识别编码"""
+    for obj in chain(session.dirty, session.deleted):
+        if not isinstance(obj, TRACKED_MODELS):
+            continue
+        source = obj.__table__.name
+        if obj in session.deleted:
+            if obj.identification_code:
+                _add_pending(session, obj.identification_code, source)
+        history = attributes.get_history(obj, 'identification_code')
+        for code in history.deleted:
+            if code:
+                _add_pending(session, code, source)
+
+
+def _collect_bulk_changes(context):
+    """批量 delete/update 无法确定识别编码，记录一条空识别编码安排全量扫描"""
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None and issubclass(mapper.class_, TRACKED_MODELS):
+        _add_pending(context.session, None, mapper.class_.__table__.name)
+
+
+def _write_change_log_before_commit(session):
+    """提交前把收集的变更写入变更日志，与业务写入处于同一事务"""
+    session.flush()
+    pending = session.info.pop(_PENDING_CHANGES_KEY, None)
+    if not pending:
+        return
+    now = datetime.now()
+    try:
+        session.execute(insert(ConsistencyChangeLog.__table__), [
+            {'identification_code': code, 'source': source, 'changed_at': now}
+            for code, source in pending.items()
+        ])
+    except Exception as e:
+        # 变更日志写入失败不阻断业务写入，由全量扫描兜底
+        logger.error(f"对账变更日志写入失败 ({len(pending)} 条): {e}")
+
+
+def _discard_pending_changes(session):
+    """事务回滚时丢弃待写入的变更"""
+    session.info.pop(_PENDING_CHANGES_KEY, None)
+
+
+def register_reconciliation_events():
+    """注册对账变更日志的会话事件监听器"""
+    if event.contains(Session, 'after_flush', _collect_untimestamped_changes):
+        return
+    event.listen(Session, 'after_flush', _collect_untimestamped_changes)
+    event.listen(Session, 'after_bulk_update', _collect_bulk_changes)
+    event.listen(Session, 'after_bulk_delete', _collect_bulk_changes)
+    event.listen(Session, 'before_commit', _write_change_log_before_commit)
+    on_outermost_rollback(_discard_pending_changes)
+    logger.info("对账变更日志事件监听器注册完成")
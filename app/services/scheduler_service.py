@@ -4,9 +4,10 @@
 管理定时任务的执行
 """
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
+from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from flask import current_app
 from .maintenance_service import maintenance_service
@@ -112,6 +113,95 @@ class SchedulerService:
                 replace_existing=True
             )
 
+            # 每日凌晨1点半全量重建库存汇总表，纠正增量刷新遗漏的偏差
+            self.scheduler.add_job(
+                func=self._run_inventory_summary_rebuild,
+                trigger=CronTrigger(hour=1, minute=30),
+                id='inventory_summary_rebuild',
+                name='每日库存汇总重建',
+                replace_existing=True
+            )
+
+            # 启动1分钟后检查库存汇总表是否已回填，未回填时在后台执行首次回填（库存页面在此之前即时计算汇总）
+            self.scheduler.add_job(
+                func=self._run_inventory_summary_backfill,
+                trigger=DateTrigger(run_date=datetime.now() + timedelta(minutes=1)),
+                id='inventory_summary_backfill',
+                name='库存汇总首次回填',
+                replace_existing=True
+            )
+
+            # 每日凌晨2点半全量重建搜索索引，纠正批量语句未标记的变更
+            self.scheduler.add_job(
+                func=self._run_search_index_rebuild,
+                trigger=CronTrigger(hour=2, minute=30),
+                id='search_index_rebuild',
+                name='每日搜索索引重建',
+                replace_existing=True
+            )
+
+            # 启动1分钟后检查搜索索引是否已回填，未回填时在后台执行首次回填（搜索在此之前使用 LIKE 查询）
+            self.scheduler.add_job(
+                func=self._run_search_index_backfill,
+                trigger=DateTrigger(run_date=datetime.now() + timedelta(minutes=1)),
+                id='search_index_backfill',
+                name='搜索索引首次回填',
+                replace_existing=True
+            )
+
+            # 启动1分钟后检查每日作业汇总表是否已回填，未回填时在后台执行首次回填（报表在此之前按进出库记录即时统计）
+            self.scheduler.add_job(
+                func=self._run_daily_rollup_backfill,
+                trigger=DateTrigger(run_date=datetime.now() + timedelta(minutes=1)),
+                id='daily_rollup_backfill',
+                name='每日作业汇总首次回填',
+                replace_existing=True
+            )
+
+            # 每15分钟增量刷新最近几天的每日作业汇总（尚未回填时先执行回填）
+            self.scheduler.add_job(
+                func=self._run_daily_rollup_refresh,
+                trigger=IntervalTrigger(minutes=15),
+                id='daily_rollup_refresh',
+                name='每日作业汇总增量刷新',
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1
+            )
+
+            # 每小时清理过期的后台导出文件和失效任务
+            self.scheduler.add_job(
+                func=self._run_export_job_cleanup,
+                trigger=IntervalTrigger(hours=1),
+                id='export_job_cleanup',
+                name='每小时导出任务清理',
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1
+            )
+
+            # 每10分钟增量对账，只核对上次对账之后有写入的识别编码
+            self.scheduler.add_job(
+                func=self._run_inventory_reconciliation,
+                trigger=IntervalTrigger(minutes=10),
+                id='inventory_reconciliation',
+                name='库存增量对账',
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1
+            )
+
+            # 每日凌晨3点半分块全量对账，块之间限速，不持有长事务
+            self.scheduler.add_job(
+                func=self._run_inventory_reconciliation_sweep,
+                trigger=CronTrigger(hour=3, minute=30),
+                id='inventory_reconciliation_sweep',
+                name='每日库存全量对账',
+                replace_existing=True,
+                coalesce=True,
+                max_instances=1
+            )
+
             self.logger.info("定时任务已添加 - 优化后的任务频率")
 
         except Exception as e:
@@ -183,6 +273,14 @@ class SchedulerService:
                     except Exception as e:
                         self.logger.warning(f"深度数据清理失败: {e}")
 
+                # 清理过期的序号计数行
+                try:
+                    from app.utils.sequence_allocator import SequenceAllocator
+                    purged = SequenceAllocator.purge_expired(keep_days=30)
+                    self.logger.info(f"清理了 {purged} 条过期序号计数")
+                except Exception as e:
+                    self.logger.warning(f"序号计数清理失败: {e}")
+
                 if result.get('success'):
                     self.logger.info("每日深度维护任务完成")
                 else:
@@ -329,6 +427,188 @@ class SchedulerService:
         except Exception as e:
             self.logger.error(f"综合性能优化异常: {e}")
 
+    def _run_inventory_summary_rebuild(self):
+        """执行库存汇总表全量重建"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过库存汇总重建")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.inventory_summary_service import InventorySummaryService
+                result = InventorySummaryService.rebuild_all()
+
+                if result.get('success'):
+                    self.logger.info(f"库存汇总重建完成: {result.get('row_count')} 行")
+                else:
+                    self.logger.error(f"库存汇总重建失败: {result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"库存汇总重建异常: {e}")
+
+    def _run_inventory_summary_backfill(self):
+        """库存汇总表尚未回填时执行首次回填"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过库存汇总回填")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.inventory_summary_service import InventorySummaryService
+                result = InventorySummaryService.backfill_if_needed()
+
+                if not result.get('success'):
+                    self.logger.error(f"库存汇总回填失败: {result.get('message')}")
+                elif not result.get('skipped'):
+                    self.logger.info(f"库存汇总回填完成: {result.get('row_count')} 行")
+
+        except Exception as e:
+            self.logger.error(f"库存汇总回填异常: {e}")
+
+    def _run_search_index_rebuild(self):
+        """执行搜索索引全量重建"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过搜索索引重建")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.search_index_service import SearchIndexService
+                result = SearchIndexService.rebuild_all()
+
+                if result.get('success'):
+                    self.logger.info(f"搜索索引重建完成: {result.get('token_count')} 个分词")
+                else:
+                    self.logger.error(f"搜索索引重建失败: {result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"搜索索引重建异常: {e}")
+
+    def _run_search_index_backfill(self):
+        """搜索索引尚未回填时执行首次回填"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过搜索索引回填")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.search_index_service import SearchIndexService
+                result = SearchIndexService.backfill_if_needed()
+
+                if not result.get('success'):
+                    self.logger.error(f"搜索索引回填失败: {result.get('message')}")
+                elif not result.get('skipped'):
+                    self.logger.info(f"搜索索引回填完成: {result.get('token_count')} 个分词")
+
+        except Exception as e:
+            self.logger.error(f"搜索索引回填异常: {e}")
+
+    def _run_daily_rollup_refresh(self):
+        """执行每日作业汇总增量刷新"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过每日作业汇总刷新")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.daily_rollup_service import DailyRollupService
+                result = DailyRollupService.refresh_recent()
+
+                if result.get('success'):
+                    self.logger.info(f"每日作业汇总刷新完成: {result.get('row_count')} 行")
+                else:
+                    self.logger.error(f"每日作业汇总刷新失败: {result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"每日作业汇总刷新异常: {e}")
+
+    def _run_daily_rollup_backfill(self):
+        """每日作业汇总表尚未回填时执行首次回填"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过每日作业汇总回填")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.daily_rollup_service import DailyRollupService
+                result = DailyRollupService.backfill_if_needed()
+
+                if not result.get('success'):
+                    self.logger.error(f"每日作业汇总回填失败: {result.get('message')}")
+                elif not result.get('skipped'):
+                    self.logger.info(f"每日作业汇总回填完成: {result.get('row_count')} 行")
+
+        except Exception as e:
+            self.logger.error(f"每日作业汇总回填异常: {e}")
+
+    def _run_export_job_cleanup(self):
+        """执行后台导出任务清理"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过导出任务清理")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.export_job_service import ExportJobService
+                result = ExportJobService.cleanup_expired()
+
+                if result.get('success'):
+                    self.logger.info(f"导出任务清理完成: 过期文件 {result.get('expired_count')} 个，"
+                                     f"失效任务 {result.get('stale_count')} 个")
+                else:
+                    self.logger.error(f"导出任务清理失败: {result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"导出任务清理异常: {e}")
+
+    def _run_inventory_reconciliation(self):
+        """执行库存增量对账，有待处理的全量扫描时顺带推进若干块"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过库存增量对账")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.reconciliation_service import InventoryReconciler
+                result = InventoryReconciler.run_incremental()
+
+                if not result.get('success'):
+                    self.logger.error(f"库存增量对账失败: {result.get('message')}")
+                    return
+                if result.get('skipped'):
+                    return
+                self.logger.info(f"库存增量对账完成: 核对 {result.get('checked_codes')} 个识别编码，"
+                                 f"新发现 {result.get('new_findings')} 个问题")
+
+                if result.get('sweep_requested'):
+                    max_chunks = self.app.config.get('RECONCILIATION_SWEEP_CHUNKS_PER_RUN', 20)
+                    sweep_result = InventoryReconciler.run_sweep(max_chunks=max_chunks)
+                    if not sweep_result.get('success'):
+                        self.logger.error(f"库存全量对账失败: {sweep_result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"库存增量对账异常: {e}")
+
+    def _run_inventory_reconciliation_sweep(self):
+        """执行库存全量对账（从上次断点继续，完成后开始新一轮）"""
+        if not self.app:
+            self.logger.warning("应用实例未初始化，跳过库存全量对账")
+            return
+
+        try:
+            with self.app.app_context():
+                from app.services.reconciliation_service import InventoryReconciler
+                result = InventoryReconciler.run_sweep()
+
+                if result.get('success'):
+                    self.logger.info(f"库存全量对账完成: 核对 {result.get('checked_codes')} 个识别编码，"
+                                     f"新发现 {result.get('new_findings')} 个问题")
+                else:
+                    self.logger.error(f"库存全量对账失败: {result.get('message')}")
+
+        except Exception as e:
+            self.logger.error(f"库存全量对账异常: {e}")
+
     def get_job_status(self):
         """获取任务状态"""
         if not self.scheduler:
@@ -0,0 +1,336 @@
+#!/usr/bin/env python3
+"""
+搜索索引服务模块
+维护 search_tokens 二元分词倒排索引，替代客户名称、识别编码、车牌上的 LIKE '%关键词%' 全表扫描：
+- 字段值规范化（去空白、转小写）后切分为二元分词，中文客户名称和车牌同样适用
+- 查询时先按分词表取出包含全部分词的记录ID，再用原 LIKE 条件在候选集合上复核，结果与 LIKE 一致
+- 写入路径提交事务前，按本次触及的记录重建分词，与业务写入处于同一事务
+- 关键词不足两个字符或索引尚未回填时回退为 LIKE 查询；回填由命令行或调度器执行，完成后写入回填标记
+"""
+import logging
+import time
+from datetime import datetime
+from itertools import chain
+from sqlalchemy import func, or_, and_, select
+from sqlalchemy.orm import attributes
+from app import db
+from app.models import Inventory, InboundRecord, OutboundRecord, TransitCargo, SearchToken
+from app.utils.session_events import mark_pending, register_pending_refresh
+
+logger = logging.getLogger(__name__)
+
+# 建立索引的记录类型及字段
+SEARCH_SOURCES = {
+    'inventory': (Inventory, ('customer_name', 'identification_code', 'plate_number')),
+    'inbound': (InboundRecord, ('customer_name', 'identification_code', 'plate_number')),
+    'outbound': (OutboundRecord, ('customer_name', 'identification_code', 'plate_number')),
+    'transit': (TransitCargo, ('customer_name', 'identification_code', 'plate_number')),
+}
+
+# 分词长度
+GRAM_SIZE = 2
+
+# 全量回填完成的标记行（不属于任何记录类型，重建和增量维护都不会删除）
+POPULATED_MARKER = {'entity_type': '_meta', 'entity_id': 0, 'field': 'index', 'gram': 'ok'}
+
+# session.info 中保存待重建记录和识别编码的键
+_PENDING_ENTITIES_KEY = 'search_index_pending_entities'
+_PENDING_CODES_KEY = 'search_index_pending_codes'
+
+
+def normalize_text(value):
+    """规范化字段值：去除所有空白并转小写"""
+    if value is None:
+        return ''
+    return ''.join(str(value).split()).lower()
+
+
+def make_grams(value):
+    """将字段值切分为去重后的二元分词"""
+    text = normalize_text(value)
+    if len(text) < GRAM_SIZE:
+        return set()
+    return {text[i:i + GRAM_SIZE] for i in range(len(text) - GRAM_SIZE + 1)}
+
+
+def _entity_type_of(model):
+    for entity_type, (source_model, _) in SEARCH_SOURCES.items():
+        if model is source_model:
+            return entity_type
+    return None
+
+
+class SearchIndexService:
+    """搜索索引服务类"""
+
+    CHUNK_SIZE = 1000
+
+    # 索引是否已回填：已回填后进程内不再检查，未回填时每隔一段时间重新读取标记
+    POPULATED_CHECK_SECONDS = 60
+    _populated = False
+    _populated_checked_at = 0.0
+
+    @classmethod
+    def reindex(cls, entity_type, entity_ids, session=None):
+        """
+        重建指定记录的分词，已删除的记录只清除分词
+
+        Args:
+            entity_type: 记录类型
+            entity_ids: 记录ID集合
+            session: 使用的数据库会话，默认 db.session（在调用方事务内执行，不提交）
+
+        Returns:
+            int: 写入的分词行数
+        """
+        session = session or db.session
+        model, fields = SEARCH_SOURCES[entity_type]
+        ids = sorted({entity_id for entity_id in entity_ids if entity_id is not None})
+        token_table = SearchToken.__table__
+        written = 0
+
+        for start in range(0, len(ids), cls.CHUNK_SIZE):
+            chunk = ids[start:start + cls.CHUNK_SIZE]
+            session.execute(token_table.delete().where(
+                token_table.c.entity_type == entity_type,
+                token_table.c.entity_id.in_(chunk)
+            ))
+            rows = session.query(model.id, *[getattr(model, field) for field in fields]).filter(
+                model.id.in_(chunk)
+            ).all()
+            tokens = cls._build_tokens(entity_type, fields, rows)
+            if tokens:
+                session.execute(token_table.insert(), tokens)
+            written += len(tokens)
+        return written
+
+    @staticmethod
+    def _build_tokens(entity_type, fields, rows):
+        tokens = []
+        for row in rows:
+            entity_id = row[0]
+            for field, value in zip(fields, row[1:]):
+                for gram in make_grams(value):
+                    tokens.append({'entity_type': entity_type, 'entity_id': entity_id,
+                                   'field': field, 'gram': gram})
+        return tokens
+
+    @classmethod
+    def reindex_codes(cls, identification_codes, session=None):
+        """按识别编码重建所有记录类型中对应记录的分词"""
+        session = session or db.session
+        codes = sorted({code for code in identification_codes if code})
+        written = 0
+        for entity_type, (model, _) in SEARCH_SOURCES.items():
+            for start in range(0, len(codes), cls.CHUNK_SIZE):
+                chunk = codes[start:start + cls.CHUNK_SIZE]
+                ids = [row[0] for row in session.query(model.id).filter(
+                    model.identification_code.in_(chunk)
+                ).all()]
+                written += cls.reindex(entity_type, ids, session=session)
+        return written
+
+    @classmethod
+    def rebuild_all(cls, chunk_size=None):
+        """
+        全量重建分词表，按记录ID分块替换并提交，重建期间搜索结果保持完整
+
+        Returns:
+            dict: 重建结果
+        """
+        chunk_size = chunk_size or cls.CHUNK_SIZE
+        token_table = SearchToken.__table__
+        start_time = datetime.now()
+        try:
+            written = 0
+            for entity_type, (model, _) in SEARCH_SOURCES.items():
+                last_id = 0
+                while True:
+                    ids = [row[0] for row in db.session.query(model.id).filter(
+                        model.id > last_id
+                    ).order_by(model.id).limit(chunk_size).all()]
+                    if not ids:
+                        break
+                    written += cls.reindex(entity_type, ids)
+                    db.session.commit()
+                    last_id = ids[-1]
+
+                # 清除已删除记录残留的分词
+                db.session.execute(token_table.delete().where(
+                    token_table.c.entity_type == entity_type,
+                    token_table.c.entity_id.notin_(select(model.id))
+                ))
+                db.session.commit()
+
+            cls._mark_populated()
+            db.session.commit()
+
+            cls._populated = True
+            duration = (datetime.now() - start_time).total_seconds()
+            logger.info(f"搜索索引全量重建完成: {written} 个分词, 耗时 {duration:.2f}秒")
+            return {'success': True, 'token_count': written, 'duration': duration}
+
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"搜索索引全量重建失败: {e}")
+            return {'success': False, 'message': str(e)}
+
+    @staticmethod
+    def _mark_populated():
+        """写入回填完成标记（由调用方提交）"""
+        token_table = SearchToken.__table__
+        db.session.execute(token_table.delete().where(
+            token_table.c.entity_type == POPULATED_MARKER['entity_type']
+        ))
+        db.session.execute(token_table.insert(), [POPULATED_MARKER])
+
+    @classmethod
+    def is_populated(cls):
+        """索引是否已完成全量回填（读取所有进程共享的回填标记，不执行回填）"""
+        if cls._populated:
+            return True
+        now = time.monotonic()
+        if cls._populated_checked_at and now - cls._populated_checked_at < cls.POPULATED_CHECK_SECONDS:
+            return False
+        cls._populated_checked_at = now
+        cls._populated = db.session.query(SearchToken.id).filter(
+            SearchToken.entity_type == POPULATED_MARKER['entity_type']
+        ).first() is not None
+        return cls._populated
+
+    @classmethod
+    def backfill_if_needed(cls):
+        """
+        索引尚未回填时（首次部署）执行一次全量回填，多个进程同时调用时只有一个执行
+
+        Returns:
+            dict: 回填结果，已回填或其他进程正在回填时 skipped 为 True
+        """
+        cls._populated_checked_at = 0.0
+        if cls.is_populated():
+            return {'success': True, 'skipped': True, 'message': '搜索索引已回填'}
+
+        from app.utils.lock_service import get_lock_service
+        locks = get_lock_service('named')
+        handle = locks.acquire('search_index_backfill', timeout=0)
+        if handle is None:
+            return {'success': True, 'skipped': True, 'message': '搜索索引正在其他进程中回填'}
+        try:
+            cls._populated_checked_at = 0.0
+            if cls.is_populated():
+                return {'success': True, 'skipped': True, 'message': '搜索索引已回填'}
+            logger.info("搜索索引尚未回填，开始全量回填")
+            return cls.rebuild_all()
+        finally:
+            locks.release(handle)
+
+    @classmethod
+    def candidate_ids(cls, model, fields, term):
+        """
+        分词表中任一字段包含关键词全部分词的记录ID子查询
+
+        Returns:
+            Select: 记录ID子查询；关键词过短或索引不可用时返回 None
+        """
+        entity_type = _entity_type_of(model)
+        grams = make_grams(term)
+        if not entity_type or not grams:
+            return None
+        if not all(field in SEARCH_SOURCES[entity_type][1] for field in fields):
+            return None
+        try:
+            if not cls.is_populated():
+                return None
+        except Exception as e:
+            logger.warning(f"搜索索引不可用，回退为 LIKE 查询: {e}")
+            return None
+
+        return select(SearchToken.entity_id).where(
+            SearchToken.entity_type == entity_type,
+            SearchToken.field.in_(fields),
+            SearchToken.gram.in_(grams)
+        ).group_by(SearchToken.entity_id, SearchToken.field).having(
+            func.count(func.distinct(SearchToken.gram)) == len(grams)
+        )
+
+    @classmethod
+    def match(cls, model, fields, term, mode='contains'):
+        """
+        生成与 LIKE 等价、可使用分词索引的查询条件
+
+        Args:
+            model: 记录模型
+            fields: 字段名列表，任一字段匹配即可
+            term: 关键词
+            mode: contains（包含）或 prefix（前缀）
+
+        Returns:
+            条件表达式，可直接用于 query.filter()
+        """
+        if isinstance(fields, str):
+            fields = (fields,)
+        pattern = f'{term}%' if mode == 'prefix' else f'%{term}%'
+        like_condition = or_(*[getattr(model, field).like(pattern) for field in fields])
+
+        candidates = cls.candidate_ids(model, fields, term)
+        if candidates is None:
+            return like_condition
+        # 分词只保证包含全部二元分词，仍需 LIKE 复核顺序和前缀
+        return and_(model.id.in_(candidates), like_condition)
+
+
+def _touched_entity(obj, check_fields):
+    """返回需要重建分词的 (记录类型, ID)，更新时只在索引字段有变化时返回"""
+    entity_type = _entity_type_of(type(obj))
+    if entity_type is None or obj.id is None:
+        return None
+    if check_fields:
+        fields = SEARCH_SOURCES[entity_type][1]
+        if not any(attributes.get_history(obj, field).has_changes() for field in fields):
+            return None
+    return entity_type, obj.id
+
+
+def _collect_touched_entities(session):
+    """flush 后收集本次新增、删除及索引字段有变化的记录"""
+    touched_objects = chain(
+        ((obj, False) for obj in chain(session.new, session.deleted)),
+        ((obj, True) for obj in session.dirty)
+    )
+    entities = set()
+    for obj, check_fields in touched_objects:
+        touched = _touched_entity(obj, check_fields)
+        if touched:
+            entities.add(touched)
+    return entities
+
+
+def mark_search_codes_dirty(identification_codes, session=None):
+    """
+    标记需要重建分词的识别编码
+
+    批量 insert()/update() 语句不经过 ORM flush，调用方需显式标记，
+    分词会在本事务提交前一并重建。
+    """
+    mark_pending(_PENDING_CODES_KEY, identification_codes, session or db.session)
+
+
+def _reindex_entities(session, entities):
+    """按记录类型分组重建分词"""
+    by_type = {}
+    for entity_type, entity_id in entities:
+        by_type.setdefault(entity_type, set()).add(entity_id)
+    for entity_type, ids in by_type.items():
+        SearchIndexService.reindex(entity_type, ids, session=session)
+
+
+def _reindex_codes(session, codes):
+    """重建标记的识别编码对应记录的分词"""
+    SearchIndexService.reindex_codes(codes, session=session)
+
+
+def register_search_index_events():
+    """注册搜索索引的会话事件监听器"""
+    register_pending_refresh(_PENDING_ENTITIES_KEY, _collect_touched_entities, _reindex_entities, name='搜索索引')
+    register_pending_refresh(_PENDING_CODES_KEY, None, _reindex_codes, name='搜索索引')
+    logger.info("搜索索引事件监听器注册完成")
@@ -2344,11 +2344,11 @@ class CargoVolumeDashboard {
                 const end = new Date(dayEndDate.value);
                 const diffDays = Math.ceil((end - start) / (1000 * 60 * 60 * 24));
 
-                if (diffDays > 7) {
-                    alert('日期范围不能超过7天');
+                if (diffDays > 30) {
+                    alert('日期范围不能超过31天');
                     dayEndDate.value = dayStartDate.value;
                     const newEnd = new Date(start);
-                    newEnd.setDate(newEnd.getDate() + 6);
+                    newEnd.setDate(newEnd.getDate() + 30);
                     dayEndDate.value = newEnd.toISOString().split('T')[0];
                 }
             };
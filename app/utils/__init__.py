@@ -12,6 +12,12 @@ from .batch_generator import generate_batch_number, parse_batch_number, get_batc
 # 导入识别编码生成器
 from .identification_generator import IdentificationCodeGenerator
 
+# 导入序号分配器
+from .sequence_allocator import SequenceAllocator
+
+# 导入键集分页
+from .keyset_pagination import KeysetPagination, keyset_paginate, encode_cursor, decode_cursor
+
 def render_ajax_aware(template_name, **context):
     """
     智能渲染函数，根据请求类型选择合适的模板
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+派生表回填标记
+汇总表等派生表首次部署时需要全量回填。回填由命令行或调度器在命名锁下执行，不在请求中进行；
+全量重建完成后写入 backfill_state 标记，请求路径只读取标记（按间隔缓存）决定是否走回退查询。
+"""
+
+import logging
+import time
+from datetime import datetime
+
+from app import db
+from app.models import BackfillState
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillMarker:
+    """一张派生表的回填标记"""
+
+    # 未回填时重新读取标记的间隔（秒）
+    CHECK_SECONDS = 60
+
+    def __init__(self, name, label):
+        """
+        Args:
+            name: backfill_state 中的名称，同时用于命名锁
+            label: 日志中使用的名称
+        """
+        self.name = name
+        self.label = label
+        self._populated = False
+        self._checked_at = 0.0
+
+    def is_populated(self):
+        """是否已完成全量回填（读取所有进程共享的标记，不执行回填）"""
+        if self._populated:
+            return True
+        now = time.monotonic()
+        if self._checked_at and now - self._checked_at < self.CHECK_SECONDS:
+            return False
+        self._checked_at = now
+        self._populated = db.session.get(BackfillState, self.name) is not None
+        return self._populated
+
+    def mark_populated(self):
+        """写入回填完成标记并提交"""
+        state = db.session.get(BackfillState, self.name)
+        if state is None:
+            db.session.add(BackfillState(name=self.name, completed_at=datetime.now()))
+        else:
+            state.completed_at = datetime.now()
+        db.session.commit()
+        self._populated = True
+
+    def backfill_if_needed(self, rebuild):
+        """
+        尚未回填时（首次部署）执行一次全量回填，多个进程同时调用时只有一个执行
+
+        Args:
+            rebuild: 全量重建函数，返回 {'success', ...} 结果，成功时负责调用 mark_populated
+
+        Returns:
+            dict: 回填结果，已回填或其他进程正在回填时 skipped 为 True
+        """
+        self._checked_at = 0.0
+        if self.is_populated():
+            return {'success': True, 'skipped': True, 'message': f'{self.label}已回填'}
+
+        from app.utils.lock_service import get_lock_service
+        locks = get_lock_service('named')
+        handle = locks.acquire(f'{self.name}_backfill', timeout=0)
+        if handle is None:
+            return {'success': True, 'skipped': True, 'message': f'{self.label}正在其他进程中回填'}
+        try:
+            self._checked_at = 0.0
+            if self.is_populated():
+                return {'success': True, 'skipped': True, 'message': f'{self.label}已回填'}
+            logger.info(f"{self.label}尚未回填，开始全量回填")
+            return rebuild()
+        finally:
+            locks.release(handle)
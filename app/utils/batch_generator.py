@@ -4,9 +4,12 @@
 批次号生成器
 """
 
+import logging
 from datetime import datetime
 from sqlalchemy import and_
 
+logger = logging.getLogger(__name__)
+
 def generate_batch_number(warehouse_id, destination_prefix=None, db_session=None):
     """
     生成批次号
@@ -19,8 +22,6 @@ def generate_batch_number(warehouse_id, destination_prefix=None, db_session=None
     Returns:
         str: 生成的批次号
     """
-    from app.models import OutboundRecord
-    
     # 仓库前缀映射
     warehouse_prefixes = {
         1: 'PH',  # 平湖仓
@@ -42,6 +43,56 @@ def generate_batch_number(warehouse_id, destination_prefix=None, db_session=None
         warehouse_prefix = warehouse_prefixes.get(warehouse_id, 'UK')
         batch_prefix = warehouse_prefix
     
+    expected_prefix = f'{batch_prefix}{date_prefix}'
+
+    try:
+        # 通过序号计数器表原子分配，多进程并发出库不会拿到相同批次号
+        from app.utils.sequence_allocator import SequenceAllocator
+
+        new_seq = SequenceAllocator.reserve(
+            scope='batch_no',
+            key=expected_prefix,
+            seed=lambda: _existing_max_batch_sequence(expected_prefix, db_session),
+            sequence_date=today.date(),
+            session=db_session
+        )
+        return f'{expected_prefix}{new_seq:02d}'
+
+    except Exception as e:
+        # 计数器分配失败时回退到按现有批次号计算的方法
+        logger.warning(f"批次号计数器分配失败，使用备用方法: {e}")
+        return _generate_batch_number_fallback(warehouse_id, batch_prefix, today, db_session)
+
+
+def _existing_max_batch_sequence(expected_prefix, db_session=None):
+    """查询当天该前缀已使用的最大批次序号（批次号全局唯一，不区分仓库）"""
+    from app.models import OutboundRecord
+
+    query = (db_session.query(OutboundRecord.batch_no) if db_session
+             else OutboundRecord.query.with_entities(OutboundRecord.batch_no))
+    existing_batches = query.filter(
+        OutboundRecord.batch_no.like(f'{expected_prefix}%')
+    ).distinct().all()
+
+    max_seq = 0
+    for (batch_no,) in existing_batches:
+        seq_part = batch_no[len(expected_prefix):]
+        if len(seq_part) > 3:
+            # 跳过带时间戳后缀的兜底批次号
+            continue
+        try:
+            max_seq = max(max_seq, int(seq_part))
+        except (ValueError, TypeError):
+            continue
+    return max_seq
+
+
+def _generate_batch_number_fallback(warehouse_id, batch_prefix, today, db_session=None):
+    """备用批次号生成方法"""
+    from app.models import OutboundRecord
+
+    date_prefix = today.strftime('%y%m%d')
+
     # 查询今天已有的批次号
     today_start = today.replace(hour=0, minute=0, second=0, microsecond=0)
     today_end = today.replace(hour=23, minute=59, second=59, microsecond=999999)
@@ -108,6 +159,7 @@ def generate_batch_number(warehouse_id, destination_prefix=None, db_session=None
     return batch_number
 
 
+
 def parse_batch_number(batch_number):
     """
     解析批次号
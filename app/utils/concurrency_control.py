@@ -3,39 +3,52 @@
 """
 并发控制工具类
 解决库存更新的并发安全问题
+库存锁和数据库命名锁都由跨进程锁服务（lock_service）实现，多个工作进程之间同样互斥。
 """
 
-import time
 import threading
 from functools import wraps
-from sqlalchemy import text
-from sqlalchemy.exc import OperationalError
 from flask import current_app
 from app import db
 from app.models import Inventory
+from app.utils.lock_service import get_lock_service, get_inventory_lock_service
 
 class InventoryLockManager:
-    """库存锁管理器"""
+    """库存锁管理器（按识别编码获取跨进程锁）"""
     
     def __init__(self):
-        self._locks = {}
-        self._lock = threading.Lock()
+        # 本线程获取的锁: 识别编码 -> [LockHandle]，release_lock 按识别编码释放
+        self._handles = threading.local()
+    
+    def _thread_handles(self):
+        handles = getattr(self._handles, 'by_code', None)
+        if handles is None:
+            handles = self._handles.by_code = {}
+        return handles
     
     def acquire_lock(self, identification_code, timeout=30):
         """获取库存锁"""
-        with self._lock:
-            if identification_code not in self._locks:
-                self._locks[identification_code] = threading.Lock()
-        
-        return self._locks[identification_code].acquire(timeout=timeout)
+        handle = get_inventory_lock_service().acquire(identification_code, timeout)
+        if handle is None:
+            return False
+        self._thread_handles().setdefault(identification_code, []).append(handle)
+        return True
+    
+    def acquire_locks(self, identification_codes, timeout=30):
+        """按排序后的顺序获取多个识别编码的库存锁，返回 LockHandle，超时返回 None"""
+        return get_inventory_lock_service().acquire_many(identification_codes, timeout)
     
     def release_lock(self, identification_code):
         """释放库存锁"""
-        if identification_code in self._locks:
-            try:
-                self._locks[identification_code].release()
-            except:
-                pass
+        handles = self._thread_handles().get(identification_code)
+        if handles:
+            get_inventory_lock_service().release(handles.pop())
+            if not handles:
+                del self._thread_handles()[identification_code]
+    
+    def release_locks(self, handle):
+        """释放 acquire_locks 获取的锁"""
+        get_inventory_lock_service().release(handle)
 
 # 全局锁管理器实例
 inventory_lock_manager = InventoryLockManager()
@@ -65,20 +78,21 @@ def with_inventory_lock(identification_code_param='identification_code'):
                 return func(*args, **kwargs)
             
             # 获取锁
-            if not inventory_lock_manager.acquire_lock(identification_code):
+            handle = get_inventory_lock_service().acquire(identification_code)
+            if handle is None:
                 raise Exception(f"获取库存锁超时: {identification_code}")
             
             try:
                 return func(*args, **kwargs)
             finally:
-                inventory_lock_manager.release_lock(identification_code)
+                get_inventory_lock_service().release(handle)
         
         return wrapper
     return decorator
 
 def with_database_lock(lock_name, timeout=30):
     """
-    数据库级别的锁装饰器
+    命名锁装饰器（MySQL 下为 GET_LOCK，在独立连接上持有，不受业务会话提交的影响）
     
     Args:
         lock_name: 锁名称
@@ -87,29 +101,14 @@ def with_database_lock(lock_name, timeout=30):
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            lock_acquired = False
+            service = get_lock_service('named')
+            handle = service.acquire(lock_name, timeout)
+            if handle is None:
+                raise Exception(f"获取数据库锁失败: {lock_name}")
             try:
-                # 获取数据库锁
-                result = db.session.execute(
-                    text("SELECT GET_LOCK(:lock_name, :timeout)"),
-                    {"lock_name": lock_name, "timeout": timeout}
-                ).scalar()
-                
-                if result != 1:
-                    raise Exception(f"获取数据库锁失败: {lock_name}")
-                
-                lock_acquired = True
                 return func(*args, **kwargs)
-                
             finally:
-                if lock_acquired:
-                    try:
-                        db.session.execute(
-                            text("SELECT RELEASE_LOCK(:lock_name)"),
-                            {"lock_name": lock_name}
-                        )
-                    except:
-                        pass
+                service.release(handle)
         
         return wrapper
     return decorator
@@ -150,110 +149,34 @@ def safe_inventory_update(identification_code, operation_type, **update_data):
     Args:
         identification_code: 识别编码
         operation_type: 操作类型 ('add', 'subtract', 'set')
-        **update_data: 更新数据 (pallet_count, package_count, weight, volume)
+        **update_data: 更新数据 (pallet_count, package_count, weight, volume, version 等)
     """
-    max_retries = 3
-    retry_delay = 0.1
-    
-    for attempt in range(max_retries):
-        try:
-            with db.session.begin():
-                # 使用SELECT FOR UPDATE锁定记录
-                inventory = db.session.query(Inventory).filter(
-                    Inventory.identification_code == identification_code
-                ).with_for_update().first()
-                
-                if not inventory:
-                    raise Exception(f"库存记录不存在: {identification_code}")
-                
-                # 执行更新操作
-                if operation_type == 'add':
-                    inventory.pallet_count += update_data.get('pallet_count', 0)
-                    inventory.package_count += update_data.get('package_count', 0)
-                    inventory.weight += update_data.get('weight', 0)
-                    inventory.volume += update_data.get('volume', 0)
-                elif operation_type == 'subtract':
-                    new_pallet = inventory.pallet_count - update_data.get('pallet_count', 0)
-                    new_package = inventory.package_count - update_data.get('package_count', 0)
-                    
-                    # 检查库存是否足够
-                    if new_pallet < 0 or new_package < 0:
-                        raise Exception(f"库存不足: 当前板数{inventory.pallet_count}, 件数{inventory.package_count}")
-                    
-                    inventory.pallet_count = new_pallet
-                    inventory.package_count = new_package
-                    inventory.weight -= update_data.get('weight', 0)
-                    inventory.volume -= update_data.get('volume', 0)
-                elif operation_type == 'set':
-                    inventory.pallet_count = update_data.get('pallet_count', inventory.pallet_count)
-                    inventory.package_count = update_data.get('package_count', inventory.package_count)
-                    inventory.weight = update_data.get('weight', inventory.weight)
-                    inventory.volume = update_data.get('volume', inventory.volume)
-                
-                # 更新其他字段
-                for key, value in update_data.items():
-                    if key not in ['pallet_count', 'package_count', 'weight', 'volume']:
-                        setattr(inventory, key, value)
-                
-                db.session.commit()
-                current_app.logger.info(f"库存更新成功: {identification_code}, 操作: {operation_type}")
-                return inventory
-                
-        except OperationalError as e:
-            if "Deadlock" in str(e) and attempt < max_retries - 1:
-                current_app.logger.warning(f"检测到死锁，重试 {attempt + 1}/{max_retries}")
-                time.sleep(retry_delay * (2 ** attempt))  # 指数退避
-                continue
-            else:
-                raise
-        except Exception as e:
-            db.session.rollback()
-            raise
-    
-    raise Exception(f"库存更新失败，已重试{max_retries}次")
+    batch_inventory_update([dict(update_data, identification_code=identification_code,
+                                 operation_type=operation_type)])
+    current_app.logger.info(f"库存更新成功: {identification_code}, 操作: {operation_type}")
+    return db.session.query(Inventory).filter(Inventory.identification_code == identification_code).first()
 
 def batch_inventory_update(updates):
     """
     批量库存更新操作
     
+    在一个事务内按ID顺序锁定全部库存行，以 CASE 语句批量写入并检查版本号，
+    任一记录不存在、库存不足或版本冲突时整批回滚（见 InventoryBulkMutator）。
+    
     Args:
         updates: 更新列表，每个元素包含 {identification_code, operation_type, **update_data}
+    
+    Returns:
+        dict: 变更结果，applied 中包含每条库存更新前后的数量
     """
-    # 按识别编码排序，避免死锁
-    sorted_updates = sorted(updates, key=lambda x: x['identification_code'])
+    from app.services.inventory_mutation_service import InventoryBulkMutator
+    from app.utils.unit_of_work import unit_of_work
     
+    # 死锁、锁等待超时时回滚并重新执行整批更新
     try:
-        with db.session.begin():
-            for update in sorted_updates:
-                identification_code = update['identification_code']
-                operation_type = update['operation_type']
-                update_data = {k: v for k, v in update.items() 
-                             if k not in ['identification_code', 'operation_type']}
-                
-                # 锁定并更新库存
-                inventory = db.session.query(Inventory).filter(
-                    Inventory.identification_code == identification_code
-                ).with_for_update().first()
-                
-                if not inventory:
-                    raise Exception(f"库存记录不存在: {identification_code}")
-                
-                # 执行更新逻辑（与safe_inventory_update相同）
-                if operation_type == 'subtract':
-                    new_pallet = inventory.pallet_count - update_data.get('pallet_count', 0)
-                    new_package = inventory.package_count - update_data.get('package_count', 0)
-                    
-                    if new_pallet < 0 or new_package < 0:
-                        raise Exception(f"库存不足: {identification_code}")
-                    
-                    inventory.pallet_count = new_pallet
-                    inventory.package_count = new_package
-                # ... 其他操作类型
-            
-            db.session.commit()
-            current_app.logger.info(f"批量库存更新成功，共{len(updates)}条记录")
-            
+        result = unit_of_work.run('inventory_batch', lambda: InventoryBulkMutator().apply(updates))
     except Exception as e:
-        db.session.rollback()
         current_app.logger.error(f"批量库存更新失败: {str(e)}")
         raise
+    current_app.logger.info(f"批量库存更新成功，共{len(result['applied'])}条记录")
+    return result
@@ -7,7 +7,7 @@
 
 from flask import current_app
 from app import db
-from app.models import InboundRecord, Inventory, OutboundRecord, TransitCargo, Warehouse
+from app.models import InboundRecord, Inventory, TransitCargo, Warehouse
 from sqlalchemy import func, text
 from datetime import datetime
 import json
@@ -70,66 +70,49 @@ class DataConsistencyChecker:
         return issues
     
     @staticmethod
-    def check_inventory_balance():
-        """检查库存平衡性"""
+    def check_inventory_balance(identification_codes=None):
+        """
+        检查库存平衡性（负库存、库存与出入库记录的一致性）
+
+        指定识别编码时直接核对这些识别编码；未指定时先执行一次增量对账，
+        再读取对账问题表中未解决的问题，不再逐个识别编码重算全部历史。
+        """
+        from app.services.reconciliation_service import InventoryReconciler, NEGATIVE_INVENTORY
+
+        if identification_codes is not None:
+            findings = InventoryReconciler.check_codes(identification_codes)
+        else:
+            result = InventoryReconciler.run_incremental()
+            if result.get('sweep_requested'):
+                # 尚未完成过全量扫描（首次运行或发生了批量写入），先补齐
+                result = InventoryReconciler.run_sweep(throttle_seconds=0)
+            if not result.get('success'):
+                current_app.logger.warning(f"对账失败，使用已有的对账结果: {result.get('message')}")
+            findings = [finding.to_dict() for finding in InventoryReconciler.get_open_findings()]
+
         issues = []
-        
-        # 检查负库存
-        negative_inventory = Inventory.query.filter(
-            db.or_(
-                Inventory.pallet_count < 0,
-                Inventory.package_count < 0
-            )
-        ).all()
-        
-        for inv in negative_inventory:
-            issues.append({
-                'type': 'negative_inventory',
-                'severity': 'high',
-                'identification_code': inv.identification_code,
-                'warehouse_id': inv.operated_warehouse_id,
-                'details': f'负库存: 板数={inv.pallet_count}, 件数={inv.package_count}',
-                'affected_tables': ['inventory'],
-                'fix_suggestion': '检查出库记录，修正库存数量'
-            })
-        
-        # 检查库存与出入库记录的一致性
-        all_codes = db.session.query(Inventory.identification_code).distinct().all()
-        
-        for (code,) in all_codes:
-            # 计算理论库存
-            inbound_total = db.session.query(
-                func.sum(InboundRecord.pallet_count).label('total_pallet'),
-                func.sum(InboundRecord.package_count).label('total_package')
-            ).filter_by(identification_code=code).first()
-            
-            outbound_total = db.session.query(
-                func.sum(OutboundRecord.pallet_count).label('total_pallet'),
-                func.sum(OutboundRecord.package_count).label('total_package')
-            ).filter_by(identification_code=code).first()
-            
-            actual_total = db.session.query(
-                func.sum(Inventory.pallet_count).label('total_pallet'),
-                func.sum(Inventory.package_count).label('total_package')
-            ).filter_by(identification_code=code).first()
-            
-            # 计算理论值
-            theoretical_pallet = (inbound_total.total_pallet or 0) - (outbound_total.total_pallet or 0)
-            theoretical_package = (inbound_total.total_package or 0) - (outbound_total.total_package or 0)
-            
-            actual_pallet = actual_total.total_pallet or 0
-            actual_package = actual_total.total_package or 0
-            
-            if theoretical_pallet != actual_pallet or theoretical_package != actual_package:
+        for finding in findings:
+            if finding['finding_type'] == NEGATIVE_INVENTORY:
+                issues.append({
+                    'type': 'negative_inventory',
+                    'severity': 'high',
+                    'identification_code': finding['identification_code'],
+                    'warehouse_id': finding['warehouse_id'],
+                    'details': finding['details'],
+                    'affected_tables': ['inventory'],
+                    'fix_suggestion': '检查出库记录，修正库存数量'
+                })
+            else:
                 issues.append({
                     'type': 'inventory_balance_mismatch',
                     'severity': 'high',
-                    'identification_code': code,
-                    'details': f'库存不平衡: 理论值(板:{theoretical_pallet},件:{theoretical_package}) vs 实际值(板:{actual_pallet},件:{actual_package})',
-                    'affected_tables': ['inventory', 'inbound_record', 'outbound_record'],
+                    'identification_code': finding['identification_code'],
+                    'warehouse_id': finding['warehouse_id'],
+                    'details': finding['details'],
+                    'affected_tables': ['inventory', 'inbound_record', 'receive_record', 'outbound_record'],
                     'fix_suggestion': '重新计算库存或检查出入库记录'
                 })
-        
+
         return issues
     
     @staticmethod
@@ -137,9 +137,8 @@ class DataIntegrityManager:
             issues.extend(relevant_issues)
             
             # 检查库存平衡性
-            balance_issues = self.consistency_checker.check_inventory_balance()
-            relevant_balance_issues = [issue for issue in balance_issues if issue.get('identification_code') == identification_code]
-            issues.extend(relevant_balance_issues)
+            balance_issues = self.consistency_checker.check_inventory_balance([identification_code])
+            issues.extend(balance_issues)
             
             if issues:
                 high_severity_issues = [issue for issue in issues if issue.get('severity') == 'high']
@@ -83,25 +83,32 @@ class IdentificationCodeGenerator:
     @classmethod
     def _get_next_sequence(cls, warehouse_id: int, customer_name: str,
                           clean_plate: str, date_str: str, operation_type: str) -> int:
-        """获取下一个序号，使用数据库锁防止并发问题"""
-        from app.models import InboundRecord, OutboundRecord
-        from app import db
-        from sqlalchemy import text
+        """获取下一个序号，通过序号计数器表原子分配，防止多进程并发取到相同序号"""
+        from app.utils.sequence_allocator import SequenceAllocator
 
-        # 使用数据库锁防止并发问题
-        try:
-            # 构建预期的识别编码前缀
-            warehouse_prefix = cls.WAREHOUSE_PREFIXES.get(warehouse_id, 'UK')
-            expected_prefix = f'{warehouse_prefix}/{customer_name}/{clean_plate}/{date_str}/'
+        warehouse_prefix = cls.WAREHOUSE_PREFIXES.get(warehouse_id, 'UK')
+        code_prefix = f'{warehouse_prefix}/{customer_name}/{clean_plate}/{date_str}'
 
-            # 直接使用备用方法，避免复杂的SQL查询
-            return cls._get_next_sequence_fallback(warehouse_id, customer_name, clean_plate, date_str, operation_type)
+        try:
+            return SequenceAllocator.reserve(
+                scope=cls._sequence_scope(operation_type),
+                key=code_prefix,
+                seed=lambda: cls._get_next_sequence_fallback(
+                    warehouse_id, customer_name, clean_plate, date_str, operation_type
+                ) - 1,
+                sequence_date=datetime.strptime(date_str, '%Y%m%d').date()
+            )
 
         except Exception as e:
-            # 如果数据库查询失败，回退到原始方法
-            print(f"数据库查询失败，使用备用方法: {e}")
+            # 如果计数器分配失败，回退到按现有记录计算的方法
+            print(f"序号计数器分配失败，使用备用方法: {e}")
             return cls._get_next_sequence_fallback(warehouse_id, customer_name, clean_plate, date_str, operation_type)
 
+    @staticmethod
+    def _sequence_scope(operation_type: str) -> str:
+        """序号计数器类别"""
+        return 'inbound_code' if operation_type == 'inbound' else 'outbound_code'
+
     @classmethod
     def _get_next_sequence_fallback(cls, warehouse_id: int, customer_name: str,
                                   clean_plate: str, date_str: str, operation_type: str) -> int:
@@ -140,7 +147,90 @@ class IdentificationCodeGenerator:
                     continue
 
         return max_sequence + 1
-    
+
+    @classmethod
+    def build_code_prefix(cls, warehouse_id: int, customer_name: str,
+                          plate_number: str, code_date: datetime = None) -> str:
+        """
+        构建识别编码前缀（不含序号）
+
+        Returns:
+            str: 格式: 仓库前缀/客户全称/车牌/日期
+        """
+        warehouse_prefix = cls.WAREHOUSE_PREFIXES.get(warehouse_id, 'UK')
+        clean_plate = cls._clean_plate_number(plate_number)
+        date_str = (code_date or datetime.now()).strftime('%Y%m%d')
+        return f'{warehouse_prefix}/{customer_name}/{clean_plate}/{date_str}'
+
+    @classmethod
+    def reserve_sequences(cls, prefix_counts: dict, operation_type: str = 'inbound') -> dict:
+        """
+        为多个编码前缀一次性预留序号区间
+
+        通过序号计数器表一次往返完成所有前缀的原子分配；
+        计数器尚不存在的前缀，以现有记录中的最大序号作为种子。
+
+        Args:
+            prefix_counts: {编码前缀: 需要的序号数量}
+            operation_type: 操作类型 ('inbound' 或 'outbound')
+
+        Returns:
+            dict: {编码前缀: 预留区间的起始序号}
+        """
+        from app.utils.sequence_allocator import SequenceAllocator
+
+        # 前缀末段为编码日期，记录到计数行用于过期清理
+        sequence_dates = {}
+        for prefix in prefix_counts:
+            try:
+                sequence_dates[prefix] = datetime.strptime(prefix.rsplit('/', 1)[-1], '%Y%m%d').date()
+            except ValueError:
+                sequence_dates[prefix] = None
+
+        return SequenceAllocator.reserve_many(
+            scope=cls._sequence_scope(operation_type),
+            key_counts=prefix_counts,
+            seed_func=lambda prefixes: cls._existing_max_sequences(prefixes, operation_type),
+            sequence_date=sequence_dates
+        )
+
+    @classmethod
+    def _existing_max_sequences(cls, prefixes: list, operation_type: str = 'inbound') -> dict:
+        """
+        用一条查询取出多个前缀下已有识别编码的最大序号
+
+        Returns:
+            dict: {编码前缀: 已使用的最大序号}
+        """
+        from app.models import InboundRecord, OutboundRecord
+        from app import db
+
+        if not prefixes:
+            return {}
+
+        model = InboundRecord if operation_type == 'inbound' else OutboundRecord
+        max_sequences = {prefix: 0 for prefix in prefixes}
+
+        existing_codes = db.session.query(model.identification_code).filter(
+            model.identification_code.isnot(None),
+            db.or_(*[model.identification_code.like(f'{prefix}/%') for prefix in prefixes])
+        ).all()
+
+        for (code,) in existing_codes:
+            prefix, _, sequence_part = code.rpartition('/')
+            if prefix in max_sequences:
+                try:
+                    max_sequences[prefix] = max(max_sequences[prefix], int(sequence_part))
+                except ValueError:
+                    continue
+
+        return max_sequences
+
+    @classmethod
+    def format_code(cls, code_prefix: str, sequence: int) -> str:
+        """拼接编码前缀和序号"""
+        return f'{code_prefix}/{int(sequence):03d}'
+
     @classmethod
     def parse_identification_code(cls, identification_code: str) -> dict:
         """
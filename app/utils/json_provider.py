@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+基于 orjson 的 Flask JSON 序列化
+库存列表、统计等 JSON 接口的响应体由 orjson 生成，比标准库 json 快数倍：
+- 日期时间、Decimal 等类型仍交给 Flask 默认的转换函数，输出格式与原来一致
+- 中文直接以 UTF-8 输出，不再转义为 \\uXXXX，响应体更小
+- orjson 不支持的参数或数据（如超过 64 位的整数）自动回退到标准库 json
+orjson 未安装时不启用，继续使用 Flask 默认实现。
+"""
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+# orjson 可以直接处理的 dumps 参数，其他参数回退到标准库 json
+_SUPPORTED_DUMPS_ARGS = {'default', 'sort_keys', 'indent', 'separators', 'ensure_ascii'}
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """orjson JSON 序列化提供者"""
+
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - _SUPPORTED_DUMPS_ARGS or kwargs.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent') == 2:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode('utf-8')
+        except TypeError:
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        try:
+            return orjson.loads(s)
+        except orjson.JSONDecodeError:
+            # 与标准库行为保持一致（如 NaN 字面量），并抛出标准库的异常类型
+            return super().loads(s)
+
+
+def init_json_provider(app):
+    """orjson 可用时替换应用的 JSON 序列化提供者"""
+    if not ORJSON_AVAILABLE or not app.config.get('ORJSON_RESPONSES_ENABLED', True):
+        return False
+    app.json = OrjsonProvider(app)
+    return True
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+键集（游标）分页
+列表按 (时间, id) 排序，翻页时以上一页边界记录的 (时间, id) 作为查询条件，
+代替 OFFSET 跳过前面所有行：
+- 游标为 base64 编码的边界位置，客户端原样回传，不需要理解其内容
+- 没有游标时按页码取数据（OFFSET），保留页码跳转
+- 总数可选精确计数、封顶计数（超过上限只显示“N+”）或不计数
+时间字段为 NULL 的记录按 MySQL/SQLite 的规则视为最小值。
+"""
+
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_, func
+
+from app import db
+
+# 封顶计数的默认上限
+DEFAULT_COUNT_CAP = 10000
+COUNT_MODES = ('exact', 'approximate', 'none')
+
+
+def encode_cursor(time_value, id_value, direction='next', page=None):
+    """
+    生成游标
+
+    Args:
+        time_value: 边界记录的时间
+        id_value: 边界记录的ID
+        direction: next（向后翻页）或 prev（向前翻页）
+        page: 翻页后的页码，仅用于页面显示
+
+    Returns:
+        str: URL 安全的游标字符串
+    """
+    payload = {
+        't': time_value.isoformat() if time_value is not None else None,
+        'i': id_value,
+        'd': direction,
+        'p': page
+    }
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """
+    解析游标，格式错误时返回 None
+
+    Returns:
+        dict: {'time': datetime|None, 'id': int, 'direction': str, 'page': int|None}
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw.decode('utf-8'))
+        direction = payload.get('d', 'next')
+        if direction not in ('next', 'prev') or payload.get('i') is None:
+            return None
+        time_value = payload.get('t')
+        page = payload.get('p')
+        return {
+            'time': datetime.fromisoformat(time_value) if time_value is not None else None,
+            'id': int(payload['i']),
+            'direction': direction,
+            'page': int(page) if page is not None else None
+        }
+    except (ValueError, TypeError, AttributeError):
+        return None
+
+
+def _seek_condition(time_column, id_column, time_value, id_value, after):
+    """
+    (时间, id) 位于边界之后/之前的条件（按升序比较，NULL 视为最小值）
+    """
+    if after:
+        if time_value is None:
+            return or_(time_column.isnot(None), and_(time_column.is_(None), id_column > id_value))
+        return or_(time_column > time_value, and_(time_column == time_value, id_column > id_value))
+
+    if time_value is None:
+        return and_(time_column.is_(None), id_column < id_value)
+    return or_(time_column.is_(None), time_column < time_value,
+               and_(time_column == time_value, id_column < id_value))
+
+
+class KeysetPagination:
+    """键集分页结果，属性与 SimplePagination / flask_sqlalchemy 分页对象兼容"""
+
+    def __init__(self, items=None, page=1, per_page=50, total=None, has_prev=False, has_next=False,
+                 prev_cursor=None, next_cursor=None, total_is_estimate=False):
+        self.items = items or []
+        self.page = page
+        self.per_page = per_page
+        self.total = total
+        self.has_prev = has_prev
+        self.has_next = has_next
+        self.prev_cursor = prev_cursor
+        self.next_cursor = next_cursor
+        self.total_is_estimate = total_is_estimate
+
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.has_prev else self.page
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.has_next else self.page
+
+    @property
+    def pages(self):
+        """计算总页数，不计数时按已知的页数计算"""
+        if self.total is None:
+            return self.next_num
+        if self.per_page == 0:
+            return 0
+        pages = max(1, (self.total + self.per_page - 1) // self.per_page)
+        # 封顶计数时实际页数可能更多，至少包含当前页
+        return max(pages, self.next_num) if self.total_is_estimate else pages
+
+    def iter_pages(self, left_edge=1, right_edge=1, left_current=1, right_current=2):
+        last = 0
+        pages = self.pages
+        for num in range(1, pages + 1):
+            if num <= left_edge or \
+               (num > self.page - left_current - 1 and num < self.page + right_current) or \
+               num > pages - right_edge:
+                if last + 1 != num:
+                    yield None
+                yield num
+                last = num
+
+    def to_dict(self):
+        """JSON 接口使用的分页信息"""
+        return {
+            'page': self.page,
+            'per_page': self.per_page,
+            'total': self.total,
+            'total_is_estimate': self.total_is_estimate,
+            'pages': self.pages if self.total is not None else None,
+            'has_prev': self.has_prev,
+            'has_next': self.has_next,
+            'prev_cursor': self.prev_cursor,
+            'next_cursor': self.next_cursor
+        }
+
+
+def keyset_paginate(query, time_column, id_column, cursor=None, page=1, per_page=50,
+                    descending=False, count_mode='exact', count_cap=None):
+    """
+    按 (时间, id) 键集分页
+
+    Args:
+        query: 已应用筛选条件的查询，原有排序会被替换
+        time_column: 排序时间字段
+        id_column: 主键字段，保证排序唯一
+        cursor: 上一次返回的 next_cursor / prev_cursor，有效时忽略 page
+        page: 没有游标时的页码
+        per_page: 每页数量
+        descending: 是否按时间降序
+        count_mode: exact（精确计数）、approximate（封顶计数）、none（不计数）
+        count_cap: 封顶计数的上限，默认 DEFAULT_COUNT_CAP
+
+    Returns:
+        KeysetPagination: 分页结果
+    """
+    per_page = max(int(per_page or 1), 1)
+    page = max(int(page or 1), 1)
+    if count_mode not in COUNT_MODES:
+        count_mode = 'exact'
+
+    base_query = query.order_by(None)
+    position = decode_cursor(cursor)
+    forward = position is None or position['direction'] == 'next'
+
+    # 向前翻页时反向扫描，取到数据后再恢复显示顺序
+    scan_descending = descending if forward else not descending
+    order = (time_column.desc(), id_column.desc()) if scan_descending else (time_column.asc(), id_column.asc())
+    page_query = base_query.order_by(*order)
+
+    if position:
+        page_query = page_query.filter(_seek_condition(
+            time_column, id_column, position['time'], position['id'], after=not scan_descending
+        ))
+        page = max(position['page'] or 1, 1)
+    else:
+        page_query = page_query.offset((page - 1) * per_page)
+
+    # 多取一条判断是否还有下一页（向前翻页时为上一页）
+    rows = page_query.limit(per_page + 1).all()
+    has_more = len(rows) > per_page
+    items = rows[:per_page]
+
+    if forward:
+        has_next = has_more
+        has_prev = page > 1
+    else:
+        items.reverse()
+        has_prev = has_more
+        has_next = True
+        if not has_prev:
+            page = 1
+
+    total = None
+    total_is_estimate = False
+    if not position and not has_more:
+        # 最后一页，总数可直接算出
+        total = (page - 1) * per_page + len(items)
+    elif count_mode == 'exact':
+        total = base_query.count()
+    elif count_mode == 'approximate':
+        cap = count_cap or DEFAULT_COUNT_CAP
+        capped = base_query.with_entities(id_column).limit(cap + 1).subquery()
+        total = db.session.query(func.count()).select_from(capped).scalar()
+        if total > cap:
+            total = cap
+            total_is_estimate = True
+
+    time_key = time_column.key
+    id_key = id_column.key
+    prev_cursor = next_cursor = None
+    if items and has_prev:
+        first = items[0]
+        prev_cursor = encode_cursor(getattr(first, time_key), getattr(first, id_key), 'prev', page - 1)
+    if items and has_next:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, time_key), getattr(last, id_key), 'next', page + 1)
+
+    return KeysetPagination(
+        items=items,
+        page=page,
+        per_page=per_page,
+        total=total,
+        has_prev=has_prev,
+        has_next=has_next,
+        prev_cursor=prev_cursor,
+        next_cursor=next_cursor,
+        total_is_estimate=total_is_estimate
+    )
@@ -0,0 +1,553 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+跨进程锁服务
+多个 gunicorn 工作进程同时修改同一识别编码的库存时，进程内的 threading.Lock 无法互斥。
+锁服务按部署环境选择后端：
+- redis: SET NX PX 租约锁，锁值为持有者令牌，释放时比对持有者；租约不续约，按请求最长处理时间设置
+- mysql: GET_LOCK/RELEASE_LOCK，每个线程的锁共用一条独立连接，不受业务会话提交、归还连接的影响
+- file: SQLite 等单机部署使用文件锁（flock），同一台机器上的进程之间互斥
+- local: 以上都不可用时退化为进程内锁
+锁键按哈希分条（lock striping），锁对象数量固定，不随识别编码增长；
+批量获取时按分条编号排序依次获取，多个批量出库请求之间不会互相死锁；
+同一线程重复获取已持有的分条时直接计数（可重入）。
+"""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+from flask import current_app, g, has_app_context, has_request_context
+
+try:
+    import fcntl
+    FCNTL_AVAILABLE = True
+except ImportError:
+    fcntl = None
+    FCNTL_AVAILABLE = False
+
+try:
+    import msvcrt
+    MSVCRT_AVAILABLE = True
+except ImportError:
+    msvcrt = None
+    MSVCRT_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# 默认分条数
+DEFAULT_STRIPES = 1024
+
+# 默认租约（毫秒，Redis 后端）：租约不续约，需大于持锁请求的最长处理时间
+# （nginx proxy_read_timeout 为 60 秒），否则请求未结束锁就可能过期被其他进程取得
+DEFAULT_LEASE_MS = 120000
+
+# 获取锁失败后的轮询间隔（秒），逐次加倍到上限
+POLL_INTERVAL = 0.01
+MAX_POLL_INTERVAL = 0.2
+
+# 等待时间统计的分桶上限（毫秒）
+WAIT_BUCKETS_MS = (1, 10, 50, 100, 500, 1000, 5000)
+
+
+class LockTimeout(Exception):
+    """获取锁超时"""
+
+
+class LockBackend(ABC):
+    """锁后端：按锁名获取、释放，返回的令牌用于释放"""
+
+    name = 'base'
+
+    @abstractmethod
+    def try_acquire(self, lock_name: str, lease_ms: int):
+        """尝试获取一次，成功返回令牌，失败返回 None"""
+
+    def acquire(self, lock_name: str, timeout: float, lease_ms: int):
+        """在 timeout 秒内获取锁，默认实现为带退避的轮询"""
+        deadline = time.monotonic() + max(timeout, 0)
+        interval = POLL_INTERVAL
+        while True:
+            token = self.try_acquire(lock_name, lease_ms)
+            if token is not None:
+                return token
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return None
+            time.sleep(min(interval, remaining))
+            interval = min(interval * 2, MAX_POLL_INTERVAL)
+
+    @abstractmethod
+    def release(self, lock_name: str, token) -> bool:
+        """释放锁，锁已不属于本持有者（如租约过期）时返回 False"""
+
+
+class LocalLockBackend(LockBackend):
+    """进程内锁（只在单进程部署或其他后端都不可用时使用）"""
+
+    name = 'local'
+
+    def __init__(self):
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def _lock(self, lock_name):
+        with self._guard:
+            lock = self._locks.get(lock_name)
+            if lock is None:
+                lock = self._locks[lock_name] = threading.Lock()
+            return lock
+
+    def try_acquire(self, lock_name, lease_ms):
+        return True if self._lock(lock_name).acquire(blocking=False) else None
+
+    def acquire(self, lock_name, timeout, lease_ms):
+        return True if self._lock(lock_name).acquire(timeout=max(timeout, 0)) else None
+
+    def release(self, lock_name, token):
+        try:
+            self._lock(lock_name).release()
+            return True
+        except RuntimeError:
+            return False
+
+
+class FileLockBackend(LockBackend):
+    """文件锁，同一台机器上的进程之间互斥"""
+
+    name = 'file'
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or os.path.join(tempfile.gettempdir(), 'wms_locks')
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, lock_name):
+        safe_name = hashlib.md5(lock_name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{safe_name}.lock')
+
+    def try_acquire(self, lock_name, lease_ms):
+        fd = os.open(self._path(lock_name), os.O_CREAT | os.O_RDWR)
+        try:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return fd
+        except OSError:
+            os.close(fd)
+            return None
+
+    def release(self, lock_name, token):
+        try:
+            if FCNTL_AVAILABLE:
+                fcntl.flock(token, fcntl.LOCK_UN)
+            else:
+                os.lseek(token, 0, os.SEEK_SET)
+                msvcrt.locking(token, msvcrt.LK_UNLCK, 1)
+            return True
+        except OSError:
+            return False
+        finally:
+            os.close(token)
+
+
+class MySQLLockBackend(LockBackend):
+    """
+    MySQL GET_LOCK 命名锁
+    同一线程持有的所有锁共用一条独立连接（GET_LOCK 按会话持有，一个会话可同时持有多个锁），
+    批量获取上百个分条时只占用一条连接，不会耗尽连接池；最后一个锁释放后连接归还连接池。
+    """
+
+    name = 'mysql'
+
+    def __init__(self, engine):
+        self.engine = engine
+        # 本线程的锁连接: [连接, 持有的锁数]
+        self._local = threading.local()
+
+    @staticmethod
+    def _mysql_name(lock_name):
+        # MySQL 锁名最长 64 个字符
+        if len(lock_name) <= 64:
+            return lock_name
+        return 'wms:' + hashlib.md5(lock_name.encode('utf-8')).hexdigest()
+
+    def _session(self):
+        """本线程的锁连接，不存在时从连接池取一条"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = [self.engine.connect(), 0]
+        return session
+
+    def _close_if_idle(self, session):
+        """连接上不再持有锁时归还连接池"""
+        if session[1] > 0:
+            return
+        if getattr(self._local, 'session', None) is session:
+            self._local.session = None
+        session[0].close()
+
+    def try_acquire(self, lock_name, lease_ms):
+        return self.acquire(lock_name, 0, lease_ms)
+
+    def acquire(self, lock_name, timeout, lease_ms):
+        from sqlalchemy import text
+        session = self._session()
+        try:
+            result = session[0].execute(
+                text("SELECT GET_LOCK(:lock_name, :timeout)"),
+                {"lock_name": self._mysql_name(lock_name), "timeout": max(int(timeout + 0.999), 0)}
+            ).scalar()
+        except Exception:
+            self._close_if_idle(session)
+            raise
+        if result != 1:
+            self._close_if_idle(session)
+            return None
+        session[1] += 1
+        return session
+
+    def release(self, lock_name, token):
+        from sqlalchemy import text
+        if token[0].closed:
+            # 连接已作废，服务端已随会话断开释放了锁
+            return False
+        token[1] -= 1
+        try:
+            result = token[0].execute(
+                text("SELECT RELEASE_LOCK(:lock_name)"), {"lock_name": self._mysql_name(lock_name)}
+            ).scalar()
+            return result == 1
+        except Exception:
+            # 连接异常时作废连接，会话断开后服务端释放该连接上的全部锁
+            token[0].invalidate()
+            token[1] = 0
+            raise
+        finally:
+            self._close_if_idle(token)
+
+
+class RedisLockBackend(LockBackend):
+    """Redis 租约锁，令牌为持有者标识，释放时只删除自己持有的锁"""
+
+    name = 'redis'
+
+    KEY_PREFIX = 'warehouse_system:lock:'
+
+    # 只有锁值与持有者令牌一致时才删除
+    RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+    def __init__(self, client):
+        self.client = client
+        self._release = client.register_script(self.RELEASE_SCRIPT)
+        self._owner = uuid.uuid4().hex[:8]
+
+    def try_acquire(self, lock_name, lease_ms):
+        value = f'{self._owner}:{uuid.uuid4().hex}'
+        if self.client.set(self.KEY_PREFIX + lock_name, value, nx=True, px=max(int(lease_ms), 1)):
+            return value
+        return None
+
+    def release(self, lock_name, token):
+        return bool(self._release(keys=[self.KEY_PREFIX + lock_name], args=[token]))
+
+
+class LockHandle:
+    """一次（批量）获取的锁"""
+
+    __slots__ = ('keys', 'lock_names', 'acquired_at', 'released')
+
+    def __init__(self, keys, lock_names):
+        self.keys = keys
+        self.lock_names = lock_names
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+
+class LockService:
+    """分条的跨进程锁服务"""
+
+    def __init__(self, backend: LockBackend, namespace: str = 'inventory', stripes: int = DEFAULT_STRIPES,
+                 default_timeout: float = 30.0, lease_ms: int = DEFAULT_LEASE_MS):
+        """
+        Args:
+            backend: 锁后端
+            namespace: 锁名前缀
+            stripes: 分条数，0 表示不分条（锁名即键名，用于少量命名锁）
+            default_timeout: 默认等待时间（秒）
+            lease_ms: 租约时间（Redis 后端），持有者异常退出后锁在租约到期时自动释放；
+                      租约不续约，需大于持锁请求的最长处理时间
+        """
+        self.backend = backend
+        self.namespace = namespace
+        self.stripes = stripes
+        self.default_timeout = default_timeout
+        self.lease_ms = lease_ms
+
+        # 本线程持有的锁: 锁名 -> [重入次数, 后端令牌]
+        self._held = threading.local()
+        self.stats_lock = threading.Lock()
+        self.stats = {
+            'acquired': 0,
+            'reentered': 0,
+            'timeouts': 0,
+            'errors': 0,
+            'lost': 0,
+            'wait_ms_total': 0.0,
+            'wait_ms_max': 0.0,
+            'hold_ms_total': 0.0,
+            'hold_ms_max': 0.0,
+            'wait_buckets': {f'<={bucket}ms': 0 for bucket in WAIT_BUCKETS_MS}
+        }
+        self.stats['wait_buckets']['>5000ms'] = 0
+
+    # ---------------- 锁名 ----------------
+
+    def lock_name(self, key) -> str:
+        """键对应的锁名（分条时为分条编号）"""
+        if not self.stripes:
+            return f'{self.namespace}:{key}'
+        stripe = zlib.crc32(str(key).encode('utf-8')) % self.stripes
+        return f'{self.namespace}:{stripe:04d}'
+
+    def _held_locks(self) -> Dict[str, list]:
+        held = getattr(self._held, 'locks', None)
+        if held is None:
+            held = self._held.locks = {}
+        return held
+
+    # ---------------- 获取、释放 ----------------
+
+    def acquire(self, key, timeout: Optional[float] = None) -> Optional[LockHandle]:
+        """获取单个键的锁，超时返回 None"""
+        return self.acquire_many([key], timeout)
+
+    def acquire_many(self, keys: Iterable, timeout: Optional[float] = None) -> Optional[LockHandle]:
+        """
+        按锁名排序依次获取多个键的锁，全部获取成功才返回；任一超时则释放已获取的锁并返回 None
+
+        Args:
+            keys: 键列表（如识别编码），重复、空值自动忽略
+            timeout: 整批的等待时间（秒）
+        """
+        keys = sorted({str(key) for key in keys if key})
+        lock_names = sorted({self.lock_name(key) for key in keys})
+        timeout = self.default_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        held = self._held_locks()
+        acquired: List[str] = []
+        started = time.monotonic()
+
+        try:
+            for lock_name in lock_names:
+                entry = held.get(lock_name)
+                if entry is not None:
+                    entry[0] += 1
+                    acquired.append(lock_name)
+                    self._count('reentered')
+                    continue
+
+                token = self.backend.acquire(lock_name, max(deadline - time.monotonic(), 0), self.lease_ms)
+                if token is None:
+                    self._count('timeouts')
+                    self._release_names(acquired)
+                    logger.warning(f"获取锁超时: {lock_name}（{len(keys)}个键，等待{timeout}秒）")
+                    return None
+                held[lock_name] = [1, token]
+                acquired.append(lock_name)
+        except Exception as e:
+            self._count('errors')
+            self._release_names(acquired)
+            logger.error(f"获取锁失败: {e}")
+            raise
+
+        self._record_wait((time.monotonic() - started) * 1000)
+        self._count('acquired')
+        return LockHandle(keys, lock_names)
+
+    def release(self, handle: Optional[LockHandle]):
+        """释放获取的锁（可重复调用）"""
+        if handle is None or handle.released:
+            return
+        handle.released = True
+        self._release_names(handle.lock_names)
+        self._record_hold((time.monotonic() - handle.acquired_at) * 1000)
+
+    def _release_names(self, lock_names):
+        held = self._held_locks()
+        # 按获取的相反顺序释放
+        for lock_name in reversed(lock_names):
+            entry = held.get(lock_name)
+            if entry is None:
+                continue
+            entry[0] -= 1
+            if entry[0] > 0:
+                continue
+            del held[lock_name]
+            try:
+                if not self.backend.release(lock_name, entry[1]):
+                    # 租约已过期，期间可能已被其他进程持有
+                    self._count('lost')
+                    logger.warning(f"释放锁时锁已不属于本持有者: {lock_name}")
+            except Exception as e:
+                self._count('errors')
+                logger.error(f"释放锁失败 {lock_name}: {e}")
+
+    @contextmanager
+    def lock(self, *keys, timeout: Optional[float] = None):
+        """
+        获取一个或多个键的锁的上下文管理器，超时抛出 LockTimeout
+
+            with inventory_locks.lock(*identification_codes) as handle:
+                ...
+        """
+        handle = self.acquire_many(keys, timeout)
+        if handle is None:
+            raise LockTimeout(f"获取锁超时: {', '.join(str(key) for key in keys[:5])}")
+        try:
+            yield handle
+        finally:
+            self.release(handle)
+
+    # ---------------- 统计 ----------------
+
+    def _count(self, stat):
+        with self.stats_lock:
+            self.stats[stat] += 1
+
+    def _record_wait(self, wait_ms):
+        with self.stats_lock:
+            self.stats['wait_ms_total'] += wait_ms
+            self.stats['wait_ms_max'] = max(self.stats['wait_ms_max'], wait_ms)
+            for bucket in WAIT_BUCKETS_MS:
+                if wait_ms <= bucket:
+                    self.stats['wait_buckets'][f'<={bucket}ms'] += 1
+                    break
+            else:
+                self.stats['wait_buckets']['>5000ms'] += 1
+
+    def _record_hold(self, hold_ms):
+        with self.stats_lock:
+            self.stats['hold_ms_total'] += hold_ms
+            self.stats['hold_ms_max'] = max(self.stats['hold_ms_max'], hold_ms)
+
+    def get_stats(self):
+        with self.stats_lock:
+            stats = dict(self.stats, wait_buckets=dict(self.stats['wait_buckets']))
+        acquired = stats['acquired'] or 1
+        stats['wait_ms_avg'] = round(stats['wait_ms_total'] / acquired, 3)
+        stats['hold_ms_avg'] = round(stats['hold_ms_total'] / acquired, 3)
+        stats['backend'] = self.backend.name
+        stats['stripes'] = self.stripes
+        return stats
+
+
+# ---------------- 后端选择 ----------------
+
+def create_lock_backend(backend_name: str = 'auto') -> LockBackend:
+    """
+    创建锁后端
+
+    Args:
+        backend_name: auto/redis/mysql/file/local；auto 依次选择 Redis、MySQL、文件锁
+    """
+    if backend_name in ('auto', 'redis'):
+        try:
+            from app.cache.redis_cache import get_redis_cache
+            redis_cache = get_redis_cache()
+            if redis_cache is not None and redis_cache.available:
+                return RedisLockBackend(redis_cache.client)
+        except Exception as e:
+            logger.warning(f"Redis锁后端不可用: {e}")
+        if backend_name == 'redis':
+            logger.warning("Redis不可用，锁服务改用其他后端")
+
+    if backend_name in ('auto', 'redis', 'mysql') and has_app_context():
+        from app import db
+        if db.engine.dialect.name == 'mysql':
+            return MySQLLockBackend(db.engine)
+
+    if backend_name != 'local' and (FCNTL_AVAILABLE or MSVCRT_AVAILABLE):
+        directory = current_app.config.get('LOCK_FILE_DIR') if has_app_context() else None
+        return FileLockBackend(directory)
+
+    logger.warning("跨进程锁不可用，使用进程内锁（多进程部署时无法互斥）")
+    return LocalLockBackend()
+
+
+_services: Dict[str, LockService] = {}
+_services_lock = threading.Lock()
+
+
+def get_lock_service(namespace: str = 'inventory') -> LockService:
+    """
+    获取锁服务（每个命名空间一个实例）
+
+    inventory 命名空间按识别编码分条，named 命名空间用于 with_database_lock 等少量命名锁。
+    """
+    service = _services.get(namespace)
+    if service is not None:
+        return service
+    with _services_lock:
+        service = _services.get(namespace)
+        if service is None:
+            config = current_app.config if has_app_context() else {}
+            backend = create_lock_backend(config.get('LOCK_BACKEND', 'auto'))
+            stripes = 0 if namespace == 'named' else config.get('LOCK_STRIPES', DEFAULT_STRIPES)
+            service = LockService(
+                backend,
+                namespace=namespace,
+                stripes=stripes,
+                default_timeout=config.get('LOCK_TIMEOUT_SECONDS', 30),
+                lease_ms=config.get('LOCK_LEASE_MS', DEFAULT_LEASE_MS)
+            )
+            _services[namespace] = service
+            logger.info(f"锁服务已创建: {namespace}，后端: {backend.name}，分条数: {stripes}")
+    return service
+
+
+def get_inventory_lock_service() -> LockService:
+    return get_lock_service('inventory')
+
+
+# ---------------- 请求内持有 ----------------
+
+def hold_inventory_locks(identification_codes: Iterable, timeout: Optional[float] = None) -> LockHandle:
+    """
+    获取识别编码的库存锁并持有到请求结束（teardown_request 时释放），超时抛出 LockTimeout
+
+    用于一次修改多个识别编码的批量出库等接口，在读取库存之前调用。
+    """
+    codes = list(identification_codes)
+    service = get_inventory_lock_service()
+    handle = service.acquire_many(codes, timeout)
+    if handle is None:
+        raise LockTimeout("库存正在被其他操作修改，请稍后重试")
+    if has_request_context():
+        g.setdefault('_held_lock_handles', []).append((service, handle))
+    return handle
+
+
+def release_request_locks(exception=None):
+    """释放本请求持有的锁"""
+    handles = g.pop('_held_lock_handles', None) if has_request_context() else None
+    for service, handle in reversed(handles or []):
+        service.release(handle)
+
+
+def init_lock_service(app):
+    """注册请求结束时释放锁"""
+    app.teardown_request(release_request_locks)
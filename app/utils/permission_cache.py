@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+用户有效权限缓存
+一次查询出用户的全部有效权限（角色、菜单、页面、操作、仓库权限），之后的权限检查都是集合查找：
+- 同一请求内保存在 flask.g 中，菜单渲染等大量检查不再访问缓存或数据库
+- 跨请求保存在双层缓存中（permissions:user:<ID>），带有用户权限标签
+- 权限、角色、用户记录的写入提交后按用户失效（批量 delete/update 无法确定用户时全部失效），
+  角色本身及角色权限的修改涉及所有持有该角色的用户，提交后全部失效，
+  失效通过缓存标签版本号在各进程之间同步
+缓存系统不可用时直接从数据库解析，仍在请求内复用。
+"""
+
+import logging
+from itertools import chain
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session, attributes
+
+from app.utils.session_events import on_outermost_rollback
+
+logger = logging.getLogger(__name__)
+
+# 所有用户权限缓存共用的标签
+ALL_PERMISSIONS_TAG = 'perm:all'
+
+# session.info 中保存待失效用户的键，None 表示全部失效
+_PENDING_USERS_KEY = 'permission_cache_pending'
+
+# 影响有效权限的用户字段（登录时间等字段的修改不使权限缓存失效）
+_USER_PERMISSION_FIELDS = ('is_admin', 'username')
+
+# 影响有效权限的角色字段（名称、描述等字段的修改不使权限缓存失效）
+_ROLE_PERMISSION_FIELDS = ('role_code', 'role_level', 'status')
+
+
+def _user_tag(user_id):
+    return f'perm:user:{user_id}'
+
+
+class EffectivePermissions:
+    """用户的有效权限集合"""
+
+    __slots__ = ('user_id', 'super_admin', 'roles', 'menus', 'pages', 'operations', 'warehouses')
+
+    def __init__(self, user_id, super_admin=False, roles=(), menus=(), pages=(), operations=(), warehouses=()):
+        self.user_id = user_id
+        self.super_admin = super_admin
+        self.roles = frozenset(roles)
+        self.menus = frozenset(menus)
+        self.pages = frozenset(pages)
+        self.operations = frozenset(operations)
+        # 仓库权限: (仓库ID, 仓库权限代码)
+        self.warehouses = frozenset((int(warehouse_id), code) for warehouse_id, code in warehouses)
+
+    def to_dict(self):
+        """转换为可缓存的字典"""
+        return {
+            'user_id': self.user_id,
+            'super_admin': self.super_admin,
+            'roles': sorted(self.roles),
+            'menus': sorted(self.menus),
+            'pages': sorted(self.pages),
+            'operations': sorted(self.operations),
+            'warehouses': sorted([warehouse_id, code] for warehouse_id, code in self.warehouses)
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['user_id'], data.get('super_admin', False), data.get('roles', ()), data.get('menus', ()),
+            data.get('pages', ()), data.get('operations', ()), data.get('warehouses', ())
+        )
+
+    def has_role(self, role_code):
+        return role_code in self.roles
+
+    def has_menu(self, menu_code):
+        return self.super_admin or menu_code in self.menus
+
+    def has_page(self, page_code):
+        if self.super_admin:
+            return True
+        # page_code 是列表时，有任何一个页面权限即可
+        if isinstance(page_code, (list, tuple, set)):
+            return any(code in self.pages for code in page_code)
+        return page_code in self.pages
+
+    def has_operation(self, operation_code):
+        return self.super_admin or operation_code in self.operations
+
+    def has_warehouse(self, warehouse_id, warehouse_permission_code):
+        if self.super_admin:
+            return True
+        try:
+            return (int(warehouse_id), warehouse_permission_code) in self.warehouses
+        except (TypeError, ValueError):
+            return False
+
+    def has_permission(self, permission_code):
+        """页面、菜单、操作权限中任一包含该权限代码"""
+        return (self.super_admin or permission_code in self.pages
+                or permission_code in self.menus or permission_code in self.operations)
+
+    def warehouse_ids(self):
+        return {warehouse_id for warehouse_id, _ in self.warehouses}
+
+
+class PermissionCache:
+    """用户有效权限缓存"""
+
+    CACHE_TYPE = 'user_permissions'
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'permissions:user:{user_id}'
+
+    @classmethod
+    def get(cls, user_id):
+        """
+        获取用户的有效权限，依次读取请求内缓存、双层缓存，都未命中时从数据库解析
+
+        Returns:
+            EffectivePermissions: 用户不存在时返回没有任何权限的集合
+        """
+        memo = None
+        if has_request_context():
+            memo = g.setdefault('_effective_permissions', {})
+            permissions = memo.get(user_id)
+            if permissions is not None:
+                return permissions
+
+        permissions = None
+        try:
+            from app.cache.dual_cache_manager import get_dual_cache_manager
+            data = get_dual_cache_manager().get(
+                cls.cache_key(user_id),
+                fallback=lambda: cls.resolve(user_id).to_dict(),
+                cache_type=cls.CACHE_TYPE,
+                tags=[ALL_PERMISSIONS_TAG, _user_tag(user_id)]
+            )
+            if data:
+                permissions = EffectivePermissions.from_dict(data)
+        except Exception as e:
+            logger.warning(f"读取用户权限缓存失败，直接查询数据库: {e}")
+
+        if permissions is None:
+            permissions = cls.resolve(user_id)
+        if memo is not None:
+            memo[user_id] = permissions
+        return permissions
+
+    @staticmethod
+    def resolve(user_id):
+        """从数据库解析用户的有效权限"""
+        from app import db
+        from app.models import (
+            User, UserRole, Role, UserMenuPermission, UserPagePermission,
+            UserOperationPermission, UserWarehousePermission
+        )
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return EffectivePermissions(user_id)
+
+        roles = db.session.query(Role.role_code).join(UserRole, UserRole.role_id == Role.id).filter(
+            UserRole.user_id == user_id, UserRole.status == 'active'
+        ).all()
+        menus = db.session.query(UserMenuPermission.menu_code).filter_by(user_id=user_id, is_granted=True).all()
+        pages = db.session.query(UserPagePermission.page_code).filter_by(user_id=user_id, is_granted=True).all()
+        operations = db.session.query(UserOperationPermission.operation_code).filter_by(
+            user_id=user_id, is_granted=True
+        ).all()
+        warehouses = db.session.query(
+            UserWarehousePermission.warehouse_id, UserWarehousePermission.warehouse_permission_code
+        ).filter_by(user_id=user_id, is_granted=True).all()
+
+        return EffectivePermissions(
+            user_id,
+            super_admin=user.is_super_admin(),
+            roles=[row[0] for row in roles],
+            menus=[row[0] for row in menus],
+            pages=[row[0] for row in pages],
+            operations=[row[0] for row in operations],
+            warehouses=[(row[0], row[1]) for row in warehouses]
+        )
+
+    @classmethod
+    def invalidate_user(cls, *user_ids):
+        """使指定用户的权限缓存失效"""
+        cls._invalidate([_user_tag(user_id) for user_id in user_ids if user_id is not None], user_ids)
+
+    @classmethod
+    def invalidate_all(cls):
+        """使所有用户的权限缓存失效"""
+        cls._invalidate([ALL_PERMISSIONS_TAG], None)
+
+    @staticmethod
+    def _invalidate(tags, user_ids):
+        if has_request_context():
+            memo = g.get('_effective_permissions')
+            if memo:
+                if user_ids is None:
+                    memo.clear()
+                else:
+                    for user_id in user_ids:
+                        memo.pop(user_id, None)
+        if not tags:
+            return
+        try:
+            from app.cache.cache_tags import invalidate_tags
+            invalidate_tags(*tags)
+        except Exception as e:
+            logger.error(f"用户权限缓存失效失败: {e}")
+
+
+# ---------------- 写入提交后失效 ----------------
+
+def _permission_models():
+    from app.models import (
+        User, UserRole, UserMenuPermission, UserPagePermission,
+        UserOperationPermission, UserWarehousePermission
+    )
+    return (User, UserRole, UserMenuPermission, UserPagePermission,
+            UserOperationPermission, UserWarehousePermission)
+
+
+def _role_models():
+    from app.models import Role, RolePermission
+    return (Role, RolePermission)
+
+
+def _mark_pending(session, user_id):
+    if user_id is None:
+        session.info[_PENDING_USERS_KEY] = None
+        return
+    pending = session.info.setdefault(_PENDING_USERS_KEY, set())
+    if pending is not None:
+        pending.add(user_id)
+
+
+def _collect_permission_changes(session, flush_context):
+    """flush 后收集权限、角色、用户记录有变化的用户"""
+    models = role_models = None
+    for obj in chain(session.new, session.dirty, session.deleted):
+        if models is None:
+            models = _permission_models()
+            role_models = _role_models()
+        if isinstance(obj, role_models):
+            if isinstance(obj, role_models[0]) and obj in session.dirty and not any(
+                attributes.get_history(obj, field).has_changes() for field in _ROLE_PERMISSION_FIELDS
+            ):
+                continue
+            _mark_pending(session, None)
+            continue
+        if not isinstance(obj, models):
+            continue
+        if isinstance(obj, models[0]):
+            if obj in session.dirty and not any(
+                attributes.get_history(obj, field).has_changes() for field in _USER_PERMISSION_FIELDS
+            ):
+                continue
+            _mark_pending(session, obj.id)
+        else:
+            _mark_pending(session, obj.user_id)
+
+
+def _collect_bulk_permission_changes(context):
+    """批量 delete/update 无法确定涉及的用户，提交后全部失效"""
+    mapper = getattr(context, 'mapper', None)
+    if mapper is not None and issubclass(mapper.class_, _permission_models() + _role_models()):
+        _mark_pending(context.session, None)
+
+
+def _invalidate_after_commit(session):
+    if _PENDING_USERS_KEY not in session.info:
+        return
+    pending = session.info.pop(_PENDING_USERS_KEY)
+    if pending is None:
+        PermissionCache.invalidate_all()
+    elif pending:
+        PermissionCache.invalidate_user(*pending)
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_PENDING_USERS_KEY, None)
+
+
+def register_permission_cache_events():
+    """注册权限缓存失效的会话事件监听器"""
+    if event.contains(Session, 'after_flush', _collect_permission_changes):
+        return
+    event.listen(Session, 'after_flush', _collect_permission_changes)
+    event.listen(Session, 'after_bulk_update', _collect_bulk_permission_changes)
+    event.listen(Session, 'after_bulk_delete', _collect_bulk_permission_changes)
+    event.listen(Session, 'after_commit', _invalidate_after_commit)
+    on_outermost_rollback(_discard_after_rollback)
+    logger.info("用户权限缓存失效事件监听器注册完成")
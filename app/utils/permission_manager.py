@@ -2,111 +2,63 @@
 # -*- coding: utf-8 -*-
 """
 精细化权限管理工具类
+权限检查基于用户有效权限缓存（见 permission_cache），同一用户的多次检查只解析一次权限。
 """
 
+from datetime import datetime
+
 from flask_login import current_user
 from app.models import (
     MenuPermission, PagePermission, OperationPermission, WarehousePermission,
     UserMenuPermission, UserPagePermission, UserOperationPermission, UserWarehousePermission
 )
-from app.models import User, Warehouse
+from app.models import Warehouse
+from app.utils.permission_cache import PermissionCache
 
 
 class PermissionManager:
     """权限管理器"""
     
+    @staticmethod
+    def get_effective_permissions(user_id):
+        """获取用户的有效权限集合（超级管理员标记、角色、菜单、页面、操作、仓库权限）"""
+        return PermissionCache.get(user_id)
+    
+    @staticmethod
+    def invalidate_user_permissions(user_id=None):
+        """使用户的权限缓存失效，user_id 为 None 时全部失效（写入经过 ORM 会话时自动失效，无需调用）"""
+        if user_id is None:
+            PermissionCache.invalidate_all()
+        else:
+            PermissionCache.invalidate_user(user_id)
+    
     @staticmethod
     def has_menu_permission(user_id, menu_code):
         """检查用户是否有菜单权限"""
         if not user_id or not menu_code:
             return False
-            
-        # 超级管理员拥有所有权限
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
-            return True
-            
-        # 检查用户菜单权限
-        permission = UserMenuPermission.query.filter_by(
-            user_id=user_id,
-            menu_code=menu_code,
-            is_granted=True
-        ).first()
-        
-        return permission is not None
+        return PermissionCache.get(user_id).has_menu(menu_code)
     
     @staticmethod
     def has_page_permission(user_id, page_code):
-        """检查用户是否有页面权限"""
+        """检查用户是否有页面权限（page_code 是列表时，有任何一个权限即可）"""
         if not user_id or not page_code:
             return False
-
-        # 超级管理员拥有所有权限
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
-            return True
-
-        # 如果page_code是列表，检查是否有任何一个权限
-        if isinstance(page_code, list):
-            for code in page_code:
-                permission = UserPagePermission.query.filter_by(
-                    user_id=user_id,
-                    page_code=code,
-                    is_granted=True
-                ).first()
-                if permission:
-                    return True
-            return False
-
-        # 检查用户页面权限
-        permission = UserPagePermission.query.filter_by(
-            user_id=user_id,
-            page_code=page_code,
-            is_granted=True
-        ).first()
-
-        return permission is not None
+        return PermissionCache.get(user_id).has_page(page_code)
     
     @staticmethod
     def has_operation_permission(user_id, operation_code):
         """检查用户是否有操作权限"""
         if not user_id or not operation_code:
             return False
-            
-        # 超级管理员拥有所有权限
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
-            return True
-            
-        # 检查用户操作权限
-        permission = UserOperationPermission.query.filter_by(
-            user_id=user_id,
-            operation_code=operation_code,
-            is_granted=True
-        ).first()
-        
-        return permission is not None
+        return PermissionCache.get(user_id).has_operation(operation_code)
     
     @staticmethod
     def has_warehouse_permission(user_id, warehouse_id, warehouse_permission_code):
         """检查用户是否有仓库权限"""
         if not user_id or not warehouse_id or not warehouse_permission_code:
             return False
-            
-        # 超级管理员拥有所有权限
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
-            return True
-            
-        # 检查用户仓库权限
-        permission = UserWarehousePermission.query.filter_by(
-            user_id=user_id,
-            warehouse_id=warehouse_id,
-            warehouse_permission_code=warehouse_permission_code,
-            is_granted=True
-        ).first()
-        
-        return permission is not None
+        return PermissionCache.get(user_id).has_warehouse(warehouse_id, warehouse_permission_code)
     
     @staticmethod
     def get_user_accessible_menus(user_id):
@@ -115,19 +67,14 @@ class PermissionManager:
             return []
             
         # 超级管理员可以访问所有菜单
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
+        permissions = PermissionCache.get(user_id)
+        if permissions.super_admin:
             return MenuPermission.query.filter_by(is_active=True).order_by(
                 MenuPermission.menu_level, MenuPermission.menu_order
             ).all()
         
         # 获取用户有权限的菜单
-        user_menu_permissions = UserMenuPermission.query.filter_by(
-            user_id=user_id,
-            is_granted=True
-        ).all()
-        
-        menu_codes = [perm.menu_code for perm in user_menu_permissions]
+        menu_codes = list(permissions.menus)
         
         menus = MenuPermission.query.filter(
             MenuPermission.menu_code.in_(menu_codes),
@@ -145,20 +92,15 @@ class PermissionManager:
             return []
             
         # 超级管理员可以访问所有页面
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
+        permissions = PermissionCache.get(user_id)
+        if permissions.super_admin:
             query = PagePermission.query.filter_by(is_active=True)
             if menu_code:
                 query = query.filter_by(menu_code=menu_code)
             return query.all()
         
         # 获取用户有权限的页面
-        user_page_permissions = UserPagePermission.query.filter_by(
-            user_id=user_id,
-            is_granted=True
-        ).all()
-        
-        page_codes = [perm.page_code for perm in user_page_permissions]
+        page_codes = list(permissions.pages)
         
         query = PagePermission.query.filter(
             PagePermission.page_code.in_(page_codes),
@@ -177,17 +119,12 @@ class PermissionManager:
             return []
             
         # 超级管理员可以访问所有仓库
-        user = User.query.get(user_id)
-        if user and user.is_super_admin():
+        permissions = PermissionCache.get(user_id)
+        if permissions.super_admin:
             return Warehouse.query.filter_by(status='active').all()
         
         # 获取用户有权限的仓库
-        user_warehouse_permissions = UserWarehousePermission.query.filter_by(
-            user_id=user_id,
-            is_granted=True
-        ).all()
-        
-        warehouse_ids = list(set([perm.warehouse_id for perm in user_warehouse_permissions]))
+        warehouse_ids = list(permissions.warehouse_ids())
         
         warehouses = Warehouse.query.filter(
             Warehouse.id.in_(warehouse_ids),
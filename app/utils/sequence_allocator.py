@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+序号分配器
+基于 sequence_counters 计数器表原子分配识别编码、批次号序号：
+- 先对计数行执行 UPDATE current_value = current_value + n，行锁保证多个 gunicorn 进程不会拿到相同序号
+- 计数行不存在时按现有业务数据取种子值插入，并发插入冲突时改为递增
+- 一次调用可为多个键批量预留区间，批量导入只需一次往返
+计数器与业务写入处于同一事务，事务回滚时序号一并回滚，不产生空号。
+"""
+
+from datetime import datetime, timedelta
+from sqlalchemy import case
+from sqlalchemy.exc import IntegrityError
+
+
+class SequenceAllocator:
+    """序号分配器"""
+
+    # 并发插入计数行冲突时的最大重试次数
+    MAX_INSERT_ATTEMPTS = 3
+
+    @classmethod
+    def reserve(cls, scope, key, count=1, seed=None, sequence_date=None, session=None):
+        """
+        为单个键预留连续序号
+
+        Args:
+            scope: 序号类别
+            key: 序号键
+            count: 预留数量
+            seed: 计数行不存在时调用，返回已使用的最大序号
+            sequence_date: 序号所属日期
+            session: 数据库会话，默认 db.session
+
+        Returns:
+            int: 预留区间的起始序号
+        """
+        seed_func = (lambda keys: {key: seed()}) if seed else None
+        return cls.reserve_many(scope, {key: count}, seed_func=seed_func,
+                                sequence_date=sequence_date, session=session)[key]
+
+    @classmethod
+    def reserve_many(cls, scope, key_counts, seed_func=None, sequence_date=None, session=None):
+        """
+        为多个键批量预留连续序号
+
+        Args:
+            scope: 序号类别
+            key_counts: {序号键: 预留数量}
+            seed_func: 接收缺失的键列表，返回 {序号键: 已使用的最大序号}
+            sequence_date: 序号所属日期，也可传 {序号键: 日期}
+            session: 数据库会话，默认 db.session
+
+        Returns:
+            dict: {序号键: 预留区间的起始序号}
+        """
+        from app import db
+        from app.models import SequenceCounter
+
+        session = session or db.session
+        key_counts = {key: int(count) for key, count in key_counts.items() if count and int(count) > 0}
+        if not key_counts:
+            return {}
+
+        table = SequenceCounter.__table__
+        keys = sorted(key_counts)
+
+        # 1. 递增已存在的计数行（按键排序加锁，避免交叉死锁）
+        cls._increment(session, table, scope, key_counts)
+        current = cls._current_values(session, table, scope, keys)
+
+        # 2. 为不存在的计数行取种子值并插入
+        pending = [key for key in keys if key not in current]
+        for attempt in range(cls.MAX_INSERT_ATTEMPTS):
+            if not pending:
+                break
+
+            seeds = seed_func(pending) if seed_func else {}
+            now = datetime.now()
+            rows = [{
+                'scope': scope,
+                'sequence_key': key,
+                'sequence_date': sequence_date.get(key) if isinstance(sequence_date, dict) else sequence_date,
+                'current_value': int(seeds.get(key) or 0) + key_counts[key],
+                'created_at': now,
+                'updated_at': now
+            } for key in pending]
+
+            try:
+                with session.begin_nested():
+                    session.execute(table.insert(), rows)
+                pending = []
+            except IntegrityError:
+                # 其他进程已创建部分计数行，对已存在的改为递增
+                cls._increment(session, table, scope, {key: key_counts[key] for key in pending})
+                created = cls._current_values(session, table, scope, pending)
+                pending = [key for key in pending if key not in created]
+
+        if pending:
+            raise RuntimeError(f"序号计数器创建失败: {scope} {pending}")
+
+        current = cls._current_values(session, table, scope, keys)
+        return {key: current[key] - key_counts[key] + 1 for key in keys}
+
+    @staticmethod
+    def _increment(session, table, scope, key_counts):
+        """按键递增计数，返回受影响行数"""
+        result = session.execute(
+            table.update().where(
+                table.c.scope == scope,
+                table.c.sequence_key.in_(sorted(key_counts))
+            ).values(
+                current_value=table.c.current_value + case(key_counts, value=table.c.sequence_key, else_=0),
+                updated_at=datetime.now()
+            )
+        )
+        return result.rowcount
+
+    @staticmethod
+    def _current_values(session, table, scope, keys):
+        """读取计数当前值（加锁读，读取最新已提交版本）"""
+        rows = session.execute(
+            table.select().with_only_columns(
+                table.c.sequence_key, table.c.current_value
+            ).where(
+                table.c.scope == scope,
+                table.c.sequence_key.in_(keys)
+            ).with_for_update()
+        ).all()
+        return {row.sequence_key: row.current_value for row in rows}
+
+    @classmethod
+    def purge_expired(cls, keep_days=30):
+        """清理过期日期的计数行（被清理的键再次使用时会按业务数据重新取种子）"""
+        from app import db
+        from app.models import SequenceCounter
+
+        cutoff = (datetime.now() - timedelta(days=keep_days)).date()
+        deleted = SequenceCounter.query.filter(
+            SequenceCounter.sequence_date.isnot(None),
+            SequenceCounter.sequence_date < cutoff
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return deleted
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+会话事件公共工具
+after_rollback 在 SAVEPOINT 回滚时也会触发（如 SequenceAllocator.reserve 在 begin_nested() 中捕获
+IntegrityError），此时外层事务仍然有效，不能丢弃外层事务收集的待处理数据。
+这里统一监听 after_soft_rollback，只在最外层事务回滚时调用注册的处理函数。
+
+汇总表、搜索索引等派生数据按同一流程维护（register_pending_refresh）：
+flush 后收集本次写入触及的条目，提交前在 SAVEPOINT 中刷新，最外层事务回滚时丢弃。
+"""
+
+import logging
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_rollback_handlers = []
+
+# session.info 中的待刷新条目键 -> (收集函数, 刷新函数, 名称)
+_pending_refreshes = {}
+_REFRESHING_KEY = 'pending_refresh_running'
+
+
+def _dispatch_outermost_rollback(session, previous_transaction):
+    """最外层事务回滚后依次调用处理函数，SAVEPOINT 回滚不处理"""
+    if previous_transaction.nested or previous_transaction.parent is not None:
+        return
+    for handler in list(_rollback_handlers):
+        try:
+            handler(session)
+        except Exception as e:
+            logger.error(f"事务回滚处理失败 {getattr(handler, '__name__', handler)}: {e}")
+
+
+def on_outermost_rollback(handler):
+    """
+    注册最外层事务回滚后的处理函数（可重复调用）
+
+    Args:
+        handler: 接收 session 参数的可调用对象，通常用于丢弃 session.info 中待处理的数据
+    """
+    if handler not in _rollback_handlers:
+        _rollback_handlers.append(handler)
+    if not event.contains(Session, 'after_soft_rollback', _dispatch_outermost_rollback):
+        event.listen(Session, 'after_soft_rollback', _dispatch_outermost_rollback)
+
+
+def _collect_pending(session, flush_context):
+    """flush 后收集本次写入触及的条目"""
+    for key, (collect, _, _) in _pending_refreshes.items():
+        if collect is None:
+            continue
+        items = collect(session)
+        if items:
+            session.info.setdefault(key, set()).update(items)
+
+
+def mark_pending(key, items, session):
+    """
+    标记待刷新的条目
+
+    批量 insert()/update() 语句不经过 ORM flush，调用方需显式标记，
+    条目会在本事务提交前一并刷新。
+    """
+    items = {item for item in items if item}
+    if items:
+        session.info.setdefault(key, set()).update(items)
+
+
+def _refresh_pending_before_commit(session):
+    """事务提交前刷新触及的条目，与业务写入处于同一事务"""
+    if session.info.get(_REFRESHING_KEY):
+        return
+    session.info[_REFRESHING_KEY] = True
+    failed = set()
+    try:
+        while True:
+            # 刷新本身的写入也可能触及其他派生数据，循环到没有新的待刷新条目
+            session.flush()
+            batches = [(key, session.info.pop(key, None)) for key in _pending_refreshes if key not in failed]
+            batches = [(key, items) for key, items in batches if items]
+            if not batches:
+                break
+            for key, items in batches:
+                _, refresh, name = _pending_refreshes[key]
+                try:
+                    # 在 SAVEPOINT 中刷新，失败时只回滚派生数据的删除、插入，不会把删掉的行一并提交
+                    with session.begin_nested():
+                        refresh(session, items)
+                except Exception as e:
+                    # 刷新失败不阻断业务写入，由定时重建纠偏
+                    logger.error(f"{name}刷新失败 ({len(items)} 项): {e}")
+                    failed.add(key)
+    finally:
+        session.info.pop(_REFRESHING_KEY, None)
+        for key in failed:
+            session.info.pop(key, None)
+
+
+def _discard_pending(session):
+    """事务回滚时丢弃待刷新的条目"""
+    for key in _pending_refreshes:
+        session.info.pop(key, None)
+
+
+def register_pending_refresh(key, collect, refresh, name=None):
+    """
+    注册提交前刷新的派生数据（可重复调用）
+
+    Args:
+        key: session.info 中保存待刷新条目集合的键
+        collect: collect(session) 返回本次 flush 触及的条目集合；None 表示只通过 mark_pending 标记
+        refresh: refresh(session, items) 在调用方事务的 SAVEPOINT 中刷新条目，不提交
+        name: 日志中使用的名称，默认为 key
+    """
+    _pending_refreshes[key] = (collect, refresh, name or key)
+    if not event.contains(Session, 'after_flush', _collect_pending):
+        event.listen(Session, 'after_flush', _collect_pending)
+        event.listen(Session, 'before_commit', _refresh_pending_before_commit)
+        on_outermost_rollback(_discard_pending)
@@ -9,7 +9,6 @@ from contextlib import contextmanager
 from functools import wraps
 from flask import current_app
 from app import db
-from sqlalchemy.exc import SQLAlchemyError
 import traceback
 import time
 
@@ -221,24 +220,19 @@ class TransitTransactionManager:
             current_app.logger.error(f"错误堆栈: {traceback.format_exc()}")
             raise
 
-def retry_on_deadlock(max_retries=3, delay=0.1):
+def retry_on_deadlock(max_retries=3, delay=0.1, operation_type=None):
     """
     死锁重试装饰器
+    
+    被装饰的函数自行管理事务，遇到死锁、锁等待超时等可重试冲突时回滚并重新执行，
+    重试次数和等待时间按 operation_type（默认函数名）统计（见 unit_of_work）。
     """
     def decorator(func):
         @wraps(func)
         def wrapper(*args, **kwargs):
-            for attempt in range(max_retries):
-                try:
-                    return func(*args, **kwargs)
-                except SQLAlchemyError as e:
-                    if "deadlock" in str(e).lower() and attempt < max_retries - 1:
-                        current_app.logger.warning(f"检测到死锁，第 {attempt + 1} 次重试: {str(e)}")
-                        time.sleep(delay * (2 ** attempt))  # 指数退避
-                        continue
-                    else:
-                        raise
-            return None
+            from app.utils.unit_of_work import unit_of_work
+            return unit_of_work.run(operation_type or func.__name__, lambda: func(*args, **kwargs),
+                                    transaction=False, max_attempts=max_retries, base_delay=delay)
         return wrapper
     return decorator
 
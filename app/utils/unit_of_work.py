@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+工作单元执行器 - 死锁和锁等待超时自动重试
+把一次完整的写入（读取、修改、提交）作为一个工作单元执行，数据库报告死锁、锁等待超时、
+序列化失败或 SQLite 数据库锁定时，回滚后按带随机抖动的指数退避重新执行整个单元：
+- 识别 MySQL 1213/1205/3572、PostgreSQL 40001/40P01、SQLite database is locked/busy
+- 事务由 run 的 transaction 参数（默认 TransactionManager.atomic_transaction）开启和提交，每次重试都重新进入
+- 嵌套的工作单元不单独重试，由最外层单元重放（死锁后整个事务已被数据库回滚）
+- transactional_view 用于自行提交并捕获异常的接口：视图因可重试错误返回 5xx 时重放视图
+- 按操作类型统计重试次数、等待时间和错误类型
+"""
+
+import random
+import threading
+import time
+from contextlib import nullcontext
+from functools import wraps
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app import db
+
+# 错误类型
+DEADLOCK = 'deadlock'
+LOCK_WAIT = 'lock_wait'
+SERIALIZATION = 'serialization'
+DATABASE_LOCKED = 'database_locked'
+
+# MySQL 错误码
+_MYSQL_ERRORS = {
+    1213: DEADLOCK,       # ER_LOCK_DEADLOCK
+    1205: LOCK_WAIT,      # ER_LOCK_WAIT_TIMEOUT
+    3572: LOCK_WAIT,      # ER_LOCK_NOWAIT
+}
+
+# PostgreSQL SQLSTATE
+_PG_ERRORS = {
+    '40001': SERIALIZATION,
+    '40P01': DEADLOCK,
+    '55P03': LOCK_WAIT,
+}
+
+# 按错误信息识别（驱动没有提供错误码时）
+_MESSAGE_PATTERNS = (
+    ('deadlock', DEADLOCK),
+    ('lock wait timeout', LOCK_WAIT),
+    ('database is locked', DATABASE_LOCKED),
+    ('database table is locked', DATABASE_LOCKED),
+    ('database is busy', DATABASE_LOCKED),
+    ('could not serialize access', SERIALIZATION),
+)
+
+DEFAULT_MAX_ATTEMPTS = 4
+DEFAULT_BASE_DELAY = 0.05
+DEFAULT_MAX_DELAY = 1.0
+
+
+def classify_retryable_error(exc):
+    """
+    判断异常是否是可重试的并发冲突
+
+    沿异常链（__cause__/__context__）查找驱动原始异常，按错误码和错误信息识别。
+
+    Returns:
+        str: 错误类型（deadlock/lock_wait/serialization/database_locked），不可重试返回 None
+    """
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        for candidate in (getattr(exc, 'orig', None), exc):
+            if candidate is None:
+                continue
+            args = getattr(candidate, 'args', ())
+            if args and isinstance(args[0], int) and args[0] in _MYSQL_ERRORS:
+                return _MYSQL_ERRORS[args[0]]
+            pgcode = getattr(candidate, 'pgcode', None) or getattr(candidate, 'sqlstate', None)
+            if pgcode in _PG_ERRORS:
+                return _PG_ERRORS[pgcode]
+        message = str(exc).lower()
+        for pattern, kind in _MESSAGE_PATTERNS:
+            if pattern in message:
+                return kind
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+class UnitOfWorkExecutor:
+    """工作单元执行器"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._stats_lock = threading.Lock()
+        self._stats = {}
+
+    # ---------------- 执行 ----------------
+
+    def run(self, operation_type, work, transaction=None, max_attempts=None, retry_result=None, base_delay=None):
+        """
+        执行一个工作单元，遇到可重试的并发冲突时回滚并重新执行
+
+        Args:
+            operation_type: 操作类型，用于统计（outbound/inventory/transit 等）
+            work: 无参数的可调用对象，每次重试都重新调用，必须重新读取所需数据
+            transaction: 返回事务上下文管理器的无参数可调用对象，每次重试重新进入；
+                         默认 TransactionManager.atomic_transaction，work 自行提交时传 False
+            max_attempts: 最多执行次数，默认 TRANSACTION_RETRY_ATTEMPTS 配置
+            retry_result: 判断 work 返回值是否表示本次因冲突失败（已自行回滚）的可调用对象
+            base_delay: 首次重试的等待秒数，默认 TRANSACTION_RETRY_BASE_DELAY 配置
+
+        Returns:
+            work 的返回值
+        """
+        if transaction is None:
+            from app.utils.transaction_manager import TransactionManager
+            transaction = TransactionManager.atomic_transaction
+        elif transaction is False:
+            transaction = nullcontext
+
+        # 嵌套在其他工作单元中时只执行一次，冲突交给最外层重放
+        depth = getattr(self._local, 'depth', 0)
+        if depth:
+            self._local.depth = depth + 1
+            try:
+                with transaction():
+                    return work()
+            finally:
+                self._local.depth = depth
+
+        max_attempts = max_attempts or self._config('TRANSACTION_RETRY_ATTEMPTS', DEFAULT_MAX_ATTEMPTS)
+        stats = self._stats_for(operation_type)
+        self._increment(stats, 'units')
+        started = time.time()
+
+        attempt = 0
+        while True:
+            attempt += 1
+            self._local.depth = 1
+            self._local.observed_error = None
+            try:
+                with transaction():
+                    result = work()
+            except Exception as e:
+                kind = classify_retryable_error(e)
+                if kind is None:
+                    self._finish(stats, 'failed', started)
+                    raise
+                if attempt >= max_attempts:
+                    self._record_error(stats, kind)
+                    self._finish(stats, 'exhausted', started)
+                    self._log('error', f"{operation_type} 工作单元重试{attempt - 1}次后仍然冲突({kind}): {e}")
+                    raise
+                self._retry(stats, operation_type, kind, attempt, str(e), base_delay)
+                continue
+            finally:
+                self._local.depth = 0
+
+            kind = self._local.observed_error
+            if kind and retry_result is not None and retry_result(result):
+                if attempt < max_attempts:
+                    self._retry(stats, operation_type, kind, attempt, '接口因并发冲突返回失败', base_delay)
+                    continue
+                self._record_error(stats, kind)
+                self._finish(stats, 'exhausted', started)
+                self._log('error', f"{operation_type} 工作单元重试{attempt - 1}次后仍然冲突({kind})")
+                return result
+
+            self._finish(stats, 'succeeded', started)
+            return result
+
+    def note_error(self, exc):
+        """记录本线程当前工作单元中出现的可重试错误（即使被调用方捕获）"""
+        if getattr(self._local, 'depth', 0):
+            kind = classify_retryable_error(exc)
+            if kind:
+                self._local.observed_error = kind
+
+    # ---------------- 重试 ----------------
+
+    def _retry(self, stats, operation_type, kind, attempt, detail, base_delay=None):
+        """回滚会话并等待后重试"""
+        try:
+            db.session.rollback()
+        except Exception:
+            pass
+        delay = self._backoff(attempt, base_delay)
+        self._record_error(stats, kind)
+        with self._stats_lock:
+            stats['retries'] += 1
+            stats['wait_seconds'] += delay
+            stats['max_wait_seconds'] = max(stats['max_wait_seconds'], delay)
+        self._log('warning', f"{operation_type} 检测到并发冲突({kind})，{delay:.3f}秒后第{attempt}次重试: {detail}")
+        time.sleep(delay)
+
+    def _backoff(self, attempt, base_delay=None):
+        """指数退避加随机抖动，避免冲突双方同时重试再次冲突"""
+        if base_delay is None:
+            base_delay = self._config('TRANSACTION_RETRY_BASE_DELAY', DEFAULT_BASE_DELAY)
+        max_delay = self._config('TRANSACTION_RETRY_MAX_DELAY', DEFAULT_MAX_DELAY)
+        ceiling = min(max_delay, base_delay * (2 ** (attempt - 1)))
+        return random.uniform(ceiling / 2, ceiling)
+
+    # ---------------- 统计 ----------------
+
+    def _stats_for(self, operation_type):
+        with self._stats_lock:
+            stats = self._stats.get(operation_type)
+            if stats is None:
+                stats = self._stats[operation_type] = {
+                    'units': 0, 'succeeded': 0, 'failed': 0, 'exhausted': 0, 'retries': 0,
+                    'wait_seconds': 0.0, 'max_wait_seconds': 0.0, 'total_seconds': 0.0, 'errors': {}
+                }
+            return stats
+
+    def _increment(self, stats, key):
+        with self._stats_lock:
+            stats[key] += 1
+
+    def _record_error(self, stats, kind):
+        with self._stats_lock:
+            stats['errors'][kind] = stats['errors'].get(kind, 0) + 1
+
+    def _finish(self, stats, outcome, started):
+        with self._stats_lock:
+            stats[outcome] += 1
+            stats['total_seconds'] += time.time() - started
+
+    def get_stats(self):
+        """按操作类型的重试统计"""
+        with self._stats_lock:
+            result = {}
+            for operation_type, stats in self._stats.items():
+                result[operation_type] = dict(
+                    stats,
+                    errors=dict(stats['errors']),
+                    wait_seconds=round(stats['wait_seconds'], 3),
+                    max_wait_seconds=round(stats['max_wait_seconds'], 3),
+                    total_seconds=round(stats['total_seconds'], 3),
+                    retry_rate=round(stats['retries'] / stats['units'], 3) if stats['units'] else 0.0
+                )
+            return result
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._stats.clear()
+
+    @staticmethod
+    def _config(key, default):
+        if has_app_context():
+            return current_app.config.get(key, default)
+        return default
+
+    @staticmethod
+    def _log(level, message):
+        if has_app_context():
+            getattr(current_app.logger, level)(message)
+
+
+# 全局执行器
+unit_of_work = UnitOfWorkExecutor()
+
+
+def _is_failed_response(result):
+    """视图返回值是否是 5xx 响应"""
+    status = None
+    if isinstance(result, tuple) and len(result) > 1 and isinstance(result[1], int):
+        status = result[1]
+    elif hasattr(result, 'status_code'):
+        status = result.status_code
+    return status is not None and status >= 500
+
+
+def transactional_view(operation_type):
+    """
+    接口级工作单元装饰器（放在路由装饰器和权限装饰器之下）
+
+    适用于最后统一提交一次、并自行捕获异常返回 500 的写接口：
+    本次执行中数据库报告过可重试冲突且接口返回 5xx 时，回滚后重新执行整个接口。
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            return unit_of_work.run(operation_type, lambda: view(*args, **kwargs), transaction=False,
+                                    retry_result=_is_failed_response)
+        return wrapper
+    return decorator
+
+
+def _note_engine_error(context):
+    """数据库报错时记录错误类型，接口捕获异常后仍能判断是否需要重放"""
+    unit_of_work.note_error(context.original_exception)
+
+
+def register_unit_of_work_events():
+    """注册数据库错误监听（可重复调用）"""
+    if not event.contains(Engine, 'handle_error', _note_engine_error):
+        event.listen(Engine, 'handle_error', _note_engine_error)
+
+
+def init_unit_of_work(app):
+    """初始化工作单元执行器"""
+    register_unit_of_work_events()
+    app.extensions['unit_of_work'] = unit_of_work
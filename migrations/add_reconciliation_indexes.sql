@@ -0,0 +1,21 @@
+-- 增量对账按更新时间查找有写入的识别编码所需的索引
+-- 新表 consistency_change_log、consistency_findings、reconciliation_state 由 db.create_all() 创建
+-- 执行前请备份数据库
+
+CREATE INDEX IF NOT EXISTS ix_inbound_record_updated_at
+ON inbound_record (updated_at);
+
+CREATE INDEX IF NOT EXISTS ix_outbound_record_updated_at
+ON outbound_record (updated_at);
+
+CREATE INDEX IF NOT EXISTS ix_receive_record_updated_at
+ON receive_record (updated_at);
+
+CREATE INDEX IF NOT EXISTS ix_inventory_last_updated
+ON inventory (last_updated);
+
+-- 查看索引创建结果
+SHOW INDEX FROM inbound_record;
+SHOW INDEX FROM outbound_record;
+SHOW INDEX FROM receive_record;
+SHOW INDEX FROM inventory;